@@ -21,12 +21,12 @@
 # SOFTWARE.
 
 from __future__ import annotations
-import bz2
 import sys
 import time
 import threading
 from threading import RLock
 import struct
+import collections
 from RNS.Channel import Channel, MessageBase, SystemMessageTypes
 import RNS
 from io import RawIOBase, BufferedRWPair, BufferedReader, BufferedWriter
@@ -84,7 +84,12 @@ class StreamDataMessage(MessageBase):
         self.data = raw[2:]
 
         if self.compressed:
-            self.data = bz2.decompress(self.data)
+            # Stream data carries no codec identifier, but
+            # the codec can be recognised by its output
+            codec = RNS.Compression.identify(self.data)
+            if codec == None:
+                raise ValueError("Stream data was compressed with an unknown codec")
+            self.data = codec.decompress(self.data)
 
 
 class RawChannelReader(RawIOBase, AbstractContextManager):
@@ -112,16 +117,38 @@ class RawChannelReader(RawIOBase, AbstractContextManager):
         self._stream_id = stream_id
         self._channel = channel
         self._lock = RLock()
-        self._buffer = bytearray()
+
+        # Received data is kept as a queue of the chunks it
+        # arrived in, which are copied once, when they are
+        # read, no matter how small the reads are.
+        self._chunks: collections.deque[bytes] = collections.deque()
+        self._offset = 0
+        self._size = 0
+        self._ready = 0
+
         self._eof = False
         self._channel._register_message_type(StreamDataMessage, is_system_type=True)
         self._channel.add_message_handler(self._handle_message)
         self._listeners: [Callable[[int], None]] = []
 
+        # Ready callbacks are run in order by one task on
+        # the callback executor of the link, which is
+        # queued when data arrives, and returns once
+        # every message has been announced. While there
+        # are callbacks, the data of a message becomes
+        # readable when it is announced, so reads in a
+        # callback do not run ahead of the message.
+        self._unannounced: collections.deque[int] = collections.deque()
+        self._notifying = False
+
     def add_ready_callback(self, cb: Callable[[int], None]):
         """
         Add a function to be called when new data is available.
-        The function should have the signature ``(ready_bytes: int) -> None``
+        The function should have the signature ``(ready_bytes: int) -> None``,
+        where ``ready_bytes`` is the number of bytes ready to read. Callbacks
+        are called one at a time, in order, once for each message received
+        on the stream, and the data of each message becomes readable as it
+        is announced.
 
         :param cb: function to call
         """
@@ -136,34 +163,95 @@ class RawChannelReader(RawIOBase, AbstractContextManager):
         """
         with self._lock:
             self._listeners.remove(cb)
+            if len(self._listeners) == 0:
+                self._release_unannounced()
+
+    def _release_unannounced(self):
+        self._ready += sum(self._unannounced)
+        self._unannounced.clear()
 
     def _handle_message(self, message: MessageBase):
         if isinstance(message, StreamDataMessage):
             if message.stream_id == self._stream_id:
                 with self._lock:
-                    if message.data is not None:
-                        self._buffer.extend(message.data)
+                    length = 0
+                    if message.data is not None and len(message.data) > 0:
+                        length = len(message.data)
+                        self._chunks.append(message.data)
+                        self._size += length
                     if message.eof:
                         self._eof = True
-                    for listener in self._listeners:
-                        try:
-                            threading.Thread(target=listener, name="Message Callback", args=[len(self._buffer)], daemon=True).start()
-                        except Exception as ex:
-                            RNS.log("Error calling RawChannelReader(" + str(self._stream_id) + ") callback: " + str(ex), RNS.LOG_ERROR)
-                    return True
+
+                    notify = False
+                    if len(self._listeners) > 0:
+                        self._unannounced.append(length)
+                        notify = not self._notifying
+                        if notify:
+                            self._notifying = True
+                    else:
+                        self._ready += length
+
+                if notify:
+                    try:
+                        executor = getattr(getattr(self._channel._outlet, "link", None), "callback_executor", None)
+                        RNS.Executor.dispatch(executor, self._notify, key=self, bounded=False)
+                    except Exception as ex:
+                        with self._lock:
+                            self._notifying = False
+                            self._release_unannounced()
+                        RNS.log("Error calling RawChannelReader(" + str(self._stream_id) + ") callback: " + str(ex), RNS.LOG_ERROR)
+                return True
         return False
 
+    def _notify(self):
+        while True:
+            with self._lock:
+                if len(self._unannounced) == 0 or len(self._listeners) == 0:
+                    self._release_unannounced()
+                    self._notifying = False
+                    return
+                self._ready += self._unannounced.popleft()
+                ready = self._ready
+                listeners = self._listeners.copy()
+
+            for listener in listeners:
+                try:
+                    listener(ready)
+                except Exception as ex:
+                    RNS.log("Error calling RawChannelReader(" + str(self._stream_id) + ") callback: " + str(ex), RNS.LOG_ERROR)
+
     def _read(self, __size: int) -> bytes | None:
-        with self._lock:
-            result = self._buffer[:__size]
-            self._buffer = self._buffer[__size:]
-            return result if len(result) > 0 or self._eof else None
+        result = bytearray(min(__size, self._ready))
+        read = self.readinto(result)
+        return bytes(result[:read]) if read is not None else None
 
     def readinto(self, __buffer: bytearray) -> int | None:
-        ready = self._read(len(__buffer))
-        if ready is not None:
-            __buffer[:len(ready)] = ready
-        return len(ready) if ready is not None else None
+        with self._lock:
+            if self._ready == 0:
+                return 0 if self._eof and self._size == 0 else None
+
+            target = memoryview(__buffer).cast("B")
+            chunks = self._chunks
+            offset = self._offset
+            position = 0
+            end = min(len(target), self._ready)
+            while position < end and len(chunks) > 0:
+                chunk = chunks[0]
+                available = len(chunk)-offset
+                if available <= end-position:
+                    target[position:position+available] = chunk if offset == 0 else memoryview(chunk)[offset:]
+                    position += available
+                    chunks.popleft()
+                    offset = 0
+                else:
+                    target[position:end] = memoryview(chunk)[offset:offset+end-position]
+                    offset += end-position
+                    position = end
+
+            self._offset = offset
+            self._size -= position
+            self._ready -= position
+            return position
 
     def writable(self) -> bool:
         return False
@@ -178,6 +266,7 @@ class RawChannelReader(RawIOBase, AbstractContextManager):
         with self._lock:
             self._channel.remove_message_handler(self._handle_message)
             self._listeners.clear()
+            self._release_unannounced()
 
     def __enter__(self):
         return self
@@ -204,7 +293,19 @@ class RawChannelWriter(RawIOBase, AbstractContextManager):
     """
 
     MAX_CHUNK_LEN     = 1024*16
-    COMPRESSION_TRIES = 4
+    COMPRESSION_TRIES = 2
+
+    # Until the compression ratio of a stream is known,
+    # enough input for this ratio is compressed for each
+    # message, and afterwards slightly more than what
+    # the measured ratio suggests would fit.
+    INITIAL_RATIO = 0.5
+    RATIO_MARGIN  = 0.9
+
+    # When batching is enabled, small writes are held
+    # for up to this many seconds by default, so they
+    # can be sent together in full messages.
+    BATCH_DEADLINE = 0.05
 
     def __init__(self, stream_id: int, channel: Channel):
         """
@@ -217,36 +318,75 @@ class RawChannelWriter(RawIOBase, AbstractContextManager):
         self._channel = channel
         self._eof = False
         self._mdu = channel.mdu - StreamDataMessage.OVERHEAD
+        self._lock = RLock()
+        self._batch_deadline = None
+        self._pending = bytearray()
+        self._flush_timer = None
+
+        # Each stream keeps track of how well its data
+        # compresses, using the codec selected for the
+        # link, or the default one on other channels.
+        self._link = getattr(channel._outlet, "link", None)
+        self._compression = RNS.Compression.Strategy(self._codec_name())
+
+    def _codec_name(self) -> str:
+        # Stream data is compressed with the default codec
+        # until the remote peer has shown it supports the
+        # codec selected for the link.
+        if isinstance(self._link, RNS.Link) and self._link.remote_codecs:
+            return self._link.compression.codec.name
+        else:
+            return RNS.Compression.DEFAULT
+
+    def set_batching(self, deadline: float | None = BATCH_DEADLINE):
+        """
+        Enables or disables batching of small writes. When enabled, data
+        written is held until it fills a message, or for at most *deadline*
+        seconds, so that streams written in small pieces are sent in full
+        messages. Flushing a buffered writer does not send held data early.
 
-    def write(self, __b: bytes) -> int | None:
-        try:
-            comp_tries = RawChannelWriter.COMPRESSION_TRIES
-            comp_try = 1
-            comp_success = False
-            chunk_len = len(__b)
-            if chunk_len > RawChannelWriter.MAX_CHUNK_LEN:
-                chunk_len = RawChannelWriter.MAX_CHUNK_LEN
-                __b = __b[:RawChannelWriter.MAX_CHUNK_LEN]
-            chunk_segment = None
-            while chunk_len > 32 and comp_try < comp_tries:
-                chunk_segment_length = int(chunk_len/comp_try)
-                compressed_chunk = bz2.compress(__b[:chunk_segment_length])
-                compressed_length = len(compressed_chunk)
-                if compressed_length < StreamDataMessage.MAX_DATA_LEN and compressed_length < chunk_segment_length:
-                    comp_success = True
-                    break
-                else:
-                    comp_try += 1
-
-            if comp_success:
-                chunk = compressed_chunk
-                processed_length = chunk_segment_length
-            else:
-                chunk = bytes(__b[:StreamDataMessage.MAX_DATA_LEN])
-                processed_length = len(chunk)
+        :param deadline: The longest time in seconds data is held, or *None* to disable batching.
+        :raises: *TypeError* if *deadline* is not a non-negative number or *None*.
+        """
+        if deadline is not None and (not isinstance(deadline, (int, float)) or isinstance(deadline, bool) or deadline < 0):
+            raise TypeError("Batching deadline must be a non-negative number or None")
 
-            message = StreamDataMessage(self._stream_id, chunk, self._eof, comp_success)
-            
+        with self._lock:
+            self._batch_deadline = deadline
+        if deadline is None:
+            self._flush_pending()
+
+    def _compress(self, data: bytes) -> tuple[bytes, int, bool]:
+        # Compresses as much of data as is expected to fit in
+        # one message, and once more with less input if that
+        # turned out too much. Compression is attempted for
+        # as long as it pays off for the stream, as tracked
+        # by its compression strategy.
+        if self._compression.codec.name != self._codec_name():
+            self._compression = RNS.Compression.Strategy(self._codec_name())
+
+        if len(data) > 32:
+            codec = self._compression.select(None)
+            if codec is not None:
+                ratio = self._compression.ratio or RawChannelWriter.INITIAL_RATIO
+                length = min(len(data), int(StreamDataMessage.MAX_DATA_LEN/max(ratio, 0.01)*RawChannelWriter.RATIO_MARGIN))
+                for attempt in range(RawChannelWriter.COMPRESSION_TRIES):
+                    compressed = codec.compress(data[:length])
+                    if len(compressed) <= StreamDataMessage.MAX_DATA_LEN or attempt == RawChannelWriter.COMPRESSION_TRIES-1:
+                        break
+                    length = int(length*StreamDataMessage.MAX_DATA_LEN/len(compressed)*RawChannelWriter.RATIO_MARGIN)
+
+                self._compression.record(length, len(compressed))
+                if len(compressed) <= StreamDataMessage.MAX_DATA_LEN and len(compressed) < length:
+                    return compressed, length, True
+
+        chunk = bytes(data[:StreamDataMessage.MAX_DATA_LEN])
+        return chunk, len(chunk), False
+
+    def _send(self, data: bytes) -> int:
+        try:
+            chunk, processed_length, compressed = self._compress(data)
+            message = StreamDataMessage(self._stream_id, chunk, self._eof, compressed)
             self._channel.send(message)
             return processed_length
 
@@ -255,6 +395,56 @@ class RawChannelWriter(RawIOBase, AbstractContextManager):
                 raise
         return 0
 
+    def write(self, __b: bytes) -> int | None:
+        if len(__b) > RawChannelWriter.MAX_CHUNK_LEN:
+            __b = __b[:RawChannelWriter.MAX_CHUNK_LEN]
+
+        with self._lock:
+            if (self._batch_deadline is None or self._eof) and len(self._pending) == 0:
+                return self._send(__b)
+
+            # Written data is held until there is enough for
+            # a full message, but never more than one chunk
+            # of it, so that writes block while the channel
+            # is not ready.
+            accepted = min(len(__b), RawChannelWriter.MAX_CHUNK_LEN-len(self._pending))
+            self._pending.extend(__b[:accepted])
+            self._send_pending(full_only=self._batch_deadline is not None)
+
+            if len(self._pending) > 0 and self._flush_timer is None:
+                self._flush_timer = RNS.Timers.shared().call_later(self._batch_deadline or 0, self._flush_pending)
+
+            return accepted
+
+    def _send_pending(self, full_only: bool):
+        with self._lock:
+            while len(self._pending) > 0:
+                if full_only and len(self._pending) < self._full_length():
+                    return
+                sent = self._send(self._pending)
+                if sent == 0:
+                    return
+                del self._pending[:sent]
+
+    def _full_length(self) -> int:
+        # The amount of data that fills a message, once compressed
+        ratio = self._compression.ratio
+        if ratio is None or ratio >= 1 or self._compression.skip > 0:
+            return StreamDataMessage.MAX_DATA_LEN
+        else:
+            return int(StreamDataMessage.MAX_DATA_LEN/ratio*RawChannelWriter.RATIO_MARGIN)
+
+    def _flush_pending(self):
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self._send_pending(full_only=False)
+
+            # Retry shortly if the channel was not ready
+            if len(self._pending) > 0:
+                self._flush_timer = RNS.Timers.shared().call_later(RawChannelWriter.BATCH_DEADLINE, self._flush_pending)
+
     def close(self):
         try:
             link_rtt = self._channel._outlet.link.rtt
@@ -262,6 +452,16 @@ class RawChannelWriter(RawIOBase, AbstractContextManager):
         except Exception as e:
             timeout = time.time() + 15
 
+        while time.time() < timeout and len(self._pending) > 0:
+            self._send_pending(full_only=False)
+            if len(self._pending) > 0:
+                time.sleep(0.05)
+
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
         while time.time() < timeout and not self._channel.is_ready_to_send():
             time.sleep(0.05)
 
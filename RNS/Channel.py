@@ -21,7 +21,6 @@
 # SOFTWARE.
 
 from __future__ import annotations
-import collections
 import enum
 import threading
 import time
@@ -36,6 +35,7 @@ TPacket = TypeVar("TPacket")
 
 class SystemMessageTypes(enum.IntEnum):
     SMT_STREAM_DATA = 0xff00
+    SMT_FRAGMENT    = 0xff01
 
 class ChannelOutletBase(ABC, Generic[TPacket]):
     """
@@ -163,6 +163,42 @@ class MessageBase(abc.ABC):
 MessageCallbackType = NewType("MessageCallbackType", Callable[[MessageBase], bool])
 
 
+class FragmentMessage(MessageBase):
+    """
+    Internal message carrying a part of a message too large to
+    fit in a single packet. The first fragment also carries the
+    type and total length of the fragmented message.
+    """
+    MSGTYPE = SystemMessageTypes.SMT_FRAGMENT
+
+    FLAG_FIRST = 0x01
+    FLAG_LAST  = 0x02
+
+    # Size of the header in the first fragment, and in the rest
+    FIRST_OVERHEAD = 1+2+4
+    OVERHEAD       = 1
+
+    def __init__(self, flags: int = 0, data: bytes = None, msgtype: int = None, length: int = None):
+        self.flags = flags
+        self.data = data
+        self.msgtype = msgtype
+        self.length = length
+
+    def pack(self) -> bytes:
+        if self.flags & FragmentMessage.FLAG_FIRST:
+            return struct.pack(">BHI", self.flags, self.msgtype, self.length) + self.data
+        else:
+            return struct.pack(">B", self.flags) + self.data
+
+    def unpack(self, raw: bytes):
+        self.flags = raw[0]
+        if self.flags & FragmentMessage.FLAG_FIRST:
+            _, self.msgtype, self.length = struct.unpack(">BHI", raw[:FragmentMessage.FIRST_OVERHEAD])
+            self.data = raw[FragmentMessage.FIRST_OVERHEAD:]
+        else:
+            self.data = raw[FragmentMessage.OVERHEAD:]
+
+
 class Envelope:
     """
     Internal wrapper used to transport messages over a channel and
@@ -181,10 +217,11 @@ class Envelope:
 
         return message
 
-    def pack(self) -> bytes:
+    def pack(self, data: bytes | None = None) -> bytes:
         if self.message.__class__.MSGTYPE is None:
             raise ChannelException(CEType.ME_NO_MSG_TYPE, f"{self.message.__class__} lacks MSGTYPE")
-        data = self.message.pack()
+        if data is None:
+            data = self.message.pack()
         self.raw = struct.pack(">HHH", self.message.MSGTYPE, self.sequence, len(data)) + data
         self.packed = True
         return self.raw
@@ -195,6 +232,8 @@ class Envelope:
         self.message = message
         self.raw = raw
         self.packet: TPacket = None
+        self.packet_id = None
+        self.sent = None
         self.sequence = sequence
         self.outlet = outlet
         self.tries = 0
@@ -203,6 +242,76 @@ class Envelope:
         self.tracked = False
 
 
+class EnvelopeRing:
+    """
+    Internal collection of the envelopes in transit on a channel,
+    indexed both by sequence number and by the outlet packet ID of
+    the packet carrying each envelope, so that envelopes can be
+    found, added and removed in constant time. When messages are
+    coalesced, several envelopes are carried by the same packet.
+    """
+    def __init__(self):
+        self._by_sequence: dict[int, Envelope] = {}
+        self._by_packet_id: dict[any, list[Envelope]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_sequence)
+
+    def __iter__(self):
+        return iter(list(self._by_sequence.values()))
+
+    def __contains__(self, envelope: Envelope) -> bool:
+        return self._by_sequence.get(envelope.sequence) is envelope
+
+    def add(self, envelope: Envelope) -> bool:
+        if envelope.sequence in self._by_sequence:
+            return False
+        self._by_sequence[envelope.sequence] = envelope
+        return True
+
+    def get(self, sequence: int) -> Envelope | None:
+        return self._by_sequence.get(sequence)
+
+    def pop(self, sequence: int) -> Envelope | None:
+        envelope = self._by_sequence.pop(sequence, None)
+        if envelope is not None and envelope.packet_id is not None:
+            carried = self._by_packet_id.get(envelope.packet_id)
+            if carried is not None and envelope in carried:
+                carried.remove(envelope)
+                if len(carried) == 0:
+                    self._by_packet_id.pop(envelope.packet_id)
+        return envelope
+
+    def remove(self, envelope: Envelope):
+        if envelope in self:
+            self.pop(envelope.sequence)
+
+    def index_packet(self, envelopes: list[Envelope], packet_id: any):
+        # The ID of a packet can change when it is resent,
+        # so envelopes are indexed by its current one.
+        for envelope in envelopes:
+            if envelope.packet_id is not None:
+                self._by_packet_id.pop(envelope.packet_id, None)
+            envelope.packet_id = packet_id
+
+        carried = [envelope for envelope in envelopes if envelope in self]
+        if len(carried) > 0:
+            self._by_packet_id[packet_id] = carried
+
+    def find_packet(self, packet_id: any) -> list[Envelope] | None:
+        return self._by_packet_id.get(packet_id)
+
+    def packets(self) -> int:
+        """
+        :return: The number of packets carrying envelopes in the ring
+        """
+        return len(self._by_packet_id)
+
+    def clear(self):
+        self._by_sequence.clear()
+        self._by_packet_id.clear()
+
+
 class Channel(contextlib.AbstractContextManager):
     """
     Provides reliable delivery of messages over
@@ -219,7 +328,12 @@ class Channel(contextlib.AbstractContextManager):
         the ``Link``; neither end is the client or
         server.
      **Size-constrained**
-        Messages must be encoded into a single packet.
+        Messages must fit in a single packet, unless
+        fragmentation is enabled with
+        ``set_max_message_size()``. Larger messages
+        are then split into fragments, which are sent,
+        windowed and retried like other messages, and
+        reassembled by the receiver.
 
     ``Channel`` is similar to ``Packet``, except that it
     provides reliable delivery (automatic retries) as well
@@ -270,6 +384,17 @@ class Channel(contextlib.AbstractContextManager):
     SEQ_MAX     = 0xFFFF
     SEQ_MODULUS = SEQ_MAX+1
 
+    # When coalescing is enabled, messages are held
+    # for up to this many seconds by default, to be
+    # sent together with the messages that follow.
+    COALESCE_LATENCY = 0.05
+
+    # Fragmented messages are reassembled up to this
+    # size, unless a different limit is set. Only one
+    # message at a time is reassembled, so this also
+    # bounds the memory used for that.
+    MAX_MESSAGE_SIZE = 64*1024
+
     def __init__(self, outlet: ChannelOutletBase):
         """
 
@@ -277,8 +402,8 @@ class Channel(contextlib.AbstractContextManager):
         """
         self._outlet = outlet
         self._lock = threading.RLock()
-        self._tx_ring: collections.deque[Envelope] = collections.deque()
-        self._rx_ring: collections.deque[Envelope] = collections.deque()
+        self._tx_ring = EnvelopeRing()
+        self._rx_ring = EnvelopeRing()
         self._message_callbacks: [MessageCallbackType] = []
         self._next_sequence = 0
         self._next_rx_sequence = 0
@@ -286,17 +411,26 @@ class Channel(contextlib.AbstractContextManager):
         self._max_tries = 5
         self.fast_rate_rounds    = 0
         self.medium_rate_rounds  = 0
+        self._coalesce_latency = None
+        self._coalesced: list[Envelope] = []
+        self._coalesced_size = 0
+        self._coalesce_timer = None
+        self._flushing = 0
+        self._max_message_size = None
+        self._fragments: list[Envelope] = []
+        self._reassembly: FragmentMessage | None = None
+        self._reassembly_data: bytearray | None = None
+        self._register_message_type(FragmentMessage, is_system_type=True)
 
         if self._outlet.rtt > Channel.RTT_SLOW:
             self.window              = 1
-            self.window_max          = 1
-            self.window_min          = 1
             self.window_flexibility  = 1
         else:
             self.window              = Channel.WINDOW
-            self.window_max          = Channel.WINDOW_MAX_SLOW
-            self.window_min          = Channel.WINDOW_MIN
             self.window_flexibility  = Channel.WINDOW_FLEXIBILITY
+        self.window_max, self.window_min = self._window_limits()
+
+        self._congestion = RNS.Congestion.create_channel(self)
 
     def __enter__(self) -> Channel:
         return self
@@ -376,28 +510,22 @@ class Channel(contextlib.AbstractContextManager):
                     self._outlet.set_packet_delivered_callback(envelope.packet, None)
             self._tx_ring.clear()
             self._rx_ring.clear()
-
-    def _emplace_envelope(self, envelope: Envelope, ring: collections.deque[Envelope]) -> bool:
+            self._coalesced = []
+            self._coalesced_size = 0
+            self._fragments = []
+            self._reassembly = None
+            self._reassembly_data = None
+            if self._coalesce_timer is not None:
+                self._coalesce_timer.cancel()
+                self._coalesce_timer = None
+
+    def _emplace_envelope(self, envelope: Envelope, ring: EnvelopeRing) -> bool:
         with self._lock:
-            i = 0
-            
-            for existing in ring:
+            if not ring.add(envelope):
+                RNS.log(f"Envelope: Emplacement of duplicate envelope with sequence "+str(envelope.sequence), RNS.LOG_EXTREME)
+                return False
 
-                if envelope.sequence == existing.sequence:
-                    RNS.log(f"Envelope: Emplacement of duplicate envelope with sequence "+str(envelope.sequence), RNS.LOG_EXTREME)
-                    return False
-                
-                if envelope.sequence < existing.sequence and not (self._next_rx_sequence - envelope.sequence) > (Channel.SEQ_MAX//2):
-                    ring.insert(i, envelope)
-
-                    envelope.tracked = True
-                    return True
-                
-                i += 1
-            
             envelope.tracked = True
-            ring.append(envelope)
-
             return True
 
     def _run_callbacks(self, message: MessageBase):
@@ -411,6 +539,18 @@ class Channel(contextlib.AbstractContextManager):
                 RNS.log("Channel "+str(self)+" experienced an error while running a message callback. The contained exception was: "+str(e), RNS.LOG_ERROR)
 
     def _receive(self, raw: bytes):
+        # Packets carry one envelope, or when the sender coalesces
+        # messages, several consecutive ones, which are delimited
+        # by the length in each envelope header.
+        offset = 0
+        while offset < len(raw):
+            end = len(raw)
+            if len(raw)-offset >= 6:
+                end = min(end, offset+6+struct.unpack(">H", raw[offset+4:offset+6])[0])
+            self._receive_envelope(raw[offset:end])
+            offset = end
+
+    def _receive_envelope(self, raw: bytes):
         try:
             envelope = Envelope(outlet=self._outlet, raw=raw)
             with self._lock:
@@ -433,29 +573,70 @@ class Channel(contextlib.AbstractContextManager):
                 return
             else:
                 with self._lock:
-                    contigous = []
-                    for e in self._rx_ring:
-                        if e.sequence == self._next_rx_sequence:
-                            contigous.append(e)
-                            self._next_rx_sequence = (self._next_rx_sequence + 1) % Channel.SEQ_MODULUS
-                            if self._next_rx_sequence == 0:
-                                for e in self._rx_ring:
-                                    if e.sequence == self._next_rx_sequence:
-                                        contigous.append(e)
-                                        self._next_rx_sequence = (self._next_rx_sequence + 1) % Channel.SEQ_MODULUS
-
-                    for e in contigous:
+                    # Envelopes are released for as long as the
+                    # next expected sequence has been received
+                    while True:
+                        e = self._rx_ring.pop(self._next_rx_sequence)
+                        if e is None:
+                            break
+
+                        self._next_rx_sequence = (self._next_rx_sequence + 1) % Channel.SEQ_MODULUS
                         if not e.unpacked:
                             m = e.unpack(self._message_factories)
                         else:
                             m = e.message
-                            
-                        self._rx_ring.remove(e)
+
+                        if isinstance(m, FragmentMessage):
+                            m = self._reassemble(m)
+                            if m is None:
+                                continue
+
                         self._run_callbacks(m)
 
         except Exception as e:
             RNS.log("An error ocurred while receiving data on "+str(self)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
 
+    def _reassemble(self, fragment: FragmentMessage) -> MessageBase | None:
+        # Fragments are released in sequence order, so those
+        # of one message always follow each other, and only
+        # one message at a time is being reassembled.
+        if fragment.flags & FragmentMessage.FLAG_FIRST:
+            self._reassembly = None
+            self._reassembly_data = None
+            if fragment.length > (self._max_message_size or Channel.MAX_MESSAGE_SIZE):
+                RNS.log(f"Discarding fragmented message of {fragment.length} bytes on {self}, since it exceeds the maximum message size", RNS.LOG_WARNING)
+                return None
+            self._reassembly = fragment
+            self._reassembly_data = bytearray()
+
+        if self._reassembly is None:
+            return None
+
+        self._reassembly_data += fragment.data
+        if len(self._reassembly_data) > self._reassembly.length:
+            RNS.log(f"Discarding fragmented message on {self}, since its fragments exceed the advertised length", RNS.LOG_WARNING)
+            self._reassembly = None
+            self._reassembly_data = None
+            return None
+
+        if not fragment.flags & FragmentMessage.FLAG_LAST:
+            return None
+
+        first = self._reassembly
+        data = bytes(self._reassembly_data)
+        self._reassembly = None
+        self._reassembly_data = None
+        if len(data) != first.length:
+            RNS.log(f"Discarding fragmented message on {self}, since it was shorter than advertised", RNS.LOG_WARNING)
+            return None
+
+        ctor = self._message_factories.get(first.msgtype, None)
+        if ctor is None:
+            raise ChannelException(CEType.ME_NOT_REGISTERED, f"Unable to find constructor for Channel MSGTYPE {hex(first.msgtype)}")
+        message = ctor()
+        message.unpack(data)
+        return message
+
     def is_ready_to_send(self) -> bool:
         """
         Check if ``Channel`` is ready to send.
@@ -466,141 +647,379 @@ class Channel(contextlib.AbstractContextManager):
             return False
 
         with self._lock:
-            outstanding = 0
-            for envelope in self._tx_ring:
-                if envelope.outlet == self._outlet: 
-                    if not envelope.packet or not self._outlet.get_packet_state(envelope.packet) == MessageState.MSGSTATE_DELIVERED:
-                        outstanding += 1
+            # A fragmented message is sent in full
+            # before any message that follows it
+            if len(self._fragments) > 0:
+                return False
+
+            return self._window_open()
 
-            if outstanding >= self.window:
+    def _window_open(self) -> bool:
+        with self._lock:
+            # Envelopes leave the TX ring when they are delivered,
+            # or when the channel is shut down after a timeout, so
+            # every envelope in it is outstanding. Coalesced ones
+            # are limited by the number of packets carrying them,
+            # and in total by the receive window of the remote end.
+            if self._coalesce_latency is None:
+                if len(self._tx_ring) >= self.window:
+                    return False
+            elif len(self._tx_ring) >= Channel.WINDOW_MAX or self._packets_in_flight() >= self.window:
                 return False
 
         return True
 
+    def _send_fragments(self):
+        # Fragments are sent as the window opens
+        # up, and retried like any other message
+        while True:
+            with self._lock:
+                if len(self._fragments) == 0 or not self._window_open():
+                    return
+                envelope = self._fragments.pop(0)
+                self._emplace_envelope(envelope, self._tx_ring)
+                self._flushing += 1
+            self._send_envelopes([envelope])
+
+    def _fragment(self, envelope: Envelope, data: bytes) -> list[Envelope]:
+        # Splits a message into fragment envelopes with
+        # consecutive sequence numbers, starting at the
+        # one allocated for the message itself.
+        fragments = []
+        capacity = self._outlet.mdu-6
+        offset = 0
+        while offset < len(data) or len(fragments) == 0:
+            if len(fragments) == 0:
+                length = capacity-FragmentMessage.FIRST_OVERHEAD
+                fragment = FragmentMessage(FragmentMessage.FLAG_FIRST, data[:length], envelope.message.MSGTYPE, len(data))
+            else:
+                length = capacity-FragmentMessage.OVERHEAD
+                fragment = FragmentMessage(0, data[offset:offset+length])
+            offset += length
+            if offset >= len(data):
+                fragment.flags |= FragmentMessage.FLAG_LAST
+
+            sequence = (envelope.sequence+len(fragments)) % Channel.SEQ_MODULUS
+            fragment_envelope = Envelope(self._outlet, message=fragment, sequence=sequence)
+            fragment_envelope.pack()
+            fragments.append(fragment_envelope)
+
+        return fragments
+
+    def set_congestion_control(self, algorithm: str):
+        """
+        Sets the congestion control algorithm that sizes the window
+        of packets in flight on this ``Channel``. Round-trip times
+        measured so far are kept.
+
+        :param algorithm: One of ``RNS.Congestion.CLASSIC`` or ``RNS.Congestion.VEGAS``, or the name of a controller registered with ``RNS.Congestion.register_channel``.
+        :raises: *TypeError* if the algorithm is unsupported.
+        """
+        if not algorithm in RNS.Congestion.channel_controllers:
+            raise TypeError("Unsupported congestion control algorithm")
+
+        with self._lock:
+            if self._congestion.NAME != algorithm:
+                # Controllers may change the window limits, so
+                # the limits for the current round-trip time
+                # are restored before the next one is attached
+                self.window_max, self.window_min = self._window_limits()
+                self.window = max(self.window_min, min(self.window_max, self.window))
+                congestion = RNS.Congestion.create_channel(self, algorithm)
+                congestion.clock = self._congestion.clock
+                congestion.estimator = self._congestion.estimator
+                self._congestion = congestion
+
+    def _window_limits(self) -> tuple[int, int]:
+        # The window limits for the round-trip time of the
+        # link, raised to those of the medium and fast tiers
+        # once the rate was sustained in them for long enough
+        if self._outlet.rtt > Channel.RTT_SLOW:
+            return 1, 1
+        elif self.fast_rate_rounds >= Channel.FAST_RATE_THRESHOLD:
+            return Channel.WINDOW_MAX_FAST, Channel.WINDOW_MIN_LIMIT_FAST
+        elif self.medium_rate_rounds >= Channel.FAST_RATE_THRESHOLD:
+            return Channel.WINDOW_MAX_MEDIUM, Channel.WINDOW_MIN_LIMIT_MEDIUM
+        else:
+            return Channel.WINDOW_MAX_SLOW, Channel.WINDOW_MIN
+
+    def set_max_message_size(self, size: int | None = MAX_MESSAGE_SIZE):
+        """
+        Enables fragmentation, and sets the largest message that can be
+        sent, or received, over this ``Channel``. Messages larger than
+        a single packet are split into fragments, and reassembled by the
+        receiver, which holds at most this many bytes of a message being
+        reassembled. Fragmented messages are received up to
+        ``MAX_MESSAGE_SIZE`` bytes when no limit is set.
+
+        Only the current version of ``Channel`` can receive fragmented
+        messages, so this should only be enabled when the remote peer is
+        known to support it.
+
+        :param size: The maximum message size in bytes, or *None* to disable fragmentation.
+        :raises: *TypeError* if *size* is not a positive integer or *None*.
+        """
+        if size is not None and (not isinstance(size, int) or isinstance(size, bool) or size <= 0):
+            raise TypeError("Maximum message size must be a positive integer or None")
+
+        with self._lock:
+            self._max_message_size = size
+
     def _packet_tx_op(self, packet: TPacket, op: Callable[[TPacket], bool]):
+        flush = None
         with self._lock:
-            envelope = next(filter(lambda e: self._outlet.get_packet_id(e.packet) == self._outlet.get_packet_id(packet),
-                                   self._tx_ring), None)
+            envelopes = self._tx_ring.find_packet(self._outlet.get_packet_id(packet))
+            envelope = envelopes[0] if envelopes else None
 
-            if envelope and op(envelope):
-                envelope.tracked = False
+            if envelope and op(envelopes):
+                for e in list(envelopes):
+                    e.tracked = False
                 if envelope in self._tx_ring:
-                    self._tx_ring.remove(envelope)
-
-                    if self.window < self.window_max:
-                        self.window += 1
-
-                        # TODO: Remove at some point
-                        # RNS.log("Increased "+str(self)+" window to "+str(self.window), RNS.LOG_DEBUG)
-
-                    if self._outlet.rtt != 0:
-                        if self._outlet.rtt > Channel.RTT_FAST:
-                            self.fast_rate_rounds = 0
-
-                            if self._outlet.rtt > Channel.RTT_MEDIUM:
-                                self.medium_rate_rounds = 0
-
-                            else:
-                                self.medium_rate_rounds += 1
-                                if self.window_max < Channel.WINDOW_MAX_MEDIUM and self.medium_rate_rounds == Channel.FAST_RATE_THRESHOLD:
-                                    self.window_max = Channel.WINDOW_MAX_MEDIUM
-                                    self.window_min = Channel.WINDOW_MIN_LIMIT_MEDIUM
-                                    # TODO: Remove at some point
-                                    # RNS.log("Increased "+str(self)+" max window to "+str(self.window_max), RNS.LOG_DEBUG)
-                                    # RNS.log("Increased "+str(self)+" min window to "+str(self.window_min), RNS.LOG_DEBUG)
-                            
-                        else:
-                            self.fast_rate_rounds += 1
-                            if self.window_max < Channel.WINDOW_MAX_FAST and self.fast_rate_rounds == Channel.FAST_RATE_THRESHOLD:
-                                self.window_max = Channel.WINDOW_MAX_FAST
-                                self.window_min = Channel.WINDOW_MIN_LIMIT_FAST
-                                # TODO: Remove at some point
-                                # RNS.log("Increased "+str(self)+" max window to "+str(self.window_max), RNS.LOG_DEBUG)
-                                # RNS.log("Increased "+str(self)+" min window to "+str(self.window_min), RNS.LOG_DEBUG)
+                    for e in list(envelopes):
+                        self._tx_ring.remove(e)
 
+                    # Round-trip times are only sampled from packets
+                    # that were not retried, since it is unknown
+                    # which of the tries a delivery proof was for.
+                    rtt = None
+                    if envelope.tries == 1 and envelope.sent is not None:
+                        rtt = self._congestion.clock()-envelope.sent
+                        self._congestion.sample(rtt)
+                    self._congestion.delivered(rtt)
+                    self._update_packet_timeouts(delivered=envelope.sent)
+
+
+                    # A packet slot was freed for overdue
+                    # messages waiting to be sent together
+                    if self._coalesce_timer is None:
+                        flush = self._take_coalesced()
 
                 else:
                     RNS.log("Envelope not found in TX ring for "+str(self), RNS.LOG_EXTREME)
         if not envelope:
             RNS.log("Spurious message received on "+str(self), RNS.LOG_EXTREME)
+        if flush:
+            self._send_envelopes(flush)
+        if len(self._fragments) > 0:
+            self._send_fragments()
 
     def _packet_delivered(self, packet: TPacket):
-        self._packet_tx_op(packet, lambda env: True)
-
-    def _update_packet_timeouts(self):
+        self._packet_tx_op(packet, lambda envelopes: True)
+
+    def _update_packet_timeouts(self, delivered: float | None = None):
+        # Timeouts only depend on the number of tries
+        # and the size of the ring, so each is computed
+        # once for all envelopes with the same tries.
+        # Once round-trip times have been measured, the
+        # timeouts of packets sent after one that was
+        # delivered restart, as in RFC 6298, since they
+        # were queued behind it. Packets sent before it
+        # are not extended, as they were likely lost.
+        now = self._congestion.clock()
+        restart = delivered is not None and self._congestion.uses_rto and self._congestion.retransmission_timeout(1) is not None
+        timeouts = {}
         for envelope in self._tx_ring:
-            updated_timeout = self._get_packet_timeout_time(envelope.tries)
+            if not envelope.tries in timeouts:
+                timeouts[envelope.tries] = self._get_packet_timeout_time(envelope.tries)
+            updated_timeout = timeouts[envelope.tries]
+            if restart and envelope.sent is not None and envelope.sent >= delivered:
+                updated_timeout += now-envelope.sent
             if envelope.packet and hasattr(envelope.packet, "receipt") and envelope.packet.receipt and envelope.packet.receipt.timeout:
                 if updated_timeout > envelope.packet.receipt.timeout:
                     envelope.packet.receipt.set_timeout(updated_timeout)
 
     def _get_packet_timeout_time(self, tries: int) -> float:
-        to = pow(1.5, tries - 1) * max(self._outlet.rtt*2.5, 0.025) * (len(self._tx_ring)+1.5)
+        # Until round-trip times have been measured on the
+        # channel, or if the congestion controller does not
+        # use them, the timeout is estimated from the link
+        # round-trip time and the packets in flight.
+        to = self._congestion.retransmission_timeout(tries) if self._congestion.uses_rto else None
+        if to is None:
+            outstanding = len(self._tx_ring) if self._coalesce_latency is None else self._packets_in_flight()
+            to = pow(1.5, tries - 1) * max(self._outlet.rtt*2.5, 0.025) * (outstanding+1.5)
         return to
 
     def _packet_timeout(self, packet: TPacket):
-        def retry_envelope(envelope: Envelope) -> bool:
+        def retry_envelopes(envelopes: list[Envelope]) -> bool:
+            envelope = envelopes[0]
             if envelope.tries >= self._max_tries:
                 RNS.log("Retry count exceeded on "+str(self)+", tearing down Link.", RNS.LOG_ERROR)
                 self._shutdown()  # start on separate thread?
                 self._outlet.timed_out()
                 return True
 
-            envelope.tries += 1
+            # All envelopes carried by the packet are retried with it
+            for e in envelopes:
+                e.tries += 1
             self._outlet.resend(envelope.packet)
+            self._tx_ring.index_packet(list(envelopes), self._outlet.get_packet_id(envelope.packet))
             self._outlet.set_packet_delivered_callback(envelope.packet, self._packet_delivered)
             self._outlet.set_packet_timeout_callback(envelope.packet, self._packet_timeout, self._get_packet_timeout_time(envelope.tries))
             self._update_packet_timeouts()
-
-            if self.window > self.window_min:
-                self.window -= 1
-                # TODO: Remove at some point
-                # RNS.log("Decreased "+str(self)+" window to "+str(self.window), RNS.LOG_DEBUG)
-
-                if self.window_max > (self.window_min+self.window_flexibility):
-                    self.window_max -= 1
-                    # TODO: Remove at some point
-                    # RNS.log("Decreased "+str(self)+" max window to "+str(self.window_max), RNS.LOG_DEBUG)
-
-                # TODO: Remove at some point
-                # RNS.log("Decreased "+str(self)+" window to "+str(self.window), RNS.LOG_EXTREME)
+            self._congestion.timeout()
 
             return False
 
         if self._outlet.get_packet_state(packet) != MessageState.MSGSTATE_DELIVERED:
-            self._packet_tx_op(packet, retry_envelope)
+            self._packet_tx_op(packet, retry_envelopes)
 
     def send(self, message: MessageBase) -> Envelope:
         """
         Send a message. If a message send is attempted and
         ``Channel`` is not ready, an exception is thrown.
 
+        If fragmentation is enabled, messages too large for a single
+        packet are fragmented, and the ``Channel`` is not ready to send
+        again until all fragments have been sent.
+
         :param message: an instance of a ``MessageBase`` subclass
+        :returns: The envelope of the message. For a fragmented message, this is the envelope of its last fragment, which is only sent once the window has room for it, so its ``packet`` is *None* until then. All fragments have been sent when ``is_ready_to_send()`` returns *True* again.
+        :raises: ``ChannelException`` if the message does not fit in a packet and fragmentation is disabled, or is larger than the maximum message size.
         """
         envelope: Envelope | None = None
         with self._lock:
             if not self.is_ready_to_send():
                 raise ChannelException(CEType.ME_LINK_NOT_READY, f"Link is not ready")
         
+            if message.__class__.MSGTYPE is None:
+                raise ChannelException(CEType.ME_NO_MSG_TYPE, f"{message.__class__} lacks MSGTYPE")
+
+            data = message.pack()
             envelope = Envelope(self._outlet, message=message, sequence=self._next_sequence)
-            self._next_sequence = (self._next_sequence + 1) % Channel.SEQ_MODULUS
-            self._emplace_envelope(envelope, self._tx_ring)
+            if len(data)+6 > self._outlet.mdu:
+                if self._max_message_size is None:
+                    raise ChannelException(CEType.ME_TOO_BIG, f"Packed message too big for packet: {len(data)+6} > {self._outlet.mdu}")
+                if len(data) > self._max_message_size:
+                    raise ChannelException(CEType.ME_TOO_BIG, f"Message too big: {len(data)} > {self._max_message_size}")
+
+                fragments = self._fragment(envelope, data)
+                self._next_sequence = (self._next_sequence + len(fragments)) % Channel.SEQ_MODULUS
+                self._fragments.extend(fragments)
+                envelope = fragments[-1]
+
+            else:
+                envelope.pack(data)
+                self._next_sequence = (self._next_sequence + 1) % Channel.SEQ_MODULUS
+                self._emplace_envelope(envelope, self._tx_ring)
+                fragments = None
 
         if envelope is None:
             raise BlockingIOError()
 
-        envelope.pack()
-        if len(envelope.raw) > self._outlet.mdu:
-            raise ChannelException(CEType.ME_TOO_BIG, f"Packed message too big for packet: {len(envelope.raw)} > {self._outlet.mdu}")
-        
-        envelope.packet = self._outlet.send(envelope.raw)
-        envelope.tries += 1
-        self._outlet.set_packet_delivered_callback(envelope.packet, self._packet_delivered)
-        self._outlet.set_packet_timeout_callback(envelope.packet, self._packet_timeout, self._get_packet_timeout_time(envelope.tries))
-        self._update_packet_timeouts()
+        if fragments:
+            self._send_fragments()
+        elif self._coalesce_latency is not None:
+            self._coalesce(envelope)
+        else:
+            with self._lock:
+                self._flushing += 1
+            self._send_envelopes([envelope])
 
         return envelope
 
+    def set_coalescing(self, latency: float | None = COALESCE_LATENCY):
+        """
+        Enables or disables coalescing of messages. When enabled, messages
+        are held for up to *latency* seconds, and sent together with the
+        messages that follow them in a single packet, up to the MDU of the
+        link. Delivery is confirmed, and retried, for each packet instead of
+        each message, which saves both airtime and window space for small
+        messages. Messages are still delivered to the remote message
+        handlers one by one, in order.
+
+        Only the current version of ``Channel`` can receive coalesced
+        messages, so this should only be enabled when the remote peer is
+        known to support it.
+
+        :param latency: The longest time in seconds a message is held, or *None* to disable coalescing.
+        :raises: *TypeError* if *latency* is not a non-negative number or *None*.
+        """
+        if latency is not None and (not isinstance(latency, (int, float)) or isinstance(latency, bool) or latency < 0):
+            raise TypeError("Coalescing latency must be a non-negative number or None")
+
+        with self._lock:
+            self._coalesce_latency = latency
+            flush = self._take_coalesced(force=True) if latency is None else None
+
+        if flush:
+            self._send_envelopes(flush)
+
+    def _packets_in_flight(self) -> int:
+        return self._tx_ring.packets()+self._flushing
+
+    def _coalesce(self, envelope: Envelope):
+        flushes = []
+        with self._lock:
+            # A message that does not fit with the ones waiting is
+            # sent after them, in the next packet. The window was
+            # checked before, so there is room for another packet.
+            if len(self._coalesced) > 0 and self._coalesced_size+len(envelope.raw) > self._outlet.mdu:
+                flushes.append(self._take_coalesced(force=True))
+
+            self._coalesced.append(envelope)
+            self._coalesced_size += len(envelope.raw)
+
+            if self._coalesced_size+6 >= self._outlet.mdu or len(self._tx_ring) >= Channel.WINDOW_MAX:
+                # No further message can fit, or be sent before this
+                # packet is, so it is sent as soon as the window allows
+                if self._coalesce_timer is not None:
+                    self._coalesce_timer.cancel()
+                    self._coalesce_timer = None
+                flushes.append(self._take_coalesced())
+
+            elif self._coalesce_timer is None and len(self._coalesced) == 1:
+                self._coalesce_timer = RNS.Timers.shared().call_later(self._coalesce_latency, self._coalesce_timeout)
+
+        for flush in flushes:
+            if flush:
+                self._send_envelopes(flush)
+
+    def _coalesce_timeout(self):
+        with self._lock:
+            self._coalesce_timer = None
+            flush = self._take_coalesced()
+
+        if flush:
+            self._send_envelopes(flush)
+
+    def _take_coalesced(self, force: bool = False) -> list[Envelope] | None:
+        # Takes the messages waiting to be sent together, if
+        # the window has room for another packet. Otherwise
+        # they are taken once a packet is delivered. Waiting
+        # messages without a running timer are overdue.
+        if len(self._coalesced) == 0:
+            return None
+        if not force and self._packets_in_flight() >= self.window:
+            return None
+
+        if self._coalesce_timer is not None:
+            self._coalesce_timer.cancel()
+            self._coalesce_timer = None
+
+        envelopes = self._coalesced
+        self._coalesced = []
+        self._coalesced_size = 0
+        self._flushing += 1
+        return envelopes
+
+    def _send_envelopes(self, envelopes: list[Envelope]):
+        try:
+            packet = self._outlet.send(b"".join([envelope.raw for envelope in envelopes]))
+            with self._lock:
+                sent = self._congestion.clock()
+                for envelope in envelopes:
+                    envelope.packet = packet
+                    envelope.sent = sent
+                    envelope.tries += 1
+                self._tx_ring.index_packet(envelopes, self._outlet.get_packet_id(packet))
+        finally:
+            with self._lock:
+                self._flushing -= 1
+
+        self._outlet.set_packet_delivered_callback(packet, self._packet_delivered)
+        self._outlet.set_packet_timeout_callback(packet, self._packet_timeout, self._get_packet_timeout_time(envelopes[0].tries))
+        self._update_packet_timeouts()
+
     @property
     def mdu(self):
         """
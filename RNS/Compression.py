@@ -0,0 +1,287 @@
+# MIT License
+#
+# Copyright (c) 2016-2023 Mark Qvist / unsigned.io and contributors.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import RNS
+import bz2
+import zlib
+import threading
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# Names of the built-in compression codecs,
+# for use with Link.set_compression
+BZ2       = "bz2"
+ZLIB_FAST = "zlib-1"
+ZLIB      = "zlib-6"
+ZLIB_BEST = "zlib-9"
+LZMA      = "lzma"
+
+# bz2 is the only codec understood by receivers
+# that predate codec selection, so it is used
+# unless another codec is explicitly selected,
+# and until the remote peer has shown support
+# for other codecs.
+DEFAULT   = BZ2
+
+# Before compressing, this many evenly spread
+# samples of SAMPLE_SIZE bytes are compressed with
+# fast zlib. If that does not save at least
+# SAMPLE_MIN_SAVING of the size, the data is not
+# expected to be compressible, and is sent as is.
+SAMPLE_COUNT      = 4
+SAMPLE_SIZE       = 4*1024
+SAMPLE_MIN_SAVING = 0.05
+
+class Codec():
+    """
+    Base class for compression codecs. Codecs are identified in
+    resource advertisements by their *ID*, and in stream data by
+    the magic bytes of their output.
+    """
+    ID = None
+
+    def __init__(self, name):
+        self.name = name
+
+    def compress(self, data):
+        raise NotImplementedError()
+
+    def compressor(self):
+        """
+        :returns: An incremental compressor with ``compress`` and ``flush`` methods.
+        """
+        raise NotImplementedError()
+
+    def decompressor(self):
+        """
+        :returns: An incremental decompressor with the same interface as ``bz2.BZ2Decompressor``.
+        """
+        raise NotImplementedError()
+
+    def decompress(self, data):
+        raise NotImplementedError()
+
+    def identifies(self, data):
+        """
+        :returns: Whether *data* looks like the output of this codec.
+        """
+        raise NotImplementedError()
+
+
+class BZ2Codec(Codec):
+    ID = 0x00
+
+    def compress(self, data):
+        return bz2.compress(data)
+
+    def compressor(self):
+        return bz2.BZ2Compressor()
+
+    def decompressor(self):
+        return bz2.BZ2Decompressor()
+
+    def decompress(self, data):
+        return bz2.decompress(data)
+
+    def identifies(self, data):
+        return data[:3] == b"BZh"
+
+
+class ZlibDecompressor():
+    # Adapts zlib decompression objects to the interface
+    # of bz2.BZ2Decompressor, which keeps input that did
+    # not fit in max_length internally.
+    def __init__(self):
+        self._decompressor = zlib.decompressobj()
+        self.needs_input = True
+
+    @property
+    def eof(self):
+        return self._decompressor.eof
+
+    def decompress(self, data, max_length=-1):
+        data = self._decompressor.unconsumed_tail+data
+        output = self._decompressor.decompress(data, max(max_length, 0))
+        self.needs_input = len(self._decompressor.unconsumed_tail) == 0
+        return output
+
+
+class ZlibCodec(Codec):
+    ID = 0x01
+
+    def __init__(self, name, level):
+        super().__init__(name)
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def compressor(self):
+        return zlib.compressobj(self.level)
+
+    def decompressor(self):
+        return ZlibDecompressor()
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+    def identifies(self, data):
+        return len(data) >= 2 and data[0] & 0x0F == 0x08 and (data[0] << 8 | data[1]) % 31 == 0
+
+
+class LZMACodec(Codec):
+    ID = 0x02
+
+    def compress(self, data):
+        return lzma.compress(data)
+
+    def compressor(self):
+        return lzma.LZMACompressor()
+
+    def decompressor(self):
+        return lzma.LZMADecompressor()
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+    def identifies(self, data):
+        return data[:6] == b"\xFD7zXZ\x00"
+
+
+codecs = {
+    BZ2:       BZ2Codec(BZ2),
+    ZLIB_FAST: ZlibCodec(ZLIB_FAST, 1),
+    ZLIB:      ZlibCodec(ZLIB, 6),
+    ZLIB_BEST: ZlibCodec(ZLIB_BEST, 9),
+}
+
+if lzma != None:
+    codecs[LZMA] = LZMACodec(LZMA)
+
+def all_available():
+    """
+    :returns: Whether every built-in codec can be used on this system.
+    """
+    return lzma != None
+
+def by_id(codec_id):
+    """
+    :returns: A codec that can decompress data advertised with *codec_id*, or *None* if it is not available.
+    """
+    for codec in codecs.values():
+        if codec.ID == codec_id:
+            return codec
+    return None
+
+def identify(data):
+    """
+    :returns: The codec that produced the compressed *data*, or *None* if it is not recognised.
+    """
+    for codec in codecs.values():
+        if codec.identifies(data):
+            return codec
+    return None
+
+def sample(data):
+    """
+    :returns: Evenly spread samples of *data*, concatenated.
+    """
+    if len(data) <= SAMPLE_COUNT*SAMPLE_SIZE:
+        return bytes(data)
+
+    stride = (len(data)-SAMPLE_SIZE)//(SAMPLE_COUNT-1)
+    return b"".join(bytes(data[i*stride:i*stride+SAMPLE_SIZE]) for i in range(SAMPLE_COUNT))
+
+def sample_file(file, start, length):
+    """
+    :returns: Evenly spread samples of *length* bytes of *file* from *start*, concatenated.
+    """
+    if length <= SAMPLE_COUNT*SAMPLE_SIZE:
+        file.seek(start)
+        return file.read(length)
+
+    stride = (length-SAMPLE_SIZE)//(SAMPLE_COUNT-1)
+    samples = []
+    for i in range(SAMPLE_COUNT):
+        file.seek(start+i*stride)
+        samples.append(file.read(SAMPLE_SIZE))
+    return b"".join(samples)
+
+def compressible(samples):
+    """
+    :returns: Whether compressing *samples* with fast zlib saves enough to make compressing the data they were taken from worthwhile.
+    """
+    if len(samples) == 0:
+        return False
+    return len(zlib.compress(samples, 1)) <= len(samples)*(1-SAMPLE_MIN_SAVING)
+
+
+class Strategy():
+    """
+    Decides whether and how to compress data sent over a link.
+    Data that samples show to be incompressible is never passed
+    to the codec. When compression of data that passed sampling
+    keeps failing to pay off anyway, further attempts are skipped
+    for exponentially more payloads, up to *MAX_SKIP*, until one
+    succeeds.
+    """
+    MAX_SKIP = 32
+
+    def __init__(self, codec=DEFAULT):
+        self.lock     = threading.Lock()
+        self.codec    = codecs[codec]
+        self.failures = 0
+        self.skip     = 0
+        self.ratio    = None
+
+    def select(self, samples, remember=True):
+        """
+        :param samples: Samples of the data to be sent, see :func:`sample`, or *None* to decide only from the outcome of earlier compression.
+        :param remember: If *False*, the decision depends only on *samples*, so it is the same every time the same data is sent.
+        :returns: The codec to compress the data with, or *None* if compression is not expected to pay off.
+        """
+        if remember:
+            with self.lock:
+                if self.skip > 0:
+                    self.skip -= 1
+                    return None
+
+        if samples == None or compressible(samples):
+            return self.codec
+        else:
+            return None
+
+    def record(self, original_size, compressed_size):
+        """
+        Records the outcome of compressing data with the selected codec.
+        """
+        with self.lock:
+            ratio = compressed_size/max(original_size, 1)
+            self.ratio = ratio if self.ratio == None else 0.75*self.ratio+0.25*ratio
+            if compressed_size < original_size:
+                self.failures = 0
+            else:
+                self.failures += 1
+                self.skip = min(2**(self.failures-1), Strategy.MAX_SKIP)
@@ -0,0 +1,624 @@
+# MIT License
+#
+# Copyright (c) 2016-2023 Mark Qvist / unsigned.io and contributors.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import RNS
+import math
+import time
+import threading
+
+# Names of the built-in congestion control
+# algorithms, for use with Link.set_congestion_control
+# and Link.set_channel_congestion_control
+CLASSIC = "classic"
+AIMD    = "aimd"
+BBR     = "bbr"
+VEGAS   = "vegas"
+
+DEFAULT = CLASSIC
+
+class Bottleneck():
+    """
+    Keeps track of the incoming resource transfers that share an
+    interface, so that controllers can divide its capacity fairly
+    between them, in proportion to the priority of each resource,
+    instead of competing for it.
+    """
+    bottlenecks = {}
+    lock        = threading.Lock()
+
+    @staticmethod
+    def join(controller):
+        interface = controller.resource.link.attached_interface
+        with Bottleneck.lock:
+            if not interface in Bottleneck.bottlenecks:
+                Bottleneck.bottlenecks[interface] = Bottleneck(interface)
+            bottleneck = Bottleneck.bottlenecks[interface]
+            bottleneck.controllers.append(controller)
+            return bottleneck
+
+    @staticmethod
+    def leave(controller):
+        with Bottleneck.lock:
+            bottleneck = controller.bottleneck
+            if bottleneck != None and controller in bottleneck.controllers:
+                bottleneck.controllers.remove(controller)
+                if len(bottleneck.controllers) == 0 and Bottleneck.bottlenecks.get(bottleneck.interface) == bottleneck:
+                    Bottleneck.bottlenecks.pop(bottleneck.interface)
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.controllers = []
+
+    def capacity(self):
+        """
+        :returns: The highest bottleneck bandwidth estimate of any transfer on this interface in bytes per second, or *None*.
+        """
+        estimates = [c.btl_bw for c in self.controllers.copy() if c.btl_bw != None]
+        if len(estimates) > 0:
+            return max(estimates)
+        else:
+            return None
+
+    def share(self, controller):
+        """
+        :returns: The fair share of the estimated capacity for the transfer of *controller* in bytes per second, or *None*.
+        """
+        capacity = self.capacity()
+        if capacity == None:
+            return None
+        else:
+            weights = sum(c.resource.priority for c in self.controllers.copy())
+            return capacity*controller.resource.priority/max(controller.resource.priority, weights)
+
+
+class CongestionControl():
+    """
+    Base class for resource congestion controllers. A controller is
+    attached to each incoming resource, and sets the number of parts
+    requested per round in ``resource.window``. The resource reports
+    requests, responses, received parts, completed rounds and timeouts
+    to the controller, which keeps the timing of the current round.
+
+    Subclasses implement ``completed`` and ``timeout``. They may use
+    ``self.clock`` for timekeeping, which can be replaced to run a
+    controller in virtual time.
+    """
+    NAME = None
+
+    def __init__(self, resource):
+        self.resource      = resource
+        self.bottleneck    = None
+        self.clock         = time.time
+        self.btl_bw        = None
+        self.min_rtt       = None
+        self.request_time  = None
+        self.response_time = None
+        self.last_arrival  = None
+        self.round_bytes   = 0
+        self.train_bytes   = 0
+        self.requested     = 0
+        self.received      = 0
+
+    def started(self):
+        self.bottleneck = Bottleneck.join(self)
+
+    def concluded(self):
+        Bottleneck.leave(self)
+
+    def request_sent(self, parts):
+        self.request_time  = self.clock()
+        self.response_time = None
+        self.last_arrival  = None
+        self.round_bytes   = 0
+        self.train_bytes   = 0
+        self.requested     = parts
+        self.received      = 0
+
+    def response(self):
+        if self.response_time == None:
+            self.response_time = self.clock()
+
+    def part_received(self, length):
+        now = self.clock()
+        if self.response_time == None:
+            self.response_time = now
+        if self.received > 0:
+            self.train_bytes += length
+        self.round_bytes  += length
+        self.received     += 1
+        self.last_arrival  = now
+
+    def round_completed(self):
+        if self.request_time != None and self.last_arrival != None:
+            rtt = self.response_time - self.request_time
+            duration = self.last_arrival - self.request_time
+            dispersion = self.last_arrival - self.response_time
+            if dispersion > 0 and self.train_bytes > 0:
+                dispersion_rate = self.train_bytes/dispersion
+            else:
+                dispersion_rate = None
+
+            self.completed(rtt, self.round_bytes, duration, dispersion_rate)
+
+    def completed(self, rtt, delivered, duration, dispersion_rate):
+        """
+        Called when all parts requested in a round have been received.
+
+        :param rtt: Time from sending the request until the first part arrived, in seconds.
+        :param delivered: Number of bytes received in the round.
+        :param duration: Time from sending the request until the last part arrived, in seconds.
+        :param dispersion_rate: The rate at which the parts of the round arrived in bytes per second, or *None* if it could not be measured.
+        """
+        pass
+
+    def timeout(self):
+        """
+        Called when the receiver timed out waiting for requested parts.
+        """
+        pass
+
+    def set_window(self, window):
+        self.resource.window = max(RNS.Resource.WINDOW_MIN, min(RNS.Resource.WINDOW_MAX, int(window)))
+        if self.resource.window_max < self.resource.window:
+            self.resource.window_max = self.resource.window
+
+
+class ClassicControl(CongestionControl):
+    """
+    The original Reticulum window adaptation. The window grows by one
+    part per completed round up to a maximum, which is raised for fast
+    links and lowered for very slow ones after a number of rounds at
+    the respective rates, and shrinks by one part per timeout.
+    """
+    NAME = CLASSIC
+
+    def __init__(self, resource):
+        super().__init__(resource)
+        self.fast_rate_rounds = 0
+        self.very_slow_rate_rounds = 0
+
+    def response(self):
+        super().response()
+        if self.resource.req_resp_rtt_rate > RNS.Resource.RATE_FAST and self.fast_rate_rounds < RNS.Resource.FAST_RATE_THRESHOLD:
+            self.fast_rate_rounds += 1
+
+            if self.fast_rate_rounds == RNS.Resource.FAST_RATE_THRESHOLD:
+                self.resource.window_max = RNS.Resource.WINDOW_MAX_FAST
+
+    def completed(self, rtt, delivered, duration, dispersion_rate):
+        resource = self.resource
+        if resource.window < resource.window_max:
+            resource.window += 1
+            if (resource.window - resource.window_min) > (resource.window_flexibility-1):
+                resource.window_min += 1
+
+        if resource.req_data_rtt_rate != 0:
+            if resource.req_data_rtt_rate > RNS.Resource.RATE_FAST and self.fast_rate_rounds < RNS.Resource.FAST_RATE_THRESHOLD:
+                self.fast_rate_rounds += 1
+
+                if self.fast_rate_rounds == RNS.Resource.FAST_RATE_THRESHOLD:
+                    resource.window_max = RNS.Resource.WINDOW_MAX_FAST
+
+            if self.fast_rate_rounds == 0 and resource.req_data_rtt_rate < RNS.Resource.RATE_VERY_SLOW and self.very_slow_rate_rounds < RNS.Resource.VERY_SLOW_RATE_THRESHOLD:
+                self.very_slow_rate_rounds += 1
+
+                if self.very_slow_rate_rounds == RNS.Resource.VERY_SLOW_RATE_THRESHOLD:
+                    resource.window_max = RNS.Resource.WINDOW_MAX_VERY_SLOW
+
+    def timeout(self):
+        resource = self.resource
+        if resource.window > resource.window_min:
+            resource.window -= 1
+            if resource.window_max > resource.window_min:
+                resource.window_max -= 1
+                if (resource.window_max - resource.window) > (resource.window_flexibility-1):
+                    resource.window_max -= 1
+
+
+class AIMDControl(CongestionControl):
+    """
+    Additive increase, multiplicative decrease. The window doubles
+    per round until the first timeout, and then grows by one part
+    per round, and is halved on every timeout.
+    """
+    NAME = AIMD
+
+    INCREASE = 1
+    DECREASE = 0.5
+
+    def __init__(self, resource):
+        super().__init__(resource)
+        self.slow_start_threshold = RNS.Resource.WINDOW_MAX
+
+    def completed(self, rtt, delivered, duration, dispersion_rate):
+        if self.resource.window < self.slow_start_threshold:
+            self.set_window(min(self.resource.window*2, self.slow_start_threshold))
+        else:
+            self.set_window(self.resource.window+AIMDControl.INCREASE)
+
+    def timeout(self):
+        self.slow_start_threshold = max(RNS.Resource.WINDOW_MIN, math.floor(self.resource.window*AIMDControl.DECREASE))
+        self.set_window(self.slow_start_threshold)
+
+
+class BBRControl(CongestionControl):
+    """
+    A rate-based controller modelled on BBR. It estimates the
+    bottleneck bandwidth from the rate at which the parts of each
+    round arrive, and the round-trip time from the delay until the
+    first part arrives. The window is sized so that transmitting it
+    takes ``ROUND_FILL`` times longer than the request round trip,
+    which keeps the path busy between rounds, and the estimated
+    capacity of the interface is divided between all transfers
+    sharing it.
+
+    Since resource parts are requested in rounds, and not sent as a
+    continuous stream, isolated losses only delay a round. They do
+    not reduce the window unless the fraction of parts lost in a
+    round exceeds ``LOSS_THRESHOLD``, which indicates queue overflow
+    rather than random loss on the path.
+    """
+    NAME = BBR
+
+    # Windowed maximum filter lengths
+    BW_ROUNDS      = 10
+    MIN_RTT_WINDOW = 10.0
+
+    # Ratio of transmission time to request round
+    # trip time that the window is sized for
+    ROUND_FILL     = 4
+
+    # Gain applied while no bandwidth estimate
+    # is available yet
+    STARTUP_GAIN   = 2
+
+    LOSS_THRESHOLD = 0.2
+    LOSS_BACKOFF   = 0.9
+
+    def __init__(self, resource):
+        super().__init__(resource)
+        self.bw_samples = []
+        self.min_rtt_stamp = None
+        self.window_cap = RNS.Resource.WINDOW_MAX
+
+    def completed(self, rtt, delivered, duration, dispersion_rate):
+        now = self.clock()
+        if rtt > 0:
+            if self.min_rtt == None or rtt <= self.min_rtt or now-self.min_rtt_stamp > BBRControl.MIN_RTT_WINDOW:
+                self.min_rtt = rtt
+                self.min_rtt_stamp = now
+
+        sample = dispersion_rate
+        if sample == None and duration > 0:
+            sample = delivered/duration
+        if sample != None:
+            self.bw_samples.append(sample)
+            if len(self.bw_samples) > BBRControl.BW_ROUNDS:
+                self.bw_samples.pop(0)
+            self.btl_bw = max(self.bw_samples)
+
+        if self.window_cap < RNS.Resource.WINDOW_MAX:
+            self.window_cap += 1
+
+        self.update_window()
+
+    def update_window(self):
+        share = self.bottleneck.share(self) if self.bottleneck != None else self.btl_bw
+        if share == None or self.min_rtt == None:
+            window = self.resource.window*BBRControl.STARTUP_GAIN
+        else:
+            window = math.ceil(BBRControl.ROUND_FILL*share*self.min_rtt/self.resource.sdu)
+
+        self.set_window(min(window, self.window_cap))
+
+    def timeout(self):
+        if self.requested > 0:
+            lost = max(0, self.requested-self.received)
+            if lost/self.requested > BBRControl.LOSS_THRESHOLD:
+                self.window_cap = max(RNS.Resource.WINDOW_MIN, math.floor(max(self.received, 1)*BBRControl.LOSS_BACKOFF))
+                self.set_window(min(self.resource.window, self.window_cap))
+
+
+controllers = {
+    CLASSIC: ClassicControl,
+    AIMD:    AIMDControl,
+    BBR:     BBRControl,
+}
+
+def register(name, controller_class):
+    """
+    Registers a congestion controller class, making it selectable
+    with :func:`RNS.Link.set_congestion_control`.
+    """
+    if not issubclass(controller_class, CongestionControl):
+        raise TypeError("Congestion controllers must be subclasses of CongestionControl")
+    controllers[name] = controller_class
+
+def create(resource, name=None):
+    """
+    :returns: A new congestion controller instance for *resource*, using the algorithm selected for its link.
+    """
+    if name == None:
+        name = getattr(resource.link, "congestion_control", DEFAULT)
+    return controllers[name](resource)
+
+
+class RTTEstimator():
+    """
+    Estimates the round-trip time of a path from samples, and derives
+    a retransmission timeout from it, as specified in RFC 6298. Samples
+    must only be taken from packets that were not retransmitted.
+    """
+    ALPHA   = 1/8
+    BETA    = 1/4
+    K       = 4
+
+    # The clock granularity, and the bounds of the
+    # retransmission timeout, in seconds
+    G       = 0.01
+    RTO_MIN = 0.2
+    RTO_MAX = 60.0
+
+    def __init__(self):
+        self.srtt   = None
+        self.rttvar = None
+        self.rto    = None
+
+    def sample(self, rtt):
+        if self.srtt == None:
+            self.srtt   = rtt
+            self.rttvar = rtt/2
+        else:
+            self.rttvar = (1-RTTEstimator.BETA)*self.rttvar + RTTEstimator.BETA*abs(self.srtt-rtt)
+            self.srtt   = (1-RTTEstimator.ALPHA)*self.srtt + RTTEstimator.ALPHA*rtt
+
+        self.rto = min(RTTEstimator.RTO_MAX, max(RTTEstimator.RTO_MIN, self.srtt+max(RTTEstimator.G, RTTEstimator.K*self.rttvar)))
+
+    def timeout(self, tries):
+        """
+        :returns: The retransmission timeout for a packet sent *tries* times, backed off exponentially, or *None* if no samples were taken yet.
+        """
+        if self.rto == None:
+            return None
+        return min(RTTEstimator.RTO_MAX, self.rto*pow(2, tries-1))
+
+
+class ChannelControl():
+    """
+    Base class for channel congestion controllers. A controller is
+    attached to each channel, and sets the number of packets it
+    keeps in flight in ``channel.window``, between ``window_min``
+    and ``window_max``. The channel reports deliveries, with a
+    round-trip time sample for packets that were not retransmitted,
+    and timeouts to the controller.
+
+    Subclasses implement ``delivered`` and ``timeout``. They may use
+    ``self.clock`` for timekeeping, which can be replaced to run a
+    controller in virtual time.
+
+    Controllers with ``uses_rto`` set have their packets time out
+    after the RFC 6298 retransmission timeout, once round-trip times
+    have been measured on the channel. Others keep the timeouts the
+    channel estimates from the link round-trip time.
+    """
+    NAME     = None
+    uses_rto = True
+
+    def __init__(self, channel):
+        self.channel   = channel
+        self.clock     = time.time
+        self.estimator = RTTEstimator()
+
+    def sample(self, rtt):
+        self.estimator.sample(rtt)
+
+    def retransmission_timeout(self, tries):
+        """
+        :returns: The timeout for a packet sent *tries* times, or *None* if the round-trip time is not yet known.
+        """
+        return self.estimator.timeout(tries)
+
+    def delivered(self, rtt):
+        """
+        Called when a packet sent on the channel was delivered.
+
+        :param rtt: The round-trip time of the packet in seconds, or *None* if it was retransmitted.
+        """
+        pass
+
+    def timeout(self):
+        """
+        Called when a packet sent on the channel timed out, and is retried.
+        """
+        pass
+
+    def set_window(self, window):
+        channel = self.channel
+        channel.window = max(channel.window_min, min(channel.window_max, int(window)))
+
+
+class ClassicChannelControl(ChannelControl):
+    """
+    The original Reticulum channel window adaptation. The window grows
+    by one packet per delivery up to a maximum, which is raised after
+    a number of deliveries at medium and fast round-trip times, and
+    shrinks by one packet per timeout.
+    """
+    NAME     = CLASSIC
+    uses_rto = False
+
+    def delivered(self, rtt):
+        channel = self.channel
+        if channel.window < channel.window_max:
+            channel.window += 1
+
+        if channel._outlet.rtt != 0:
+            if channel._outlet.rtt > RNS.Channel.Channel.RTT_FAST:
+                channel.fast_rate_rounds = 0
+
+                if channel._outlet.rtt > RNS.Channel.Channel.RTT_MEDIUM:
+                    channel.medium_rate_rounds = 0
+
+                else:
+                    channel.medium_rate_rounds += 1
+                    if channel.window_max < RNS.Channel.Channel.WINDOW_MAX_MEDIUM and channel.medium_rate_rounds == RNS.Channel.Channel.FAST_RATE_THRESHOLD:
+                        channel.window_max = RNS.Channel.Channel.WINDOW_MAX_MEDIUM
+                        channel.window_min = RNS.Channel.Channel.WINDOW_MIN_LIMIT_MEDIUM
+
+            else:
+                channel.fast_rate_rounds += 1
+                if channel.window_max < RNS.Channel.Channel.WINDOW_MAX_FAST and channel.fast_rate_rounds == RNS.Channel.Channel.FAST_RATE_THRESHOLD:
+                    channel.window_max = RNS.Channel.Channel.WINDOW_MAX_FAST
+                    channel.window_min = RNS.Channel.Channel.WINDOW_MIN_LIMIT_FAST
+
+    def timeout(self):
+        channel = self.channel
+        if channel.window > channel.window_min:
+            channel.window -= 1
+
+            if channel.window_max > (channel.window_min+channel.window_flexibility):
+                channel.window_max -= 1
+
+
+class VegasChannelControl(ChannelControl):
+    """
+    A delay-based controller modelled on TCP Vegas. It compares the
+    round-trip times measured in each round with the lowest one seen
+    recently, to estimate how many packets are queued on the path.
+    The window grows while fewer than ``ALPHA`` packets are queued,
+    and shrinks when more than ``BETA`` are, which keeps the queues
+    on shared interfaces short without leaving the path idle.
+
+    While no queueing is detected after the channel is opened, the
+    window grows by one packet per delivery, doubling it every round.
+    On radio links, loss is often unrelated to congestion, which
+    shows as delay first. Timeouts therefore only reduce the window,
+    by ``LOSS_BACKOFF`` and at most once per round, when packets were
+    queueing on the path as they were lost.
+    """
+    NAME = VEGAS
+
+    ALPHA = 1
+    BETA  = 3
+    GAMMA = 1
+
+    # The lowest round-trip time is kept for each
+    # interval of this many seconds, and the lowest
+    # of the last BASE_HISTORY intervals is used,
+    # so changes in the path are eventually seen.
+    BASE_INTERVAL = 60.0
+    BASE_HISTORY  = 10
+
+    LOSS_BACKOFF = 0.75
+
+    def __init__(self, channel):
+        super().__init__(channel)
+        self.base_history   = []
+        self.base_rtt       = None
+        self.round_rtt      = None
+        self.round_end      = None
+        self.queueing       = 0
+        self.backed_off     = False
+        self.slow_start     = True
+        self.cwnd           = channel.window
+        channel.window_max  = RNS.Channel.Channel.WINDOW_MAX
+
+    def queued(self, rtt):
+        """
+        :returns: The estimated number of packets queued on the path while a packet with *rtt* was in flight.
+        """
+        return self.cwnd*(1-self.base_rtt/rtt)
+
+    def delivered(self, rtt):
+        if rtt == None or rtt <= 0:
+            return
+
+        now = self.clock()
+        interval = int(now//VegasChannelControl.BASE_INTERVAL)
+        if len(self.base_history) == 0 or self.base_history[-1][0] != interval:
+            self.base_history.append([interval, rtt])
+            if len(self.base_history) > VegasChannelControl.BASE_HISTORY:
+                self.base_history.pop(0)
+        elif rtt < self.base_history[-1][1]:
+            self.base_history[-1][1] = rtt
+        self.base_rtt = min([minimum for _, minimum in self.base_history])
+        self.queueing = self.queued(rtt)
+
+        if self.round_rtt == None or rtt < self.round_rtt:
+            self.round_rtt = rtt
+
+        if self.slow_start:
+            if self.queueing > VegasChannelControl.GAMMA:
+                self.slow_start = False
+            else:
+                self.cwnd = min(self.cwnd+1, self.channel.window_max)
+
+        if self.round_end == None:
+            self.round_end = now+rtt
+
+        elif now >= self.round_end:
+            # The window is adjusted once per round, using
+            # the lowest round-trip time measured in it, to
+            # filter out delays not caused by queueing.
+            if not self.slow_start:
+                queued = self.queued(self.round_rtt)
+                if queued < VegasChannelControl.ALPHA:
+                    self.cwnd += 1
+                elif queued > VegasChannelControl.BETA:
+                    self.cwnd -= 1
+
+            self.round_rtt = None
+            self.round_end = now+rtt
+            self.backed_off = False
+
+        self.cwnd = max(self.channel.window_min, min(self.channel.window_max, self.cwnd))
+        self.set_window(self.cwnd)
+
+    def timeout(self):
+        self.slow_start = False
+        if self.queueing > VegasChannelControl.BETA and not self.backed_off:
+            self.backed_off = True
+            self.cwnd = max(self.channel.window_min, self.cwnd*VegasChannelControl.LOSS_BACKOFF)
+            self.set_window(self.cwnd)
+
+
+channel_controllers = {
+    CLASSIC: ClassicChannelControl,
+    VEGAS:   VegasChannelControl,
+}
+
+def register_channel(name, controller_class):
+    """
+    Registers a channel congestion controller class, making it
+    selectable with :func:`RNS.Link.set_channel_congestion_control`.
+    """
+    if not issubclass(controller_class, ChannelControl):
+        raise TypeError("Channel congestion controllers must be subclasses of ChannelControl")
+    channel_controllers[name] = controller_class
+
+def create_channel(channel, name=None):
+    """
+    :returns: A new congestion controller instance for *channel*, using the algorithm *name*, or the default one.
+    """
+    if name == None:
+        name = DEFAULT
+    return channel_controllers[name](channel)
@@ -0,0 +1,204 @@
+# MIT License
+#
+# Copyright (c) 2016-2023 Mark Qvist / unsigned.io and contributors.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import RNS
+import os
+import threading
+from collections import OrderedDict
+
+class ContentStore:
+    """
+    A content-addressed store of received resource segments. Segments
+    of resources whose hash is derived from their data, such as
+    cacheable and resumable resources, are kept here once received,
+    keyed by their resource hash. When the same content is advertised
+    again, it is taken from the store, and the transfer is proven to
+    the sender without any parts being requested.
+
+    The store is limited to a quota of disk space, configured with the
+    ``content_store_size`` option, and evicts the least recently used
+    content first. It is disabled when the quota is zero.
+    """
+    DEFAULT_QUOTA = 0
+    CHUNK_SIZE    = 256*1024
+
+    path    = None
+    quota   = DEFAULT_QUOTA
+    used    = 0
+    entries = OrderedDict()
+    storing = set()
+    lock    = threading.Lock()
+
+    @staticmethod
+    def start(path, quota=DEFAULT_QUOTA):
+        """
+        Loads the store from *path*, ordering existing
+        content by the time it was last used.
+        """
+        with ContentStore.lock:
+            ContentStore.path = path
+            ContentStore.entries = OrderedDict()
+            ContentStore.used = 0
+
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+            found = []
+            for filename in os.listdir(path):
+                filepath = path+"/"+filename
+                if len(filename) == (RNS.Identity.HASHLENGTH//8)*2:
+                    try:
+                        found.append((os.path.getmtime(filepath), bytes.fromhex(filename), os.path.getsize(filepath)))
+                    except Exception as e:
+                        RNS.log("Could not load "+str(filepath)+" into content store: "+str(e), RNS.LOG_ERROR)
+                elif filename.endswith(".tmp"):
+                    os.unlink(filepath)
+
+            for mtime, resource_hash, size in sorted(found):
+                ContentStore.entries[resource_hash] = size
+                ContentStore.used += size
+
+        ContentStore.set_quota(quota)
+
+    @staticmethod
+    def set_quota(quota):
+        """
+        Sets the disk space the store may use, in bytes, evicting
+        the least recently used content until it fits.
+
+        :param quota: The quota in bytes. Zero disables the store.
+        :raises: *TypeError* if the quota is not a non-negative integer.
+        """
+        if not isinstance(quota, int) or quota < 0:
+            raise TypeError("Content store quota must be a non-negative integer")
+
+        with ContentStore.lock:
+            ContentStore.quota = quota
+            ContentStore.__evict(0)
+
+    @staticmethod
+    def enabled():
+        return ContentStore.path != None and ContentStore.quota > 0
+
+    @staticmethod
+    def get(resource_hash):
+        """
+        :returns: The path of the stored content for *resource_hash*, or *None* if it is not held.
+        """
+        with ContentStore.lock:
+            if not resource_hash in ContentStore.entries:
+                return None
+
+            ContentStore.entries.move_to_end(resource_hash)
+            filepath = ContentStore.__filepath(resource_hash)
+            try:
+                # The modification time persists the usage order
+                os.utime(filepath)
+                return filepath
+            except Exception as e:
+                ContentStore.used -= ContentStore.entries.pop(resource_hash)
+                return None
+
+    @staticmethod
+    def store(resource_hash, source_path, offset, length):
+        """
+        Copies *length* bytes from *offset* of the file at *source_path*
+        into the store, as the content of *resource_hash*.
+
+        :returns: *True* if the content was stored, otherwise *False*.
+        """
+        if not ContentStore.enabled() or length > ContentStore.quota:
+            return False
+
+        with ContentStore.lock:
+            if resource_hash in ContentStore.entries:
+                ContentStore.entries.move_to_end(resource_hash)
+                return True
+            if resource_hash in ContentStore.storing:
+                # The same content is being copied in
+                # by another thread already
+                return False
+            ContentStore.storing.add(resource_hash)
+            ContentStore.__evict(length)
+
+        filepath = ContentStore.__filepath(resource_hash)
+        try:
+            with open(source_path, "rb") as source, open(filepath+".tmp", "wb") as target:
+                source.seek(offset)
+                remaining = length
+                while remaining > 0:
+                    chunk = source.read(min(ContentStore.CHUNK_SIZE, remaining))
+                    if len(chunk) == 0:
+                        raise IOError("Source file ended before the content was copied")
+                    target.write(chunk)
+                    remaining -= len(chunk)
+            os.replace(filepath+".tmp", filepath)
+
+        except Exception as e:
+            RNS.log("Could not add "+RNS.prettyhexrep(resource_hash)+" to content store: "+str(e), RNS.LOG_ERROR)
+            if os.path.isfile(filepath+".tmp"):
+                os.unlink(filepath+".tmp")
+            with ContentStore.lock:
+                ContentStore.storing.discard(resource_hash)
+            return False
+
+        with ContentStore.lock:
+            ContentStore.storing.discard(resource_hash)
+            # The store may have been restarted while the
+            # content was copied, so the entry is checked
+            # again before it is accounted for.
+            if resource_hash in ContentStore.entries:
+                ContentStore.entries.move_to_end(resource_hash)
+            else:
+                ContentStore.entries[resource_hash] = length
+                ContentStore.used += length
+            ContentStore.__evict(0)
+
+        RNS.log("Added "+RNS.prettysize(length)+" of content for "+RNS.prettyhexrep(resource_hash)+" to content store", RNS.LOG_DEBUG)
+        return True
+
+    @staticmethod
+    def remove(resource_hash):
+        with ContentStore.lock:
+            if resource_hash in ContentStore.entries:
+                ContentStore.used -= ContentStore.entries.pop(resource_hash)
+                ContentStore.__unlink(resource_hash)
+
+    @staticmethod
+    def __filepath(resource_hash):
+        return ContentStore.path+"/"+resource_hash.hex()
+
+    @staticmethod
+    def __unlink(resource_hash):
+        try:
+            os.unlink(ContentStore.__filepath(resource_hash))
+        except Exception as e:
+            RNS.log("Could not remove "+RNS.prettyhexrep(resource_hash)+" from content store: "+str(e), RNS.LOG_ERROR)
+
+    @staticmethod
+    def __evict(needed):
+        # Removes the least recently used content until
+        # the needed space is available within the quota.
+        while len(ContentStore.entries) > 0 and ContentStore.used+needed > ContentStore.quota:
+            resource_hash, size = ContentStore.entries.popitem(last=False)
+            ContentStore.used -= size
+            ContentStore.__unlink(resource_hash)
@@ -23,10 +23,9 @@
 import RNS.Cryptography.Provider as cp
 import RNS.vendor.platformutils as pu
 
-if cp.PROVIDER == cp.PROVIDER_INTERNAL:
-    from .aes import AES
-    
-elif cp.PROVIDER == cp.PROVIDER_PYCA:
+from .aes import AES
+
+if cp.use_pyca:
     from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
     if pu.cryptography_old_api():
@@ -37,32 +36,72 @@ class AES_128_CBC:
 
     @staticmethod
     def encrypt(plaintext, key, iv):
-        if cp.PROVIDER == cp.PROVIDER_INTERNAL:
-            cipher = AES(key)
-            return cipher.encrypt(plaintext, iv)
-
-        elif cp.PROVIDER == cp.PROVIDER_PYCA:
-            if not pu.cryptography_old_api():
-                cipher = Cipher(algorithms.AES(key), modes.CBC(iv))
-            else:
-                cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-            
-            encryptor = cipher.encryptor()
-            ciphertext = encryptor.update(plaintext) + encryptor.finalize()
-            return ciphertext
+        return cp.implementation(cp.AES_CBC).encrypt(plaintext, key, iv)
+
+    @staticmethod
+    def decrypt(ciphertext, key, iv):
+        return cp.implementation(cp.AES_CBC).decrypt(ciphertext, key, iv)
+
+    @staticmethod
+    def context(key):
+        """
+        Returns a cipher context for *key* from the active provider,
+        with ``encrypt(plaintext, iv)`` and ``decrypt(ciphertext, iv)``
+        methods. The key schedule is only set up once per context.
+        """
+        return cp.implementation(cp.AES_CBC).context(key)
+
+
+class AES_CBC_Internal:
+
+    @staticmethod
+    def encrypt(plaintext, key, iv):
+        cipher = AES(key)
+        return cipher.encrypt(plaintext, iv)
+
+    @staticmethod
+    def decrypt(ciphertext, key, iv):
+        cipher = AES(key)
+        return cipher.decrypt(ciphertext, iv)
+
+    @staticmethod
+    def context(key):
+        return AES(key)
+
+
+class AES_CBC_PyCA:
+
+    class Context:
+        def __init__(self, key):
+            self.algorithm = algorithms.AES(key)
+
+        def encrypt(self, plaintext, iv):
+            encryptor = AES_CBC_PyCA._cipher(self.algorithm, iv).encryptor()
+            return encryptor.update(plaintext) + encryptor.finalize()
+
+        def decrypt(self, ciphertext, iv):
+            decryptor = AES_CBC_PyCA._cipher(self.algorithm, iv).decryptor()
+            return decryptor.update(ciphertext) + decryptor.finalize()
+
+    @staticmethod
+    def context(key):
+        return AES_CBC_PyCA.Context(key)
+
+    @staticmethod
+    def _cipher(algorithm, iv):
+        if not pu.cryptography_old_api():
+            return Cipher(algorithm, modes.CBC(iv))
+        else:
+            return Cipher(algorithm, modes.CBC(iv), backend=default_backend())
+
+    @staticmethod
+    def encrypt(plaintext, key, iv):
+        encryptor = AES_CBC_PyCA._cipher(algorithms.AES(key), iv).encryptor()
+        ciphertext = encryptor.update(plaintext) + encryptor.finalize()
+        return ciphertext
 
     @staticmethod
     def decrypt(ciphertext, key, iv):
-        if cp.PROVIDER == cp.PROVIDER_INTERNAL:
-            cipher = AES(key)
-            return cipher.decrypt(ciphertext, iv)
-
-        elif cp.PROVIDER == cp.PROVIDER_PYCA:
-            if not pu.cryptography_old_api():
-                cipher = Cipher(algorithms.AES(key), modes.CBC(iv))
-            else:
-                cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-
-            decryptor = cipher.decryptor()
-            plaintext = decryptor.update(ciphertext) + decryptor.finalize()
-            return plaintext
+        decryptor = AES_CBC_PyCA._cipher(algorithms.AES(key), iv).decryptor()
+        plaintext = decryptor.update(ciphertext) + decryptor.finalize()
+        return plaintext
@@ -39,3 +39,17 @@ class Ed25519PublicKey:
 
     def verify(self, signature, message):
         self.vk.verify(signature, message)
+
+    @staticmethod
+    def verify_batch(batch):
+        # Takes a list of (public key, signature, message)
+        # tuples, and returns the indices of the tuples
+        # that failed verification.
+        return ed25519.verify_batch([(Ed25519PublicKey._vk(public_key), signature, message) for public_key, signature, message in batch])
+
+    @staticmethod
+    def _vk(public_key):
+        if isinstance(public_key, Ed25519PublicKey):
+            return public_key.vk
+        else:
+            return ed25519.VerifyingKey(public_key.public_bytes())
@@ -23,12 +23,24 @@
 import hashlib
 from math import ceil
 from RNS.Cryptography import HMAC
+import RNS.Cryptography.Provider as cp
+import RNS.vendor.platformutils as pu
+
+if cp.use_pyca:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+    if pu.cryptography_old_api():
+        from cryptography.hazmat.backends import default_backend
+
+HASH_LEN = 32
 
 def hkdf(length=None, derive_from=None, salt=None, context=None):
-    hash_len = 32
+    return cp.implementation(cp.HKDF)(length=length, derive_from=derive_from, salt=salt, context=context)
 
-    def hmac_sha256(key, data):
-        return HMAC.new(key, data).digest()
+def hkdf_internal(length=None, derive_from=None, salt=None, context=None):
+    hash_len = HASH_LEN
+    hmac_sha256 = HMAC.hmac_sha256
 
     if length == None or length < 1:
         raise ValueError("Invalid output key length")
@@ -52,3 +64,30 @@ def hkdf(length=None, derive_from=None, salt=None, context=None):
         derived += block
 
     return derived[:length]
+
+
+def hkdf_pyca(length=None, derive_from=None, salt=None, context=None):
+    # RFC 5869 limits output to 255 blocks. The internal
+    # implementation wraps the block counter instead, so
+    # longer outputs are always derived internally.
+    if length != None and length > 255*HASH_LEN:
+        return hkdf_internal(length, derive_from, salt, context)
+
+    if length == None or length < 1:
+        raise ValueError("Invalid output key length")
+
+    if derive_from == None or derive_from == "":
+        raise ValueError("Cannot derive key from empty input material")
+
+    if salt == None or len(salt) == 0:
+        salt = bytes([0] * HASH_LEN)
+
+    if context == None:
+        context = b""
+
+    if not pu.cryptography_old_api():
+        kdf = HKDF(algorithm=hashes.SHA256(), length=length, salt=salt, info=context)
+    else:
+        kdf = HKDF(algorithm=hashes.SHA256(), length=length, salt=salt, info=context, backend=default_backend())
+
+    return kdf.derive(derive_from)
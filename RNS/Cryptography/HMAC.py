@@ -5,6 +5,8 @@
 
 import warnings as _warnings
 import hashlib as _hashlib
+import hmac as _stdlib_hmac
+import RNS.Cryptography.Provider as cp
 
 trans_5C = bytes((x ^ 0x5C) for x in range(256))
 trans_36 = bytes((x ^ 0x36) for x in range(256))
@@ -180,4 +182,67 @@ def digest(key, msg, digest):
     outer.update(key.translate(trans_5C))
     inner.update(msg)
     outer.update(inner.digest())
-    return outer.digest()
\ No newline at end of file
+    return outer.digest()
+
+
+def hmac_sha256(key, msg):
+    """HMAC-SHA256 using the active cryptography provider.
+    key: bytes or buffer, The key for the keyed hash object.
+    msg: bytes or buffer, Input message.
+    """
+    return cp.implementation(cp.HMAC).digest(key, msg)
+
+
+def hmac_sha256_keyed(key):
+    """Returns a function computing HMAC-SHA256 of a message with a fixed
+    key, using the active cryptography provider. The keyed state is set
+    up once and copied for each message.
+    key: bytes or buffer, The key for the keyed hash object.
+    """
+    return cp.implementation(cp.HMAC).keyed(key)
+
+
+def hmac_sha256_stream(key):
+    """Returns an incremental HMAC-SHA256 object with update() and digest()
+    methods, using the active cryptography provider.
+    key: bytes or buffer, The key for the keyed hash object.
+    """
+    return cp.implementation(cp.HMAC).stream(key)
+
+
+class HMAC_SHA256_Stdlib:
+    @staticmethod
+    def digest(key, msg):
+        return _stdlib_hmac.digest(key, msg, "sha256")
+
+    @staticmethod
+    def stream(key):
+        return _stdlib_hmac.new(key, digestmod=_hashlib.sha256)
+
+    @staticmethod
+    def keyed(key):
+        state = _stdlib_hmac.new(key, digestmod=_hashlib.sha256)
+        def mac(msg):
+            h = state.copy()
+            h.update(msg)
+            return h.digest()
+        return mac
+
+
+class HMAC_SHA256_Internal:
+    @staticmethod
+    def digest(key, msg):
+        return new(key, msg).digest()
+
+    @staticmethod
+    def stream(key):
+        return new(key)
+
+    @staticmethod
+    def keyed(key):
+        state = new(key)
+        def mac(msg):
+            h = state.copy()
+            h.update(msg)
+            return h.digest()
+        return mac
@@ -1,4 +1,5 @@
 import importlib
+import RNS.Cryptography.Provider as cp
 if importlib.util.find_spec('hashlib') != None:
     import hashlib
 else:
@@ -16,16 +17,20 @@ else:
 
 """
 The SHA primitives are abstracted here to allow platform-
-aware hardware acceleration in the future. Currently only
-uses Python's internal SHA-256 implementation. All SHA-256
-calls in RNS end up here.
+aware hardware acceleration in the future. SHA-256 is
+dispatched to the active provider, which is normally
+hashlib. All SHA-256 calls in RNS end up here.
 """
 
 def sha256(data):
-    digest = ext_sha256()
-    digest.update(data)
+    return cp.implementation(cp.SHA256)(data)
 
-    return digest.digest()
+def sha256_hasher():
+    """
+    Returns an incremental SHA-256 hash object, for hashing
+    data that is not available all at once.
+    """
+    return ext_sha256()
 
 def sha512(data):
     digest = ext_sha512()
@@ -1,4 +1,6 @@
 import importlib
+import time
+import os
 
 PROVIDER_NONE     = 0x00
 PROVIDER_INTERNAL = 0x01
@@ -29,10 +31,299 @@ if use_pyca:
 else:
     PROVIDER = PROVIDER_INTERNAL
 
+# Cryptographic primitives that can be provided
+# by different implementations. Each primitive
+# is selected independently of the others.
+X25519   = "x25519"
+ED25519  = "ed25519"
+AES_CBC  = "aes_cbc"
+SHA256   = "sha256"
+HMAC     = "hmac"
+HKDF     = "hkdf"
+
+PRIMITIVES     = [X25519, ED25519, AES_CBC, SHA256, HMAC, HKDF]
+
+# Primitives used for every packet on links or
+# authenticated interfaces. A pure-Python provider
+# for any of these will severely limit throughput.
+HOT_PRIMITIVES = [ED25519, AES_CBC, SHA256, HMAC]
+
+# Approximate time spent benchmarking each
+# available provider of a primitive
+BENCHMARK_TIME = 0.05
+
+_registry = {}
+_active   = {}
+_measured = {}
+
+def register(primitive, name, loader, pure_python=False):
+    """
+    Registers a provider for a primitive. Providers are preferred
+    in order of registration, except that native providers are
+    always preferred over pure-Python ones. The *loader* is called
+    once, when the provider is first used, and must return the
+    implementation or raise an exception if it is not available.
+    """
+    if not primitive in _registry:
+        _registry[primitive] = {}
+    _registry[primitive][name] = {"loader": loader, "pure_python": pure_python, "implementation": None, "failed": False}
+
+def _load(primitive, name):
+    entry = _registry[primitive][name]
+    if entry["implementation"] == None and not entry["failed"]:
+        try:
+            entry["implementation"] = entry["loader"]()
+        except Exception as e:
+            entry["failed"] = True
+    return entry["implementation"]
+
+def available(primitive):
+    """
+    :returns: A list of the names of all usable providers for *primitive*.
+    """
+    return [name for name in _registry.get(primitive, {}) if _load(primitive, name) != None]
+
+def default(primitive):
+    names = available(primitive)
+    native = [name for name in names if not _registry[primitive][name]["pure_python"]]
+    if len(native) > 0:
+        return native[0]
+    elif len(names) > 0:
+        return names[0]
+    else:
+        return None
+
+def select(primitive, name):
+    """
+    Selects the provider used for *primitive*. Selection should happen
+    before any keys are created, since key objects from different
+    providers are generally not interchangeable.
+
+    :raises: *ValueError* if the primitive or provider is unknown or unavailable.
+    """
+    if not primitive in _registry:
+        raise ValueError("Unknown cryptographic primitive \""+str(primitive)+"\"")
+    if not name in _registry[primitive]:
+        raise ValueError("Unknown provider \""+str(name)+"\" for "+str(primitive))
+    if _load(primitive, name) == None:
+        raise ValueError("Provider \""+str(name)+"\" for "+str(primitive)+" is not available on this system")
+    _active[primitive] = name
+
+def active(primitive):
+    """
+    :returns: The name of the provider currently used for *primitive*.
+    """
+    if not primitive in _active:
+        _active[primitive] = default(primitive)
+    return _active[primitive]
+
+def implementation(primitive):
+    try:
+        return _registry[primitive][_active[primitive]]["implementation"]
+    except KeyError:
+        return _load(primitive, active(primitive))
+
+def is_pure_python(primitive, name=None):
+    if name == None:
+        name = active(primitive)
+    return _registry[primitive][name]["pure_python"]
+
+def benchmark(primitive, name, duration=BENCHMARK_TIME):
+    """
+    Runs a short microbenchmark of a provider, and records the result.
+
+    :returns: The measured operations per second.
+    """
+    impl = _load(primitive, name)
+    if impl == None:
+        return None
+
+    op = _benchmarks[primitive](impl)
+    ops = 0
+    start = time.time()
+    deadline = start+duration
+    while True:
+        op()
+        ops += 1
+        now = time.time()
+        if now > deadline:
+            break
+
+    rate = ops/max(now-start, 1e-9)
+    _measured[(primitive, name)] = rate
+    return rate
+
+def autoselect(duration=BENCHMARK_TIME, exclude=[]):
+    """
+    Benchmarks all available providers for each primitive not in
+    *exclude*, and selects the fastest one.
+    """
+    for primitive in PRIMITIVES:
+        if not primitive in exclude:
+            names = available(primitive)
+            if len(names) > 1:
+                rates = {}
+                for name in names:
+                    try:
+                        rates[name] = benchmark(primitive, name, duration)
+                    except Exception as e:
+                        pass
+                if len(rates) > 0:
+                    select(primitive, max(rates, key=rates.get))
+            elif len(names) == 1:
+                select(primitive, names[0])
+
+def pure_python_hot_primitives():
+    return [primitive for primitive in HOT_PRIMITIVES if active(primitive) != None and is_pure_python(primitive)]
+
+def status(measure=False):
+    """
+    :param measure: If *True*, active providers that have not been benchmarked yet will be.
+    :returns: A dictionary with the active provider, its measured operations per second, and whether it is pure Python, for each primitive.
+    """
+    providers = {}
+    for primitive in PRIMITIVES:
+        name = active(primitive)
+        if name != None:
+            if measure and not (primitive, name) in _measured:
+                try:
+                    benchmark(primitive, name)
+                except Exception as e:
+                    pass
+
+            providers[primitive] = {
+                "provider": name,
+                "ops": _measured.get((primitive, name), None),
+                "pure_python": is_pure_python(primitive, name),
+                "hot": primitive in HOT_PRIMITIVES,
+                "available": available(primitive),
+            }
+
+    return providers
+
 def backend():
     if PROVIDER == PROVIDER_NONE:
         return "none"
-    elif PROVIDER == PROVIDER_INTERNAL:
+
+    asymmetric = [active(X25519), active(ED25519), active(AES_CBC)]
+    if all(name == "internal" for name in asymmetric):
         return "internal"
-    elif PROVIDER == PROVIDER_PYCA:
-        return "openssl, PyCA "+str(pyca_v)
\ No newline at end of file
+    elif all(name == "pyca" for name in asymmetric):
+        return "openssl, PyCA "+str(pyca_v)
+    else:
+        return "mixed, "+", ".join(primitive+": "+active(primitive) for primitive in PRIMITIVES)
+
+
+# Provider loaders
+def _load_x25519_internal():
+    from RNS.Cryptography.X25519 import X25519PrivateKey, X25519PublicKey
+    return (X25519PrivateKey, X25519PublicKey)
+
+def _load_x25519_pyca():
+    if not use_pyca: raise ImportError("PyCA is not available")
+    from RNS.Cryptography.Proxies import X25519PrivateKeyProxy, X25519PublicKeyProxy
+    return (X25519PrivateKeyProxy, X25519PublicKeyProxy)
+
+def _load_ed25519_internal():
+    from RNS.Cryptography.Ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+    return (Ed25519PrivateKey, Ed25519PublicKey)
+
+def _load_ed25519_pyca():
+    if not use_pyca: raise ImportError("PyCA is not available")
+    from RNS.Cryptography.Proxies import Ed25519PrivateKeyProxy, Ed25519PublicKeyProxy
+    return (Ed25519PrivateKeyProxy, Ed25519PublicKeyProxy)
+
+def _load_aes_cbc_internal():
+    from RNS.Cryptography.AES import AES_CBC_Internal
+    return AES_CBC_Internal
+
+def _load_aes_cbc_pyca():
+    if not use_pyca: raise ImportError("PyCA is not available")
+    from RNS.Cryptography.AES import AES_CBC_PyCA
+    return AES_CBC_PyCA
+
+def _load_sha256_hashlib():
+    from hashlib import sha256 as ext_sha256
+    def sha256(data):
+        return ext_sha256(data).digest()
+    return sha256
+
+def _load_sha256_internal():
+    from RNS.Cryptography.SHA256 import sha256 as ext_sha256
+    def sha256(data):
+        digest = ext_sha256()
+        digest.update(data)
+        return digest.digest()
+    return sha256
+
+def _load_hmac_stdlib():
+    from RNS.Cryptography.HMAC import HMAC_SHA256_Stdlib
+    return HMAC_SHA256_Stdlib
+
+def _load_hmac_internal():
+    from RNS.Cryptography.HMAC import HMAC_SHA256_Internal
+    return HMAC_SHA256_Internal
+
+def _load_hkdf_internal():
+    from RNS.Cryptography.HKDF import hkdf_internal
+    return hkdf_internal
+
+def _load_hkdf_pyca():
+    if not use_pyca: raise ImportError("PyCA is not available")
+    from RNS.Cryptography.HKDF import hkdf_pyca
+    return hkdf_pyca
+
+register(X25519,  "pyca",     _load_x25519_pyca)
+register(X25519,  "internal", _load_x25519_internal,  pure_python=True)
+register(ED25519, "pyca",     _load_ed25519_pyca)
+register(ED25519, "internal", _load_ed25519_internal, pure_python=True)
+register(AES_CBC, "pyca",     _load_aes_cbc_pyca)
+register(AES_CBC, "internal", _load_aes_cbc_internal, pure_python=True)
+register(SHA256,  "hashlib",  _load_sha256_hashlib)
+register(SHA256,  "internal", _load_sha256_internal,  pure_python=True)
+register(HMAC,    "stdlib",   _load_hmac_stdlib)
+register(HMAC,    "internal", _load_hmac_internal,    pure_python=True)
+register(HKDF,    "pyca",     _load_hkdf_pyca)
+register(HKDF,    "internal", _load_hkdf_internal)
+
+
+# Microbenchmarks. Each returns a callable
+# performing one typical operation.
+def _bench_x25519(impl):
+    private_key_class, public_key_class = impl
+    prv = private_key_class.generate()
+    peer_pub = public_key_class.from_public_bytes(private_key_class.generate().public_key().public_bytes())
+    return lambda: prv.exchange(peer_pub)
+
+def _bench_ed25519(impl):
+    private_key_class, public_key_class = impl
+    prv = private_key_class.generate()
+    pub = public_key_class.from_public_bytes(prv.public_key().public_bytes())
+    message = os.urandom(128)
+    signature = prv.sign(message)
+    return lambda: pub.verify(signature, message)
+
+def _bench_aes_cbc(impl):
+    key = os.urandom(16); iv = os.urandom(16); plaintext = os.urandom(512)
+    return lambda: impl.encrypt(plaintext, key, iv)
+
+def _bench_sha256(impl):
+    data = os.urandom(512)
+    return lambda: impl(data)
+
+def _bench_hmac(impl):
+    key = os.urandom(16); data = os.urandom(512)
+    return lambda: impl.digest(key, data)
+
+def _bench_hkdf(impl):
+    derive_from = os.urandom(32); salt = os.urandom(16)
+    return lambda: impl(length=64, derive_from=derive_from, salt=salt, context=None)
+
+_benchmarks = {
+    X25519:  _bench_x25519,
+    ED25519: _bench_ed25519,
+    AES_CBC: _bench_aes_cbc,
+    SHA256:  _bench_sha256,
+    HMAC:    _bench_hmac,
+    HKDF:    _bench_hkdf,
+}
@@ -28,6 +28,8 @@ class X25519PrivateKeyProxy:
         return X25519PublicKeyProxy(self.real.public_key())
 
     def exchange(self, peer_public_key):
+        if not isinstance(peer_public_key, X25519PublicKeyProxy):
+            peer_public_key = X25519PublicKeyProxy.from_public_bytes(peer_public_key.public_bytes())
         return self.real.exchange(peer_public_key.real)
 
 
@@ -87,4 +89,17 @@ class Ed25519PublicKeyProxy:
         )
 
     def verify(self, signature, message):
-        self.real.verify(signature, message)
\ No newline at end of file
+        self.real.verify(signature, message)
+
+    @staticmethod
+    def verify_batch(batch):
+        # OpenSSL has no batch verification, so we
+        # simply check each signature in turn.
+        failed = []
+        for i, (public_key, signature, message) in enumerate(batch):
+            try:
+                public_key.verify(signature, message)
+            except Exception as e:
+                failed.append(i)
+
+        return failed
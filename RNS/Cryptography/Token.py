@@ -53,13 +53,19 @@ class Token():
         self._signing_key = key[:16]
         self._encryption_key = key[16:]
 
+        # The keyed HMAC state and the cipher key schedule are
+        # set up once, so long-lived tokens, like the ones used
+        # by established links, do no key setup per packet.
+        self._mac = HMAC.hmac_sha256_keyed(self._signing_key)
+        self._cipher = AES_128_CBC.context(self._encryption_key)
+
 
     def verify_hmac(self, token):
         if len(token) <= 32:
             raise ValueError("Cannot verify HMAC on token of only "+str(len(token))+" bytes")
         else:
             received_hmac = token[-32:]
-            expected_hmac = HMAC.new(self._signing_key, token[:-32]).digest()
+            expected_hmac = self._mac(token[:-32])
 
             if received_hmac == expected_hmac:
                 return True
@@ -67,44 +73,172 @@ class Token():
                 return False
 
 
+    def encryptor(self):
+        """
+        Returns an incremental encryptor, that produces exactly the same
+        token format as :func:`encrypt`, for data that is not available
+        all at once. Pass data to its ``update`` method, and call its
+        ``finalize`` method to obtain the last part of the token.
+        """
+        return TokenEncryptor(self)
+
+
+    def decryptor(self, chain=None):
+        """
+        Returns an incremental decryptor for tokens produced by :func:`encrypt`
+        or an encryptor. Plaintext returned by its ``update`` method is not
+        authenticated until its ``finalize`` method has returned, which raises
+        *ValueError* if the token HMAC was invalid. Any plaintext already
+        processed must be discarded in that case.
+
+        If *chain* is given, decryption resumes in the middle of a token, and
+        the decryptor must be fed the token from the ciphertext block following
+        *chain*, which is the preceding ciphertext block, or the IV. Since the
+        HMAC covers the entire token, it is not verified in this case, and the
+        caller must authenticate the resulting plaintext by other means.
+        """
+        return TokenDecryptor(self, chain=chain)
+
+
     def encrypt(self, data = None):
         iv = os.urandom(16)
-        current_time = int(time.time())
 
         if not isinstance(data, bytes):
             raise TypeError("Token plaintext input must be bytes")
 
-        ciphertext = AES_128_CBC.encrypt(
-            plaintext = PKCS7.pad(data),
-            key = self._encryption_key,
-            iv = iv,
-        )
+        signed_parts = iv+self._cipher.encrypt(PKCS7.pad(data), iv)
 
-        signed_parts = iv+ciphertext
-
-        return signed_parts + HMAC.new(self._signing_key, signed_parts).digest()
+        return signed_parts + self._mac(signed_parts)
 
 
     def decrypt(self, token = None):
         if not isinstance(token, bytes):
             raise TypeError("Token must be bytes")
 
-        if not self.verify_hmac(token):
-            raise ValueError("Token HMAC was invalid")
+        if len(token) <= 32:
+            raise ValueError("Cannot verify HMAC on token of only "+str(len(token))+" bytes")
 
-        iv = token[:16]
-        ciphertext = token[16:-32]
+        signed_parts = token[:-32]
+        if token[-32:] != self._mac(signed_parts):
+            raise ValueError("Token HMAC was invalid")
 
         try:
             plaintext = PKCS7.unpad(
-                AES_128_CBC.decrypt(
-                    ciphertext,
-                    self._encryption_key,
-                    iv,
-                )
+                self._cipher.decrypt(signed_parts[16:], signed_parts[:16])
             )
 
             return plaintext
 
         except Exception as e:
-            raise ValueError("Could not decrypt token")
\ No newline at end of file
+            raise ValueError("Could not decrypt token")
+
+
+class TokenEncryptor():
+    def __init__(self, token):
+        self._cipher  = token._cipher
+        self._mac     = HMAC.hmac_sha256_stream(token._signing_key)
+        self._iv      = os.urandom(16)
+        self._chain   = self._iv
+        self._pending = b""
+        self._started = False
+        self._done    = False
+
+    def update(self, data):
+        if self._done:
+            raise ValueError("Cannot update a finalized token encryptor")
+
+        if not isinstance(data, bytes):
+            raise TypeError("Token plaintext input must be bytes")
+
+        if self._started:
+            output = b""
+        else:
+            output = self._iv
+            self._started = True
+
+        data = self._pending+data
+        full_blocks = len(data)//PKCS7.BLOCKSIZE*PKCS7.BLOCKSIZE
+        if full_blocks > 0:
+            ciphertext = self._cipher.encrypt(data[:full_blocks], self._chain)
+            self._chain = ciphertext[-16:]
+            output += ciphertext
+
+        self._pending = data[full_blocks:]
+        self._mac.update(output)
+        return output
+
+    def finalize(self):
+        output = self.update(b"")
+        ciphertext = self._cipher.encrypt(PKCS7.pad(self._pending), self._chain)
+        self._mac.update(ciphertext)
+        self._pending = b""
+        self._done = True
+
+        return output + ciphertext + self._mac.digest()
+
+
+class TokenDecryptor():
+    # The HMAC and the final, padded block are only known
+    # to be final when the token ends, so this many bytes
+    # are held back until finalize is called.
+    HOLDBACK = 32+16
+
+    def __init__(self, token, chain=None):
+        if chain != None and len(chain) != 16:
+            raise ValueError("Token decryptor chain block must be 16 bytes")
+
+        self._cipher  = token._cipher
+        self._mac     = HMAC.hmac_sha256_stream(token._signing_key) if chain == None else None
+        self._chain   = chain
+        self._pending = b""
+        self._done    = False
+
+    def update(self, data):
+        if self._done:
+            raise ValueError("Cannot update a finalized token decryptor")
+
+        if not isinstance(data, bytes):
+            raise TypeError("Token input must be bytes")
+
+        data = self._pending+data
+        if self._chain == None:
+            if len(data) < 16:
+                self._pending = data
+                return b""
+            self._chain = data[:16]
+            self._mac.update(self._chain)
+            data = data[16:]
+
+        available = max(0, len(data)-TokenDecryptor.HOLDBACK)
+        full_blocks = available//PKCS7.BLOCKSIZE*PKCS7.BLOCKSIZE
+        self._pending = data[full_blocks:]
+        if full_blocks == 0:
+            return b""
+
+        ciphertext = data[:full_blocks]
+        if self._mac != None:
+            self._mac.update(ciphertext)
+        plaintext = self._cipher.decrypt(ciphertext, self._chain)
+        self._chain = ciphertext[-16:]
+        return plaintext
+
+    def finalize(self):
+        if self._done:
+            raise ValueError("Cannot finalize a token decryptor twice")
+        self._done = True
+
+        if self._chain == None or len(self._pending) < 32+PKCS7.BLOCKSIZE or (len(self._pending)-32) % PKCS7.BLOCKSIZE != 0:
+            raise ValueError("Token was truncated or malformed")
+
+        ciphertext = self._pending[:-32]
+        received_hmac = self._pending[-32:]
+        self._pending = b""
+        if self._mac != None:
+            self._mac.update(ciphertext)
+            if received_hmac != self._mac.digest():
+                raise ValueError("Token HMAC was invalid")
+
+        try:
+            return PKCS7.unpad(self._cipher.decrypt(ciphertext, self._chain))
+        except Exception as e:
+            raise ValueError("Could not decrypt token")
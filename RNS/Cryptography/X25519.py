@@ -136,6 +136,8 @@ class X25519PrivateKey:
     def exchange(self, peer_public_key):
         if isinstance(peer_public_key, bytes):
             peer_public_key = X25519PublicKey.from_public_bytes(peer_public_key)
+        elif not isinstance(peer_public_key, X25519PublicKey):
+            peer_public_key = X25519PublicKey.from_public_bytes(peer_public_key.public_bytes())
 
         start = time.time()
         
@@ -10,15 +10,44 @@ from .Provider import backend
 
 import RNS.Cryptography.Provider as cp
 
-if cp.PROVIDER == cp.PROVIDER_INTERNAL:
-    from RNS.Cryptography.X25519 import X25519PrivateKey, X25519PublicKey
-    from RNS.Cryptography.Ed25519 import Ed25519PrivateKey, Ed25519PublicKey
-
-elif cp.PROVIDER == cp.PROVIDER_PYCA:
-    from RNS.Cryptography.Proxies import X25519PrivateKeyProxy as X25519PrivateKey
-    from RNS.Cryptography.Proxies import X25519PublicKeyProxy as X25519PublicKey
-    from RNS.Cryptography.Proxies import Ed25519PrivateKeyProxy as Ed25519PrivateKey
-    from RNS.Cryptography.Proxies import Ed25519PublicKeyProxy as Ed25519PublicKey
+# The key classes below dispatch to whichever provider
+# is currently selected for each primitive, and return
+# key objects created by that provider.
+
+class X25519PrivateKey:
+    @staticmethod
+    def generate():
+        return cp.implementation(cp.X25519)[0].generate()
+
+    @staticmethod
+    def from_private_bytes(data):
+        return cp.implementation(cp.X25519)[0].from_private_bytes(data)
+
+
+class X25519PublicKey:
+    @staticmethod
+    def from_public_bytes(data):
+        return cp.implementation(cp.X25519)[1].from_public_bytes(data)
+
+
+class Ed25519PrivateKey:
+    @staticmethod
+    def generate():
+        return cp.implementation(cp.ED25519)[0].generate()
+
+    @staticmethod
+    def from_private_bytes(data):
+        return cp.implementation(cp.ED25519)[0].from_private_bytes(data)
+
+
+class Ed25519PublicKey:
+    @staticmethod
+    def from_public_bytes(data):
+        return cp.implementation(cp.ED25519)[1].from_public_bytes(data)
+
+    @staticmethod
+    def verify_batch(batch):
+        return cp.implementation(cp.ED25519)[1].verify_batch(batch)
 
 py_modules  = glob.glob(os.path.dirname(__file__)+"/*.py")
 pyc_modules = glob.glob(os.path.dirname(__file__)+"/*.pyc")
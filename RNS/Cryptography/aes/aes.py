@@ -20,14 +20,25 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import struct
+import threading
+from collections import OrderedDict
+
 from .utils import *
 
 
 class AES:
-    # AES-128 block size
+    # AES block size
     block_size = 16
-    # AES-128 encrypts messages with 10 rounds
-    _rounds = 10
+    # Number of rounds for each supported key size
+    _key_rounds = {16: 10, 24: 12, 32: 14}
+
+    # Expanded keys are cached by key bytes, since
+    # the same key is normally used for many calls,
+    # for example all packets on an established link.
+    KEY_CACHE_SIZE = 256
+    _key_cache = OrderedDict()
+    _key_cache_lock = threading.Lock()
 
 
     # initiate the AES objecy
@@ -36,48 +47,101 @@ class AES:
         Initializes the object with a given key.
         """
         # make sure key length is right
-        assert len(key) == AES.block_size
+        assert len(key) in AES._key_rounds
+        self._rounds = AES._key_rounds[len(key)]
 
         # ExpandKey
-        self._round_keys = self._expand_key(key)
+        key = bytes(key)
+        with AES._key_cache_lock:
+            round_keys = AES._key_cache.get(key)
+            if round_keys != None:
+                AES._key_cache.move_to_end(key)
+
+        if round_keys == None:
+            round_keys = self._expand_key(key)
+            with AES._key_cache_lock:
+                AES._key_cache[key] = round_keys
+                while len(AES._key_cache) > AES.KEY_CACHE_SIZE:
+                    AES._key_cache.popitem(last=False)
+
+        self._enc_keys, self._dec_keys = round_keys
 
 
     # will perform the AES ExpandKey phase
     def _expand_key(self, master_key):
         """
-        Expands and returns a list of key matrices for the given master_key.
+        Expands the master_key, and returns a tuple of the encryption
+        round keys and the decryption round keys, each as a flat tuple
+        of 32-bit words.
         """
-
-        # Initialize round keys with raw key material.
-        key_columns = bytes2matrix(master_key)
-        iteration_size = len(master_key) // 4
-
-        # Each iteration has exactly as many columns as the key material.
-        i = 1
-        while len(key_columns) < (self._rounds + 1) * 4:
-            # Copy previous word.
-            word = list(key_columns[-1])
-
-            # Perform schedule_core once every "row".
-            if len(key_columns) % iteration_size == 0:
-                # Circular shift.
-                word.append(word.pop(0))
-                # Map to S-BOX.
-                word = [s_box[b] for b in word]
-                # XOR with first byte of R-CON, since the others bytes of R-CON are 0.
-                word[0] ^= r_con[i]
-                i += 1
-            elif len(master_key) == 32 and len(key_columns) % iteration_size == 4:
-                # Run word through S-box in the fourth iteration when using a
-                # 256-bit key.
-                word = [s_box[b] for b in word]
-
-            # XOR with equivalent word from previous iteration.
-            word = bytes(i^j for i, j in zip(word, key_columns[-iteration_size]))
-            key_columns.append(word)
-
-        # Group key words in 4x4 byte matrices.
-        return [key_columns[4*i : 4*(i+1)] for i in range(len(key_columns) // 4)]
+        nk = len(master_key) // 4
+        total = 4 * (self._rounds + 1)
+        words = list(struct.unpack(">"+str(nk)+"I", master_key))
+
+        for i in range(nk, total):
+            word = words[i-1]
+            if i % nk == 0:
+                # RotWord, SubWord and XOR with R-CON
+                word = (s_box_24[(word >> 16) & 0xFF] | s_box_16[(word >> 8) & 0xFF] |
+                        s_box_8[word & 0xFF] | s_box[word >> 24]) ^ (r_con[i // nk] << 24)
+            elif nk > 6 and i % nk == 4:
+                # SubWord in the fourth iteration when using a 256-bit key
+                word = (s_box_24[word >> 24] | s_box_16[(word >> 16) & 0xFF] |
+                        s_box_8[(word >> 8) & 0xFF] | s_box[word & 0xFF])
+            words.append(words[i-nk] ^ word)
+
+        # The decryption keys are used in reverse round order, and
+        # for the equivalent inverse cipher, InvMixColumns is applied
+        # to all but the first and last round keys.
+        dec_keys = []
+        for r in range(self._rounds, -1, -1):
+            for word in words[4*r:4*r+4]:
+                if r != 0 and r != self._rounds:
+                    word = (td0[s_box[word >> 24]] ^ td1[s_box[(word >> 16) & 0xFF]] ^
+                            td2[s_box[(word >> 8) & 0xFF]] ^ td3[s_box[word & 0xFF]])
+                dec_keys.append(word)
+
+        return tuple(words), tuple(dec_keys)
+
+
+    def _encrypt_words(self, s0, s1, s2, s3):
+        rk = self._enc_keys
+        s0 ^= rk[0]; s1 ^= rk[1]; s2 ^= rk[2]; s3 ^= rk[3]
+
+        k = 4
+        for _ in range(self._rounds - 1):
+            t0 = te0[s0 >> 24] ^ te1[(s1 >> 16) & 0xFF] ^ te2[(s2 >> 8) & 0xFF] ^ te3[s3 & 0xFF] ^ rk[k]
+            t1 = te0[s1 >> 24] ^ te1[(s2 >> 16) & 0xFF] ^ te2[(s3 >> 8) & 0xFF] ^ te3[s0 & 0xFF] ^ rk[k+1]
+            t2 = te0[s2 >> 24] ^ te1[(s3 >> 16) & 0xFF] ^ te2[(s0 >> 8) & 0xFF] ^ te3[s1 & 0xFF] ^ rk[k+2]
+            s3 = te0[s3 >> 24] ^ te1[(s0 >> 16) & 0xFF] ^ te2[(s1 >> 8) & 0xFF] ^ te3[s2 & 0xFF] ^ rk[k+3]
+            s0 = t0; s1 = t1; s2 = t2
+            k += 4
+
+        # last round, without MixColumns
+        return ((s_box_24[s0 >> 24] | s_box_16[(s1 >> 16) & 0xFF] | s_box_8[(s2 >> 8) & 0xFF] | s_box[s3 & 0xFF]) ^ rk[k],
+                (s_box_24[s1 >> 24] | s_box_16[(s2 >> 16) & 0xFF] | s_box_8[(s3 >> 8) & 0xFF] | s_box[s0 & 0xFF]) ^ rk[k+1],
+                (s_box_24[s2 >> 24] | s_box_16[(s3 >> 16) & 0xFF] | s_box_8[(s0 >> 8) & 0xFF] | s_box[s1 & 0xFF]) ^ rk[k+2],
+                (s_box_24[s3 >> 24] | s_box_16[(s0 >> 16) & 0xFF] | s_box_8[(s1 >> 8) & 0xFF] | s_box[s2 & 0xFF]) ^ rk[k+3])
+
+
+    def _decrypt_words(self, s0, s1, s2, s3):
+        rk = self._dec_keys
+        s0 ^= rk[0]; s1 ^= rk[1]; s2 ^= rk[2]; s3 ^= rk[3]
+
+        k = 4
+        for _ in range(self._rounds - 1):
+            t0 = td0[s0 >> 24] ^ td1[(s3 >> 16) & 0xFF] ^ td2[(s2 >> 8) & 0xFF] ^ td3[s1 & 0xFF] ^ rk[k]
+            t1 = td0[s1 >> 24] ^ td1[(s0 >> 16) & 0xFF] ^ td2[(s3 >> 8) & 0xFF] ^ td3[s2 & 0xFF] ^ rk[k+1]
+            t2 = td0[s2 >> 24] ^ td1[(s1 >> 16) & 0xFF] ^ td2[(s0 >> 8) & 0xFF] ^ td3[s3 & 0xFF] ^ rk[k+2]
+            s3 = td0[s3 >> 24] ^ td1[(s2 >> 16) & 0xFF] ^ td2[(s1 >> 8) & 0xFF] ^ td3[s0 & 0xFF] ^ rk[k+3]
+            s0 = t0; s1 = t1; s2 = t2
+            k += 4
+
+        # last round, without InvMixColumns
+        return ((inv_s_box_24[s0 >> 24] | inv_s_box_16[(s3 >> 16) & 0xFF] | inv_s_box_8[(s2 >> 8) & 0xFF] | inv_s_box[s1 & 0xFF]) ^ rk[k],
+                (inv_s_box_24[s1 >> 24] | inv_s_box_16[(s0 >> 16) & 0xFF] | inv_s_box_8[(s3 >> 8) & 0xFF] | inv_s_box[s2 & 0xFF]) ^ rk[k+1],
+                (inv_s_box_24[s2 >> 24] | inv_s_box_16[(s1 >> 16) & 0xFF] | inv_s_box_8[(s0 >> 8) & 0xFF] | inv_s_box[s3 & 0xFF]) ^ rk[k+2],
+                (inv_s_box_24[s3 >> 24] | inv_s_box_16[(s2 >> 16) & 0xFF] | inv_s_box_8[(s1 >> 8) & 0xFF] | inv_s_box[s0 & 0xFF]) ^ rk[k+3])
 
 
     # encrypt a single block of data with AES
@@ -87,31 +151,7 @@ class AES:
         """
         # length of a single block
         assert len(plaintext) == AES.block_size
-
-        # perform on a matrix
-        state = bytes2matrix(plaintext)
-
-        # AddRoundKey
-        add_round_key(state, self._round_keys[0])
-
-        # 9 main rounds
-        for i in range(1, self._rounds):
-            # SubBytes
-            sub_bytes(state)
-            # ShiftRows
-            shift_rows(state)
-            # MixCols
-            mix_columns(state)
-            # AddRoundKey
-            add_round_key(state, self._round_keys[i])
-
-        # last round, w/t AddRoundKey step
-        sub_bytes(state)
-        shift_rows(state)
-        add_round_key(state, self._round_keys[-1])
-
-        # return the encrypted matrix as bytes
-        return matrix2bytes(state)
+        return struct.pack(">4I", *self._encrypt_words(*struct.unpack(">4I", plaintext)))
 
 
     # decrypt a single block of data with AES
@@ -121,79 +161,59 @@ class AES:
         """
         # length of a single block
         assert len(ciphertext) == AES.block_size
-
-        # perform on a matrix
-        state = bytes2matrix(ciphertext)
-
-        # in reverse order, last round is first
-        add_round_key(state, self._round_keys[-1])
-        inv_shift_rows(state)
-        inv_sub_bytes(state)
-
-        for i in range(self._rounds - 1, 0, -1):
-            # nain rounds
-            add_round_key(state, self._round_keys[i])
-            inv_mix_columns(state)
-            inv_shift_rows(state)
-            inv_sub_bytes(state)
-
-        # initial AddRoundKey phase
-        add_round_key(state, self._round_keys[0])
-
-        # return bytes
-        return matrix2bytes(state)
+        return struct.pack(">4I", *self._decrypt_words(*struct.unpack(">4I", ciphertext)))
 
 
     # will encrypt the entire data 
     def encrypt(self, plaintext, iv):
         """
-        Encrypts `plaintext` using CBC mode and PKCS#7 padding, with the given
-        initialization vector (iv).
+        Encrypts `plaintext` using CBC mode, with the given initialization
+        vector (iv). The plaintext must already be padded to the block size.
         """
         # iv length must be same as block size
         assert len(iv) == AES.block_size
 
         assert len(plaintext) % AES.block_size == 0
 
-        ciphertext_blocks = []
-
-        previous = iv
-        for plaintext_block in split_blocks(plaintext):
-            # in CBC mode every block is XOR'd with the previous block
-            xorred = xor_bytes(plaintext_block, previous)
+        # The whole buffer is converted to words at once,
+        # and the output is packed in one go at the end.
+        words = struct.unpack(">"+str(len(plaintext)//4)+"I", plaintext)
+        out = [0] * len(words)
+        encrypt_words = self._encrypt_words
 
-            # encrypt current block
-            block = self._encrypt_block(xorred)
-            previous = block
+        # in CBC mode every block is XOR'd with the previous block
+        c0, c1, c2, c3 = struct.unpack(">4I", iv)
+        for i in range(0, len(words), 4):
+            c0, c1, c2, c3 = encrypt_words(words[i] ^ c0, words[i+1] ^ c1, words[i+2] ^ c2, words[i+3] ^ c3)
+            out[i] = c0; out[i+1] = c1; out[i+2] = c2; out[i+3] = c3
 
-            # append to ciphertext
-            ciphertext_blocks.append(block)
-
-        # return as bytes
-        return b''.join(ciphertext_blocks)
+        return struct.pack(">"+str(len(out))+"I", *out)
 
 
     # will decrypt the entire data 
     def decrypt(self, ciphertext, iv):
         """
-        Decrypts `ciphertext` using CBC mode and PKCS#7 padding, with the given
-        initialization vector (iv).
+        Decrypts `ciphertext` using CBC mode, with the given initialization
+        vector (iv). Padding is not removed.
         """
         # iv length must be same as block size
         assert len(iv) == AES.block_size
 
-        plaintext_blocks = []
+        assert len(ciphertext) % AES.block_size == 0
+
+        words = struct.unpack(">"+str(len(ciphertext)//4)+"I", ciphertext)
+        out = [0] * len(words)
+        decrypt_words = self._decrypt_words
 
-        previous = iv
-        for ciphertext_block in split_blocks(ciphertext):
-            # in CBC mode every block is XOR'd with the previous block
-            xorred = xor_bytes(previous, self._decrypt_block(ciphertext_block))
-            
-            # append plaintext
-            plaintext_blocks.append(xorred)
-            previous = ciphertext_block
+        # in CBC mode every block is XOR'd with the previous block
+        p0, p1, p2, p3 = struct.unpack(">4I", iv)
+        for i in range(0, len(words), 4):
+            c0 = words[i]; c1 = words[i+1]; c2 = words[i+2]; c3 = words[i+3]
+            d0, d1, d2, d3 = decrypt_words(c0, c1, c2, c3)
+            out[i] = d0 ^ p0; out[i+1] = d1 ^ p1; out[i+2] = d2 ^ p2; out[i+3] = d3 ^ p3
+            p0 = c0; p1 = c1; p2 = c2; p3 = c3
 
-        return b''.join(plaintext_blocks)
+        return struct.pack(">"+str(len(out))+"I", *out)
 
 
 def test():
@@ -65,6 +65,43 @@ inv_s_box = (
 )
 
 
+## AES T-tables
+# Each table combines SubBytes and MixColumns for one byte position
+# of a column, so that a full round can be computed with 16 table
+# lookups and XORs on 32-bit big-endian column words. The second set
+# does the same for the inverse cipher. The S-box tables shifted into
+# each byte position are used for the final round.
+def _gmul(a, b):
+    p = 0
+    while b:
+        if b & 1:
+            p ^= a
+        a = ((a << 1) ^ 0x11B) if (a & 0x80) else (a << 1)
+        b >>= 1
+    return p
+
+def _ror8(w):
+    return ((w >> 8) | (w << 24)) & 0xFFFFFFFF
+
+def _build_tables(box, coefficients):
+    t0 = tuple((_gmul(box[x], coefficients[0]) << 24) | (_gmul(box[x], coefficients[1]) << 16) | (_gmul(box[x], coefficients[2]) << 8) | _gmul(box[x], coefficients[3]) for x in range(256))
+    t1 = tuple(_ror8(w) for w in t0)
+    t2 = tuple(_ror8(w) for w in t1)
+    t3 = tuple(_ror8(w) for w in t2)
+    return t0, t1, t2, t3
+
+te0, te1, te2, te3 = _build_tables(s_box, (2, 1, 1, 3))
+td0, td1, td2, td3 = _build_tables(inv_s_box, (14, 9, 13, 11))
+
+s_box_24 = tuple(b << 24 for b in s_box)
+s_box_16 = tuple(b << 16 for b in s_box)
+s_box_8  = tuple(b << 8  for b in s_box)
+
+inv_s_box_24 = tuple(b << 24 for b in inv_s_box)
+inv_s_box_16 = tuple(b << 16 for b in inv_s_box)
+inv_s_box_8  = tuple(b << 8  for b in inv_s_box)
+
+
 ## AES AddRoundKey
 # Round constants https://en.wikipedia.org/wiki/AES_key_schedule#Round_constants
 r_con = (
@@ -131,6 +131,36 @@ def scalarmult_element(pt, n): # extended->extended
     _ = double_element(scalarmult_element(pt, n>>1))
     return _add_elements_nonunfied(_, pt) if n&1 else _
 
+def multiscalarmult_elements(pairs, w=4): # [(extended, n), ...]->extended
+    # Straus' interleaved multi-scalar multiplication. Computes the sum of
+    # n_i*pt_i while sharing the doublings between all terms, which is what
+    # makes batch signature verification cheaper than checking one at a
+    # time. Uses the unified addition, so it tolerates the accumulator
+    # being Zero or equal to a table entry.
+    zero = xform_affine_to_extended((0,1))
+    if len(pairs) == 0:
+        return zero
+    mask = (1<<w)-1
+    tables = []
+    maxbits = 0
+    for pt, n in pairs:
+        assert n >= 0
+        table = [zero, pt]
+        for i in range(2, 1<<w):
+            table.append(add_elements(table[-1], pt))
+        tables.append((table, n))
+        maxbits = max(maxbits, n.bit_length())
+
+    acc = zero
+    for shift in range(((maxbits+w-1)//w)*w - w, -1, -w):
+        for _ in range(w):
+            acc = double_element(acc)
+        for table, n in tables:
+            digit = (n >> shift) & mask
+            if digit:
+                acc = add_elements(acc, table[digit])
+    return acc
+
 # points are encoded as 32-bytes little-endian, b255 is sign, b2b1b0 are 0
 
 def encodepoint(P):
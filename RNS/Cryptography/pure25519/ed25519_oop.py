@@ -23,6 +23,7 @@
 import os
 import base64
 from . import _ed25519
+from . import eddsa
 BadSignatureError = _ed25519.BadSignatureError
 
 def create_keypair(entropy=os.urandom):
@@ -199,6 +200,11 @@ class VerifyingKey(object):
         msg2 = _ed25519.open(sig_and_msg, self.vk_s)
         assert msg2 == msg
 
+def verify_batch(items):
+    """Verify a list of (VerifyingKey, signature, message) tuples at once.
+    Returns a list of the indices of the items that did not verify."""
+    return eddsa.checkvalid_batch([(sig, msg, vk.vk_s) for vk, sig, msg in items])
+
 def selftest():
     message = b"crypto libraries should always test themselves at powerup"
     sk = SigningKey(b"priv0-VIsfn5OFGa09Un2MR6Hm7BQ5++xhcQskU2OGXG8jSJl4cWLZrRrVcSN2gVYMGtZT+3354J5jfmqAcuRSD9KIyg",
@@ -23,8 +23,9 @@
 from RNS.Cryptography.Hashes import sha512
 from .basic import (bytes_to_clamped_scalar,
                     bytes_to_scalar, scalar_to_bytes,
-                    bytes_to_element, Base)
-import hashlib, binascii
+                    bytes_to_element, Base, L,
+                    multiscalarmult_elements, is_extended_zero)
+import hashlib, binascii, os
 
 def H(m):
     return sha512(m)
@@ -63,6 +64,81 @@ def checkvalid(s, m, pk):
     v2 = R.add(A.scalarmult(h))
     return v1==v2
 
+# Decoding a public key includes a full subgroup check, which
+# costs as much as a scalar multiplication. Keys tend to repeat
+# across batches (re-announces, proofs from the same peer), so
+# decoded keys are kept in a small, bounded cache.
+_batch_vk_cache = {}
+_BATCH_VK_CACHE_MAX = 1024
+
+def _batch_decode_vk(pk):
+    A = _batch_vk_cache.get(pk)
+    if A is None:
+        A = bytes_to_element(pk)
+        while len(_batch_vk_cache) >= _BATCH_VK_CACHE_MAX:
+            try:
+                _batch_vk_cache.pop(next(iter(_batch_vk_cache)))
+            except (KeyError, StopIteration, RuntimeError):
+                break
+        _batch_vk_cache[pk] = A
+    return A
+
+def checkvalid_batch(items, entropy_f=os.urandom):
+    """Check a list of (signature, message, public key) tuples, and return
+    the indices of the ones that are not valid.
+
+    All items that decode correctly are checked at once with a random linear
+    combination of their verification equations:
+
+        [sum(z_i*S_i)]B == sum([z_i]R_i + [z_i*h_i]A_i)
+
+    where z_i are random 128-bit scalars. Since R_i and A_i are required to be
+    in the main subgroup, exactly as in checkvalid(), a batch passes if and only
+    if every signature in it would pass individually (except with negligible
+    probability). If a batch fails, it is bisected to find the failing items.
+    """
+    failed = []
+    terms = []
+    for i, (s, m, pk) in enumerate(items):
+        try:
+            if len(s) != 64 or len(pk) != 32:
+                raise ValueError("signature or public-key length is wrong")
+            R = bytes_to_element(s[:32])
+            A = _batch_decode_vk(pk)
+            S = bytes_to_scalar(s[32:])
+            h = Hint(s[:32] + pk + m)
+            z = bytes_to_scalar(entropy_f(16)+bytes(16)) | 1
+            terms.append((i, R, A, S, h, z))
+        except Exception:
+            failed.append(i)
+
+    def batch_holds(batch):
+        if len(batch) == 1:
+            _, R, A, S, h, _ = batch[0]
+            return Base.scalarmult(S) == R.add(A.scalarmult(h))
+
+        pairs = []
+        s_sum = 0
+        for _, R, A, S, h, z in batch:
+            s_sum += z*S
+            pairs.append((R.XYTZ, z))
+            pairs.append((A.XYTZ, (z*h) % L))
+        pairs.append((Base.XYTZ, (-s_sum) % L))
+        return is_extended_zero(multiscalarmult_elements(pairs))
+
+    def find_failing(batch):
+        if len(batch) == 0 or batch_holds(batch):
+            return
+        if len(batch) == 1:
+            failed.append(batch[0][0])
+        else:
+            mid = len(batch)//2
+            find_failing(batch[:mid])
+            find_failing(batch[mid:])
+
+    find_failing(terms)
+    return sorted(failed)
+
 # wrappers
 
 import os
@@ -25,6 +25,7 @@ import math
 import time
 import threading
 import RNS
+from collections import OrderedDict
 
 from RNS.Cryptography import Token
 from .vendor import umsgpack as umsgpack
@@ -35,6 +36,63 @@ class Callbacks:
         self.packet = None
         self.proof_requested = None
 
+class ResponseCache:
+    """
+    Keeps responses generated by request handlers that were registered
+    with a cache TTL, so that identical requests can be answered without
+    calling the handler again. Entries expire after their TTL, and the
+    least recently used ones are evicted once the cache holds more than
+    *max_entries* responses, or more than *max_bytes* of packed responses.
+    """
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.lock        = threading.Lock()
+        self.entries     = OrderedDict()
+        self.size        = 0
+        self.hits        = 0
+        self.misses      = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry != None and entry[0] < time.time():
+                self.__remove(key)
+                entry = None
+
+            if entry == None:
+                self.misses += 1
+                return None
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+
+    def put(self, key, response, size, ttl):
+        with self.lock:
+            if key in self.entries:
+                self.__remove(key)
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = (time.time()+ttl, response, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.__remove(next(iter(self.entries)))
+
+    def invalidate(self, path_hash=None):
+        with self.lock:
+            for key in list(self.entries.keys()):
+                if path_hash == None or key[0] == path_hash:
+                    self.__remove(key)
+
+    def __remove(self, key):
+        self.size -= self.entries.pop(key)[2]
+
+    def __len__(self):
+        return len(self.entries)
+
+
 class Destination:
     """
     A class used to describe endpoints in a Reticulum Network. Destination
@@ -68,6 +126,23 @@ class Destination:
     ALLOW_LIST = 0x02
     request_policies = [ALLOW_NONE, ALLOW_ALL, ALLOW_LIST]
 
+    # Request handlers are called on the thread that
+    # received the request, unless they are registered
+    # to run concurrently on the request workers of the
+    # destination. Requests that have waited longer than
+    # the queue timeout for a worker are dropped, since
+    # the requester will have given up on them.
+    HANDLE_INLINE     = 0x00
+    HANDLE_CONCURRENT = 0x01
+    handler_modes = [HANDLE_INLINE, HANDLE_CONCURRENT]
+
+    REQUEST_WORKERS        = 4
+    REQUEST_QUEUE_LIMIT    = 256
+    REQUEST_QUEUE_TIMEOUT  = 15
+
+    RESPONSE_CACHE_ENTRIES = 256
+    RESPONSE_CACHE_BYTES   = 1024*1024
+
     IN         = 0x11;
     OUT        = 0x12;
     directions = [IN, OUT]
@@ -84,6 +159,17 @@ class Destination:
     The minimum interval between rotating ratchet keys, in seconds.
     """
 
+    # Name hashes and destination hashes are memoised, since
+    # the same small set of names and identities are hashed
+    # over and over again while processing announces.
+    NAME_HASH_CACHE_SIZE = 1024
+    HASH_CACHE_SIZE      = 8192
+
+    _name_hash_cache = {}
+    _hash_cache      = {}
+    _hash_cache_hits = 0
+    _hash_cache_miss = 0
+
     @staticmethod
     def expand_name(identity, app_name, *aspects):
         """
@@ -109,17 +195,63 @@ class Destination:
         """
         :returns: A destination name in adressable hash form, for an app_name and a number of aspects.
         """
-        name_hash = RNS.Identity.full_hash(Destination.expand_name(None, app_name, *aspects).encode("utf-8"))[:(RNS.Identity.NAME_HASH_LENGTH//8)]
-        addr_hash_material = name_hash
+        name_hash = Destination._name_hash(Destination.expand_name(None, app_name, *aspects))
+        identity_hash = b""
         if identity != None:
             if isinstance(identity, RNS.Identity):
-                addr_hash_material += identity.hash
+                identity_hash = identity.hash
             elif isinstance(identity, bytes) and len(identity) == RNS.Reticulum.TRUNCATED_HASHLENGTH//8:
-                addr_hash_material += identity
+                identity_hash = identity
             else:
                 raise TypeError("Invalid material supplied for destination hash calculation")
 
-        return RNS.Identity.full_hash(addr_hash_material)[:RNS.Reticulum.TRUNCATED_HASHLENGTH//8]
+        return Destination._destination_hash(name_hash, identity_hash)
+
+    @staticmethod
+    def _cache_insert(cache, size, key, value):
+        if len(cache) >= size:
+            try:
+                cache.pop(next(iter(cache)), None)
+            except Exception as e:
+                pass
+        cache[key] = value
+
+    @staticmethod
+    def _name_hash(name):
+        name_hash = Destination._name_hash_cache.get(name, None)
+        if name_hash == None:
+            Destination._hash_cache_miss += 1
+            name_hash = RNS.Identity.full_hash(name.encode("utf-8"))[:(RNS.Identity.NAME_HASH_LENGTH//8)]
+            Destination._cache_insert(Destination._name_hash_cache, Destination.NAME_HASH_CACHE_SIZE, name, name_hash)
+        else:
+            Destination._hash_cache_hits += 1
+
+        return name_hash
+
+    @staticmethod
+    def _destination_hash(name_hash, identity_hash):
+        addr_hash_material = name_hash+identity_hash
+        destination_hash = Destination._hash_cache.get(addr_hash_material, None)
+        if destination_hash == None:
+            Destination._hash_cache_miss += 1
+            destination_hash = RNS.Identity.full_hash(addr_hash_material)[:RNS.Reticulum.TRUNCATED_HASHLENGTH//8]
+            Destination._cache_insert(Destination._hash_cache, Destination.HASH_CACHE_SIZE, addr_hash_material, destination_hash)
+        else:
+            Destination._hash_cache_hits += 1
+
+        return destination_hash
+
+    @staticmethod
+    def hash_cache_stats():
+        """
+        :returns: A dictionary with the number of cached name and destination hashes, and the number of SHA-256 invocations that were saved and performed by the caches.
+        """
+        return {
+            "name_hashes": len(Destination._name_hash_cache),
+            "destination_hashes": len(Destination._hash_cache),
+            "sha256_saved": Destination._hash_cache_hits,
+            "sha256_computed": Destination._hash_cache_miss,
+        }
 
     @staticmethod
     def app_and_aspects_from_name(full_name):
@@ -147,6 +279,12 @@ class Destination:
         self.accept_link_requests = True
         self.callbacks = Callbacks()
         self.request_handlers = {}
+        self.request_workers = Destination.REQUEST_WORKERS
+        self.request_queue_limit = Destination.REQUEST_QUEUE_LIMIT
+        self.request_queue_timeout = Destination.REQUEST_QUEUE_TIMEOUT
+        self.request_executor = None
+        self.request_executor_lock = threading.Lock()
+        self.response_cache = ResponseCache(Destination.RESPONSE_CACHE_ENTRIES, Destination.RESPONSE_CACHE_BYTES)
         self.type = type
         self.direction = direction
         self.proof_strategy = Destination.PROVE_NONE
@@ -178,7 +316,7 @@ class Destination:
 
         # Generate the destination address hash
         self.hash = Destination.hash(self.identity, app_name, *aspects)
-        self.name_hash = RNS.Identity.full_hash(self.expand_name(None, app_name, *aspects).encode("utf-8"))[:(RNS.Identity.NAME_HASH_LENGTH//8)]
+        self.name_hash = Destination._name_hash(Destination.expand_name(None, app_name, *aspects))
         self.hexhash = self.hash.hex()
 
         self.default_app_data = None
@@ -365,7 +503,7 @@ class Destination:
         else:
             self.proof_strategy = proof_strategy
 
-    def register_request_handler(self, path, response_generator = None, allow = ALLOW_NONE, allowed_list = None):
+    def register_request_handler(self, path, response_generator = None, allow = ALLOW_NONE, allowed_list = None, mode = HANDLE_INLINE, cache_ttl = None, cache_per_identity = False):
         """
         Registers a request handler.
 
@@ -373,6 +511,9 @@ class Destination:
         :param response_generator: A function or method with the signature *response_generator(path, data, request_id, link_id, remote_identity, requested_at)* to be called. Whatever this funcion returns will be sent as a response to the requester. If the function returns ``None``, no response will be sent.
         :param allow: One of ``RNS.Destination.ALLOW_NONE``, ``RNS.Destination.ALLOW_ALL`` or ``RNS.Destination.ALLOW_LIST``. If ``RNS.Destination.ALLOW_LIST`` is set, the request handler will only respond to requests for identified peers in the supplied list.
         :param allowed_list: A list of *bytes-like* :ref:`RNS.Identity<api-identity>` hashes.
+        :param mode: One of ``RNS.Destination.HANDLE_INLINE`` or ``RNS.Destination.HANDLE_CONCURRENT``. If ``RNS.Destination.HANDLE_CONCURRENT`` is set, the response generator is called on the request workers of the destination, instead of holding up the processing of inbound packets while it runs. See :func:`set_request_concurrency`.
+        :param cache_ttl: If set, responses are cached for this many seconds, and requests for the same path with the same data are answered from the cache. Only use this for handlers whose responses depend on nothing else.
+        :param cache_per_identity: Whether cached responses are kept separately for each remote identity.
         :raises: ``ValueError`` if any of the supplied arguments are invalid.
         """
         if path == None or path == "":
@@ -381,10 +522,15 @@ class Destination:
             raise ValueError("Invalid response generator specified")
         elif not allow in Destination.request_policies:
             raise ValueError("Invalid request policy")
+        elif not mode in Destination.handler_modes:
+            raise ValueError("Invalid request handler mode")
+        elif cache_ttl != None and (not isinstance(cache_ttl, (int, float)) or cache_ttl <= 0):
+            raise ValueError("Invalid response cache TTL")
         else:
             path_hash = RNS.Identity.truncated_hash(path.encode("utf-8"))
-            request_handler = [path, response_generator, allow, allowed_list]
+            request_handler = [path, response_generator, allow, allowed_list, mode, cache_ttl, cache_per_identity]
             self.request_handlers[path_hash] = request_handler
+            self.response_cache.invalidate(path_hash)
 
     def deregister_request_handler(self, path):
         """
@@ -396,10 +542,77 @@ class Destination:
         path_hash = RNS.Identity.truncated_hash(path.encode("utf-8"))
         if path_hash in self.request_handlers:
             self.request_handlers.pop(path_hash)
+            self.response_cache.invalidate(path_hash)
             return True
         else:
             return False
 
+    def set_request_concurrency(self, workers, queue_limit = REQUEST_QUEUE_LIMIT, queue_timeout = REQUEST_QUEUE_TIMEOUT):
+        """
+        Sets how requests for handlers registered with ``RNS.Destination.HANDLE_CONCURRENT``
+        are run. Defaults to ``Destination.REQUEST_WORKERS`` workers.
+
+        :param workers: The largest number of requests handled at the same time.
+        :param queue_limit: The largest number of requests waiting for a worker. Further requests are dropped.
+        :param queue_timeout: The number of seconds after which requests still waiting for a worker are dropped.
+        :raises: *TypeError* if any of the arguments are invalid.
+        """
+        if not isinstance(workers, int) or workers < 1:
+            raise TypeError("Number of request workers must be a positive integer")
+        if not isinstance(queue_limit, int) or queue_limit < 1:
+            raise TypeError("Request queue limit must be a positive integer")
+        if not isinstance(queue_timeout, (int, float)) or queue_timeout <= 0:
+            raise TypeError("Request queue timeout must be a positive number")
+
+        with self.request_executor_lock:
+            self.request_workers = workers
+            self.request_queue_limit = queue_limit
+            self.request_queue_timeout = queue_timeout
+            self.request_executor = None
+
+    def set_response_cache_limits(self, max_entries = RESPONSE_CACHE_ENTRIES, max_bytes = RESPONSE_CACHE_BYTES):
+        """
+        Sets the size limits of the response cache, and clears it.
+
+        :param max_entries: The largest number of cached responses.
+        :param max_bytes: The largest total size of cached responses, in bytes.
+        :raises: *TypeError* if any of the arguments are invalid.
+        """
+        if not isinstance(max_entries, int) or max_entries < 1:
+            raise TypeError("Response cache entry limit must be a positive integer")
+        if not isinstance(max_bytes, int) or max_bytes < 1:
+            raise TypeError("Response cache size limit must be a positive integer")
+
+        self.response_cache = ResponseCache(max_entries, max_bytes)
+
+    def clear_response_cache(self, path = None):
+        """
+        Removes cached responses, for example when the data they were generated from has changed.
+
+        :param path: The path to remove cached responses for, or *None* to remove all of them.
+        """
+        if path == None:
+            self.response_cache.invalidate()
+        else:
+            self.response_cache.invalidate(RNS.Identity.truncated_hash(path.encode("utf-8")))
+
+    def _submit_request(self, handle, *args):
+        with self.request_executor_lock:
+            if self.request_executor == None:
+                self.request_executor = RNS.Executor.CallbackExecutor(workers=self.request_workers, max_queued=self.request_queue_limit, policy=RNS.Executor.DROP_NEWEST)
+            executor = self.request_executor
+            queue_timeout = self.request_queue_timeout
+
+        queued_at = time.time()
+        def run():
+            if time.time() > queued_at+queue_timeout:
+                RNS.log("Request for "+str(self)+" waited too long for a worker, dropping it", RNS.LOG_DEBUG)
+            else:
+                handle(*args)
+
+        if not executor.submit(run):
+            RNS.log("Request queue for "+str(self)+" is full, dropping request", RNS.LOG_DEBUG)
+
     def receive(self, packet):
         if packet.packet_type == RNS.Packet.LINKREQUEST:
             plaintext = packet.data
@@ -0,0 +1,183 @@
+# MIT License
+#
+# Copyright (c) 2016-2023 Mark Qvist / unsigned.io and contributors.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+
+# Systematic Reed-Solomon erasure coding over GF(2^8),
+# using a Cauchy matrix for the repair symbols. Any k
+# of the k source symbols and their repair symbols are
+# enough to reconstruct all k source symbols. Symbols
+# are multiplied by a coefficient with bytes.translate,
+# and summed by XOR of integers, so that all per-byte
+# work is done in C.
+
+# Source and repair symbols of one block share the
+# 256 elements of the field, so a block can hold at
+# most this many symbols in total.
+MAX_SYMBOLS = 256
+
+# The margin of repair symbols sent above the expected
+# number of losses, in standard deviations.
+REPAIR_MARGIN = 1.0
+
+POLYNOMIAL = 0x11D
+
+# Exponent and logarithm tables for the generator 2.
+# The exponent table is doubled in length, so that
+# the sum of two logarithms can index it directly.
+EXP = [0]*512
+LOG = [0]*256
+
+element = 1
+for exponent in range(255):
+    EXP[exponent] = EXP[exponent+255] = element
+    LOG[element] = exponent
+    element <<= 1
+    if element & 0x100:
+        element ^= POLYNOMIAL
+
+def multiply(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return EXP[LOG[a]+LOG[b]]
+
+def inverse(a):
+    if a == 0:
+        raise ZeroDivisionError("Zero has no inverse in GF(2^8)")
+    return EXP[255-LOG[a]]
+
+tables = {}
+def table(coefficient):
+    # A translation table multiplying every byte
+    # by the coefficient, built on first use.
+    if not coefficient in tables:
+        tables[coefficient] = bytes(multiply(coefficient, b) for b in range(256))
+    return tables[coefficient]
+
+def coefficient(repair_index, source_index):
+    # Repair symbols use the field elements from the top,
+    # and source symbols those from the bottom, so every
+    # square submatrix of the Cauchy matrix is invertible.
+    return inverse((255-repair_index) ^ source_index)
+
+def combine(terms, length):
+    """
+    :param terms: A list of (coefficient, symbol) tuples.
+    :returns: The sum of the symbols multiplied by their coefficients, as *bytes* of *length*.
+    """
+    accumulator = 0
+    for c, symbol in terms:
+        if c != 0:
+            accumulator ^= int.from_bytes(symbol.translate(table(c)), "big")
+    return accumulator.to_bytes(length, "big")
+
+def encode(symbols, count):
+    """
+    Computes repair symbols for a block of source symbols.
+
+    :param symbols: A list of equally long source symbols as *bytes*.
+    :param count: The number of repair symbols to compute.
+    :returns: A list of *count* repair symbols.
+    :raises: *ValueError* if the block would exceed *MAX_SYMBOLS*.
+    """
+    if len(symbols)+count > MAX_SYMBOLS:
+        raise ValueError("Erasure coded block exceeds "+str(MAX_SYMBOLS)+" symbols")
+
+    length = len(symbols[0]) if len(symbols) > 0 else 0
+    repairs = []
+    for j in range(count):
+        repairs.append(combine([(coefficient(j, i), symbol) for i, symbol in enumerate(symbols)], length))
+    return repairs
+
+def decode(symbols, repairs):
+    """
+    Reconstructs the missing source symbols of a block.
+
+    :param symbols: A list of the source symbols, with *None* in place of missing symbols.
+    :param repairs: A dictionary of received repair symbols, keyed by repair index.
+    :returns: A dictionary of the reconstructed symbols, keyed by source index.
+    :raises: *ValueError* if not enough repair symbols were received.
+    """
+    missing = [i for i, symbol in enumerate(symbols) if symbol == None]
+    if len(missing) == 0:
+        return {}
+    if len(repairs) < len(missing):
+        raise ValueError("Not enough repair symbols to reconstruct block")
+
+    used = sorted(repairs.keys())[:len(missing)]
+    length = len(repairs[used[0]])
+
+    # Remove the contribution of the received source
+    # symbols, leaving a square system in the missing.
+    residuals = []
+    for j in used:
+        terms = [(1, repairs[j])]
+        terms.extend((coefficient(j, i), symbol) for i, symbol in enumerate(symbols) if symbol != None)
+        residuals.append(combine(terms, length))
+
+    matrix = [[coefficient(j, i) for i in missing] for j in used]
+    inverted = invert(matrix)
+
+    recovered = {}
+    for row, i in enumerate(missing):
+        recovered[i] = combine(list(zip(inverted[row], residuals)), length)
+    return recovered
+
+def invert(matrix):
+    """
+    :returns: The inverse of a square *matrix* over GF(2^8), by Gauss-Jordan elimination.
+    :raises: *ValueError* if the matrix is singular.
+    """
+    n = len(matrix)
+    rows = [list(matrix[r])+[1 if c == r else 0 for c in range(n)] for r in range(n)]
+    for column in range(n):
+        pivot = None
+        for r in range(column, n):
+            if rows[r][column] != 0:
+                pivot = r
+                break
+        if pivot == None:
+            raise ValueError("Matrix is singular")
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+
+        scale = inverse(rows[column][column])
+        rows[column] = [multiply(scale, v) for v in rows[column]]
+        for r in range(n):
+            factor = rows[r][column]
+            if r != column and factor != 0:
+                rows[r] = [v ^ multiply(factor, p) for v, p in zip(rows[r], rows[column])]
+
+    return [row[n:] for row in rows]
+
+def repair_count(k, loss):
+    """
+    :param k: The number of source symbols in the block.
+    :param loss: The observed loss rate of the channel, between 0 and 1.
+    :returns: The number of repair symbols to send along with the block, for it to be likely reconstructable without retransmission.
+    """
+    if k == 0 or loss <= 0:
+        return 0
+
+    loss = min(loss, 0.5)
+    expected = k*loss
+    count = math.ceil((expected+REPAIR_MARGIN*math.sqrt(expected*(1-loss)))/(1-loss))
+    return max(0, min(count, k, MAX_SYMBOLS-k))
@@ -0,0 +1,309 @@
+# MIT License
+#
+# Copyright (c) 2016-2023 Mark Qvist / unsigned.io and contributors.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import RNS
+import time
+import threading
+from collections import deque
+
+# Policies for callbacks submitted while the queue
+# of an executor is full for their key. The thread
+# submitting can wait for space, if it allows that,
+# or the newest callback, or the oldest one queued
+# for the same key, is dropped.
+BLOCK       = "block"
+DROP_NEWEST = "drop-newest"
+DROP_OLDEST = "drop-oldest"
+
+# Objects that run callbacks on an executor can be
+# set to run them inline instead, on the thread the
+# event occurred on, by using this in its place.
+INLINE      = "inline"
+
+# The largest number of worker threads that run
+# timers and internal work of links, resources
+# and channels, see protocol().
+PROTOCOL_WORKERS = 8
+
+class CallbackExecutor():
+    """
+    Runs callbacks on a bounded pool of worker threads. Callbacks
+    submitted with the same *key*, such as all packet callbacks of
+    one link, run one at a time in the order they were submitted,
+    while callbacks for different keys run concurrently. Workers
+    are started as needed, up to *workers*, and exit when idle.
+
+    Once *max_queued* callbacks are waiting for the same key,
+    further bounded submissions for it are handled according to
+    *policy*, which is one of ``RNS.Executor.BLOCK``,
+    ``RNS.Executor.DROP_NEWEST`` or ``RNS.Executor.DROP_OLDEST``,
+    so that one busy link does not hold up or lose the callbacks
+    of others. Callbacks submitted without a key share one limit.
+    Under the ``BLOCK`` policy, only submissions that allow it wait
+    for space, and others are dropped, so that threads which must
+    not block, such as those reading from interfaces, never do.
+    Callbacks that block for long
+    hold up the callbacks queued behind them for the same key,
+    and should hand their work off to threads of their own.
+
+    :param workers: The largest number of worker threads.
+    :param max_queued: The number of callbacks waiting for one key at which the overflow policy applies.
+    :param policy: The overflow policy.
+    :raises: *TypeError* if any of the arguments are invalid.
+    """
+
+    WORKERS      = 16
+    MAX_QUEUED   = 4096
+    IDLE_TIMEOUT = 30
+
+    def __init__(self, workers=WORKERS, max_queued=MAX_QUEUED, policy=BLOCK):
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+            raise TypeError("Number of workers must be a positive integer")
+        if not isinstance(max_queued, int) or isinstance(max_queued, bool) or max_queued < 1:
+            raise TypeError("Queue limit must be a positive integer")
+        if not policy in [BLOCK, DROP_NEWEST, DROP_OLDEST]:
+            raise TypeError("Unknown overflow policy "+str(policy))
+
+        self.max_workers  = workers
+        self.max_queued   = max_queued
+        self.policy       = policy
+        self.lock         = threading.Lock()
+        self.work         = threading.Condition(self.lock)
+        self.space        = threading.Condition(self.lock)
+
+        # Queued callbacks are kept per key, and keys with
+        # callbacks that no worker is running are ready.
+        # A key stays in queues while one of its callbacks
+        # runs, so that the next one waits for it.
+        self.queues       = {}
+        self.ready        = deque()
+        self.queued       = 0
+
+        # The number of bounded callbacks waiting
+        # for each key the queue limit applies to
+        self.limited      = {}
+        self.workers      = 0
+        self.idle         = 0
+        self.worker_ids   = set()
+
+        self.submitted    = 0
+        self.completed    = 0
+        self.dropped      = 0
+        self.peak_queued  = 0
+        self.latency      = None
+        self.max_latency  = 0
+
+    def submit(self, callback, *args, key=None, bounded=True, block=False):
+        """
+        Queues *callback* to be called with *args* by a worker.
+
+        :param key: Callbacks with the same key are run in order, one at a time. If *None*, the callback is not ordered with respect to any other.
+        :param bounded: Whether the queue limit and overflow policy apply. Callbacks that must not be lost or held up, such as timeouts, are submitted unbounded.
+        :param block: Whether the submitting thread may wait for space under the ``BLOCK`` policy. If not, the callback is dropped while the queue is full.
+        :returns: *True* if the callback was queued, or *False* if it was dropped.
+        """
+        with self.lock:
+            limit_key = key
+            if bounded and self.limited.get(limit_key, 0) >= self.max_queued:
+                if self.policy == BLOCK and block:
+                    # Workers are never blocked by their own
+                    # submissions, since that could leave no
+                    # worker to make space.
+                    if not threading.get_ident() in self.worker_ids:
+                        while self.limited.get(limit_key, 0) >= self.max_queued:
+                            self.space.wait()
+
+                elif not (self.policy == DROP_OLDEST and self.__drop_oldest(key)):
+                    self.dropped += 1
+                    return False
+
+            if key == None:
+                key = object()
+
+            queue = self.queues.get(key)
+            if queue == None:
+                queue = deque()
+                self.queues[key] = queue
+                self.ready.append(key)
+
+            queue.append((callback, args, time.time(), bounded, limit_key))
+            self.queued += 1
+            if bounded:
+                self.limited[limit_key] = self.limited.get(limit_key, 0)+1
+            self.submitted += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+
+            if len(self.ready) > self.idle and self.workers < self.max_workers:
+                self.workers += 1
+                threading.Thread(target=self.__worker, name="Callback Executor", daemon=True).start()
+            else:
+                self.work.notify()
+
+            return True
+
+    def __drop_oldest(self, key):
+        queue = self.queues.get(key)
+        if queue != None:
+            for entry in queue:
+                if entry[3]:
+                    queue.remove(entry)
+                    self.queued -= 1
+                    self.dropped += 1
+                    self.__unlimit(key)
+                    return True
+        return False
+
+    def __unlimit(self, limit_key):
+        limited = self.limited[limit_key]
+        if limited > 1:
+            self.limited[limit_key] = limited-1
+        else:
+            del self.limited[limit_key]
+
+        # Submitters may be waiting for space for
+        # different keys, so all of them are woken
+        if limited >= self.max_queued:
+            self.space.notify_all()
+
+    def __worker(self):
+        with self.lock:
+            self.worker_ids.add(threading.get_ident())
+
+        while True:
+            with self.lock:
+                while len(self.ready) == 0:
+                    self.idle += 1
+                    notified = self.work.wait(CallbackExecutor.IDLE_TIMEOUT)
+                    self.idle -= 1
+                    if not notified and len(self.ready) == 0:
+                        self.workers -= 1
+                        self.worker_ids.discard(threading.get_ident())
+                        return
+
+                key = self.ready.popleft()
+                callback, args, submitted_at, bounded, limit_key = self.queues[key].popleft()
+                self.queued -= 1
+                if bounded:
+                    self.__unlimit(limit_key)
+
+                latency = time.time()-submitted_at
+                self.latency = latency if self.latency == None else 0.75*self.latency+0.25*latency
+                self.max_latency = max(self.max_latency, latency)
+
+            try:
+                callback(*args)
+            except Exception as e:
+                RNS.log("Error while executing callback "+str(callback)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
+
+            with self.lock:
+                self.completed += 1
+                if len(self.queues[key]) > 0:
+                    self.ready.append(key)
+                else:
+                    del self.queues[key]
+
+    def queue_depth(self, key=None):
+        """
+        :param key: A key callbacks were submitted with, or *None* for all callbacks.
+        :returns: The number of callbacks waiting to run.
+        """
+        with self.lock:
+            if key == None:
+                return self.queued
+            elif key in self.queues:
+                return len(self.queues[key])
+            else:
+                return 0
+
+    def get_stats(self):
+        """
+        :returns: A dictionary with the number of ``workers``, the number of callbacks ``queued`` now and at the most (``peak_queued``), the number ``submitted``, ``completed`` and ``dropped`` so far, and the average (``latency``) and largest (``max_latency``) time in seconds callbacks waited before running.
+        """
+        with self.lock:
+            return {
+                "workers":     self.workers,
+                "queued":      self.queued,
+                "peak_queued": self.peak_queued,
+                "submitted":   self.submitted,
+                "completed":   self.completed,
+                "dropped":     self.dropped,
+                "latency":     self.latency,
+                "max_latency": self.max_latency,
+            }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+_protocol = None
+
+def shared():
+    """
+    :returns: The executor that runs callbacks for objects that have not been given one of their own.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared == None:
+            _shared = CallbackExecutor()
+        return _shared
+
+def protocol():
+    """
+    :returns: The executor that runs timers, and internal work such as sending and assembling resources. It is kept apart from the executors application callbacks run on, so that callbacks that block can not hold up timeouts and transfers.
+    """
+    global _protocol
+    with _shared_lock:
+        if _protocol == None:
+            _protocol = CallbackExecutor(workers=PROTOCOL_WORKERS)
+        return _protocol
+
+def set_shared(executor):
+    """
+    Replaces the shared executor, for example to change its number
+    of workers or overflow policy. Callbacks already queued on the
+    previous one still run.
+
+    :param executor: A :ref:`RNS.Executor.CallbackExecutor<api-executor>`.
+    :raises: *TypeError* if *executor* is not a ``CallbackExecutor``.
+    """
+    global _shared
+    if not isinstance(executor, CallbackExecutor):
+        raise TypeError("Shared executor must be a CallbackExecutor")
+    with _shared_lock:
+        _shared = executor
+
+def dispatch(executor, callback, *args, key=None, bounded=True, block=False):
+    """
+    Runs *callback* with *args* on *executor*, see :func:`CallbackExecutor.submit`.
+
+    :param executor: A :ref:`RNS.Executor.CallbackExecutor<api-executor>`, ``RNS.Executor.INLINE`` to run the callback on the calling thread, or *None* for the shared executor.
+    :returns: *True* if the callback was run or queued, or *False* if it was dropped.
+    """
+    if executor == INLINE:
+        try:
+            callback(*args)
+        except Exception as e:
+            RNS.log("Error while executing callback "+str(callback)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
+        return True
+
+    if executor == None:
+        executor = shared()
+    return executor.submit(callback, *args, key=key, bounded=bounded, block=block)
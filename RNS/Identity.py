@@ -351,55 +351,98 @@ class Identity:
             return None
 
     @staticmethod
-    def validate_announce(packet, only_validate_signature=False):
-        try:
-            if packet.packet_type == RNS.Packet.ANNOUNCE:
-                keysize       = Identity.KEYSIZE//8
-                ratchetsize   = Identity.RATCHETSIZE//8
-                name_hash_len = Identity.NAME_HASH_LENGTH//8
-                sig_len       = Identity.SIGLENGTH//8
-                destination_hash = packet.destination_hash
+    def _unpack_announce(packet):
+        keysize       = Identity.KEYSIZE//8
+        ratchetsize   = Identity.RATCHETSIZE//8
+        name_hash_len = Identity.NAME_HASH_LENGTH//8
+        sig_len       = Identity.SIGLENGTH//8
+        destination_hash = packet.destination_hash
+
+        # Get public key bytes from announce
+        public_key = packet.data[:keysize]
+
+        # If the packet context flag is set,
+        # this announce contains a new ratchet
+        if packet.context_flag == RNS.Packet.FLAG_SET:
+            name_hash   = packet.data[keysize:keysize+name_hash_len ]
+            random_hash = packet.data[keysize+name_hash_len:keysize+name_hash_len+10]
+            ratchet     = packet.data[keysize+name_hash_len+10:keysize+name_hash_len+10+ratchetsize]
+            signature   = packet.data[keysize+name_hash_len+10+ratchetsize:keysize+name_hash_len+10+ratchetsize+sig_len]
+            app_data    = b""
+            if len(packet.data) > keysize+name_hash_len+10+sig_len+ratchetsize:
+                app_data = packet.data[keysize+name_hash_len+10+sig_len+ratchetsize:]
+
+        # If the packet context flag is not set,
+        # this announce does not contain a ratchet
+        else:
+            ratchet     = b""
+            name_hash   = packet.data[keysize:keysize+name_hash_len]
+            random_hash = packet.data[keysize+name_hash_len:keysize+name_hash_len+10]
+            signature   = packet.data[keysize+name_hash_len+10:keysize+name_hash_len+10+sig_len]
+            app_data    = b""
+            if len(packet.data) > keysize+name_hash_len+10+sig_len:
+                app_data = packet.data[keysize+name_hash_len+10+sig_len:]
 
-                # Get public key bytes from announce
-                public_key = packet.data[:keysize]
-
-                # If the packet context flag is set,
-                # this announce contains a new ratchet
-                if packet.context_flag == RNS.Packet.FLAG_SET:
-                    name_hash   = packet.data[keysize:keysize+name_hash_len ]
-                    random_hash = packet.data[keysize+name_hash_len:keysize+name_hash_len+10]
-                    ratchet     = packet.data[keysize+name_hash_len+10:keysize+name_hash_len+10+ratchetsize]
-                    signature   = packet.data[keysize+name_hash_len+10+ratchetsize:keysize+name_hash_len+10+ratchetsize+sig_len]
-                    app_data    = b""
-                    if len(packet.data) > keysize+name_hash_len+10+sig_len+ratchetsize:
-                        app_data = packet.data[keysize+name_hash_len+10+sig_len+ratchetsize:]
-
-                # If the packet context flag is not set,
-                # this announce does not contain a ratchet
-                else:
-                    ratchet     = b""
-                    name_hash   = packet.data[keysize:keysize+name_hash_len]
-                    random_hash = packet.data[keysize+name_hash_len:keysize+name_hash_len+10]
-                    signature   = packet.data[keysize+name_hash_len+10:keysize+name_hash_len+10+sig_len]
-                    app_data    = b""
-                    if len(packet.data) > keysize+name_hash_len+10+sig_len:
-                        app_data = packet.data[keysize+name_hash_len+10+sig_len:]
+        signed_data = destination_hash+public_key+name_hash+random_hash+ratchet+app_data
+
+        if not len(packet.data) > Identity.KEYSIZE//8+Identity.NAME_HASH_LENGTH//8+10+Identity.SIGLENGTH//8:
+            app_data = None
+
+        return public_key, name_hash, random_hash, ratchet, signature, app_data, signed_data
+
+    @staticmethod
+    def validate_announce_signatures(packets):
+        """
+        Validates the signatures of a number of announce packets in one batch.
+        This only checks the signatures, and does not remember the announced
+        identities. Use :ref:`validate_announce<api-identity>` for full validation.
+
+        :param packets: A list of announce packets.
+        :returns: A list of indices into *packets* for which signature validation failed.
+        """
+        failed = []
+        batch = []
+        indices = []
+        for i, packet in enumerate(packets):
+            try:
+                if packet.packet_type != RNS.Packet.ANNOUNCE:
+                    raise TypeError("Packet is not an announce")
+
+                public_key, _, _, _, signature, _, signed_data = Identity._unpack_announce(packet)
+                announced_identity = Identity(create_keys=False)
+                announced_identity.load_public_key(public_key)
+                if announced_identity.pub == None:
+                    raise ValueError("Invalid public key in announce")
 
-                signed_data = destination_hash+public_key+name_hash+random_hash+ratchet+app_data
+                batch.append((announced_identity, signature, signed_data))
+                indices.append(i)
 
-                if not len(packet.data) > Identity.KEYSIZE//8+Identity.NAME_HASH_LENGTH//8+10+Identity.SIGLENGTH//8:
-                    app_data = None
+            except Exception as e:
+                failed.append(i)
+
+        if len(batch) > 0:
+            failed.extend(indices[i] for i in Identity.validate_batch(batch))
+
+        return sorted(failed)
+
+    @staticmethod
+    def validate_announce(packet, only_validate_signature=False, signature_validated=False):
+        try:
+            if packet.packet_type == RNS.Packet.ANNOUNCE:
+                destination_hash = packet.destination_hash
+                public_key, name_hash, random_hash, ratchet, signature, app_data, signed_data = Identity._unpack_announce(packet)
 
                 announced_identity = Identity(create_keys=False)
                 announced_identity.load_public_key(public_key)
 
-                if announced_identity.pub != None and announced_identity.validate(signature, signed_data):
+                # Announces that were held during an ingress burst
+                # have had their signatures validated in a batch
+                if announced_identity.pub != None and (signature_validated or announced_identity.validate(signature, signed_data)):
                     if only_validate_signature:
                         del announced_identity
                         return True
 
-                    hash_material = name_hash+announced_identity.hash
-                    expected_hash = RNS.Identity.full_hash(hash_material)[:RNS.Reticulum.TRUNCATED_HASHLENGTH//8]
+                    expected_hash = RNS.Destination._destination_hash(name_hash, announced_identity.hash)
 
                     if destination_hash == expected_hash:
                         # Check if we already have a public key for this destination
@@ -765,6 +808,27 @@ class Identity:
         else:
             raise KeyError("Signature validation failed because identity does not hold a public key")
 
+    @staticmethod
+    def validate_batch(batch):
+        """
+        Validates a number of signatures in one batch. When using the internal
+        cryptography provider, this is considerably faster than validating each
+        signature with :ref:`validate<api-identity>`.
+
+        :param batch: A list of *(identity, signature, message)* tuples, where *identity* is an :ref:`RNS.Identity<api-identity>` holding a public key.
+        :returns: A list of indices into *batch* for which the signature is not valid. An empty list if all signatures are valid.
+        :raises: *KeyError* if any of the identities do not hold a public key.
+        """
+        for identity, signature, message in batch:
+            if identity.pub == None:
+                raise KeyError("Signature validation failed because identity does not hold a public key")
+
+        try:
+            return Ed25519PublicKey.verify_batch([(identity.sig_pub, signature, message) for identity, signature, message in batch])
+        except Exception as e:
+            RNS.log("Error while validating signature batch, falling back to individual validation. The contained exception was: "+str(e), RNS.LOG_ERROR)
+            return [i for i, (identity, signature, message) in enumerate(batch) if not identity.validate(signature, message)]
+
     def prove(self, packet, destination=None):
         signature = self.sign(packet.packet_hash)
         if RNS.Reticulum.should_use_implicit_proof():
@@ -87,6 +87,8 @@ class Interface:
         self.ic_burst_penalty = Interface.IC_BURST_PENALTY
         self.ic_held_release_interval = Interface.IC_HELD_RELEASE_INTERVAL
         self.held_announces = {}
+        self.ic_held_unvalidated = set()
+        self.ic_held_lock = threading.Lock()
 
         self.ia_freq_deque = deque(maxlen=Interface.IA_FREQ_SAMPLES)
         self.oa_freq_deque = deque(maxlen=Interface.OA_FREQ_SAMPLES)
@@ -149,32 +151,64 @@ class Interface:
     def age(self):
         return time.time()-self.created
 
-    def hold_announce(self, announce_packet):
-        if announce_packet.destination_hash in self.held_announces:
-            self.held_announces[announce_packet.destination_hash] = announce_packet
-        elif not len(self.held_announces) >= self.ic_max_held_announces:
-            self.held_announces[announce_packet.destination_hash] = announce_packet
+    def hold_announce(self, announce_packet, validated=True):
+        with self.ic_held_lock:
+            if announce_packet.destination_hash in self.held_announces or not len(self.held_announces) >= self.ic_max_held_announces:
+                self.held_announces[announce_packet.destination_hash] = announce_packet
+                if validated:
+                    self.ic_held_unvalidated.discard(announce_packet.destination_hash)
+                else:
+                    self.ic_held_unvalidated.add(announce_packet.destination_hash)
+
+    # Announces received during an ingress burst can be
+    # held without having their signatures checked. They
+    # are validated here in one batch, which is much less
+    # costly than checking them one by one on arrival.
+    def validate_held_announces(self):
+        with self.ic_held_lock:
+            unvalidated = self.ic_held_unvalidated
+            self.ic_held_unvalidated = set()
+            held = [(h, self.held_announces[h]) for h in unvalidated if h in self.held_announces]
+
+        if len(held) > 0:
+            failed = RNS.Identity.validate_announce_signatures([announce_packet for h, announce_packet in held])
+            with self.ic_held_lock:
+                for i in failed:
+                    # Unless it was replaced by a newer announce
+                    # while the batch was being validated
+                    destination_hash, announce_packet = held[i]
+                    if self.held_announces.get(destination_hash) is announce_packet:
+                        self.held_announces.pop(destination_hash)
+
+            RNS.log("Validated "+str(len(held))+" held announces on "+str(self)+", "+str(len(failed))+" were invalid", RNS.LOG_EXTREME)
 
     def process_held_announces(self):
         try:
+            self.validate_held_announces()
             if not self.should_ingress_limit() and len(self.held_announces) > 0 and time.time() > self.ic_held_release:
                 freq_threshold = self.ic_burst_freq_new if self.age() < self.ic_new_time else self.ic_burst_freq
                 ia_freq = self.incoming_announce_frequency()
                 if ia_freq < freq_threshold:
                     selected_announce_packet = None
                     min_hops = RNS.Transport.PATHFINDER_M
-                    for destination_hash in self.held_announces:
-                        announce_packet = self.held_announces[destination_hash]
-                        if announce_packet.hops < min_hops:
-                            min_hops = announce_packet.hops
-                            selected_announce_packet = announce_packet
+                    with self.ic_held_lock:
+                        for destination_hash in self.held_announces:
+                            announce_packet = self.held_announces[destination_hash]
+                            if announce_packet.hops < min_hops and not destination_hash in self.ic_held_unvalidated:
+                                min_hops = announce_packet.hops
+                                selected_announce_packet = announce_packet
+
+                        if selected_announce_packet != None:
+                            self.held_announces.pop(selected_announce_packet.destination_hash)
 
                     if selected_announce_packet != None:
                         RNS.log("Releasing held announce packet "+str(selected_announce_packet)+" from "+str(self), RNS.LOG_EXTREME)
                         self.ic_held_release = time.time() + self.ic_held_release_interval
-                        self.held_announces.pop(selected_announce_packet.destination_hash)
+                        # Every held announce has had its signature
+                        # validated, either on arrival or in a batch,
+                        # so it is not checked again on release.
                         def release():
-                            RNS.Transport.inbound(selected_announce_packet.raw, selected_announce_packet.receiving_interface)
+                            RNS.Transport.inbound(selected_announce_packet.raw, selected_announce_packet.receiving_interface, signature_validated=True)
                         threading.Thread(target=release, daemon=True).start()
         
         except Exception as e:
@@ -24,7 +24,6 @@ from RNS.Cryptography import X25519PrivateKey, X25519PublicKey, Ed25519PrivateKe
 from RNS.Cryptography import Token
 from RNS.Channel import Channel, LinkChannelOutlet
 
-from time import sleep
 from .vendor import umsgpack as umsgpack
 import threading
 import inspect
@@ -107,6 +106,12 @@ class Link:
     ACCEPT_ALL  = 0x02
     resource_strategies = [ACCEPT_NONE, ACCEPT_APP, ACCEPT_ALL]
 
+    RESOURCE_CONCURRENCY = 4
+    """
+    Default maximum number of outgoing resources transferred concurrently on
+    a link. Further resources are queued until a transfer concludes.
+    """
+
     @staticmethod
     def mtu_bytes(mtu):
         return mtu.to_bytes(3, byteorder='big', signed=False)
@@ -177,7 +182,15 @@ class Link:
         self.establishment_cost = 0
         self.establishment_rate = None
         self.callbacks = LinkCallbacks()
+        self.callback_executor = None
         self.resource_strategy = Link.ACCEPT_NONE
+        self.congestion_control = RNS.Congestion.DEFAULT
+        self.channel_congestion_control = RNS.Congestion.DEFAULT
+        self.compression = RNS.Compression.Strategy()
+        self.remote_codecs = False
+        self.resource_fec = False
+        self.resource_concurrency = Link.RESOURCE_CONCURRENCY
+        self.resource_scheduler = RNS.Scheduler.ResourceScheduler(self)
         self.last_resource_window = None
         self.last_resource_eifr = None
         self.outgoing_resources = []
@@ -199,6 +212,7 @@ class Link:
         self.keepalive = Link.KEEPALIVE
         self.stale_time = Link.STALE_TIME
         self.watchdog_lock = False
+        self.watchdog = None
         self.status = Link.PENDING
         self.activated_at = None
         self.type = RNS.Destination.LINK
@@ -296,6 +310,10 @@ class Link:
                 salt=self.get_salt(),
                 context=self.get_context(),
             )
+
+            # Set up the symmetric state for the link right away,
+            # so key setup is kept out of the per-packet path.
+            self.token = Token(self.derived_key)
         else:
             RNS.log("Handshake attempt on "+str(self)+" with invalid state "+str(self.status), RNS.LOG_ERROR)
 
@@ -374,9 +392,7 @@ class Link:
                         self.__update_phy_stats(packet)
 
                         if self.callbacks.link_established != None:
-                            thread = threading.Thread(target=self.callbacks.link_established, args=(self,))
-                            thread.daemon = True
-                            thread.start()
+                            RNS.Executor.dispatch(self.callback_executor, self.callbacks.link_established, self, key=self, bounded=False)
                     else:
                         RNS.log("Invalid link proof signature received by "+str(self)+". Ignoring.", RNS.LOG_DEBUG)
         
@@ -425,21 +441,30 @@ class Link:
 
         if len(packed_request) <= self.mdu:
             request_packet   = RNS.Packet(self, packed_request, RNS.Packet.DATA, context = RNS.Packet.REQUEST)
-            packet_receipt   = request_packet.send()
+            request_packet.pack()
+
+            # The request is registered as pending before it is
+            # sent, so that a response arriving before the send
+            # call has returned is not discarded as unknown.
+            request_receipt  = RequestReceipt(
+                self,
+                request_id = request_packet.getTruncatedHash(),
+                response_callback = response_callback,
+                failed_callback = failed_callback,
+                progress_callback = progress_callback,
+                timeout = timeout,
+                request_size = len(packed_request),
+            )
 
+            packet_receipt   = request_packet.send()
             if packet_receipt == False:
+                if request_receipt in self.pending_requests:
+                    self.pending_requests.remove(request_receipt)
                 return False
             else:
                 packet_receipt.set_timeout(timeout)
-                return RequestReceipt(
-                    self,
-                    packet_receipt = packet_receipt,
-                    response_callback = response_callback,
-                    failed_callback = failed_callback,
-                    progress_callback = progress_callback,
-                    timeout = timeout,
-                    request_size = len(packed_request),
-                )
+                request_receipt.set_packet_receipt(packet_receipt)
+                return request_receipt
             
         else:
             request_id = RNS.Identity.truncated_hash(packed_request)
@@ -617,6 +642,8 @@ class Link:
             pass
 
     def link_closed(self):
+        if self.watchdog != None:
+            self.watchdog.cancel()
         for resource in self.incoming_resources:
             resource.cancel()
         for resource in self.outgoing_resources:
@@ -643,83 +670,86 @@ class Link:
 
 
     def start_watchdog(self):
-        thread = threading.Thread(target=self.__watchdog_job)
-        thread.daemon = True
-        thread.start()
+        self.watchdog = RNS.Timers.shared().timer(self.__watchdog_job)
+        self.watchdog.schedule(0)
 
     def __watchdog_job(self):
-        while not self.status == Link.CLOSED:
-            while (self.watchdog_lock):
-                rtt_wait = 0.025
-                if hasattr(self, "rtt") and self.rtt:
-                    rtt_wait = self.rtt
-
-                sleep(max(rtt_wait, 0.025))
-
-            if not self.status == Link.CLOSED:
-                # Link was initiated, but no response
-                # from destination yet
-                if self.status == Link.PENDING:
-                    next_check = self.request_time + self.establishment_timeout
-                    sleep_time = next_check - time.time()
-                    if time.time() >= self.request_time + self.establishment_timeout:
-                        RNS.log("Link establishment timed out", RNS.LOG_VERBOSE)
-                        self.status = Link.CLOSED
-                        self.teardown_reason = Link.TIMEOUT
-                        self.link_closed()
-                        sleep_time = 0.001
-
-                elif self.status == Link.HANDSHAKE:
-                    next_check = self.request_time + self.establishment_timeout
-                    sleep_time = next_check - time.time()
-                    if time.time() >= self.request_time + self.establishment_timeout:
-                        self.status = Link.CLOSED
-                        self.teardown_reason = Link.TIMEOUT
-                        self.link_closed()
-                        sleep_time = 0.001
-
-                        if self.initiator:
-                            RNS.log("Timeout waiting for link request proof", RNS.LOG_DEBUG)
-                        else:
-                            RNS.log("Timeout waiting for RTT packet from link initiator", RNS.LOG_DEBUG)
+        # Runs whenever the watchdog timer of the link expires,
+        # and schedules it again for the next check that is due.
+        if self.status == Link.CLOSED:
+            return
+
+        if self.watchdog_lock:
+            rtt_wait = 0.025
+            if hasattr(self, "rtt") and self.rtt:
+                rtt_wait = self.rtt
+
+            self.watchdog.schedule(max(rtt_wait, 0.025))
+            return
+
+        # Link was initiated, but no response
+        # from destination yet
+        if self.status == Link.PENDING:
+            next_check = self.request_time + self.establishment_timeout
+            sleep_time = next_check - time.time()
+            if time.time() >= self.request_time + self.establishment_timeout:
+                RNS.log("Link establishment timed out", RNS.LOG_VERBOSE)
+                self.status = Link.CLOSED
+                self.teardown_reason = Link.TIMEOUT
+                self.link_closed()
+                sleep_time = 0.001
 
-                elif self.status == Link.ACTIVE:
-                    activated_at = self.activated_at if self.activated_at != None else 0
-                    last_inbound = max(max(self.last_inbound, self.last_proof), activated_at)
+        elif self.status == Link.HANDSHAKE:
+            next_check = self.request_time + self.establishment_timeout
+            sleep_time = next_check - time.time()
+            if time.time() >= self.request_time + self.establishment_timeout:
+                self.status = Link.CLOSED
+                self.teardown_reason = Link.TIMEOUT
+                self.link_closed()
+                sleep_time = 0.001
 
-                    if time.time() >= last_inbound + self.keepalive:
-                        if self.initiator:
-                            self.send_keepalive()
+                if self.initiator:
+                    RNS.log("Timeout waiting for link request proof", RNS.LOG_DEBUG)
+                else:
+                    RNS.log("Timeout waiting for RTT packet from link initiator", RNS.LOG_DEBUG)
 
-                        if time.time() >= last_inbound + self.stale_time:
-                            sleep_time = self.rtt * self.keepalive_timeout_factor + Link.STALE_GRACE
-                            self.status = Link.STALE
-                        else:
-                            sleep_time = self.keepalive
-                    
-                    else:
-                        sleep_time = (last_inbound + self.keepalive) - time.time()
+        elif self.status == Link.ACTIVE:
+            activated_at = self.activated_at if self.activated_at != None else 0
+            last_inbound = max(max(self.last_inbound, self.last_proof), activated_at)
 
-                elif self.status == Link.STALE:
-                    sleep_time = 0.001
-                    self.status = Link.CLOSED
-                    self.teardown_reason = Link.TIMEOUT
-                    self.link_closed()
+            if time.time() >= last_inbound + self.keepalive:
+                if self.initiator:
+                    self.send_keepalive()
 
+                if time.time() >= last_inbound + self.stale_time:
+                    sleep_time = self.rtt * self.keepalive_timeout_factor + Link.STALE_GRACE
+                    self.status = Link.STALE
+                else:
+                    sleep_time = self.keepalive
 
-                if sleep_time == 0:
-                    RNS.log("Warning! Link watchdog sleep time of 0!", RNS.LOG_ERROR)
-                if sleep_time == None or sleep_time < 0:
-                    RNS.log("Timing error! Tearing down link "+str(self)+" now.", RNS.LOG_ERROR)
-                    self.teardown()
-                    sleep_time = 0.1
+            else:
+                sleep_time = (last_inbound + self.keepalive) - time.time()
+
+        elif self.status == Link.STALE:
+            sleep_time = 0.001
+            self.status = Link.CLOSED
+            self.teardown_reason = Link.TIMEOUT
+            self.link_closed()
 
-                sleep(sleep_time)
+        if sleep_time == 0:
+            RNS.log("Warning! Link watchdog sleep time of 0!", RNS.LOG_ERROR)
+        if sleep_time == None or sleep_time < 0:
+            RNS.log("Timing error! Tearing down link "+str(self)+" now.", RNS.LOG_ERROR)
+            self.teardown()
+            sleep_time = 0.1
 
-                if not self.__track_phy_stats:
-                    self.rssi = None
-                    self.snr  = None
-                    self.q    = None
+        if not self.__track_phy_stats:
+            self.rssi = None
+            self.snr  = None
+            self.q    = None
+
+        if self.status != Link.CLOSED:
+            self.watchdog.schedule(sleep_time)
 
 
     def __update_phy_stats(self, packet, query_shared = True, force_update = False):
@@ -765,24 +795,59 @@ class Link:
 
                 if allowed:
                     RNS.log("Handling request "+RNS.prettyhexrep(request_id)+" for: "+str(path), RNS.LOG_DEBUG)
-                    if len(inspect.signature(response_generator).parameters) == 5:
-                        response = response_generator(path, request_data, request_id, self.__remote_identity, requested_at)
-                    elif len(inspect.signature(response_generator).parameters) == 6:
-                        response = response_generator(path, request_data, request_id, self.link_id, self.__remote_identity, requested_at)
+                    mode               = request_handler[4]
+                    cache_ttl          = request_handler[5]
+                    cache_per_identity = request_handler[6]
+
+                    cache_key = None
+                    if cache_ttl != None:
+                        identity_hash = None
+                        if cache_per_identity and self.__remote_identity != None:
+                            identity_hash = self.__remote_identity.hash
+
+                        cache_key = (path_hash, RNS.Identity.full_hash(umsgpack.packb(request_data)), identity_hash)
+                        response = self.destination.response_cache.get(cache_key)
+                        if response != None:
+                            RNS.log("Answering request "+RNS.prettyhexrep(request_id)+" from response cache", RNS.LOG_DEBUG)
+                            self.__send_response(request_id, umsgpack.packb([request_id, response]))
+                            return
+
+                    if mode == RNS.Destination.HANDLE_CONCURRENT:
+                        self.destination._submit_request(self.__generate_response, request_id, request_handler, request_data, requested_at, cache_key)
                     else:
-                        raise TypeError("Invalid signature for response generator callback")
-
-                    if response != None:
-                        packed_response = umsgpack.packb([request_id, response])
-
-                        if len(packed_response) <= self.mdu:
-                            RNS.Packet(self, packed_response, RNS.Packet.DATA, context = RNS.Packet.RESPONSE).send()
-                        else:
-                            response_resource = RNS.Resource(packed_response, self, request_id = request_id, is_response = True)
+                        self.__generate_response(request_id, request_handler, request_data, requested_at, cache_key)
                 else:
                     identity_string = str(self.get_remote_identity()) if self.get_remote_identity() != None else "<Unknown>"
                     RNS.log("Request "+RNS.prettyhexrep(request_id)+" from "+identity_string+" not allowed for: "+str(path), RNS.LOG_DEBUG)
 
+    def __generate_response(self, request_id, request_handler, request_data, requested_at, cache_key):
+        path               = request_handler[0]
+        response_generator = request_handler[1]
+        cache_ttl          = request_handler[5]
+
+        if len(inspect.signature(response_generator).parameters) == 5:
+            response = response_generator(path, request_data, request_id, self.__remote_identity, requested_at)
+        elif len(inspect.signature(response_generator).parameters) == 6:
+            response = response_generator(path, request_data, request_id, self.link_id, self.__remote_identity, requested_at)
+        else:
+            raise TypeError("Invalid signature for response generator callback")
+
+        if response != None:
+            packed_response = umsgpack.packb([request_id, response])
+            if cache_key != None:
+                self.destination.response_cache.put(cache_key, response, len(packed_response), cache_ttl)
+
+            self.__send_response(request_id, packed_response)
+
+    def __send_response(self, request_id, packed_response):
+        # Concurrently handled requests can finish after
+        # the link has closed, and are then not answered.
+        if self.status == Link.ACTIVE:
+            if len(packed_response) <= self.mdu:
+                RNS.Packet(self, packed_response, RNS.Packet.DATA, context = RNS.Packet.RESPONSE).send()
+            else:
+                response_resource = RNS.Resource(packed_response, self, request_id = request_id, is_response = True)
+
     def handle_response(self, request_id, response_data, response_size, response_transfer_size):
         if self.status == Link.ACTIVE:
             remove = None
@@ -837,6 +902,7 @@ class Link:
         """
         if self._channel is None:
             self._channel = Channel(LinkChannelOutlet(self))
+            self._channel.set_congestion_control(self.channel_congestion_control)
         return self._channel
 
     def receive(self, packet):
@@ -861,10 +927,12 @@ class Link:
                         if plaintext != None:
                             self.__update_phy_stats(packet, query_shared=True)
 
+                            # Packets are dropped rather than holding
+                            # up the thread they arrived on, if the
+                            # callbacks of this link fall far behind
                             if self.callbacks.packet != None:
-                                thread = threading.Thread(target=self.callbacks.packet, args=(plaintext, packet))
-                                thread.daemon = True
-                                thread.start()
+                                if not RNS.Executor.dispatch(self.callback_executor, self.callbacks.packet, plaintext, packet, key=self):
+                                    RNS.log("Packet callback queue for "+str(self)+" is full, dropping packet", RNS.LOG_WARNING)
                             
                             if self.destination.proof_strategy == RNS.Destination.PROVE_ALL:
                                 packet.prove()
@@ -1017,6 +1085,24 @@ class Link:
                                 if resource_hash == resource.hash:
                                     resource._rejected()
 
+                    elif packet.context == RNS.Packet.RESOURCE_RPM:
+                        plaintext = self.decrypt(packet.data)
+                        if plaintext != None:
+                            self.__update_phy_stats(packet)
+                            resource_hash = plaintext[:RNS.Identity.HASHLENGTH//8]
+                            for resource in self.incoming_resources:
+                                if resource_hash == resource.hash:
+                                    resource.repair_map_packet(plaintext)
+
+                    elif packet.context == RNS.Packet.RESOURCE_RSM:
+                        plaintext = self.decrypt(packet.data)
+                        if plaintext != None:
+                            self.__update_phy_stats(packet)
+                            resource_hash = plaintext[:RNS.Identity.HASHLENGTH//8]
+                            for resource in self.outgoing_resources.copy():
+                                if resource_hash == resource.hash:
+                                    resource.resume_packet(plaintext)
+
                     elif packet.context == RNS.Packet.KEEPALIVE:
                         if not self.initiator and packet.data == bytes([0xFF]):
                             keepalive_packet = RNS.Packet(self, bytes([0xFE]), context=RNS.Packet.KEEPALIVE)
@@ -1024,14 +1110,30 @@ class Link:
                             self.had_outbound(is_keepalive = True)
 
 
-                    # TODO: find the most efficient way to allow multiple
-                    # transfers at the same time, sending resource hash on
-                    # each packet is a huge overhead. Probably some kind
-                    # of hash -> sequence map
+                    # Resource parts do not carry the resource hash, so
+                    # each incoming resource is asked to match the part
+                    # against its map hash index. Map hashes are salted
+                    # with the random hash of each resource, so this costs
+                    # one hash per resource, and the part is dispatched
+                    # only to the resource it belongs to.
                     elif packet.context == RNS.Packet.RESOURCE:
-                        for resource in self.incoming_resources:
-                            resource.receive_part(packet)
-                            self.__update_phy_stats(packet)
+                        for resource in self.incoming_resources.copy():
+                            match = resource.match_part(packet.data)
+                            if match != None:
+                                resource.receive_part(packet, match)
+                                self.__update_phy_stats(packet)
+                                break
+
+                    # Repair parts are matched against the repair map
+                    # each incoming resource received for its current
+                    # request round, in the same way as parts.
+                    elif packet.context == RNS.Packet.RESOURCE_RPR:
+                        for resource in self.incoming_resources.copy():
+                            repair_index = resource.match_repair(packet.data)
+                            if repair_index != None:
+                                resource.receive_repair(packet, repair_index)
+                                self.__update_phy_stats(packet)
+                                break
 
                     elif packet.context == RNS.Packet.CHANNEL:
                         if not self._channel:
@@ -1070,6 +1172,26 @@ class Link:
             raise e
 
 
+    def encryptor(self):
+        """
+        :returns: An incremental encryptor for data sent over this link. See :func:`RNS.Cryptography.Token.encryptor`.
+        """
+        if not self.token:
+            self.token = Token(self.derived_key)
+
+        return self.token.encryptor()
+
+
+    def decryptor(self, chain=None):
+        """
+        :returns: An incremental decryptor for data received over this link. See :func:`RNS.Cryptography.Token.decryptor`.
+        """
+        if not self.token:
+            self.token = Token(self.derived_key)
+
+        return self.token.decryptor(chain=chain)
+
+
     def decrypt(self, ciphertext):
         try:
             if not self.token:
@@ -1107,12 +1229,34 @@ class Link:
     def set_packet_callback(self, callback):
         """
         Registers a function to be called when a packet has been
-        received over this link.
+        received over this link. The callbacks for a link are run one
+        at a time, in the order the packets arrived, so a callback
+        must not wait for a later packet on the same link, since that
+        packet is only handed over once the callback has returned.
+        If too many packets are waiting for callbacks to run, further
+        ones are dropped.
 
         :param callback: A function or method with the signature *callback(message, packet)* to be called.
         """
         self.callbacks.packet = callback
 
+    def set_callback_executor(self, executor):
+        """
+        Sets how the link established and packet callbacks of this link,
+        and the ready callbacks of buffers on its channel, are run. By
+        default, they run on the shared executor, in the order the events
+        occurred. Running them inline, on the thread that received the
+        packet, saves handing them over, but holds up the processing
+        of further packets for as long as they run.
+
+        :param executor: A :ref:`RNS.Executor.CallbackExecutor<api-executor>`, ``RNS.Executor.INLINE``, or *None* for the shared executor.
+        :raises: *TypeError* if *executor* is not one of these.
+        """
+        if executor != None and executor != RNS.Executor.INLINE and not isinstance(executor, RNS.Executor.CallbackExecutor):
+            raise TypeError("Callback executor must be a CallbackExecutor, RNS.Executor.INLINE or None")
+        else:
+            self.callback_executor = executor
+
     def set_resource_callback(self, callback):
         """
         Registers a function to be called when a resource has been
@@ -1158,6 +1302,7 @@ class Link:
             self.incoming_resources.remove(resource)
         if resource in self.outgoing_resources:
             self.outgoing_resources.remove(resource)
+            self.resource_scheduler.remove(resource)
 
     def set_resource_strategy(self, resource_strategy):
         """
@@ -1171,6 +1316,85 @@ class Link:
         else:
             self.resource_strategy = resource_strategy
 
+    def set_congestion_control(self, algorithm):
+        """
+        Sets the congestion control algorithm used for resources received
+        over the link. Resources already transferring are not affected.
+
+        :param algorithm: One of ``RNS.Congestion.CLASSIC``, ``RNS.Congestion.AIMD`` or ``RNS.Congestion.BBR``, or the name of a controller registered with ``RNS.Congestion.register``.
+        :raises: *TypeError* if the algorithm is unsupported.
+        """
+        if not algorithm in RNS.Congestion.controllers:
+            raise TypeError("Unsupported congestion control algorithm")
+        else:
+            self.congestion_control = algorithm
+
+    def set_channel_congestion_control(self, algorithm):
+        """
+        Sets the congestion control algorithm used for the channel of
+        the link. ``RNS.Congestion.VEGAS`` keeps queues on the path short
+        by reacting to increasing delay, and recovers from random loss
+        faster than the classic algorithm.
+
+        :param algorithm: One of ``RNS.Congestion.CLASSIC`` or ``RNS.Congestion.VEGAS``, or the name of a controller registered with ``RNS.Congestion.register_channel``.
+        :raises: *TypeError* if the algorithm is unsupported.
+        """
+        if not algorithm in RNS.Congestion.channel_controllers:
+            raise TypeError("Unsupported congestion control algorithm")
+        else:
+            self.channel_congestion_control = algorithm
+            if self._channel != None:
+                self._channel.set_congestion_control(algorithm)
+
+    def set_compression(self, codec):
+        """
+        Sets the codec used to compress resources and buffered stream data
+        sent over the link. Only ``RNS.Compression.BZ2`` is understood by
+        peers running older versions of Reticulum, so ``RNS.Compression.BZ2``
+        is used instead of other codecs until the remote peer has reported
+        support for them, in its requests for parts of a resource sent over
+        the link.
+
+        :param codec: One of ``RNS.Compression.BZ2``, ``RNS.Compression.ZLIB_FAST``, ``RNS.Compression.ZLIB``, ``RNS.Compression.ZLIB_BEST`` or ``RNS.Compression.LZMA``.
+        :raises: *TypeError* if the codec is unsupported.
+        """
+        if not codec in RNS.Compression.codecs:
+            raise TypeError("Unsupported compression codec")
+        else:
+            self.compression = RNS.Compression.Strategy(codec)
+
+    def set_resource_fec(self, enabled):
+        """
+        Sets whether resources sent over the link are protected with forward
+        error correction. When enabled, repair parts are sent along with the
+        requested parts, at a rate tuned to the loss reported by the receiver,
+        so that lost parts can be reconstructed without being requested again.
+        Only receivers that support forward error correction report loss, as
+        negotiated in resource advertisements, so this is safe to enable with
+        any peer.
+
+        :param enabled: *True* or *False*.
+        :raises: *TypeError* if *enabled* is not a boolean.
+        """
+        if not isinstance(enabled, bool):
+            raise TypeError("Forward error correction can only be enabled or disabled")
+        else:
+            self.resource_fec = enabled
+
+    def set_resource_concurrency(self, concurrency):
+        """
+        Sets how many outgoing resources can be transferred concurrently on
+        the link. The parts of concurrent resources are interleaved, so that
+        each receives a share of the link in proportion to its priority.
+
+        :param concurrency: The maximum number of concurrent outgoing resources, at least 1.
+        :raises: *TypeError* if *concurrency* is not a positive integer.
+        """
+        if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+            raise TypeError("Resource concurrency must be a positive integer")
+        else:
+            self.resource_concurrency = concurrency
+
     def register_outgoing_resource(self, resource):
         self.outgoing_resources.append(resource)
 
@@ -1193,6 +1417,7 @@ class Link:
     def cancel_outgoing_resource(self, resource):
         if resource in self.outgoing_resources:
             self.outgoing_resources.remove(resource)
+            self.resource_scheduler.remove(resource)
         else:
             RNS.log("Attempt to cancel a non-existing outgoing resource", RNS.LOG_ERROR)
 
@@ -1203,7 +1428,7 @@ class Link:
             RNS.log("Attempt to cancel a non-existing incoming resource", RNS.LOG_ERROR)
 
     def ready_for_new_resource(self):
-        if len(self.outgoing_resources) > 0:
+        if len(self.outgoing_resources) >= self.resource_concurrency:
             return False
         else:
             return True
@@ -1225,7 +1450,7 @@ class RequestReceipt():
     RECEIVING = 0x03
     READY     = 0x04
 
-    def __init__(self, link, packet_receipt = None, resource = None, response_callback = None, failed_callback = None, progress_callback = None, timeout = None, request_size = None):
+    def __init__(self, link, packet_receipt = None, resource = None, response_callback = None, failed_callback = None, progress_callback = None, timeout = None, request_size = None, request_id = None):
         self.packet_receipt = packet_receipt
         self.resource = resource
         self.started_at = None
@@ -1235,6 +1460,10 @@ class RequestReceipt():
             self.packet_receipt.set_timeout_callback(self.request_timed_out)
             self.started_at = time.time()
 
+        elif request_id != None:
+            self.hash = request_id
+            self.started_at = time.time()
+
         elif self.resource != None:
             self.hash = resource.request_id
             resource.set_callback(self.request_resource_concluded)
@@ -1297,10 +1526,28 @@ class RequestReceipt():
             time.sleep(0.1)
 
 
+    def set_packet_receipt(self, packet_receipt):
+        # Attaches the receipt of the request packet to a request
+        # that was registered before it was sent. If the response
+        # already arrived, the packet is marked as delivered.
+        self.packet_receipt = packet_receipt
+        if self.status == RequestReceipt.READY:
+            self.__mark_delivered()
+        packet_receipt.set_timeout_callback(self.request_timed_out)
+
+    def __mark_delivered(self):
+        self.packet_receipt.status = RNS.PacketReceipt.DELIVERED
+        self.packet_receipt.proved = True
+        self.packet_receipt.concluded_at = time.time()
+        self.packet_receipt.timer.cancel()
+        if self.packet_receipt.callbacks.delivery != None:
+            self.packet_receipt.callbacks.delivery(self.packet_receipt)
+
     def request_timed_out(self, packet_receipt):
         self.status = RequestReceipt.FAILED
         self.concluded_at = time.time()
-        self.link.pending_requests.remove(self)
+        if self in self.link.pending_requests:
+            self.link.pending_requests.remove(self)
 
         if self.callbacks.failed != None:
             try:
@@ -1315,11 +1562,7 @@ class RequestReceipt():
                 self.status = RequestReceipt.RECEIVING
                 if self.packet_receipt != None:
                     if self.packet_receipt.status != RNS.PacketReceipt.DELIVERED:
-                        self.packet_receipt.status = RNS.PacketReceipt.DELIVERED
-                        self.packet_receipt.proved = True
-                        self.packet_receipt.concluded_at = time.time()
-                        if self.packet_receipt.callbacks.delivery != None:
-                            self.packet_receipt.callbacks.delivery(self.packet_receipt)
+                        self.__mark_delivered()
 
                 self.progress = resource.get_progress()
                 
@@ -1340,11 +1583,7 @@ class RequestReceipt():
             self.response_concluded_at = time.time()
 
             if self.packet_receipt != None:
-                self.packet_receipt.status = RNS.PacketReceipt.DELIVERED
-                self.packet_receipt.proved = True
-                self.packet_receipt.concluded_at = time.time()
-                if self.packet_receipt.callbacks.delivery != None:
-                    self.packet_receipt.callbacks.delivery(self.packet_receipt)
+                self.__mark_delivered()
 
             if self.callbacks.progress != None:
                 try:
@@ -76,6 +76,9 @@ class Packet:
     COMMAND        = 0x0C   # Packet is a command
     COMMAND_STATUS = 0x0D   # Packet is a status of an executed command
     CHANNEL        = 0x0E   # Packet contains link channel data
+    RESOURCE_RSM   = 0x0F   # Packet is a resource resumption offer
+    RESOURCE_RPR   = 0x10   # Packet is a resource repair part
+    RESOURCE_RPM   = 0x11   # Packet is a resource repair map
     KEEPALIVE      = 0xFA   # Packet is a keepalive packet
     LINKIDENTIFY   = 0xFB   # Packet is a link peer identification proof
     LINKCLOSE      = 0xFC   # Packet is a link close message
@@ -162,9 +165,7 @@ class Packet:
 
     def pack(self):
         self.destination_hash = self.destination.hash
-        self.header = b""
-        self.header += struct.pack("!B", self.flags)
-        self.header += struct.pack("!B", self.hops)
+        self.header = bytes((self.flags, self.hops))
 
         if self.context == Packet.LRPROOF:
             self.header += self.destination.link_id
@@ -189,6 +190,10 @@ class Packet:
                     # A resource takes care of encryption
                     # by itself
                     self.ciphertext = self.data
+                elif self.context == Packet.RESOURCE_RPR:
+                    # Repair parts are combinations of
+                    # already encrypted resource parts
+                    self.ciphertext = self.data
                 elif self.context == Packet.KEEPALIVE:
                     # Keepalive packets contain no actual
                     # data
@@ -241,12 +246,12 @@ class Packet:
             if self.header_type == Packet.HEADER_2:
                 self.transport_id = self.raw[2:DST_LEN+2]
                 self.destination_hash = self.raw[DST_LEN+2:2*DST_LEN+2]
-                self.context = ord(self.raw[2*DST_LEN+2:2*DST_LEN+3])
+                self.context = self.raw[2*DST_LEN+2]
                 self.data = self.raw[2*DST_LEN+3:]
             else:
                 self.transport_id = None
                 self.destination_hash = self.raw[2:DST_LEN+2]
-                self.context = ord(self.raw[DST_LEN+2:DST_LEN+3])
+                self.context = self.raw[DST_LEN+2]
                 self.data = self.raw[DST_LEN+3:]
 
             self.packed = False
@@ -398,6 +403,12 @@ class PacketReceipt:
     EXPL_LENGTH = RNS.Identity.HASHLENGTH//8+RNS.Identity.SIGLENGTH//8
     IMPL_LENGTH = RNS.Identity.SIGLENGTH//8
 
+    # Proofs are accepted for this long after the timeout
+    # has passed, before the receipt is marked as failed,
+    # since proofs can be held up behind other work on
+    # both ends of busy links.
+    TIMEOUT_GRACE = 1.0
+
     # Creates a new packet receipt from a sent packet
     def __init__(self, packet):
         self.hash           = packet.get_hash()
@@ -417,6 +428,9 @@ class PacketReceipt:
             self.timeout    = RNS.Reticulum.get_instance().get_first_hop_timeout(self.destination.hash)
             self.timeout   += Packet.TIMEOUT_PER_HOP * RNS.Transport.hops_to(self.destination.hash)
 
+        self.timer = RNS.Timers.shared().timer(self.__timeout_job)
+        self.timer.schedule_at(self.sent_at+self.timeout+PacketReceipt.TIMEOUT_GRACE)
+
     def get_status(self):
         """
         :returns: The status of the associated :ref:`RNS.Packet<api-packet>` instance. Can be one of ``RNS.PacketReceipt.SENT``, ``RNS.PacketReceipt.DELIVERED``, ``RNS.PacketReceipt.FAILED`` or ``RNS.PacketReceipt.CULLED``. 
@@ -444,6 +458,7 @@ class PacketReceipt:
                     self.proved = True
                     self.concluded_at = time.time()
                     self.proof_packet = proof_packet
+                    self.timer.cancel()
                     link.last_proof = self.concluded_at
 
                     if self.callbacks.delivery != None:
@@ -491,6 +506,7 @@ class PacketReceipt:
                     self.proved = True
                     self.concluded_at = time.time()
                     self.proof_packet = proof_packet
+                    self.timer.cancel()
 
                     if self.callbacks.delivery != None:
                         try:
@@ -519,6 +535,7 @@ class PacketReceipt:
                     self.proved = True
                     self.concluded_at = time.time()
                     self.proof_packet = proof_packet
+                    self.timer.cancel()
 
                     if self.callbacks.delivery != None:
                         try:
@@ -541,6 +558,13 @@ class PacketReceipt:
     def is_timed_out(self):
         return (self.sent_at+self.timeout < time.time())
 
+    # Concluded receipts are removed from the list
+    # of receipts by Transport, on its job loop
+    def __timeout_job(self):
+        self.check_timeout()
+        if self.status == PacketReceipt.SENT:
+            self.timer.schedule_at(self.sent_at+self.timeout+PacketReceipt.TIMEOUT_GRACE)
+
     def check_timeout(self):
         if self.status == PacketReceipt.SENT and self.is_timed_out():
             if self.timeout == -1:
@@ -549,11 +573,11 @@ class PacketReceipt:
                 self.status = PacketReceipt.FAILED
 
             self.concluded_at = time.time()
+            self.timer.cancel()
 
             if self.callbacks.timeout:
-                thread = threading.Thread(target=self.callbacks.timeout, args=(self,))
-                thread.daemon = True
-                thread.start()
+                executor = getattr(self.destination, "callback_executor", None)
+                RNS.Executor.dispatch(executor, self.callbacks.timeout, self, bounded=False)
 
 
     def set_timeout(self, timeout):
@@ -563,6 +587,8 @@ class PacketReceipt:
         :param timeout: The timeout in seconds.
         """
         self.timeout = float(timeout)
+        if self.status == PacketReceipt.SENT:
+            self.timer.schedule_at(self.sent_at+self.timeout+PacketReceipt.TIMEOUT_GRACE)
 
     def set_delivery_callback(self, callback):
         """
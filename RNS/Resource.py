@@ -22,12 +22,12 @@
 
 import RNS
 import os
-import bz2
 import math
 import time
 import tempfile
 import threading
 from threading import Lock
+from collections import deque, OrderedDict
 from .vendor import umsgpack as umsgpack
 from time import sleep
 
@@ -43,6 +43,9 @@ class Resource:
     :param auto_compress: Optional. Whether to auto-compress the resource. Can be *True* or *False*.
     :param callback: An optional *callable* with the signature *callback(resource)*. Will be called when the resource transfer concludes.
     :param progress_callback: An optional *callable* with the signature *callback(resource)*. Will be called whenever the resource transfer progress is updated.
+    :param resumable: Optional. Whether an interrupted transfer of the resource can be resumed over a new link, by sending the same data again as a resumable resource. Can be *True* or *False*.
+    :param priority: Optional. The share of the link the resource receives while other resources are transferred concurrently, relative to their priority. Must be a positive number, the default is 1.
+    :param cacheable: Optional. Whether the resource hash should be derived from the data, so that receivers already holding the same content in their content store can conclude the transfer without receiving it again. Can be *True* or *False*.
     """
 
     # The initial window size at beginning of transfer
@@ -112,10 +115,52 @@ class Resource:
     MAX_EFFICIENT_SIZE      = 16 * 1024 * 1024 - 1
     RESPONSE_MAX_GRACE_TIME = 10
     
-    # The maximum size to auto-compress with
-    # bz2 before sending.
+    # The maximum size to auto-compress
+    # before sending.
     AUTO_COMPRESS_MAX_SIZE = MAX_EFFICIENT_SIZE
 
+    # Resource segments read from files larger than
+    # this are streamed through compression and
+    # encryption in chunks of STREAM_CHUNK_SIZE, and
+    # the encrypted stream is spooled to a temporary
+    # file, instead of being held in memory. Incoming
+    # segments larger than this are likewise written
+    # to a spool file as parts arrive, and assembled
+    # incrementally in chunks of STREAM_CHUNK_SIZE.
+    STREAMING_THRESHOLD = 1024*1024
+    STREAM_CHUNK_SIZE   = 256*1024
+
+    # Map hashes are computed over blocks of this
+    # many parts, each read from the data or spool
+    # in a single operation.
+    HASHMAP_BLOCK_PARTS = 2048
+
+    # Receivers of resumable resources persist the
+    # decrypted payload of the segment in transfer, and
+    # the state needed to continue it, next to the
+    # storage path. When the same resource is offered
+    # again, only the parts not already held are
+    # requested from the sender.
+    RESUME_SUFFIX       = ".resume"
+    PARTIAL_SUFFIX      = ".partial"
+
+    # The compressed payloads of cacheable and resumable
+    # resources are kept in memory by their data hash, up
+    # to this many bytes in total, so sending the same
+    # content again, over any link, does not compress it
+    # again. The least recently used payloads are evicted
+    # first.
+    PAYLOAD_CACHE_SIZE  = 32*1024*1024
+
+    # Content derived random hashes are searched among
+    # this many attempts when checking whether received
+    # content should be added to the content store.
+    CONTENT_ATTEMPTS    = 8
+
+    payload_cache       = OrderedDict()
+    payload_cache_size  = 0
+    payload_cache_lock  = Lock()
+
     PART_TIMEOUT_FACTOR           = 4
     PART_TIMEOUT_FACTOR_AFTER_RTT = 2
     PROOF_TIMEOUT_FACTOR          = 3
@@ -131,6 +176,24 @@ class Resource:
     HASHMAP_IS_NOT_EXHAUSTED = 0x00
     HASHMAP_IS_EXHAUSTED = 0xFF
 
+    # Senders that set the FEC flag in advertisements
+    # receive a report in the first byte of requests
+    # that do not exhaust the hashmap. REQUEST_FEC marks
+    # the byte as a report, REQUEST_CODECS is set if the
+    # receiver can decompress every built-in codec, and
+    # the upper six bits carry the loss the receiver
+    # observed, in steps of 1/REQUEST_LOSS_STEPS. Older
+    # receivers send no report, and a report never
+    # equals HASHMAP_IS_EXHAUSTED.
+    REQUEST_FEC        = 0x01
+    REQUEST_CODECS     = 0x02
+    REQUEST_LOSS_STEPS = 50
+
+    # Concurrent resources on a link share it in
+    # proportion to their priority, which is this
+    # unless set otherwise.
+    DEFAULT_PRIORITY = 1
+
     # Status constants
     NONE            = 0x00
     QUEUED          = 0x01
@@ -173,6 +236,9 @@ class Resource:
             resource.hashmap_raw         = adv.m
             resource.encrypted           = True if resource.flags & 0x01 else False
             resource.compressed          = True if resource.flags >> 1 & 0x01 else False
+            resource.resumable           = True if resource.flags >> 5 & 0x01 else False
+            resource.sender_fec          = True if resource.flags >> 6 & 0x01 else False
+            resource.codec               = RNS.Compression.by_id(adv.z) if resource.compressed else None
             resource.initiator           = False
             resource.callback            = callback
             resource.__progress_callback = progress_callback
@@ -194,29 +260,59 @@ class Resource:
             else:
                 resource.split = False
 
+            if resource.size > Resource.STREAMING_THRESHOLD or resource.resumable:
+                resource.spool = tempfile.TemporaryFile()
+                resource.spool.truncate(resource.size)
+
             resource.hashmap = [None] * resource.total_parts
+            resource.map_hash_index = {}
             resource.hashmap_height = 0
             resource.waiting_for_hmu = False
             resource.receiving_part = False
             resource.consecutive_completed_height = -1
 
+            resource.fec_loss = None
+            resource.fec_round_id = None
+            resource.fec_round_parts = []
+            resource.fec_round_index = {}
+            resource.fec_round_received = 0
+            resource.fec_repair_map = []
+            resource.fec_repairs = {}
+
             previous_window = resource.link.get_last_resource_window()
             previous_eifr   = resource.link.get_last_resource_eifr()
             if previous_window:
                 resource.window = previous_window
             if previous_eifr:
                 resource.previous_eifr = previous_eifr
+
+            resource.congestion = RNS.Congestion.create(resource)
             
+            if resource.compressed and resource.codec == None:
+                RNS.log(f"Rejecting resource advertisement for {RNS.prettyhexrep(resource.hash)}, since it was compressed with an unsupported codec", RNS.LOG_ERROR)
+                Resource.reject(advertisement_packet)
+                return None
+
             if not resource.link.has_incoming_resource(resource):
+                if resource.resumable and not resource.__resume_begin():
+                    return None
+
+                if resource.__conclude_from_store():
+                    return resource
+
                 resource.link.register_incoming_resource(resource)
 
                 RNS.log(f"Accepting resource advertisement for {RNS.prettyhexrep(resource.hash)}. Transfer size is {RNS.prettysize(resource.size)} in {resource.total_parts} parts.", RNS.LOG_DEBUG)
+                resource.congestion.started()
                 if resource.link.callbacks.resource_started != None:
                     try:
                         resource.link.callbacks.resource_started(resource)
                     except Exception as e:
                         RNS.log("Error while executing resource started callback from "+str(resource)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
 
+                if resource.payload_held > 0:
+                    resource.__send_resume(resource.segment_index, resource.__held_parts())
+
                 resource.hashmap_update(0, resource.hashmap_raw)
 
                 resource.watchdog_job()
@@ -234,12 +330,15 @@ class Resource:
     # Create a resource for transmission to a remote destination
     # The data passed can be either a bytes-array or a file opened
     # in binary read mode.
-    def __init__(self, data, link, advertise=True, auto_compress=True, callback=None, progress_callback=None, timeout = None, segment_index = 1, original_hash = None, request_id = None, is_response = False):
+    def __init__(self, data, link, advertise=True, auto_compress=True, callback=None, progress_callback=None, timeout = None, segment_index = 1, original_hash = None, request_id = None, is_response = False, resumable = False, cacheable = False, priority = DEFAULT_PRIORITY):
         data_size = None
         resource_data = None
         self.assembly_lock = False
         self.preparing_next_segment = False
         self.next_segment = None
+        self.resumable = resumable
+        self.cacheable = cacheable
+        self.set_priority(priority)
 
         if data != None:
             if not hasattr(data, "read") and len(data) > Resource.MAX_EFFICIENT_SIZE:
@@ -249,6 +348,7 @@ class Resource:
                 data.write(original_data)
                 del original_data
 
+        stream_source = None
         if hasattr(data, "read"):
             if data_size == None:
                 data_size = os.stat(data.name).st_size
@@ -259,17 +359,26 @@ class Resource:
                 self.total_segments = 1
                 self.segment_index  = 1
                 self.split          = False
-                resource_data = data.read()
-                data.close()
+                segment_start       = data.tell()
+                segment_length      = data_size-segment_start
+                if segment_length > Resource.STREAMING_THRESHOLD:
+                    stream_source = (data, segment_start, segment_length)
+                else:
+                    resource_data = data.read()
+                    data.close()
             else:
                 self.total_segments = ((data_size-1)//Resource.MAX_EFFICIENT_SIZE)+1
                 self.segment_index  = segment_index
                 self.split          = True
                 seek_index          = segment_index-1
                 seek_position       = seek_index*Resource.MAX_EFFICIENT_SIZE
+                segment_length      = min(Resource.MAX_EFFICIENT_SIZE, data_size-seek_position)
 
-                data.seek(seek_position)
-                resource_data = data.read(Resource.MAX_EFFICIENT_SIZE)
+                if segment_length > Resource.STREAMING_THRESHOLD:
+                    stream_source = (data, seek_position, segment_length)
+                else:
+                    data.seek(seek_position)
+                    resource_data = data.read(Resource.MAX_EFFICIENT_SIZE)
                 self.input_file = data
 
         elif isinstance(data, bytes):
@@ -291,6 +400,9 @@ class Resource:
 
         self.status = Resource.NONE
         self.link = link
+        self.fec = self.link.resource_fec
+        self.fec_loss = None
+        self.sender_fec = False
         if self.link.mtu:
             self.sdu = self.link.mtu - RNS.Reticulum.HEADER_MAXSIZE - RNS.Reticulum.IFAC_MIN_SIZE
         else:
@@ -303,6 +415,7 @@ class Resource:
         self.sender_grace_time = Resource.SENDER_GRACE_TIME
         self.hmu_retry_ok = False
         self.watchdog_lock = False
+        self.watchdog = None
         self.__watchdog_job_id = 0
         self.__progress_callback = progress_callback
         self.rtt = None
@@ -313,11 +426,11 @@ class Resource:
         self.req_data_rtt_rate = 0
         self.eifr = None
         self.previous_eifr = None
-        self.fast_rate_rounds = 0
-        self.very_slow_rate_rounds = 0
+        self.congestion = None
         self.request_id = request_id
         self.is_response = is_response
         self.auto_compress = auto_compress
+        self.codec = None
 
         self.req_hashlist = []
         self.receiver_min_consecutive_height = 0
@@ -327,95 +440,97 @@ class Resource:
         else:
             self.timeout = self.link.rtt * self.link.traffic_timeout_factor
 
-        if data != None:
+        self.spool = None
+        self.spool_lock = Lock()
+        self.spooled_map_hashes = None
+        self.assembly_file = None
+        self.assembly_started = False
+        self.assembly_scheduled = False
+        self.assembly_state_lock = Lock()
+        self.assembled_offset = 0
+        self.assembly_failed = False
+        self.payload_file = None
+        self.payload_held = 0
+
+        if data != None or stream_source != None:
             self.initiator         = True
             self.callback          = callback
-            self.uncompressed_data = data
 
-            compression_began = time.time()
-            if (auto_compress and len(self.uncompressed_data) <= Resource.AUTO_COMPRESS_MAX_SIZE):
-                RNS.log("Compressing resource data...", RNS.LOG_EXTREME)
-                self.compressed_data   = bz2.compress(self.uncompressed_data)
-                RNS.log("Compression completed in "+str(round(time.time()-compression_began, 3))+" seconds", RNS.LOG_EXTREME)
+            if stream_source != None:
+                data_hasher = self.__stream_prepare(*stream_source, auto_compress)
+                if not self.split:
+                    stream_source[0].close()
             else:
-                self.compressed_data   = self.uncompressed_data
-
-            self.uncompressed_size = len(self.uncompressed_data)
-            self.compressed_size   = len(self.compressed_data)
+                data_hasher = self.__prepare(data, auto_compress)
 
-            if (self.compressed_size < self.uncompressed_size and auto_compress):
-                saved_bytes = len(self.uncompressed_data) - len(self.compressed_data)
-                RNS.log("Compression saved "+str(saved_bytes)+" bytes, sending compressed", RNS.LOG_EXTREME)
-
-                self.data  = b""
-                self.data += RNS.Identity.get_random_hash()[:Resource.RANDOM_HASH_SIZE]
-                self.data += self.compressed_data
-                
-                self.compressed = True
-                self.uncompressed_data = None
-
-            else:
-                self.data  = b""
-                self.data += RNS.Identity.get_random_hash()[:Resource.RANDOM_HASH_SIZE]
-                self.data += self.uncompressed_data
-                self.uncompressed_data = self.data
-
-                self.compressed = False
-                self.compressed_data = None
-                if auto_compress:
-                    RNS.log("Compression did not decrease size, sending uncompressed", RNS.LOG_EXTREME)
-
-            # Resources handle encryption directly to
-            # make optimal use of packet MTU on an entire
-            # encrypted stream. The Resource instance will
-            # use it's underlying link directly to encrypt.
-            self.data = self.link.encrypt(self.data)
-            self.encrypted = True
-
-            self.size = len(self.data)
+            self.size = self.encrypted_size
             self.sent_parts = 0
-            hashmap_entries = int(math.ceil(self.size/float(self.sdu)))
+            self.part_sent = bytearray(int(math.ceil(self.size/float(self.sdu))))
+            hashmap_entries = len(self.part_sent)
             self.total_parts = hashmap_entries
                 
             hashmap_ok = False
+            attempt = 0
             while not hashmap_ok:
                 hashmap_computation_began = time.time()
                 RNS.log("Starting resource hashmap computation with "+str(hashmap_entries)+" entries...", RNS.LOG_EXTREME)
 
-                self.random_hash       = RNS.Identity.get_random_hash()[:Resource.RANDOM_HASH_SIZE]
-                self.hash = RNS.Identity.full_hash(data+self.random_hash)
-                self.truncated_hash = RNS.Identity.truncated_hash(data+self.random_hash)
-                self.expected_proof = RNS.Identity.full_hash(data+self.hash)
+                if attempt == 0 and self.spooled_map_hashes != None:
+                    # Streamed resources choose their first random
+                    # hash before spooling, and hash their parts
+                    # while the spool is written.
+                    spooled_map_hashes = self.spooled_map_hashes
+                else:
+                    self.random_hash = self.__random_hash(data_hasher, attempt)
+                    spooled_map_hashes = None
+                attempt += 1
+                resource_hasher = data_hasher.copy()
+                resource_hasher.update(self.random_hash)
+                self.hash = resource_hasher.digest()
+                self.truncated_hash = self.hash[:RNS.Identity.TRUNCATED_HASHLENGTH//8]
+                proof_hasher = data_hasher.copy()
+                proof_hasher.update(self.hash)
+                self.expected_proof = proof_hasher.digest()
 
                 if original_hash == None:
                     self.original_hash = self.hash
                 else:
                     self.original_hash = original_hash
 
-                self.parts  = []
-                self.hashmap = b""
-                collision_guard_list = []
-                for i in range(0,hashmap_entries):
-                    data = self.data[i*self.sdu:(i+1)*self.sdu]
-                    map_hash = self.get_map_hash(data)
-
-                    if map_hash in collision_guard_list:
-                        RNS.log("Found hash collision in resource map, remapping...", RNS.LOG_DEBUG)
-                        hashmap_ok = False
-                        break
+                # Map hashes must be unique within the collision
+                # guard distance. The guard window is kept both
+                # as a ring, to know which hash leaves it, and
+                # as a set, for constant time lookups.
+                self.map_hashes = []
+                self.map_hash_index = {}
+                collision_guard_set = set()
+                collision_guard_ring = deque()
+                hashmap_ok = True
+                for block_start in range(0, hashmap_entries, Resource.HASHMAP_BLOCK_PARTS):
+                    block_end = min(block_start+Resource.HASHMAP_BLOCK_PARTS, hashmap_entries)
+                    if spooled_map_hashes != None:
+                        block = spooled_map_hashes[block_start:block_end]
                     else:
-                        hashmap_ok = True
-                        collision_guard_list.append(map_hash)
-                        if len(collision_guard_list) > ResourceAdvertisement.COLLISION_GUARD_SIZE:
-                            collision_guard_list.pop(0)
-
-                        part = RNS.Packet(link, data, context=RNS.Packet.RESOURCE)
-                        part.pack()
-                        part.map_hash = map_hash
-
-                        self.hashmap += part.map_hash
-                        self.parts.append(part)
+                        block = self.__map_hash_block(block_start, block_end)
+                    for map_hash in block:
+                        if map_hash in collision_guard_set:
+                            RNS.log("Found hash collision in resource map, remapping...", RNS.LOG_DEBUG)
+                            hashmap_ok = False
+                            break
+
+                        collision_guard_set.add(map_hash)
+                        collision_guard_ring.append(map_hash)
+                        if len(collision_guard_ring) > ResourceAdvertisement.COLLISION_GUARD_SIZE:
+                            collision_guard_set.remove(collision_guard_ring.popleft())
+
+                        self.__index_map_hash(map_hash, len(self.map_hashes))
+                        self.map_hashes.append(map_hash)
+
+                    if not hashmap_ok:
+                        break
 
+                self.hashmap = b"".join(self.map_hashes)
+                self.spooled_map_hashes = None
                 RNS.log("Hashmap computation concluded in "+str(round(time.time()-hashmap_computation_began, 3))+" seconds", RNS.LOG_EXTREME)
                 
             if advertise:
@@ -441,7 +556,9 @@ class Resource:
             for i in range(0,hashes):
                 if self.hashmap[i+segment*seg_len] == None:
                     self.hashmap_height += 1
-                self.hashmap[i+segment*seg_len] = hashmap[i*Resource.MAPHASH_LEN:(i+1)*Resource.MAPHASH_LEN]
+                    map_hash = hashmap[i*Resource.MAPHASH_LEN:(i+1)*Resource.MAPHASH_LEN]
+                    self.hashmap[i+segment*seg_len] = map_hash
+                    self.__index_map_hash(map_hash, i+segment*seg_len)
 
             self.waiting_for_hmu = False
             self.request_next()
@@ -449,6 +566,643 @@ class Resource:
     def get_map_hash(self, data):
         return RNS.Identity.full_hash(data+self.random_hash)[:Resource.MAPHASH_LEN]
 
+    def __random_hash(self, data_hasher, attempt):
+        if self.resumable or self.cacheable:
+            # Resumable and cacheable resources derive their
+            # random hash from the data, so the resource hash
+            # is the same every time the same data is sent.
+            return RNS.Identity.full_hash(data_hasher.copy().digest()+attempt.to_bytes(4, "big"))[:Resource.RANDOM_HASH_SIZE]
+        else:
+            return RNS.Identity.get_random_hash()[:Resource.RANDOM_HASH_SIZE]
+
+    def __map_hash_block(self, start, end):
+        # Computes the map hashes of parts from start
+        # to end, equal to get_map_hash of each part.
+        # Only used to remap spooled resources after a
+        # map hash collision, since they otherwise hash
+        # their parts while spooling.
+        if self.spool != None:
+            with self.spool_lock:
+                self.spool.seek(start*self.sdu)
+                block = self.spool.read((end-start)*self.sdu)
+        else:
+            block = self.data[start*self.sdu:end*self.sdu]
+
+        map_hashes = []
+        for offset in range(0, len(block), self.sdu):
+            hasher = RNS.Cryptography.Hashes.sha256_hasher()
+            hasher.update(block[offset:offset+self.sdu])
+            hasher.update(self.random_hash)
+            map_hashes.append(hasher.digest()[:Resource.MAPHASH_LEN])
+
+        return map_hashes
+
+    def __index_map_hash(self, map_hash, index):
+        # Map hashes are only guaranteed to be unique within
+        # the collision guard distance, so the index keeps
+        # every part index a map hash occurs at. Most map
+        # hashes occur only once, and their index is kept
+        # directly instead of in a list, to save memory.
+        indices = self.map_hash_index.get(map_hash)
+        if indices == None:
+            self.map_hash_index[map_hash] = index
+        elif type(indices) == list:
+            indices.append(index)
+        else:
+            self.map_hash_index[map_hash] = [indices, index]
+
+    def find_part(self, map_hash, start, end):
+        """
+        :returns: The index of the part with *map_hash* in the range from *start* to *end*, or *None*.
+        """
+        indices = self.map_hash_index.get(map_hash)
+        if indices == None:
+            return None
+        elif type(indices) != list:
+            indices = (indices,)
+
+        for index in indices:
+            if index >= start and index < end:
+                return index
+        return None
+
+    def match_part(self, part_data):
+        """
+        Looks up which part of this incoming resource some
+        received part data is, within the current window.
+
+        :returns: A tuple of the part index and map hash, or *None* if the data does not belong to this resource.
+        """
+        map_hash = self.get_map_hash(part_data)
+        start = self.consecutive_completed_height if self.consecutive_completed_height >= 0 else 0
+        index = self.find_part(map_hash, start, start+self.window)
+        if index == None:
+            return None
+        else:
+            return (index, map_hash)
+
+    def __prepare(self, data, auto_compress):
+        # Compresses and encrypts an in-memory resource
+        # segment, and returns a hasher over its data.
+        compression_began = time.time()
+        self.uncompressed_size = len(data)
+        data_hasher = RNS.Cryptography.Hashes.sha256_hasher()
+        data_hasher.update(data)
+        codec = None
+        cached = None
+        if auto_compress and (self.resumable or self.cacheable):
+            cached = Resource.__cached_payload(data_hasher.digest())
+
+        if cached != None and not self.__codec_usable(cached[0]):
+            cached = None
+
+        if cached != None:
+            codec, compressed_data = cached
+            RNS.log("Using cached "+codec.name+" compressed payload for resource data", RNS.LOG_EXTREME)
+        else:
+            if (auto_compress and len(data) <= Resource.AUTO_COMPRESS_MAX_SIZE):
+                codec = self.__select_codec(RNS.Compression.sample(data))
+
+            if codec != None:
+                RNS.log("Compressing resource data with "+codec.name+"...", RNS.LOG_EXTREME)
+                compressed_data = codec.compress(data)
+                self.link.compression.record(len(data), len(compressed_data))
+                RNS.log("Compression completed in "+str(round(time.time()-compression_began, 3))+" seconds", RNS.LOG_EXTREME)
+            else:
+                compressed_data = data
+
+        self.compressed_size = len(compressed_data)
+        if (self.compressed_size < self.uncompressed_size and codec != None):
+            saved_bytes = self.uncompressed_size - self.compressed_size
+            RNS.log("Compression saved "+str(saved_bytes)+" bytes, sending compressed", RNS.LOG_EXTREME)
+            payload = compressed_data
+            self.compressed = True
+            self.codec = codec
+            if (self.resumable or self.cacheable) and cached == None:
+                Resource.__cache_payload(data_hasher.digest(), codec, compressed_data)
+
+        else:
+            payload = data
+            self.compressed = False
+            if codec != None:
+                RNS.log("Compression did not decrease size, sending uncompressed", RNS.LOG_EXTREME)
+            elif auto_compress:
+                RNS.log("Resource data is not expected to be compressible, sending uncompressed", RNS.LOG_EXTREME)
+
+        # Resources handle encryption directly to
+        # make optimal use of packet MTU on an entire
+        # encrypted stream. The Resource instance will
+        # use it's underlying link directly to encrypt.
+        self.data = self.link.encrypt(self.__payload_prefix(data_hasher)+payload)
+        self.encrypted = True
+        self.encrypted_size = len(self.data)
+
+        return data_hasher
+
+    def __stream_prepare(self, input_file, start, length, auto_compress):
+        # Compresses and encrypts a resource segment from
+        # a file in chunks, and spools the encrypted stream
+        # to a temporary file. Only one chunk at a time is
+        # held in memory. Returns a hasher over the data.
+        stream_began = time.time()
+        chunk_size = Resource.STREAM_CHUNK_SIZE
+        data_hasher = RNS.Cryptography.Hashes.sha256_hasher()
+        compressed_file = None
+        compressed_size = 0
+        compressor = None
+        codec = None
+        if auto_compress and length <= Resource.AUTO_COMPRESS_MAX_SIZE:
+            codec = self.__select_codec(RNS.Compression.sample_file(input_file, start, length))
+        if codec != None:
+            compressor = codec.compressor()
+            compressed_file = tempfile.TemporaryFile()
+
+        input_file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = input_file.read(min(chunk_size, remaining))
+            if len(chunk) == 0:
+                raise IOError("Resource input file ended before the expected segment size was read")
+            remaining -= len(chunk)
+            data_hasher.update(chunk)
+            if compressor != None:
+                compressed = compressor.compress(chunk)
+                compressed_size += len(compressed)
+                compressed_file.write(compressed)
+
+        self.uncompressed_size = length
+        if compressor != None:
+            compressed = compressor.flush()
+            compressed_size += len(compressed)
+            compressed_file.write(compressed)
+            self.compressed_size = compressed_size
+            self.link.compression.record(length, compressed_size)
+        else:
+            self.compressed_size = length
+
+        if compressor != None and compressed_size < length:
+            RNS.log("Compression saved "+str(length-compressed_size)+" bytes, sending compressed", RNS.LOG_EXTREME)
+            self.compressed = True
+            self.codec = codec
+            source = compressed_file
+            source.seek(0)
+            remaining = compressed_size
+        else:
+            if compressor != None:
+                RNS.log("Compression did not decrease size, sending uncompressed", RNS.LOG_EXTREME)
+                compressed_file.close()
+            elif auto_compress:
+                RNS.log("Resource data is not expected to be compressible, sending uncompressed", RNS.LOG_EXTREME)
+            self.compressed = False
+            source = input_file
+            source.seek(start)
+            remaining = length
+
+        # The data hash is complete at this point, so the
+        # random hash can be chosen before the stream is
+        # encrypted, and each part hashed as it is spooled
+        # instead of reading the spool back afterwards.
+        self.random_hash = self.__random_hash(data_hasher, 0)
+        self.spooled_map_hashes = []
+        part_hasher = None
+        part_length = 0
+        def spool_write(encrypted):
+            nonlocal part_hasher, part_length
+            self.spool.write(encrypted)
+            encrypted = memoryview(encrypted)
+            offset = 0
+            while offset < len(encrypted):
+                if part_hasher == None:
+                    part_hasher = RNS.Cryptography.Hashes.sha256_hasher()
+                    part_length = 0
+                taken = min(self.sdu-part_length, len(encrypted)-offset)
+                part_hasher.update(encrypted[offset:offset+taken])
+                part_length += taken
+                offset += taken
+                if part_length == self.sdu:
+                    part_hasher.update(self.random_hash)
+                    self.spooled_map_hashes.append(part_hasher.digest()[:Resource.MAPHASH_LEN])
+                    part_hasher = None
+
+        encryptor = self.link.encryptor()
+        self.spool = tempfile.TemporaryFile()
+        spool_write(encryptor.update(self.__payload_prefix(data_hasher)))
+        while remaining > 0:
+            chunk = source.read(min(chunk_size, remaining))
+            if len(chunk) == 0:
+                raise IOError("Resource source ended before the expected size was read")
+            remaining -= len(chunk)
+            spool_write(encryptor.update(chunk))
+        spool_write(encryptor.finalize())
+        if part_hasher != None:
+            part_hasher.update(self.random_hash)
+            self.spooled_map_hashes.append(part_hasher.digest()[:Resource.MAPHASH_LEN])
+
+        if self.compressed:
+            compressed_file.close()
+
+        self.encrypted = True
+        self.encrypted_size = self.spool.tell()
+        self.data = None
+        RNS.log("Streamed resource segment of "+RNS.prettysize(length)+" in "+str(round(time.time()-stream_began, 3))+" seconds", RNS.LOG_EXTREME)
+
+        return data_hasher
+
+    def __select_codec(self, samples):
+        codec = self.link.compression.select(samples, remember=not self.resumable)
+        if codec != None and not self.__codec_usable(codec):
+            codec = RNS.Compression.codecs[RNS.Compression.DEFAULT]
+        return codec
+
+    def __codec_usable(self, codec):
+        # Receivers that predate codec selection only
+        # decompress the default codec, so others are
+        # used once the remote peer has reported in a
+        # request that it supports them.
+        return codec.ID == RNS.Compression.codecs[RNS.Compression.DEFAULT].ID or self.link.remote_codecs
+
+    @staticmethod
+    def __cached_payload(data_digest):
+        with Resource.payload_cache_lock:
+            if data_digest in Resource.payload_cache:
+                Resource.payload_cache.move_to_end(data_digest)
+                return Resource.payload_cache[data_digest]
+            return None
+
+    @staticmethod
+    def __cache_payload(data_digest, codec, payload):
+        if len(payload) > Resource.PAYLOAD_CACHE_SIZE:
+            return
+
+        with Resource.payload_cache_lock:
+            if data_digest in Resource.payload_cache:
+                return
+            Resource.payload_cache[data_digest] = (codec, payload)
+            Resource.payload_cache_size += len(payload)
+            while Resource.payload_cache_size > Resource.PAYLOAD_CACHE_SIZE:
+                evicted_codec, evicted_payload = Resource.payload_cache.popitem(last=False)[1]
+                Resource.payload_cache_size -= len(evicted_payload)
+
+    def __payload_prefix(self, data_hasher):
+        # The payload of resumable resources must be the same
+        # every time they are sent, so their prefix is derived
+        # from the data instead of being random.
+        if self.resumable:
+            return RNS.Identity.full_hash(data_hasher.copy().digest())[:Resource.RANDOM_HASH_SIZE]
+        else:
+            return RNS.Identity.get_random_hash()[:Resource.RANDOM_HASH_SIZE]
+
+    def get_part_data(self, index):
+        if self.spool != None:
+            with self.spool_lock:
+                self.spool.seek(index*self.sdu)
+                return self.spool.read(self.sdu)
+        else:
+            return self.data[index*self.sdu:(index+1)*self.sdu]
+
+    def __close_spool(self):
+        try:
+            if self.spool != None:
+                with self.spool_lock:
+                    self.spool.close()
+            if self.assembly_file != None:
+                self.assembly_file.close()
+            if self.payload_file != None:
+                self.payload_file.close()
+        except Exception as e:
+            RNS.log("Error while closing resource spool file: "+str(e), RNS.LOG_ERROR)
+
+    def __assembly_begin(self):
+        # Sets up the incremental pipeline that decrypts,
+        # decompresses and hashes a spooled incoming segment,
+        # and appends the plaintext to the storage path. The
+        # decrypted payload of resumable resources is instead
+        # persisted, and only expanded into storage once the
+        # segment is complete.
+        self.assembly_started = True
+        self.decompressor = self.codec.decompressor() if self.compressed else None
+        self.data_hasher = RNS.Cryptography.Hashes.sha256_hasher()
+        self.random_hash_left = Resource.RANDOM_HASH_SIZE
+
+        if self.resumable:
+            chain = None
+            if self.encrypted and self.payload_held > 0:
+                # Decryption continues from the ciphertext block
+                # preceding the first one not already held
+                with self.spool_lock:
+                    self.spool.seek(self.assembled_offset)
+                    chain = self.spool.read(16)
+                self.assembled_offset += len(chain)
+            self.decryptor = self.link.decryptor(chain=chain) if self.encrypted else None
+
+        else:
+            self.decryptor = self.link.decryptor() if self.encrypted else None
+            self.assembly_file = open(self.storagepath, "ab")
+            self.assembly_file.seek(0, os.SEEK_END)
+            self.storage_offset = self.assembly_file.tell()
+
+    def __assembly_feed(self, plaintext):
+        if self.random_hash_left > 0:
+            stripped = min(self.random_hash_left, len(plaintext))
+            plaintext = plaintext[stripped:]
+            self.random_hash_left -= stripped
+
+        if len(plaintext) == 0:
+            return
+
+        if self.decompressor != None:
+            # Output is bounded to one chunk per call, so
+            # highly compressible data cannot inflate into
+            # an unbounded buffer.
+            chunk = self.decompressor.decompress(plaintext, Resource.STREAM_CHUNK_SIZE)
+            while True:
+                self.__assembly_write(chunk)
+                if self.decompressor.eof or self.decompressor.needs_input:
+                    break
+                chunk = self.decompressor.decompress(b"", Resource.STREAM_CHUNK_SIZE)
+        else:
+            self.__assembly_write(plaintext)
+
+    def __assembly_write(self, data):
+        if len(data) > 0:
+            self.data_hasher.update(data)
+            self.assembly_file.write(data)
+
+    def __assembly_output(self, plaintext):
+        if self.resumable:
+            self.payload_file.write(plaintext)
+            self.payload_held += len(plaintext)
+        else:
+            self.__assembly_feed(plaintext)
+
+    def __assembly_expand(self):
+        # Feeds the persisted payload of a completely
+        # received resumable segment into storage.
+        self.payload_file.flush()
+        self.payload_file.seek(0)
+        self.assembly_file = open(self.storagepath, "ab")
+        while True:
+            chunk = self.payload_file.read(Resource.STREAM_CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+            self.__assembly_feed(chunk)
+
+    def __assembly_advance(self, final=False, flush=False):
+        # Feeds the consecutively received part of the spool
+        # through the assembly pipeline. Unless this is the
+        # final call, at least one full chunk must be ready,
+        # or when flushing, any data at all.
+        with self.assembly_state_lock:
+            self.__assembly_advance_locked(final, flush)
+
+    def __assembly_advance_locked(self, final, flush):
+        if self.assembly_failed:
+            if final:
+                raise ValueError("Incremental assembly of resource data failed")
+            return
+
+        try:
+            end = min((self.consecutive_completed_height+1)*self.sdu, self.size)
+            ready = end-self.assembled_offset
+            if not self.assembly_started and self.resumable and self.encrypted and self.payload_held > 0:
+                ready -= 16
+            if not final and ready < (1 if flush else Resource.STREAM_CHUNK_SIZE):
+                return
+
+            if not self.assembly_started:
+                self.__assembly_begin()
+
+            while self.assembled_offset < end:
+                length = min(Resource.STREAM_CHUNK_SIZE, end-self.assembled_offset)
+                with self.spool_lock:
+                    self.spool.seek(self.assembled_offset)
+                    chunk = self.spool.read(length)
+                self.assembled_offset += length
+                if self.decryptor != None:
+                    chunk = self.decryptor.update(chunk)
+                self.__assembly_output(chunk)
+
+            if final:
+                if self.decryptor != None:
+                    self.__assembly_output(self.decryptor.finalize())
+                if self.resumable:
+                    self.__assembly_expand()
+                if self.decompressor != None and not self.decompressor.eof:
+                    raise ValueError("Compressed resource data ended unexpectedly")
+
+            elif self.resumable:
+                self.payload_file.flush()
+                self.__save_resume_state(self.segment_index, self.hash, self.storage_offset, self.payload_held)
+
+        except Exception as e:
+            self.assembly_failed = True
+            raise e
+
+    def __resume_path(self):
+        return self.storagepath+Resource.RESUME_SUFFIX
+
+    def __partial_path(self):
+        return self.storagepath+Resource.PARTIAL_SUFFIX
+
+    def __load_resume_state(self):
+        try:
+            if not os.path.isfile(self.__resume_path()):
+                return None
+
+            with open(self.__resume_path(), "rb") as state_file:
+                state = umsgpack.unpackb(state_file.read())
+
+            # The state is only usable if the data
+            # it describes is still intact on disk
+            storage_size = os.path.getsize(self.storagepath) if os.path.isfile(self.storagepath) else 0
+            partial_size = os.path.getsize(self.__partial_path()) if os.path.isfile(self.__partial_path()) else 0
+            if state["l"] != self.total_segments or storage_size < state["s"] or partial_size < state["p"]:
+                RNS.log("Discarding stale resume state for "+str(self), RNS.LOG_DEBUG)
+                return None
+
+            return state
+
+        except Exception as e:
+            RNS.log("Could not load resume state for "+str(self)+", the contained exception was: "+str(e), RNS.LOG_ERROR)
+            return None
+
+    def __payload_codec(self):
+        return self.codec.ID if self.compressed else None
+
+    def __save_resume_state(self, segment_index, resource_hash, storage_offset, payload_held):
+        state = {
+            "i": segment_index,         # Segment in transfer
+            "l": self.total_segments,   # Total segments
+            "h": resource_hash,         # Hash of segment in transfer
+            "s": storage_offset,        # Size of stored data from previous segments
+            "p": payload_held,          # Bytes of decrypted payload held
+            "z": self.__payload_codec(),  # Codec the held payload is compressed with
+        }
+
+        # The state is replaced atomically, so
+        # it is never left partially written
+        temporary_path = self.__resume_path()+".tmp"
+        with open(temporary_path, "wb") as state_file:
+            state_file.write(umsgpack.packb(state))
+        os.replace(temporary_path, self.__resume_path())
+
+    def __resume_begin(self):
+        # Picks up the persisted state of a resumable incoming
+        # resource. Returns False if the advertised segment
+        # should not be accepted, since a later one is needed.
+        state = self.__load_resume_state()
+        if state != None and state["i"] > self.segment_index:
+            RNS.log(f"Already holding {state['i']-1} segments of {self}, asking sender to resume from segment {state['i']}", RNS.LOG_DEBUG)
+            self.__send_resume(state["i"], b"")
+            return False
+
+        if state != None and state["i"] == self.segment_index:
+            # The same data may be compressed differently when
+            # offered again, for example once the sender knows
+            # the codecs this receiver supports, in which case
+            # the held payload can not be continued.
+            self.storage_offset = state["s"]
+            held = state["p"] if state["h"] == self.hash and state.get("z") == self.__payload_codec() else 0
+        elif self.segment_index == 1:
+            self.storage_offset = 0
+            held = 0
+        else:
+            self.storage_offset = os.path.getsize(self.storagepath) if os.path.isfile(self.storagepath) else 0
+            held = 0
+
+        # Discard anything beyond what the state accounts for
+        with open(self.storagepath, "ab") as storage_file:
+            storage_file.truncate(self.storage_offset)
+
+        self.payload_file = open(self.__partial_path(), "r+b" if held > 0 else "w+b")
+        self.payload_file.truncate(held)
+        self.payload_file.seek(held)
+        self.payload_held = held
+        self.assembled_offset = held
+
+        # Parts fully covered by the held payload
+        # are marked as received
+        held_parts = min(held//self.sdu, self.total_parts)
+        for i in range(0, held_parts):
+            self.parts[i] = True
+        self.received_count = held_parts
+        self.consecutive_completed_height = held_parts-1
+
+        self.__save_resume_state(self.segment_index, self.hash, self.storage_offset, held)
+        if held > 0:
+            RNS.log(f"Resuming {self} with {RNS.prettysize(held)} of payload held, in {held_parts} of {self.total_parts} parts", RNS.LOG_DEBUG)
+
+        return True
+
+    def __resume_concluded(self, complete):
+        # Records that a resumable segment was either completely
+        # received, or that its payload did not match the resource
+        # hash, and that it must be received again.
+        try:
+            if self.payload_file != None:
+                self.payload_file.close()
+            if os.path.isfile(self.__partial_path()):
+                os.unlink(self.__partial_path())
+
+            if complete and self.segment_index == self.total_segments:
+                if os.path.isfile(self.__resume_path()):
+                    os.unlink(self.__resume_path())
+            elif complete:
+                self.__save_resume_state(self.segment_index+1, None, os.path.getsize(self.storagepath), 0)
+            else:
+                self.__save_resume_state(self.segment_index, self.hash, self.storage_offset, 0)
+
+        except Exception as e:
+            RNS.log("Error while updating resume state for "+str(self)+", the contained exception was: "+str(e), RNS.LOG_ERROR)
+
+    def __suspend(self):
+        # Persists everything consecutively received of a
+        # resumable segment, so it can be resumed later.
+        try:
+            self.__assembly_advance(flush=True)
+            if not self.assembly_failed:
+                self.payload_file.flush()
+                self.__save_resume_state(self.segment_index, self.hash, self.storage_offset, self.payload_held)
+                RNS.log(f"Suspended {self} with {RNS.prettysize(self.payload_held)} of payload held", RNS.LOG_DEBUG)
+        except Exception as e:
+            RNS.log("Error while suspending "+str(self)+", the contained exception was: "+str(e), RNS.LOG_ERROR)
+        self.__close_spool()
+
+    def __held_parts(self):
+        # A bitmap of the parts already held by the receiver
+        held = bytearray(int(math.ceil(self.total_parts/8)))
+        for i in range(0, self.total_parts):
+            if self.parts[i] != None:
+                held[i//8] |= 1 << (i%8)
+        return bytes(held)
+
+    def __send_resume(self, segment_index, held):
+        try:
+            resume_data = self.hash+umsgpack.packb([segment_index, held])
+            resume_packet = RNS.Packet(self.link, resume_data, context=RNS.Packet.RESOURCE_RSM)
+            resume_packet.send()
+        except Exception as e:
+            RNS.log("Could not send resource resumption packet, the contained exception was: "+str(e), RNS.LOG_DEBUG)
+
+    def resume_packet(self, plaintext):
+        try:
+            resumption = umsgpack.unpackb(plaintext[RNS.Identity.HASHLENGTH//8:])
+            self.resume(resumption[0], resumption[1])
+        except Exception as e:
+            RNS.log("Could not process resource resumption for "+str(self)+", the contained exception was: "+str(e), RNS.LOG_ERROR)
+
+    def resume(self, segment_index, held):
+        """
+        Called on outgoing resumable resources, when the receiver
+        already holds some of the data. Parts in the *held* bitmap
+        are considered sent, and if the receiver holds all segments
+        before *segment_index*, sending continues from there.
+        """
+        if not self.initiator or not self.resumable or self.status >= Resource.COMPLETE:
+            return
+
+        if self.split and segment_index > self.segment_index and segment_index <= self.total_segments:
+            RNS.log(f"Receiver already holds {segment_index-1} segments of {self}, resuming from segment {segment_index}", RNS.LOG_DEBUG)
+            self.__close_spool()
+            self.status = Resource.COMPLETE
+            self.link.resource_concluded(self)
+            threading.Thread(target=self.__resume_segment, args=(segment_index,), daemon=True).start()
+
+        elif segment_index == self.segment_index:
+            self.last_activity = time.time()
+            first_missing = None
+            for i in range(0, self.total_parts):
+                if i//8 < len(held) and held[i//8] >> (i%8) & 0x01:
+                    if not self.part_sent[i]:
+                        self.part_sent[i] = 1
+                        self.sent_parts += 1
+                elif first_missing == None:
+                    first_missing = i
+
+            if first_missing == None:
+                first_missing = self.total_parts
+
+            RNS.log(f"Receiver already holds {self.sent_parts} of {self.total_parts} parts of {self}", RNS.LOG_DEBUG)
+            self.receiver_min_consecutive_height = max(first_missing-1-Resource.WINDOW_MAX, 0)
+
+            # The receiver only knows the map hashes from the
+            # advertisement, so if it needs later ones to
+            # request the first missing part, they are sent.
+            if first_missing > ResourceAdvertisement.HASHMAP_MAX_LEN and first_missing < self.total_parts:
+                self.__send_hashmap_update(first_missing//ResourceAdvertisement.HASHMAP_MAX_LEN)
+
+    def __resume_segment(self, segment_index):
+        # The next segment is read from the same input
+        # file, so its preparation must finish first
+        while self.segment_index < self.total_segments and self.next_segment == None:
+            time.sleep(0.05)
+        self.next_segment = None
+
+        try:
+            self.__prepare_segment(segment_index).advertise()
+        except Exception as e:
+            RNS.log("Could not resume "+str(self)+" from segment "+str(segment_index)+", the contained exception was: "+str(e), RNS.LOG_ERROR)
+
     def advertise(self):
         """
         Advertise the resource. If the other end of the link accepts
@@ -500,143 +1254,164 @@ class Resource:
         self.eifr = expected_inflight_rate
 
     def watchdog_job(self):
-        thread = threading.Thread(target=self.__watchdog_job)
-        thread.daemon = True
-        thread.start()
+        # Starting the watchdog again supersedes the pending
+        # check, and any check already running when it was
+        # started does not schedule another one.
+        if self.watchdog == None:
+            self.watchdog = RNS.Timers.shared().timer(self.__watchdog_job)
+        self.__watchdog_job_id += 1
+        self.watchdog.schedule(0)
 
     def __watchdog_job(self):
-        self.__watchdog_job_id += 1
         this_job_id = self.__watchdog_job_id
+        if self.status >= Resource.ASSEMBLING:
+            return
 
-        while self.status < Resource.ASSEMBLING and this_job_id == self.__watchdog_job_id:
-            while self.watchdog_lock:
-                sleep(0.025)
-
-            sleep_time = None
-            if self.status == Resource.ADVERTISED:
-                sleep_time = (self.adv_sent+self.timeout+Resource.PROCESSING_GRACE)-time.time()
-                if sleep_time < 0:
-                    if self.retries_left <= 0:
-                        RNS.log("Resource transfer timeout after sending advertisement", RNS.LOG_DEBUG)
-                        self.cancel()
-                        sleep_time = 0.001
-                    else:
-                        try:
-                            RNS.log("No part requests received, retrying resource advertisement...", RNS.LOG_DEBUG)
-                            self.retries_left -= 1
-                            self.advertisement_packet = RNS.Packet(self.link, ResourceAdvertisement(self).pack(), context=RNS.Packet.RESOURCE_ADV)
-                            self.advertisement_packet.send()
-                            self.last_activity = time.time()
-                            self.adv_sent = self.last_activity
-                            sleep_time = 0.001
-                        except Exception as e:
-                            RNS.log("Could not resend advertisement packet, cancelling resource. The contained exception was: "+str(e), RNS.LOG_VERBOSE)
-                            self.cancel()
-                    
-
-            elif self.status == Resource.TRANSFERRING:
-                if not self.initiator:
-                    retries_used = self.max_retries - self.retries_left
-                    extra_wait = retries_used * Resource.PER_RETRY_DELAY
-
-                    self.update_eifr()
-                    expected_tof_remaining = (self.outstanding_parts*self.sdu*8)/self.eifr
+        if self.watchdog_lock:
+            self.watchdog.schedule(0.025)
+            return
 
-                    if self.req_resp_rtt_rate != 0:
-                        sleep_time = self.last_activity + self.part_timeout_factor*expected_tof_remaining + Resource.RETRY_GRACE_TIME + extra_wait - time.time()
-                    else:
-                        sleep_time = self.last_activity + self.part_timeout_factor*((3*self.sdu)/self.eifr) + Resource.RETRY_GRACE_TIME + extra_wait - time.time()
-                    
-                    # RNS.log(f"EIFR {RNS.prettyspeed(self.eifr)}, ETOF {RNS.prettyshorttime(expected_tof_remaining)} ", RNS.LOG_DEBUG, pt=True)
-                    # RNS.log(f"Resource ST {RNS.prettyshorttime(sleep_time)}, RTT {RNS.prettyshorttime(self.rtt or self.link.rtt)}, {self.outstanding_parts} left", RNS.LOG_DEBUG, pt=True)
-                    
-                    if sleep_time < 0:
-                        if self.retries_left > 0:
-                            ms = "" if self.outstanding_parts == 1 else "s"
-                            RNS.log("Timed out waiting for "+str(self.outstanding_parts)+" part"+ms+", requesting retry", RNS.LOG_DEBUG)
-                            if self.window > self.window_min:
-                                self.window -= 1
-                                if self.window_max > self.window_min:
-                                    self.window_max -= 1
-                                    if (self.window_max - self.window) > (self.window_flexibility-1):
-                                        self.window_max -= 1
-
-                            sleep_time = 0.001
-                            self.retries_left -= 1
-                            self.waiting_for_hmu = False
-                            self.request_next()
-                        else:
-                            self.cancel()
-                            sleep_time = 0.001
+        sleep_time = None
+        if self.status == Resource.ADVERTISED:
+            sleep_time = (self.adv_sent+self.timeout+Resource.PROCESSING_GRACE)-time.time()
+            if sleep_time < 0:
+                if self.retries_left <= 0:
+                    RNS.log("Resource transfer timeout after sending advertisement", RNS.LOG_DEBUG)
+                    self.cancel()
+                    sleep_time = 0.001
                 else:
-                    max_extra_wait = sum([(r+1) * Resource.PER_RETRY_DELAY for r in range(self.MAX_RETRIES)])
-                    max_wait = self.rtt * self.timeout_factor * self.max_retries + self.sender_grace_time + max_extra_wait
-                    sleep_time = self.last_activity + max_wait - time.time()
-                    if sleep_time < 0:
-                        RNS.log("Resource timed out waiting for part requests", RNS.LOG_DEBUG)
-                        self.cancel()
+                    try:
+                        RNS.log("No part requests received, retrying resource advertisement...", RNS.LOG_DEBUG)
+                        self.retries_left -= 1
+                        self.advertisement_packet = RNS.Packet(self.link, ResourceAdvertisement(self).pack(), context=RNS.Packet.RESOURCE_ADV)
+                        self.advertisement_packet.send()
+                        self.last_activity = time.time()
+                        self.adv_sent = self.last_activity
                         sleep_time = 0.001
+                    except Exception as e:
+                        RNS.log("Could not resend advertisement packet, cancelling resource. The contained exception was: "+str(e), RNS.LOG_VERBOSE)
+                        self.cancel()
+                
+
+        elif self.status == Resource.TRANSFERRING:
+            if not self.initiator:
+                retries_used = self.max_retries - self.retries_left
+                extra_wait = retries_used * Resource.PER_RETRY_DELAY
 
-            elif self.status == Resource.AWAITING_PROOF:
-                # Decrease timeout factor since proof packets are
-                # significantly smaller than full req/resp roundtrip
-                self.timeout_factor = Resource.PROOF_TIMEOUT_FACTOR
+                self.update_eifr()
+                expected_tof_remaining = (self.outstanding_parts*self.sdu*8)/self.eifr
 
-                sleep_time = self.last_part_sent + (self.rtt*self.timeout_factor+self.sender_grace_time) - time.time()
+                if self.req_resp_rtt_rate != 0:
+                    sleep_time = self.last_activity + self.part_timeout_factor*expected_tof_remaining + Resource.RETRY_GRACE_TIME + extra_wait - time.time()
+                else:
+                    sleep_time = self.last_activity + self.part_timeout_factor*((3*self.sdu)/self.eifr) + Resource.RETRY_GRACE_TIME + extra_wait - time.time()
+                
+                # RNS.log(f"EIFR {RNS.prettyspeed(self.eifr)}, ETOF {RNS.prettyshorttime(expected_tof_remaining)} ", RNS.LOG_DEBUG, pt=True)
+                # RNS.log(f"Resource ST {RNS.prettyshorttime(sleep_time)}, RTT {RNS.prettyshorttime(self.rtt or self.link.rtt)}, {self.outstanding_parts} left", RNS.LOG_DEBUG, pt=True)
+                
                 if sleep_time < 0:
-                    if self.retries_left <= 0:
-                        RNS.log("Resource timed out waiting for proof", RNS.LOG_DEBUG)
-                        self.cancel()
+                    if self.retries_left > 0:
+                        ms = "" if self.outstanding_parts == 1 else "s"
+                        RNS.log("Timed out waiting for "+str(self.outstanding_parts)+" part"+ms+", requesting retry", RNS.LOG_DEBUG)
+                        self.congestion.timeout()
+
                         sleep_time = 0.001
-                    else:
-                        RNS.log("All parts sent, but no resource proof received, querying network cache...", RNS.LOG_DEBUG)
                         self.retries_left -= 1
-                        expected_data = self.hash + self.expected_proof
-                        expected_proof_packet = RNS.Packet(self.link, expected_data, packet_type=RNS.Packet.PROOF, context=RNS.Packet.RESOURCE_PRF)
-                        expected_proof_packet.pack()
-                        RNS.Transport.cache_request(expected_proof_packet.packet_hash, self.link)
-                        self.last_part_sent = time.time()
+                        self.waiting_for_hmu = False
+                        self.request_next()
+                    else:
+                        self.cancel()
                         sleep_time = 0.001
+            else:
+                max_extra_wait = sum([(r+1) * Resource.PER_RETRY_DELAY for r in range(self.MAX_RETRIES)])
+                max_wait = self.rtt * self.timeout_factor * self.max_retries + self.sender_grace_time + max_extra_wait
+                sleep_time = self.last_activity + max_wait - time.time()
+                if sleep_time < 0:
+                    RNS.log("Resource timed out waiting for part requests", RNS.LOG_DEBUG)
+                    self.cancel()
+                    sleep_time = 0.001
 
-            elif self.status == Resource.REJECTED:
-                sleep_time = 0.001
+        elif self.status == Resource.AWAITING_PROOF:
+            # Decrease timeout factor since proof packets are
+            # significantly smaller than full req/resp roundtrip
+            self.timeout_factor = Resource.PROOF_TIMEOUT_FACTOR
 
-            if sleep_time == 0:
-                RNS.log("Warning! Link watchdog sleep time of 0!", RNS.LOG_DEBUG)
-            if sleep_time == None or sleep_time < 0:
-                RNS.log("Timing error, cancelling resource transfer.", RNS.LOG_ERROR)
-                self.cancel()
-            
-            if sleep_time != None:
-                sleep(min(sleep_time, Resource.WATCHDOG_MAX_SLEEP))
+            sleep_time = self.last_part_sent + (self.rtt*self.timeout_factor+self.sender_grace_time) - time.time()
+            if sleep_time < 0:
+                if self.retries_left <= 0:
+                    RNS.log("Resource timed out waiting for proof", RNS.LOG_DEBUG)
+                    self.cancel()
+                    sleep_time = 0.001
+                else:
+                    RNS.log("All parts sent, but no resource proof received, querying network cache...", RNS.LOG_DEBUG)
+                    self.retries_left -= 1
+                    expected_data = self.hash + self.expected_proof
+                    expected_proof_packet = RNS.Packet(self.link, expected_data, packet_type=RNS.Packet.PROOF, context=RNS.Packet.RESOURCE_PRF)
+                    expected_proof_packet.pack()
+                    RNS.Transport.cache_request(expected_proof_packet.packet_hash, self.link)
+                    self.last_part_sent = time.time()
+                    sleep_time = 0.001
+
+        elif self.status == Resource.REJECTED:
+            # Nothing is left to watch for
+            return
+
+        if sleep_time == 0:
+            RNS.log("Warning! Link watchdog sleep time of 0!", RNS.LOG_DEBUG)
+        if sleep_time == None or sleep_time < 0:
+            RNS.log("Timing error, cancelling resource transfer.", RNS.LOG_ERROR)
+            self.cancel()
+
+        if sleep_time != None and self.status < Resource.ASSEMBLING and this_job_id == self.__watchdog_job_id:
+            self.watchdog.schedule(min(sleep_time, Resource.WATCHDOG_MAX_SLEEP))
 
     def assemble(self):
         if not self.status == Resource.FAILED:
             try:
                 self.status = Resource.ASSEMBLING
-                stream = b"".join(self.parts)
-
-                if self.encrypted:
-                    data = self.link.decrypt(stream)
+                if self.spool != None:
+                    self.__assembly_advance(final=True)
+                    data_hasher = self.data_hasher
+                    self.data = None
                 else:
-                    data = stream
+                    stream = b"".join(self.parts)
 
-                # Strip off random hash
-                data = data[Resource.RANDOM_HASH_SIZE:]
+                    if self.encrypted:
+                        data = self.link.decrypt(stream)
+                    else:
+                        data = stream
 
-                if self.compressed:
-                    self.data = bz2.decompress(data)
-                else:
-                    self.data = data
+                    # Strip off random hash
+                    data = data[Resource.RANDOM_HASH_SIZE:]
+
+                    if self.compressed:
+                        self.data = self.codec.decompress(data)
+                    else:
+                        self.data = data
 
-                calculated_hash = RNS.Identity.full_hash(self.data+self.random_hash)
+                    data_hasher = RNS.Cryptography.Hashes.sha256_hasher()
+                    data_hasher.update(self.data)
+
+                resource_hasher = data_hasher.copy()
+                resource_hasher.update(self.random_hash)
+                calculated_hash = resource_hasher.digest()
 
                 if calculated_hash == self.hash:
-                    self.file = open(self.storagepath, "ab")
-                    self.file.write(self.data)
-                    self.file.close()
+                    if self.spool != None:
+                        self.__close_spool()
+                        if self.resumable:
+                            self.__resume_concluded(complete=True)
+                    else:
+                        self.file = open(self.storagepath, "ab")
+                        self.storage_offset = self.file.tell()
+                        self.file.write(self.data)
+                        self.file.close()
+                    proof_hasher = data_hasher.copy()
+                    proof_hasher.update(self.hash)
+                    self.proof = proof_hasher.digest()
                     self.status = Resource.COMPLETE
                     self.prove()
+                    self.__store_content(data_hasher.digest())
                 else:
                     self.status = Resource.CORRUPT
 
@@ -646,34 +1421,140 @@ class Resource:
                 RNS.log("The contained exception was: "+str(e), RNS.LOG_ERROR)
                 self.status = Resource.CORRUPT
 
-            self.link.resource_concluded(self)
+            if self.status == Resource.CORRUPT and self.spool != None:
+                self.__discard_assembly()
+                if self.resumable:
+                    self.__resume_concluded(complete=False)
 
-            if self.segment_index == self.total_segments:
-                if self.callback != None:
-                    self.data = open(self.storagepath, "rb")
-                    try:
-                        self.callback(self)
-                    except Exception as e:
-                        RNS.log("Error while executing resource assembled callback from "+str(self)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
+            self.__concluded()
+
+    def __concluded(self):
+        # Hands a received segment that either completed
+        # or failed verification over to the application.
+        self.congestion.concluded()
+        self.link.resource_concluded(self)
 
+        if self.segment_index == self.total_segments:
+            if self.callback != None:
+                # A corrupt resource may have left no data in storage
+                if os.path.isfile(self.storagepath):
+                    self.data = open(self.storagepath, "rb")
+                else:
+                    self.data = None
                 try:
-                    if hasattr(self.data, "close") and callable(self.data.close):
-                        self.data.close()
+                    self.callback(self)
+                except Exception as e:
+                    RNS.log("Error while executing resource assembled callback from "+str(self)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
 
+            try:
+                if hasattr(self.data, "close") and callable(self.data.close):
+                    self.data.close()
+
+                if os.path.isfile(self.storagepath):
                     os.unlink(self.storagepath)
 
-                except Exception as e:
-                    RNS.log("Error while cleaning up resource files, the contained exception was:", RNS.LOG_ERROR)
-                    RNS.log(str(e))
-            else:
-                RNS.log("Resource segment "+str(self.segment_index)+" of "+str(self.total_segments)+" received, waiting for next segment to be announced", RNS.LOG_DEBUG)
+            except Exception as e:
+                RNS.log("Error while cleaning up resource files, the contained exception was:", RNS.LOG_ERROR)
+                RNS.log(str(e))
+        else:
+            RNS.log("Resource segment "+str(self.segment_index)+" of "+str(self.total_segments)+" received, waiting for next segment to be announced", RNS.LOG_DEBUG)
+
+
+    def __discard_assembly(self):
+        # Removes any unverified plaintext that the
+        # incremental assembly appended to storage.
+        with self.assembly_state_lock:
+            try:
+                if self.assembly_file != None and not self.assembly_file.closed:
+                    self.assembly_file.truncate(self.storage_offset)
+                    self.__close_spool()
+                    if self.storage_offset == 0:
+                        os.unlink(self.storagepath)
+            except Exception as e:
+                RNS.log("Error while discarding partially assembled resource data: "+str(e), RNS.LOG_ERROR)
+            self.__close_spool()
+
+    def __content_derived(self, data_digest):
+        # Whether the random hash was derived from the data,
+        # which makes the resource hash a content address.
+        for attempt in range(Resource.CONTENT_ATTEMPTS):
+            if RNS.Identity.full_hash(data_digest+attempt.to_bytes(4, "big"))[:Resource.RANDOM_HASH_SIZE] == self.random_hash:
+                return True
+        return False
+
+    def __store_content(self, data_digest):
+        # Adds a verified segment to the content store, if
+        # the same content would be advertised with the same
+        # resource hash again.
+        try:
+            if RNS.ContentStore.enabled() and self.__content_derived(data_digest):
+                length = os.path.getsize(self.storagepath)-self.storage_offset
+                RNS.ContentStore.store(self.hash, self.storagepath, self.storage_offset, length)
+        except Exception as e:
+            RNS.log("Error while adding "+str(self)+" to content store: "+str(e), RNS.LOG_ERROR)
+
+    def __conclude_from_store(self):
+        # Concludes an advertised segment with content already
+        # held in the content store, and proves it to the sender
+        # without requesting any parts. Returns False if the
+        # content is not held, or does not match the resource
+        # hash, in which case it is transferred as usual.
+        stored_path = RNS.ContentStore.get(self.hash)
+        if stored_path == None:
+            return False
+
+        if not self.resumable:
+            self.storage_offset = os.path.getsize(self.storagepath) if os.path.isfile(self.storagepath) else 0
+
+        try:
+            data_hasher = RNS.Cryptography.Hashes.sha256_hasher()
+            with open(stored_path, "rb") as stored_file, open(self.storagepath, "ab") as storage_file:
+                while True:
+                    chunk = stored_file.read(Resource.STREAM_CHUNK_SIZE)
+                    if len(chunk) == 0:
+                        break
+                    data_hasher.update(chunk)
+                    storage_file.write(chunk)
+
+            resource_hasher = data_hasher.copy()
+            resource_hasher.update(self.random_hash)
+            if resource_hasher.digest() != self.hash:
+                raise ValueError("Stored content does not match the resource hash")
+
+        except Exception as e:
+            RNS.log("Could not conclude "+str(self)+" from content store: "+str(e), RNS.LOG_WARNING)
+            RNS.ContentStore.remove(self.hash)
+            with open(self.storagepath, "ab") as storage_file:
+                storage_file.truncate(self.storage_offset)
+            if self.storage_offset == 0 and not self.resumable:
+                os.unlink(self.storagepath)
+            return False
+
+        proof_hasher = data_hasher.copy()
+        proof_hasher.update(self.hash)
+        self.proof = proof_hasher.digest()
+        self.status = Resource.COMPLETE
+        self.received_count = self.total_parts
+        self.__close_spool()
+        if self.resumable:
+            self.__resume_concluded(complete=True)
+
+        self.link.register_incoming_resource(self)
+        RNS.log(f"Concluded {self} with {RNS.prettysize(os.path.getsize(stored_path))} of content from content store", RNS.LOG_DEBUG)
+        if self.link.callbacks.resource_started != None:
+            try:
+                self.link.callbacks.resource_started(self)
+            except Exception as e:
+                RNS.log("Error while executing resource started callback from "+str(self)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
 
+        self.prove()
+        self.__concluded()
+        return True
 
     def prove(self):
         if not self.status == Resource.FAILED:
             try:
-                proof = RNS.Identity.full_hash(self.data+self.hash)
-                proof_data = self.hash+proof
+                proof_data = self.hash+self.proof
                 proof_packet = RNS.Packet(self.link, proof_data, packet_type=RNS.Packet.PROOF, context=RNS.Packet.RESOURCE_PRF)
                 proof_packet.send()
                 RNS.Transport.cache(proof_packet, force_cache=True)
@@ -686,22 +1567,34 @@ class Resource:
         # Prepare the next segment for advertisement
         RNS.log(f"Preparing segment {self.segment_index+1} of {self.total_segments} for resource {self}", RNS.LOG_DEBUG)
         self.preparing_next_segment = True
-        self.next_segment = Resource(
+        self.next_segment = self.__prepare_segment(self.segment_index+1)
+
+    def __prepare_segment(self, segment_index):
+        return Resource(
             self.input_file, self.link,
             callback = self.callback,
-            segment_index = self.segment_index+1,
+            segment_index = segment_index,
             original_hash=self.original_hash,
             progress_callback = self.__progress_callback,
             request_id = self.request_id,
             is_response = self.is_response,
             advertise = False,
             auto_compress = self.auto_compress,
+            resumable = self.resumable,
+            cacheable = self.cacheable,
+            priority = self.priority,
         )
 
     def validate_proof(self, proof_data):
         if not self.status == Resource.FAILED:
             if len(proof_data) == RNS.Identity.HASHLENGTH//8*2:
                 if proof_data[RNS.Identity.HASHLENGTH//8:] == self.expected_proof:
+                    self.__close_spool()
+                    # Segments stay referenced by the segment before
+                    # them until the whole resource concludes, so the
+                    # part lookup state is released once proven.
+                    self.map_hashes = []
+                    self.map_hash_index = {}
                     self.status = Resource.COMPLETE
                     self.link.resource_concluded(self)
                     if self.segment_index == self.total_segments:
@@ -736,7 +1629,7 @@ class Resource:
                 pass
 
 
-    def receive_part(self, packet):
+    def receive_part(self, packet, match=None):
         with self.receive_lock:
 
             self.receiving_part = True
@@ -760,83 +1653,195 @@ class Resource:
                     req_resp_cost = len(packet.raw)+self.req_sent_bytes
                     self.req_resp_rtt_rate = req_resp_cost / rtt
 
-                    if self.req_resp_rtt_rate > Resource.RATE_FAST and self.fast_rate_rounds < Resource.FAST_RATE_THRESHOLD:
-                        self.fast_rate_rounds += 1
-
-                        if self.fast_rate_rounds == Resource.FAST_RATE_THRESHOLD:
-                            self.window_max = Resource.WINDOW_MAX_FAST
+                self.congestion.response()
 
             if not self.status == Resource.FAILED:
                 self.status = Resource.TRANSFERRING
                 part_data = packet.data
-                part_hash = self.get_map_hash(part_data)
-
-                consecutive_index = self.consecutive_completed_height if self.consecutive_completed_height >= 0 else 0
-                i = consecutive_index
-                for map_hash in self.hashmap[consecutive_index:consecutive_index+self.window]:
-                    if map_hash == part_hash:
-                        if self.parts[i] == None:
-
-                            # Insert data into parts list
-                            self.parts[i] = part_data
-                            self.rtt_rxd_bytes += len(part_data)
-                            self.received_count += 1
-                            self.outstanding_parts -= 1
-
-                            # Update consecutive completed pointer
-                            if i == self.consecutive_completed_height + 1:
-                                self.consecutive_completed_height = i
-                            
-                            cp = self.consecutive_completed_height + 1
-                            while cp < len(self.parts) and self.parts[cp] != None:
-                                self.consecutive_completed_height = cp
-                                cp += 1
-
-                            if self.__progress_callback != None:
-                                try:
-                                    self.__progress_callback(self)
-                                except Exception as e:
-                                    RNS.log("Error while executing progress callback from "+str(self)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
+                if match == None:
+                    match = self.match_part(part_data)
 
-                    i += 1
+                if match != None and self.parts[match[0]] == None:
+                    if match[0] in self.fec_round_index:
+                        self.fec_round_received += 1
+                    self.__store_part(match[0], part_data)
+                    if len(self.fec_repairs) > 0:
+                        self.__recover_parts()
 
                 self.receiving_part = False
+                self.__parts_stored()
+            else:
+                self.receiving_part = False
+
+    def __store_part(self, i, part_data):
+        # Insert data into parts list, or write
+        # it to the spool and mark it received
+        if self.spool != None:
+            with self.spool_lock:
+                self.spool.seek(i*self.sdu)
+                self.spool.write(part_data)
+            self.parts[i] = True
+        else:
+            self.parts[i] = part_data
+        self.rtt_rxd_bytes += len(part_data)
+        self.congestion.part_received(len(part_data))
+        self.received_count += 1
+        self.outstanding_parts -= 1
+
+        # Update consecutive completed pointer
+        if i == self.consecutive_completed_height + 1:
+            self.consecutive_completed_height = i
+        
+        cp = self.consecutive_completed_height + 1
+        while cp < len(self.parts) and self.parts[cp] != None:
+            self.consecutive_completed_height = cp
+            cp += 1
+
+        if self.__progress_callback != None:
+            try:
+                self.__progress_callback(self)
+            except Exception as e:
+                RNS.log("Error while executing progress callback from "+str(self)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
+
+    def __parts_stored(self):
+        if self.received_count == self.total_parts and not self.assembly_lock:
+            self.assembly_lock = True
+            if self.spool != None:
+                # Spooled segments are decrypted and verified on
+                # the protocol executor, after any incremental
+                # assembly still queued for them.
+                self.status = Resource.ASSEMBLING
+                RNS.Executor.protocol().submit(self.assemble, key=self, bounded=False)
+            else:
+                self.assemble()
+        elif self.outstanding_parts == 0:
+            if self.req_sent != 0:
+                rtt = time.time()-self.req_sent
+                req_transferred = self.rtt_rxd_bytes - self.rtt_rxd_bytes_at_part_req
+
+                if rtt != 0:
+                    self.req_data_rtt_rate = req_transferred/rtt
+                    self.update_eifr()
+                    self.rtt_rxd_bytes_at_part_req = self.rtt_rxd_bytes
+
+            # The congestion controller adjusts the
+            # window before the next round is requested
+            self.congestion.round_completed()
+            self.request_next()
 
-                if self.received_count == self.total_parts and not self.assembly_lock:
-                    self.assembly_lock = True
-                    self.assemble()
-                elif self.outstanding_parts == 0:
-                    # TODO: Figure out if there is a mathematically
-                    # optimal way to adjust windows
-                    if self.window < self.window_max:
-                        self.window += 1
-                        if (self.window - self.window_min) > (self.window_flexibility-1):
-                            self.window_min += 1
+        # Work on assembling spooled data while the next
+        # requested parts are in flight. This is done on the
+        # protocol executor, so decrypting and writing chunks
+        # does not hold up the thread parts arrive on.
+        if self.spool != None and self.received_count < self.total_parts and not self.assembly_scheduled:
+            consecutive_end = (self.consecutive_completed_height+1)*self.sdu
+            if consecutive_end-self.assembled_offset >= Resource.STREAM_CHUNK_SIZE:
+                self.assembly_scheduled = True
+                RNS.Executor.protocol().submit(self.__assembly_job, key=self, bounded=False)
+
+    def __assembly_job(self):
+        self.assembly_scheduled = False
+        if self.status == Resource.FAILED:
+            return
 
-                    if self.req_sent != 0:
-                        rtt = time.time()-self.req_sent
-                        req_transferred = self.rtt_rxd_bytes - self.rtt_rxd_bytes_at_part_req
+        try:
+            self.__assembly_advance()
+        except Exception as e:
+            if self.status != Resource.FAILED:
+                RNS.log("Error while incrementally assembling "+str(self)+": "+str(e), RNS.LOG_ERROR)
+
+    def repair_map_packet(self, plaintext):
+        # Holds the map hashes of the repair parts the
+        # sender will send for the current request round.
+        offset = RNS.Identity.HASHLENGTH//8
+        round_id = plaintext[offset:offset+Resource.MAPHASH_LEN]
+        repair_map = plaintext[offset+Resource.MAPHASH_LEN:]
+        with self.receive_lock:
+            if round_id == self.fec_round_id:
+                self.fec_repair_map = [repair_map[i:i+Resource.MAPHASH_LEN] for i in range(0, len(repair_map), Resource.MAPHASH_LEN)]
 
-                        if rtt != 0:
-                            self.req_data_rtt_rate = req_transferred/rtt
-                            self.update_eifr()
-                            self.rtt_rxd_bytes_at_part_req = self.rtt_rxd_bytes
+    def match_repair(self, repair_data):
+        """
+        Looks up which repair part of the current request
+        round some received repair part data is.
+
+        :returns: The repair index, or *None* if the data does not belong to this resource.
+        """
+        if len(self.fec_repair_map) == 0:
+            return None
 
-                            if self.req_data_rtt_rate > Resource.RATE_FAST and self.fast_rate_rounds < Resource.FAST_RATE_THRESHOLD:
-                                self.fast_rate_rounds += 1
+        map_hash = self.get_map_hash(repair_data)
+        if map_hash in self.fec_repair_map:
+            return self.fec_repair_map.index(map_hash)
+        else:
+            return None
 
-                                if self.fast_rate_rounds == Resource.FAST_RATE_THRESHOLD:
-                                    self.window_max = Resource.WINDOW_MAX_FAST
+    def receive_repair(self, packet, repair_index):
+        with self.receive_lock:
+            self.last_activity = time.time()
+            self.retries_left = self.max_retries
 
-                            if self.fast_rate_rounds == 0 and self.req_data_rtt_rate < Resource.RATE_VERY_SLOW and self.very_slow_rate_rounds < Resource.VERY_SLOW_RATE_THRESHOLD:
-                                self.very_slow_rate_rounds += 1
+            if not self.status == Resource.FAILED and not repair_index in self.fec_repairs:
+                self.receiving_part = True
+                self.fec_repairs[repair_index] = packet.data
+                recovered = self.__recover_parts()
+                self.receiving_part = False
+                if recovered:
+                    self.__parts_stored()
 
-                                if self.very_slow_rate_rounds == Resource.VERY_SLOW_RATE_THRESHOLD:
-                                    self.window_max = Resource.WINDOW_MAX_VERY_SLOW
+    def __part_length(self, i):
+        if i == self.total_parts-1:
+            return self.size-i*self.sdu
+        else:
+            return self.sdu
+
+    def __recover_parts(self):
+        # Reconstructs the parts of the current request
+        # round that were lost, once enough repair parts
+        # have been received to make up for them.
+        missing = [i for i in self.fec_round_parts if self.parts[i] == None]
+        if len(missing) == 0 or len(missing) > len(self.fec_repairs):
+            return False
 
-                    self.request_next()
+        symbols = []
+        for i in self.fec_round_parts:
+            if self.parts[i] == None:
+                symbols.append(None)
+            elif self.parts[i] == True:
+                with self.spool_lock:
+                    self.spool.seek(i*self.sdu)
+                    symbols.append(self.spool.read(self.__part_length(i)).ljust(self.sdu, b"\x00"))
             else:
-                self.receiving_part = False
+                symbols.append(self.parts[i].ljust(self.sdu, b"\x00"))
+
+        try:
+            recovered = RNS.Erasure.decode(symbols, self.fec_repairs)
+        except Exception as e:
+            RNS.log("Could not reconstruct lost parts of "+str(self)+": "+str(e), RNS.LOG_DEBUG)
+            return False
+
+        recovered_count = 0
+        for position, symbol in recovered.items():
+            i = self.fec_round_parts[position]
+            part_data = symbol[:self.__part_length(i)]
+            if self.get_map_hash(part_data) == self.hashmap[i]:
+                self.__store_part(i, part_data)
+                recovered_count += 1
+            else:
+                RNS.log("Reconstructed part of "+str(self)+" did not match its map hash", RNS.LOG_DEBUG)
+
+        RNS.log("Reconstructed "+str(recovered_count)+" lost parts of "+str(self)+" from repair parts", RNS.LOG_EXTREME)
+        return recovered_count > 0
+
+    def __request_report(self):
+        report = Resource.REQUEST_FEC
+        if RNS.Compression.all_available():
+            report |= Resource.REQUEST_CODECS
+        if self.fec_loss != None:
+            # Any observed loss is reported as at least one
+            # step, so that it is not rounded away entirely
+            report |= min(math.ceil(self.fec_loss*Resource.REQUEST_LOSS_STEPS), Resource.REQUEST_LOSS_STEPS) << 2
+        return report
 
     # Called on incoming resource to send a request for more data
     def request_next(self):
@@ -848,6 +1853,7 @@ class Resource:
                 self.outstanding_parts = 0
                 hashmap_exhausted = Resource.HASHMAP_IS_NOT_EXHAUSTED
                 requested_hashes = b""
+                requested_parts = []
 
                 i = 0; pn = self.consecutive_completed_height+1
                 search_start = pn
@@ -858,20 +1864,48 @@ class Resource:
                         part_hash = self.hashmap[pn]
                         if part_hash != None:
                             requested_hashes += part_hash
+                            requested_parts.append(pn)
                             self.outstanding_parts += 1
                             i += 1
                         else:
                             hashmap_exhausted = Resource.HASHMAP_IS_EXHAUSTED
+                            break
 
                     pn += 1
-                    if i >= self.window or hashmap_exhausted == Resource.HASHMAP_IS_EXHAUSTED:
+                    if i >= self.window:
                         break
 
-                hmu_part = bytes([hashmap_exhausted])
+                # The loss of the previous round counts every part
+                # that was not received directly, whether it was
+                # reconstructed from repair parts or not.
+                if len(self.fec_round_parts) > 0:
+                    loss = 1-self.fec_round_received/len(self.fec_round_parts)
+                    self.fec_loss = loss if self.fec_loss == None else 0.75*self.fec_loss+0.25*loss
+
+                self.fec_round_id = RNS.Identity.full_hash(requested_hashes)[:Resource.MAPHASH_LEN]
+                self.fec_round_parts = requested_parts
+                self.fec_round_index = {part_index: position for position, part_index in enumerate(requested_parts)}
+                self.fec_round_received = 0
+                self.fec_repair_map = []
+                self.fec_repairs = {}
+
+                if hashmap_exhausted == Resource.HASHMAP_IS_NOT_EXHAUSTED and self.sender_fec:
+                    hmu_part = bytes([self.__request_report()])
+                else:
+                    hmu_part = bytes([hashmap_exhausted])
+
                 if hashmap_exhausted == Resource.HASHMAP_IS_EXHAUSTED:
-                    last_map_hash = self.hashmap[self.hashmap_height-1]
-                    hmu_part += last_map_hash
+                    last_map_hash = self.hashmap[pn-1]
                     self.waiting_for_hmu = True
+                    if last_map_hash == None:
+                        # A resumed resource does not know the map
+                        # hashes preceding the first part it needs,
+                        # so the sender is asked to resume again,
+                        # and will send them in a hashmap update.
+                        self.__send_resume(self.segment_index, self.__held_parts())
+                        self.last_activity = time.time()
+                        return
+                    hmu_part += last_map_hash
 
                 request_data = hmu_part + self.hash + requested_hashes
                 request_packet = RNS.Packet(self.link, request_data, context = RNS.Packet.RESOURCE_REQ)
@@ -882,6 +1916,7 @@ class Resource:
                     self.req_sent = self.last_activity
                     self.req_sent_bytes = len(request_packet.raw)
                     self.req_resp = None
+                    self.congestion.request_sent(self.outstanding_parts)
 
                 except Exception as e:
                     RNS.log("Could not send resource request packet, cancelling resource", RNS.LOG_DEBUG)
@@ -904,27 +1939,46 @@ class Resource:
             wants_more_hashmap = True if request_data[0] == Resource.HASHMAP_IS_EXHAUSTED else False
             pad = 1+Resource.MAPHASH_LEN if wants_more_hashmap else 1
 
+            # Requests that do not exhaust the hashmap carry the
+            # report of receivers supporting repair parts, and
+            # exhausting requests keep the last report.
+            if not wants_more_hashmap and request_data[0] & Resource.REQUEST_FEC:
+                self.fec_loss = min(request_data[0] >> 2, Resource.REQUEST_LOSS_STEPS)/Resource.REQUEST_LOSS_STEPS
+                if request_data[0] & Resource.REQUEST_CODECS:
+                    self.link.remote_codecs = True
+
             requested_hashes = request_data[pad+RNS.Identity.HASHLENGTH//8:]
 
             # Define the search scope
             search_start = self.receiver_min_consecutive_height
             search_end   = self.receiver_min_consecutive_height+ResourceAdvertisement.COLLISION_GUARD_SIZE
 
-            map_hashes = []
+            search_end = min(search_end, self.total_parts)
+            requested_parts = set()
+            source_parts = []
             for i in range(0,len(requested_hashes)//Resource.MAPHASH_LEN):
                 map_hash = requested_hashes[i*Resource.MAPHASH_LEN:(i+1)*Resource.MAPHASH_LEN]
-                map_hashes.append(map_hash)
-
-            search_scope = self.parts[search_start:search_end]
-            requested_parts = list(filter(lambda part: part.map_hash in map_hashes, search_scope))
-
-            for part in requested_parts:
+                part_index = self.find_part(map_hash, search_start, search_end)
+                if part_index != None:
+                    requested_parts.add(part_index)
+                source_parts.append(part_index)
+            requested_parts = sorted(requested_parts)
+
+            repairs = None
+            if self.fec and self.fec_loss != None and not None in source_parts:
+                repairs = self.__prepare_repairs(requested_hashes, source_parts)
+                self.__send_repair_map(repairs)
+
+            # Parts are queued in the link scheduler, which
+            # interleaves them with the parts of any other
+            # resources transferring on the link.
+            for part_index in requested_parts:
                 try:
-                    if not part.sent:
-                        part.send()
+                    part = RNS.Packet(self.link, self.get_part_data(part_index), context=RNS.Packet.RESOURCE)
+                    self.link.resource_scheduler.enqueue(self, part, self.__part_sent)
+                    if not self.part_sent[part_index]:
+                        self.part_sent[part_index] = 1
                         self.sent_parts += 1
-                    else:
-                        part.resend()
 
                     self.last_activity = time.time()
                     self.last_part_sent = self.last_activity
@@ -933,17 +1987,21 @@ class Resource:
                     RNS.log("Resource could not send parts, cancelling transfer!", RNS.LOG_DEBUG)
                     RNS.log("The contained exception was: "+str(e), RNS.LOG_DEBUG)
                     self.cancel()
+
+            if repairs != None:
+                # The repair map is sent both before and after the
+                # requested parts, since repair parts can not be
+                # matched by a receiver that lost it.
+                self.__send_repair_map(repairs)
+                self.__send_repairs(repairs)
             
             if wants_more_hashmap:
                 last_map_hash = request_data[1:Resource.MAPHASH_LEN+1]
                 
-                part_index   = self.receiver_min_consecutive_height
-                search_start = part_index
-                search_end   = self.receiver_min_consecutive_height+ResourceAdvertisement.COLLISION_GUARD_SIZE
-                for part in self.parts[search_start:search_end]:
-                    part_index += 1
-                    if part.map_hash == last_map_hash:
-                        break
+                search_start = self.receiver_min_consecutive_height
+                search_end   = min(search_start+ResourceAdvertisement.COLLISION_GUARD_SIZE, self.total_parts)
+                last_index   = self.find_part(last_map_hash, search_start, search_end)
+                part_index   = last_index+1 if last_index != None else max(search_start, search_end)
 
                 self.receiver_min_consecutive_height = max(part_index-1-Resource.WINDOW_MAX, 0)
 
@@ -954,26 +2012,9 @@ class Resource:
                 else:
                     segment = part_index // ResourceAdvertisement.HASHMAP_MAX_LEN
 
-                
-                hashmap_start = segment*ResourceAdvertisement.HASHMAP_MAX_LEN
-                hashmap_end   = min((segment+1)*ResourceAdvertisement.HASHMAP_MAX_LEN, len(self.parts))
-
-                hashmap = b""
-                for i in range(hashmap_start,hashmap_end):
-                    hashmap += self.hashmap[i*Resource.MAPHASH_LEN:(i+1)*Resource.MAPHASH_LEN]
-
-                hmu = self.hash+umsgpack.packb([segment, hashmap])
-                hmu_packet = RNS.Packet(self.link, hmu, context = RNS.Packet.RESOURCE_HMU)
-
-                try:
-                    hmu_packet.send()
-                    self.last_activity = time.time()
-                except Exception as e:
-                    RNS.log("Could not send resource HMU packet, cancelling resource", RNS.LOG_DEBUG)
-                    RNS.log("The contained exception was: "+str(e), RNS.LOG_DEBUG)
-                    self.cancel()
+                self.__send_hashmap_update(segment)
 
-            if self.sent_parts == len(self.parts):
+            if self.sent_parts == self.total_parts:
                 self.status = Resource.AWAITING_PROOF
                 self.retries_left = 3
 
@@ -983,6 +2024,61 @@ class Resource:
                 except Exception as e:
                     RNS.log("Error while executing progress callback from "+str(self)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
 
+    def __part_sent(self, packet):
+        self.last_activity = time.time()
+        self.last_part_sent = self.last_activity
+
+    def __prepare_repairs(self, requested_hashes, source_parts):
+        # Computes repair parts for the requested parts, in
+        # the order they were requested, with a count tuned
+        # to the loss the receiver reported.
+        count = RNS.Erasure.repair_count(len(source_parts), self.fec_loss)
+        if count == 0:
+            return None
+
+        symbols = [self.get_part_data(part_index).ljust(self.sdu, b"\x00") for part_index in source_parts]
+        repair_parts = RNS.Erasure.encode(symbols, count)
+        round_id = RNS.Identity.full_hash(requested_hashes)[:Resource.MAPHASH_LEN]
+        repair_map = b"".join([self.get_map_hash(repair_part) for repair_part in repair_parts])
+        return (self.hash+round_id+repair_map, repair_parts)
+
+    def __send_repair_map(self, repairs):
+        if repairs != None:
+            try:
+                self.link.resource_scheduler.enqueue(self, RNS.Packet(self.link, repairs[0], context=RNS.Packet.RESOURCE_RPM))
+            except Exception as e:
+                RNS.log("Could not send repair map for "+str(self)+": "+str(e), RNS.LOG_DEBUG)
+
+    def __send_repairs(self, repairs):
+        for repair_part in repairs[1]:
+            try:
+                self.link.resource_scheduler.enqueue(self, RNS.Packet(self.link, repair_part, context=RNS.Packet.RESOURCE_RPR), self.__packet_sent)
+            except Exception as e:
+                RNS.log("Could not send repair part for "+str(self)+": "+str(e), RNS.LOG_DEBUG)
+                break
+
+    def __packet_sent(self, packet):
+        self.last_activity = time.time()
+
+    def __send_hashmap_update(self, segment):
+        hashmap_start = segment*ResourceAdvertisement.HASHMAP_MAX_LEN
+        hashmap_end   = min((segment+1)*ResourceAdvertisement.HASHMAP_MAX_LEN, self.total_parts)
+
+        hashmap = b""
+        for i in range(hashmap_start,hashmap_end):
+            hashmap += self.hashmap[i*Resource.MAPHASH_LEN:(i+1)*Resource.MAPHASH_LEN]
+
+        hmu = self.hash+umsgpack.packb([segment, hashmap])
+        hmu_packet = RNS.Packet(self.link, hmu, context = RNS.Packet.RESOURCE_HMU)
+
+        try:
+            self.link.resource_scheduler.enqueue(self, hmu_packet, self.__packet_sent)
+            self.last_activity = time.time()
+        except Exception as e:
+            RNS.log("Could not send resource HMU packet, cancelling resource", RNS.LOG_DEBUG)
+            RNS.log("The contained exception was: "+str(e), RNS.LOG_DEBUG)
+            self.cancel()
+
     def cancel(self):
         """
         Cancels transferring the resource.
@@ -990,6 +2086,7 @@ class Resource:
         if self.status < Resource.COMPLETE:
             self.status = Resource.FAILED
             if self.initiator:
+                self.__close_spool()
                 if self.link.status == RNS.Link.ACTIVE:
                     try:
                         cancel_packet = RNS.Packet(self.link, self.hash, context=RNS.Packet.RESOURCE_ICL)
@@ -998,6 +2095,11 @@ class Resource:
                         RNS.log("Could not send resource cancel packet, the contained exception was: "+str(e), RNS.LOG_ERROR)
                 self.link.cancel_outgoing_resource(self)
             else:
+                if self.resumable:
+                    self.__suspend()
+                elif self.spool != None:
+                    self.__discard_assembly()
+                self.congestion.concluded()
                 self.link.cancel_incoming_resource(self)
             
             if self.callback != None:
@@ -1022,6 +2124,22 @@ class Resource:
     def set_callback(self, callback):
         self.callback = callback
 
+    def set_priority(self, priority):
+        """
+        Sets the priority of the resource. While several resources are
+        transferred concurrently on a link, each receives a share of it in
+        proportion to its priority. This applies to both outgoing resources,
+        whose parts are interleaved by the sender, and incoming resources,
+        whose requests are sized to their share of the link.
+
+        :param priority: A positive number.
+        :raises: *TypeError* if *priority* is not a positive number.
+        """
+        if not isinstance(priority, (int, float)) or isinstance(priority, bool) or not priority > 0:
+            raise TypeError("Resource priority must be a positive number")
+        else:
+            self.priority = priority
+
     def progress_callback(self, callback):
         self.__progress_callback = callback
 
@@ -1182,7 +2300,7 @@ class ResourceAdvertisement:
         if resource != None:
             self.t = resource.size              # Transfer size
             self.d = resource.total_size        # Total uncompressed data size
-            self.n = len(resource.parts)        # Number of parts
+            self.n = resource.total_parts       # Number of parts
             self.h = resource.hash              # Resource hash
             self.r = resource.random_hash       # Resource random hash
             self.o = resource.original_hash     # First-segment hash
@@ -1195,6 +2313,9 @@ class ResourceAdvertisement:
             self.q = resource.request_id        # ID of associated request
             self.u = False                      # Is request flag
             self.p = False                      # Is response flag
+            self.x = resource.resumable         # Resumable flag
+            self.y = True                       # FEC flag
+            self.z = resource.codec.ID if resource.compressed else 0x00 # Compression codec
 
             if self.q != None:
                 if not resource.is_response:
@@ -1205,7 +2326,7 @@ class ResourceAdvertisement:
                     self.p = True
 
             # Flags
-            self.f = 0x00 | self.p << 4 | self.u << 3 | self.s << 2 | self.c << 1 | self.e
+            self.f = 0x00 | self.y << 6 | self.x << 5 | self.p << 4 | self.u << 3 | self.s << 2 | self.c << 1 | self.e
 
     def get_transfer_size(self):
         return self.t
@@ -1250,6 +2371,11 @@ class ResourceAdvertisement:
             "m": hashmap
         }
 
+        # Receivers that predate codec selection ignore the
+        # codec, and only decompress the default one
+        if self.z != 0x00:
+            dictionary["z"] = self.z    # Compression codec
+
         return umsgpack.packb(dictionary)
 
 
@@ -1274,5 +2400,8 @@ class ResourceAdvertisement:
         adv.s = True if ((adv.f >> 2) & 0x01) == 0x01 else False
         adv.u = True if ((adv.f >> 3) & 0x01) == 0x01 else False
         adv.p = True if ((adv.f >> 4) & 0x01) == 0x01 else False
+        adv.x = True if ((adv.f >> 5) & 0x01) == 0x01 else False
+        adv.y = True if ((adv.f >> 6) & 0x01) == 0x01 else False
+        adv.z = dictionary.get("z", 0x00)
 
         return adv
\ No newline at end of file
@@ -245,6 +245,7 @@ class Reticulum:
         Reticulum.storagepath   = Reticulum.configdir+"/storage"
         Reticulum.cachepath     = Reticulum.configdir+"/storage/cache"
         Reticulum.resourcepath  = Reticulum.configdir+"/storage/resources"
+        Reticulum.contentpath   = Reticulum.configdir+"/storage/content"
         Reticulum.identitypath  = Reticulum.configdir+"/storage/identities"
         Reticulum.interfacepath = Reticulum.configdir+"/interfaces"
 
@@ -261,6 +262,7 @@ class Reticulum:
         self.share_instance       = True
         self.rpc_listener         = None
         self.rpc_key              = None
+        self.content_store_size   = 0
 
         self.ifac_salt = Reticulum.IFAC_SALT
 
@@ -292,6 +294,9 @@ class Reticulum:
         if not os.path.isdir(Reticulum.resourcepath):
             os.makedirs(Reticulum.resourcepath)
 
+        if not os.path.isdir(Reticulum.contentpath):
+            os.makedirs(Reticulum.contentpath)
+
         if not os.path.isdir(Reticulum.identitypath):
             os.makedirs(Reticulum.identitypath)
 
@@ -313,10 +318,15 @@ class Reticulum:
 
         self.__apply_config()
         RNS.log(f"Utilising cryptography backend \"{RNS.Cryptography.Provider.backend()}\"", RNS.LOG_DEBUG)
+        for primitive in RNS.Cryptography.Provider.pure_python_hot_primitives():
+            RNS.log(f"The {primitive} primitive is provided by a pure-Python implementation, which will limit throughput", RNS.LOG_WARNING)
         RNS.log(f"Configuration loaded from {self.configpath}", RNS.LOG_VERBOSE)
         
         RNS.Identity.load_known_destinations()
 
+        if self.content_store_size > 0:
+            RNS.ContentStore.start(Reticulum.contentpath, self.content_store_size)
+
         RNS.Transport.start(self)
 
         self.rpc_addr = ("127.0.0.1", self.local_control_port)
@@ -415,6 +425,8 @@ class Reticulum:
             self.__start_jobs()
 
     def __apply_config(self):
+        crypto_benchmark = False
+        crypto_overrides = []
         if "logging" in self.config:
             for option in self.config["logging"]:
                 value = self.config["logging"][option]
@@ -488,6 +500,28 @@ class Reticulum:
                         Reticulum.__use_implicit_proof = True
                     if v == False:
                         Reticulum.__use_implicit_proof = False
+                if option == "crypto_benchmark":
+                    v = self.config["reticulum"].as_bool(option)
+                    if v == True:
+                        crypto_benchmark = True
+                if option == "content_store_size":
+                    v = self.config["reticulum"].as_float(option)
+                    if v > 0:
+                        self.content_store_size = int(v*1000*1000)
+
+            if "crypto_providers" in self.config["reticulum"]:
+                v = self.config["reticulum"].as_list("crypto_providers")
+                for selection in v:
+                    try:
+                        primitive, provider = selection.split(":")
+                        RNS.Cryptography.Provider.select(primitive.strip().lower(), provider.strip().lower())
+                        crypto_overrides.append(primitive.strip().lower())
+                    except Exception as e:
+                        RNS.log(f"Could not apply cryptography provider selection \"{selection}\": {e}", RNS.LOG_ERROR)
+
+        if crypto_benchmark:
+            RNS.log("Benchmarking cryptography providers...", RNS.LOG_VERBOSE)
+            RNS.Cryptography.Provider.autoselect(exclude=crypto_overrides)
 
         self.__start_local_interface()
 
@@ -827,7 +861,14 @@ class Reticulum:
         # Clean resource caches
         for filename in os.listdir(self.resourcepath):
             try:
-                if len(filename) == (RNS.Identity.HASHLENGTH//8)*2:
+                # Resumable resources leave their state and
+                # partial payload next to the stored data
+                basename = filename
+                for suffix in [RNS.Resource.RESUME_SUFFIX, RNS.Resource.PARTIAL_SUFFIX]:
+                    if basename.endswith(suffix):
+                        basename = basename[:-len(suffix)]
+
+                if len(basename) == (RNS.Identity.HASHLENGTH//8)*2:
                     filepath = self.resourcepath + "/" + filename
                     mtime = os.path.getmtime(filepath)
                     age = now - mtime
@@ -889,6 +930,9 @@ class Reticulum:
                     if path == "link_count":
                         rpc_connection.send(self.get_link_count())
 
+                    if path == "crypto_providers":
+                        rpc_connection.send(self.get_crypto_providers())
+
                     if path == "packet_rssi":
                         rpc_connection.send(self.get_packet_rssi(call["packet_hash"]))
 
@@ -1199,6 +1243,16 @@ class Reticulum:
         else:
             return len(RNS.Transport.link_table)
 
+    def get_crypto_providers(self):
+        if self.is_connected_to_shared_instance:
+            rpc_connection = multiprocessing.connection.Client(self.rpc_addr, authkey=self.rpc_key)
+            rpc_connection.send({"get": "crypto_providers"})
+            response = rpc_connection.recv()
+            return response
+
+        else:
+            return RNS.Cryptography.Provider.status(measure=True)
+
     def get_packet_rssi(self, packet_hash):
         if self.is_connected_to_shared_instance:
             rpc_connection = multiprocessing.connection.Client(self.rpc_addr, authkey=self.rpc_key)
@@ -0,0 +1,133 @@
+# MIT License
+#
+# Copyright (c) 2016-2023 Mark Qvist / unsigned.io and contributors.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import RNS
+import threading
+from collections import deque
+
+class ResourceScheduler():
+    """
+    Schedules the packets of the resources sent over a link. Each
+    resource queues the packets it is asked for, and queued packets
+    are sent in order of their virtual finish time, as in weighted
+    fair queueing. Resources with packets waiting share the link in
+    proportion to their priority, so that the parts of a small
+    resource are not held back behind a window of a large one.
+    Packets of the same resource are always sent in the order they
+    were queued.
+    """
+
+    def __init__(self, link):
+        self.link         = link
+        self.lock         = threading.Lock()
+        self.queues       = {}
+        self.finish_tags  = {}
+        self.virtual_time = 0
+        self.draining     = False
+
+    def enqueue(self, resource, packet, sent=None):
+        """
+        Queues *packet* for sending on behalf of *resource*.
+
+        :param sent: An optional *callable* with the signature *sent(packet)*, called once the packet was sent.
+        """
+        with self.lock:
+            if not resource in self.queues:
+                self.queues[resource] = deque()
+
+            # Queues that were idle start at the current virtual
+            # time, so they can not save up credit while idle.
+            start  = max(self.virtual_time, self.finish_tags.get(resource, 0))
+            finish = start+len(packet.data)/resource.priority
+            self.finish_tags[resource] = finish
+            self.queues[resource].append((finish, packet, sent))
+
+            # Queued packets are sent by one task at a time
+            # on the protocol executor, which runs until the
+            # queues are empty.
+            if not self.draining:
+                self.draining = True
+                RNS.Executor.protocol().submit(self.__drain, key=self, bounded=False)
+
+    def remove(self, resource):
+        """
+        Drops any packets still queued for *resource*.
+        """
+        with self.lock:
+            self.queues.pop(resource, None)
+            self.finish_tags.pop(resource, None)
+
+    def queued(self, resource=None):
+        """
+        :returns: The number of packets queued for *resource*, or for all resources if *None*.
+        """
+        with self.lock:
+            if resource == None:
+                return sum(len(queue) for queue in self.queues.values())
+            elif resource in self.queues:
+                return len(self.queues[resource])
+            else:
+                return 0
+
+    def next(self):
+        """
+        Removes the packet with the lowest virtual finish time
+        from the queues.
+
+        :returns: A tuple of the resource, packet and sent callback, or *None* if nothing is queued.
+        """
+        with self.lock:
+            return self.__select()
+
+    def __select(self):
+        selected = None
+        for resource, queue in self.queues.items():
+            if selected == None or queue[0][0] < self.queues[selected][0][0]:
+                selected = resource
+
+        if selected == None:
+            return None
+
+        finish, packet, sent = self.queues[selected].popleft()
+        self.virtual_time = finish
+        if len(self.queues[selected]) == 0:
+            self.queues.pop(selected)
+        return (selected, packet, sent)
+
+    def __drain(self):
+        while True:
+            with self.lock:
+                entry = self.__select()
+                if entry == None:
+                    self.draining = False
+                    return
+
+            resource, packet, sent = entry
+            try:
+                packet.send()
+                if sent != None:
+                    sent(packet)
+
+            except Exception as e:
+                RNS.log("Could not send packet for "+str(resource)+", cancelling transfer", RNS.LOG_DEBUG)
+                RNS.log("The contained exception was: "+str(e), RNS.LOG_DEBUG)
+                resource.cancel()
@@ -0,0 +1,201 @@
+# MIT License
+#
+# Copyright (c) 2016-2023 Mark Qvist / unsigned.io and contributors.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import RNS
+import time
+import heapq
+import threading
+
+class Timer():
+    """
+    A deadline registered with a :ref:`RNS.Timers.TimerService<api-timers>`.
+    When it expires, its callback is run on the callback executor of the
+    service. A timer has at most one deadline at a time, so scheduling it
+    again replaces the previous deadline, and it can be scheduled again
+    from its own callback to run periodically.
+
+      This class need not be instantiated directly.
+      Use :func:`RNS.Timers.TimerService.timer` to create timers.
+    """
+
+    def __init__(self, service, callback, args):
+        self.service    = service
+        self.callback   = callback
+        self.args       = args
+        self.deadline   = None
+        self.generation = 0
+
+    def schedule(self, delay):
+        """
+        Schedules the timer to expire in *delay* seconds.
+        """
+        self.service._schedule(self, time.time()+delay)
+
+    def schedule_at(self, deadline):
+        """
+        Schedules the timer to expire at *deadline*, in seconds since the epoch.
+        """
+        self.service._schedule(self, deadline)
+
+    def cancel(self):
+        """
+        Cancels the timer, if it is scheduled.
+        """
+        self.service._cancel(self)
+
+    def is_scheduled(self):
+        """
+        :returns: Whether the timer is scheduled to expire.
+        """
+        return self.deadline != None
+
+    def _expire(self):
+        try:
+            self.callback(*self.args)
+        except Exception as e:
+            RNS.log("Error while executing timer callback "+str(self.callback)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
+
+
+class TimerService():
+    """
+    Keeps the deadlines of any number of timers in a heap, and waits
+    for the earliest of them on a single thread. Expired timers are
+    handed to *executor*, or the protocol executor, so that timer
+    callbacks that take a while do not hold up other timers, and
+    application callbacks can not hold up timers. Callbacks of the
+    same timer never run concurrently.
+
+    :param executor: A :ref:`RNS.Executor.CallbackExecutor<api-executor>`, or *None* for the protocol executor.
+    """
+
+    # Deadlines that were replaced or cancelled are
+    # left in the heap until they expire, unless they
+    # come to outnumber the live ones by this factor,
+    # at which point the heap is rebuilt.
+    COMPACTION_FACTOR = 2
+    COMPACTION_MIN    = 1024
+
+    def __init__(self, executor=None):
+        self.executor  = executor
+        self.lock      = threading.Lock()
+        self.changed   = threading.Condition(self.lock)
+        self.heap      = []
+        self.sequence  = 0
+        self.scheduled = 0
+        self.thread    = None
+
+    def timer(self, callback, *args):
+        """
+        Creates a timer that calls *callback* with *args* when it expires.
+        The timer is not scheduled until :func:`Timer.schedule` is called.
+
+        :returns: A :ref:`RNS.Timers.Timer<api-timers>`.
+        """
+        return Timer(self, callback, args)
+
+    def call_later(self, delay, callback, *args):
+        """
+        Calls *callback* with *args* in *delay* seconds.
+
+        :returns: The scheduled :ref:`RNS.Timers.Timer<api-timers>`, which can be cancelled.
+        """
+        timer = self.timer(callback, *args)
+        timer.schedule(delay)
+        return timer
+
+    def _schedule(self, timer, deadline):
+        with self.lock:
+            if timer.deadline == None:
+                self.scheduled += 1
+            timer.deadline = deadline
+            timer.generation += 1
+            self.sequence += 1
+            heapq.heappush(self.heap, (deadline, self.sequence, timer.generation, timer))
+            self.__compact()
+
+            if self.heap[0][3] is timer:
+                self.changed.notify()
+
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.__run, name="Timer Service", daemon=True)
+                self.thread.start()
+
+    def _cancel(self, timer):
+        with self.lock:
+            if timer.deadline != None:
+                self.scheduled -= 1
+                timer.deadline = None
+                timer.generation += 1
+
+    def __compact(self):
+        if len(self.heap) > TimerService.COMPACTION_MIN and len(self.heap) > self.scheduled*TimerService.COMPACTION_FACTOR:
+            self.heap = [entry for entry in self.heap if entry[2] == entry[3].generation]
+            heapq.heapify(self.heap)
+
+    def __run(self):
+        while True:
+            expired = []
+            with self.lock:
+                while len(expired) == 0:
+                    while len(self.heap) > 0 and self.heap[0][2] != self.heap[0][3].generation:
+                        heapq.heappop(self.heap)
+
+                    if len(self.heap) == 0:
+                        self.changed.wait()
+                        continue
+
+                    now = time.time()
+                    if self.heap[0][0] > now:
+                        self.changed.wait(self.heap[0][0]-now)
+                        continue
+
+                    while len(self.heap) > 0 and self.heap[0][0] <= now:
+                        deadline, sequence, generation, timer = heapq.heappop(self.heap)
+                        if generation == timer.generation:
+                            timer.deadline = None
+                            self.scheduled -= 1
+                            expired.append(timer)
+
+            executor = self.executor if self.executor != None else RNS.Executor.protocol()
+            for timer in expired:
+                RNS.Executor.dispatch(executor, timer._expire, key=timer, bounded=False)
+
+    def get_scheduled(self):
+        """
+        :returns: The number of scheduled timers.
+        """
+        with self.lock:
+            return self.scheduled
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared():
+    """
+    :returns: The timer service that links, resources and packet receipts register their deadlines with.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared == None:
+            _shared = TimerService()
+        return _shared
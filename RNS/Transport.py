@@ -85,6 +85,7 @@ class Transport:
     destinations                = []           # All active destinations
     pending_links               = []           # Links that are being established
     active_links                = []           # Links that are active
+    active_link_ids             = {}           # Active links by link ID, for looking up the link of inbound packets
     packet_hashlist             = set()        # A list of packet hashes for duplicate detection
     packet_hashlist_prev        = set()
     receipts                    = []           # Receipts of all outgoing packets for proof processing
@@ -407,25 +408,24 @@ class Transport:
 
                             Transport.pending_links.remove(link)
 
-                    for link in Transport.active_links:
+                    for link in list(Transport.active_links):
                         if link.status == RNS.Link.CLOSED:
-                            Transport.active_links.remove(link)
+                            Transport.deregister_link(link)
 
                     Transport.links_last_checked = time.time()
 
-                # Process receipts list for timed-out packets
+                # Remove concluded receipts, and cull receipts
+                # beyond the maximum. Receipts time out on the
+                # timer service, but are only removed here, so
+                # the list is not changed from other threads
+                # while inbound proofs are checked against it.
                 if time.time() > Transport.receipts_last_checked+Transport.receipts_check_interval:
+                    Transport.receipts[:] = [receipt for receipt in Transport.receipts if receipt.status == RNS.PacketReceipt.SENT]
                     while len(Transport.receipts) > Transport.MAX_RECEIPTS:
                         culled_receipt = Transport.receipts.pop(0)
                         culled_receipt.timeout = -1
                         culled_receipt.check_timeout()
 
-                    for receipt in Transport.receipts:
-                        receipt.check_timeout()
-                        if receipt.status != RNS.PacketReceipt.SENT:
-                            if receipt in Transport.receipts:
-                                Transport.receipts.remove(receipt)
-
                     Transport.receipts_last_checked = time.time()
 
                 # Process announces needing retransmission
@@ -817,7 +817,10 @@ class Transport:
             # Don't generate receipts for link-related packets
             not (packet.context >= RNS.Packet.KEEPALIVE and packet.context <= RNS.Packet.LRPROOF) and
             # Don't generate receipts for resource packets
-            not (packet.context >= RNS.Packet.RESOURCE and packet.context <= RNS.Packet.RESOURCE_RCL)):
+            not (packet.context >= RNS.Packet.RESOURCE and packet.context <= RNS.Packet.RESOURCE_RCL) and
+            not packet.context == RNS.Packet.RESOURCE_RSM and
+            not packet.context == RNS.Packet.RESOURCE_RPR and
+            not packet.context == RNS.Packet.RESOURCE_RPM):
 
             generate_receipt = True
 
@@ -1071,6 +1074,8 @@ class Transport:
             return True
         if packet.context == RNS.Packet.RESOURCE:
             return True
+        if packet.context == RNS.Packet.RESOURCE_RPR:
+            return True
         if packet.context == RNS.Packet.CACHE_REQUEST:
             return True
         if packet.context == RNS.Packet.CHANNEL:
@@ -1112,7 +1117,7 @@ class Transport:
         return False
 
     @staticmethod
-    def inbound(raw, interface=None):
+    def inbound(raw, interface=None, signature_validated=False):
         # If interface access codes are enabled,
         # we must authenticate each packet.
         if len(raw) > 2:
@@ -1425,7 +1430,14 @@ class Transport:
             # announces, queueing rebroadcasts of these, and removal
             # of queued announce rebroadcasts once handed to the next node.
             if packet.packet_type == RNS.Packet.ANNOUNCE:
-                if interface != None and RNS.Identity.validate_announce(packet, only_validate_signature=True):
+                # If the interface is already in an ingress burst,
+                # announces for unknown destinations will be held,
+                # and their signatures are then validated in batches
+                # by the interface, instead of one at a time here.
+                # Their arrival still counts towards the ingress
+                # limit right away, like that of any other announce.
+                defer_validation = not signature_validated and interface != None and interface.ic_burst_active and not packet.destination_hash in Transport.destination_table
+                if interface != None and (signature_validated or defer_validation or RNS.Identity.validate_announce(packet, only_validate_signature=True)):
                     interface.received_announce()
 
                 if not packet.destination_hash in Transport.destination_table:
@@ -1434,12 +1446,12 @@ class Transport:
                     # destinations will have re-announces controlled
                     # by normal announce rate limiting.
                     if interface.should_ingress_limit():
-                        interface.hold_announce(packet)
+                        interface.hold_announce(packet, validated=not defer_validation)
                         Transport.jobs_locked = False
                         return
 
                 local_destination = next((d for d in Transport.destinations if d.hash == packet.destination_hash), None)
-                if local_destination == None and RNS.Identity.validate_announce(packet):
+                if local_destination == None and RNS.Identity.validate_announce(packet, signature_validated=signature_validated):
                     if packet.transport_id != None:
                         received_from = packet.transport_id
                         
@@ -1750,12 +1762,14 @@ class Transport:
 
                             # Call externally registered callbacks from apps
                             # wanting to know when an announce arrives
+                            if len(Transport.announce_handlers) > 0:
+                                announce_identity = RNS.Identity.recall(packet.destination_hash)
+
                             for handler in Transport.announce_handlers:
                                 try:
                                     # Check that the announced destination matches
                                     # the handlers aspect filter
                                     execute_callback = False
-                                    announce_identity = RNS.Identity.recall(packet.destination_hash)
                                     if handler.aspect_filter == None:
                                         # If the handlers aspect filter is set to
                                         # None, we execute the callback in all cases
@@ -1822,30 +1836,30 @@ class Transport:
             # Handling for local data packets
             elif packet.packet_type == RNS.Packet.DATA:
                 if packet.destination_type == RNS.Destination.LINK:
-                    for link in Transport.active_links:
-                        if link.link_id == packet.destination_hash:
-                            if link.attached_interface == packet.receiving_interface:
-                                packet.link = link
-                                if packet.context == RNS.Packet.CACHE_REQUEST:
-                                    cached_packet = Transport.get_cached_packet(packet.data)
-                                    if cached_packet != None:
-                                        cached_packet.unpack()
-                                        RNS.Packet(destination=link, data=cached_packet.data,
-                                                   packet_type=cached_packet.packet_type, context=cached_packet.context).send()
-
-                                    Transport.jobs_locked = False
-                                else:
-                                    link.receive(packet)
+                    link = Transport.active_link_ids.get(packet.destination_hash)
+                    if link != None:
+                        if link.attached_interface == packet.receiving_interface:
+                            packet.link = link
+                            if packet.context == RNS.Packet.CACHE_REQUEST:
+                                cached_packet = Transport.get_cached_packet(packet.data)
+                                if cached_packet != None:
+                                    cached_packet.unpack()
+                                    RNS.Packet(destination=link, data=cached_packet.data,
+                                               packet_type=cached_packet.packet_type, context=cached_packet.context).send()
+
+                                Transport.jobs_locked = False
                             else:
-                                # In the strange and rare case that an interface
-                                # is partly malfunctioning, and a link-associated
-                                # packet is being received on an interface that
-                                # has failed sending, and transport has failed over
-                                # to another path, we remove this packet hash from
-                                # the filter hashlist so the link can receive the
-                                # packet when it finally arrives over another path.
-                                while packet.packet_hash in Transport.packet_hashlist:
-                                    Transport.packet_hashlist.remove(packet.packet_hash)
+                                link.receive(packet)
+                        else:
+                            # In the strange and rare case that an interface
+                            # is partly malfunctioning, and a link-associated
+                            # packet is being received on an interface that
+                            # has failed sending, and transport has failed over
+                            # to another path, we remove this packet hash from
+                            # the filter hashlist so the link can receive the
+                            # packet when it finally arrives over another path.
+                            while packet.packet_hash in Transport.packet_hashlist:
+                                Transport.packet_hashlist.remove(packet.packet_hash)
                 else:
                     for destination in Transport.destinations:
                         if destination.hash == packet.destination_hash and destination.type == packet.destination_type:
@@ -1928,14 +1942,14 @@ class Transport:
                                     link.validate_proof(packet)
 
                 elif packet.context == RNS.Packet.RESOURCE_PRF:
-                    for link in Transport.active_links:
-                        if link.link_id == packet.destination_hash:
-                            link.receive(packet)
+                    link = Transport.active_link_ids.get(packet.destination_hash)
+                    if link != None:
+                        link.receive(packet)
                 else:
                     if packet.destination_type == RNS.Destination.LINK:
-                        for link in Transport.active_links:
-                            if link.link_id == packet.destination_hash:
-                                packet.link = link
+                        link = Transport.active_link_ids.get(packet.destination_hash)
+                        if link != None:
+                            packet.link = link
                                 
                     if len(packet.data) == RNS.PacketReceipt.EXPL_LENGTH:
                         proof_hash = packet.data[:RNS.Identity.HASHLENGTH//8]
@@ -2094,6 +2108,22 @@ class Transport:
             Transport.pending_links.append(link)
         else:
             Transport.active_links.append(link)
+            Transport.active_link_ids[link.link_id] = link
+
+    @staticmethod
+    def deregister_link(link):
+        if link in Transport.active_links:
+            Transport.active_links.remove(link)
+
+        # Another active link can have registered the same
+        # link ID, for example for a retried link request,
+        # in which case it takes over the lookup by ID.
+        if Transport.active_link_ids.get(link.link_id) is link:
+            Transport.active_link_ids.pop(link.link_id)
+            for other in reversed(Transport.active_links):
+                if other.link_id == link.link_id:
+                    Transport.active_link_ids[other.link_id] = other
+                    break
 
     @staticmethod
     def activate_link(link):
@@ -2103,6 +2133,7 @@ class Transport:
                 raise IOError("Invalid link state for link activation: "+str(link.status))
             Transport.pending_links.remove(link)
             Transport.active_links.append(link)
+            Transport.active_link_ids[link.link_id] = link
             link.status = RNS.Link.ACTIVE
         else:
             RNS.log("Attempted to activate a link that was not in the pending table", RNS.LOG_ERROR)
@@ -583,7 +583,7 @@ def fetch(configdir, verbosity = 0, quietness = 0, destination = None, file = No
     exit(0)
 
 
-def send(configdir, verbosity = 0, quietness = 0, destination = None, file = None, timeout = RNS.Transport.PATH_REQUEST_TIMEOUT, silent=False, phy_rates=False, no_compress=False):
+def send(configdir, verbosity = 0, quietness = 0, destination = None, file = None, timeout = RNS.Transport.PATH_REQUEST_TIMEOUT, silent=False, phy_rates=False, no_compress=False, resume=False):
     global current_resource, resource_done, link, speed, show_phy_rates, phy_got_total, phy_speed
     from tempfile import TemporaryFile
     targetloglevel = 3+verbosity-quietness
@@ -710,7 +710,7 @@ def send(configdir, verbosity = 0, quietness = 0, destination = None, file = Non
     auto_compress = True
     if no_compress:
         auto_compress = False
-    resource = RNS.Resource(temp_file, link, callback = sender_progress, progress_callback = sender_progress, auto_compress = auto_compress)
+    resource = RNS.Resource(temp_file, link, callback = sender_progress, progress_callback = sender_progress, auto_compress = auto_compress, resumable = resume)
     current_resource = resource
 
     while resource.status < RNS.Resource.TRANSFERRING:
@@ -796,6 +796,7 @@ def main():
         parser.add_argument("-S", '--silent', action='store_true', default=False, help="disable transfer progress output")
         parser.add_argument("-l", '--listen', action='store_true', default=False, help="listen for incoming transfer requests")
         parser.add_argument("-C", '--no-compress', action='store_true', default=False, help="disable automatic compression")
+        parser.add_argument("-r", '--resume', action='store_true', default=False, help="allow resuming the transfer if it is interrupted")
         parser.add_argument("-F", '--allow-fetch', action='store_true', default=False, help="allow authenticated clients to fetch files")
         parser.add_argument("-f", '--fetch', action='store_true', default=False, help="fetch file from remote listener instead of sending")
         parser.add_argument("-j", "--jail", metavar="path", action="store", default=None, help="restrict fetch requests to specified path", type=str)
@@ -855,6 +856,7 @@ def main():
                 silent = args.silent,
                 phy_rates = args.phy_rates,
                 no_compress = args.no_compress,
+                resume = args.resume,
             )
 
         else:
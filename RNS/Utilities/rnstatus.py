@@ -135,7 +135,8 @@ def get_remote_status(destination_hash, include_lstats, identity, no_output=Fals
 
 def program_setup(configdir, dispall=False, verbosity=0, name_filter=None, json=False, astats=False,
                   lstats=False, sorting=None, sort_reverse=False, remote=None, management_identity=None,
-                  remote_timeout=RNS.Transport.PATH_REQUEST_TIMEOUT, must_exit=True, rns_instance=None, traffic_totals=False):
+                  remote_timeout=RNS.Transport.PATH_REQUEST_TIMEOUT, must_exit=True, rns_instance=None, traffic_totals=False,
+                  cstats=False):
     
     if remote:
         require_shared = False
@@ -199,6 +200,12 @@ def program_setup(configdir, dispall=False, verbosity=0, name_filter=None, json=
         except Exception as e:
             pass
 
+        if cstats and stats != None:
+            try:
+                stats["crypto_providers"] = reticulum.get_crypto_providers()
+            except Exception as e:
+                pass
+
     if stats != None:
         if json:
             import json
@@ -408,6 +415,17 @@ def program_setup(configdir, dispall=False, verbosity=0, name_filter=None, json=
             txstat  = txb_str+"  "+RNS.prettyspeed(stats["txs"])
             print(f"\n Totals       : {txstat}\n                {rxstat}")
 
+        if "crypto_providers" in stats and stats["crypto_providers"] != None:
+            print("\n Cryptography :", end="")
+            first = True
+            for primitive in stats["crypto_providers"]:
+                cs = stats["crypto_providers"][primitive]
+                ops_str = f"{RNS.prettyfrequency(cs['ops'], suffix='ops/s')}" if cs["ops"] != None else "unmeasured"
+                notice = "  (pure Python)" if cs["pure_python"] else ""
+                indent = " " if first else "                "
+                print(f"{indent}{primitive:<8} {cs['provider']:<9} {ops_str}{notice}")
+                first = False
+
         if "transport_id" in stats and stats["transport_id"] != None:
             print("\n Transport Instance "+RNS.prettyhexrep(stats["transport_id"])+" running")
             if "probe_responder" in stats and stats["probe_responder"] != None:
@@ -520,6 +538,14 @@ def main(must_exit=True, rns_instance=None):
             default=RNS.Transport.PATH_REQUEST_TIMEOUT
         )
 
+        parser.add_argument(
+            "-C",
+            "--crypto",
+            action="store_true",
+            help="show active cryptography providers",
+            default=False,
+        )
+
         parser.add_argument('-v', '--verbose', action='count', default=0)
 
         parser.add_argument("filter", nargs="?", default=None, help="only display interfaces with names including filter", type=str)
@@ -547,6 +573,7 @@ def main(must_exit=True, rns_instance=None):
             must_exit=must_exit,
             rns_instance=rns_instance,
             traffic_totals=args.totals,
+            cstats=args.crypto,
         )
 
     except KeyboardInterrupt:
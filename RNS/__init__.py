@@ -42,6 +42,14 @@ from .Packet import Packet
 from .Packet import PacketReceipt
 from .Resolver import Resolver
 from .Resource import Resource, ResourceAdvertisement
+from .ContentStore import ContentStore
+from . import Congestion
+from . import Compression
+from . import Erasure
+from . import Scheduler
+from . import Executor
+from . import Timers
+from . import aio
 from .Cryptography import HKDF
 from .Cryptography import Hashes
 
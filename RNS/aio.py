@@ -0,0 +1,482 @@
+# MIT License
+#
+# Copyright (c) 2016-2023 Mark Qvist / unsigned.io and contributors.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import RNS
+import asyncio
+import threading
+import weakref
+
+# While a channel is not ready to send, coroutines
+# waiting to send on it check again at this interval.
+SEND_POLL_INTERVAL = 0.01
+
+# Received stream data is read in chunks of this size
+STREAM_READ_SIZE = 64*1024
+
+class Bridge():
+    """
+    Carries events from the threads Reticulum runs callbacks on to an
+    asyncio event loop. Every callback registered by this module does
+    nothing but hand its event to the bridge of the loop it belongs
+    to, which schedules it on the loop with ``call_soon_threadsafe``,
+    so no threads are started on behalf of the event loop, and all
+    state of the asynchronous objects is only touched from the loop.
+
+      This class need not be instantiated directly. Use
+      :func:`RNS.aio.get_bridge` to get the bridge of the running loop.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def call(self, callback, *args):
+        """
+        Schedules *callback* to be called with *args* on the event loop.
+        Events for a loop that has been closed are discarded.
+        """
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass
+
+    def resolve(self, future, result):
+        """
+        Sets the result of *future*, unless it has been cancelled.
+        """
+        self.call(Bridge._resolve, future, result)
+
+    def fail(self, future, exception):
+        """
+        Sets the exception of *future*, unless it has been cancelled.
+        """
+        self.call(Bridge._fail, future, exception)
+
+    @staticmethod
+    def _resolve(future, result):
+        if not future.done():
+            future.set_result(result)
+
+    @staticmethod
+    def _fail(future, exception):
+        if not future.done():
+            future.set_exception(exception)
+
+
+_bridges = weakref.WeakKeyDictionary()
+_bridges_lock = threading.Lock()
+
+def get_bridge(loop=None):
+    """
+    :param loop: An asyncio event loop, or *None* for the running loop.
+    :returns: The :ref:`RNS.aio.Bridge<api-aio>` for *loop*, which is created on first use.
+    :raises: *RuntimeError* if *loop* is *None* and no event loop is running.
+    """
+    if loop == None:
+        loop = asyncio.get_running_loop()
+
+    with _bridges_lock:
+        if not loop in _bridges:
+            _bridges[loop] = Bridge(loop)
+        return _bridges[loop]
+
+
+class Link():
+    """
+    Wraps a :ref:`RNS.Link<api-link>` for use from asyncio coroutines.
+    Use :func:`RNS.aio.Link.establish` to establish a new link, or wrap
+    a link that was established otherwise, such as one received by a
+    destination, from a coroutine running on the event loop.
+
+    :param link: The :ref:`RNS.Link<api-link>` to wrap.
+    """
+
+    def __init__(self, link):
+        self.link     = link
+        self._bridge  = get_bridge()
+        self._closed  = self._bridge.loop.create_future()
+        self._channel = None
+
+        # Any closed callback set earlier is kept, and
+        # called before the link is reported closed.
+        self._closed_callback = link.callbacks.link_closed
+        link.set_link_closed_callback(self._link_closed)
+        if link.status == RNS.Link.CLOSED:
+            self._bridge.resolve(self._closed, link)
+
+    @classmethod
+    async def establish(cls, destination, timeout=None):
+        """
+        Establishes a link to *destination*.
+
+        :param destination: An outgoing :ref:`RNS.Destination<api-destination>` to establish a link to.
+        :param timeout: An optional timeout in seconds. If *None* is supplied, the establishment timeout of the link applies.
+        :returns: An :ref:`RNS.aio.Link<api-aio>` once the link is established.
+        :raises: *ConnectionError* if the link could not be established, or *asyncio.TimeoutError* if *timeout* expired first.
+        """
+        bridge = get_bridge()
+        established = bridge.loop.create_future()
+        link = RNS.Link(destination, established_callback=lambda link: bridge.resolve(established, link))
+        wrapper = cls(link)
+        wrapper._closed.add_done_callback(lambda closed: Bridge._fail(established, ConnectionError("Could not establish link to "+str(destination))))
+
+        try:
+            await asyncio.wait_for(established, timeout)
+        except BaseException:
+            if link.status != RNS.Link.CLOSED:
+                link.teardown()
+            raise
+
+        return wrapper
+
+    def _link_closed(self, link):
+        if self._closed_callback != None:
+            try:
+                self._closed_callback(link)
+            except Exception as e:
+                RNS.log("Error while executing link closed callback from "+str(link)+". The contained exception was: "+str(e), RNS.LOG_ERROR)
+
+        self._bridge.resolve(self._closed, link)
+        if self._channel != None:
+            self._channel._end()
+
+    async def request(self, path, data=None, timeout=None):
+        """
+        Sends a request to the remote peer, and waits for the response.
+
+        :param path: The request path.
+        :param data: Optional data to send with the request.
+        :param timeout: An optional timeout in seconds for the request. If *None* is supplied it will be calculated based on link RTT.
+        :returns: The response.
+        :raises: *IOError* if the request could not be sent, or failed.
+        """
+        response = self._bridge.loop.create_future()
+        receipt = self.link.request(
+            path,
+            data,
+            response_callback = lambda receipt: self._bridge.resolve(response, receipt.response),
+            failed_callback = lambda receipt: self._bridge.fail(response, IOError("Request to "+str(path)+" failed")),
+            timeout = timeout,
+        )
+
+        if receipt == False:
+            raise IOError("Could not send request to "+str(path))
+
+        return await response
+
+    def get_channel(self):
+        """
+        :returns: An :ref:`RNS.aio.Channel<api-aio>` wrapping the channel of the link.
+        """
+        if self._channel == None:
+            self._channel = Channel(self.link.get_channel())
+            if self._closed.done():
+                self._channel._end()
+        return self._channel
+
+    async def open_buffer(self, receive_stream_id, send_stream_id):
+        """
+        Opens a pair of streams on the channel of the link, see :func:`RNS.aio.open_buffer`.
+        """
+        return await open_buffer(receive_stream_id, send_stream_id, self.get_channel())
+
+    def teardown(self):
+        """
+        Closes the link and purges encryption keys.
+        """
+        self.link.teardown()
+
+    async def wait_closed(self):
+        """
+        Waits until the link is closed.
+        """
+        await asyncio.shield(self._closed)
+
+
+class Channel():
+    """
+    Wraps a ``Channel`` for use from asyncio coroutines. Messages of
+    the types registered with :func:`register_message_type` can be
+    received by iterating over the wrapper with ``async for``, which
+    ends when the link of the channel closes, or the wrapper is closed.
+    Messages are queued until they are iterated over. Messages of other
+    types are left to the other handlers of the channel.
+
+    :param channel: The ``Channel`` to wrap.
+    """
+
+    def __init__(self, channel):
+        self.channel  = channel
+        self._bridge  = get_bridge()
+        self._queue   = asyncio.Queue()
+        self._ended   = False
+        self._message_types = set()
+        self.channel.add_message_handler(self._handle_message)
+
+    def register_message_type(self, message_class):
+        """
+        Registers a message class with the channel, see ``Channel.register_message_type``.
+        """
+        self.channel.register_message_type(message_class)
+        self._message_types.add(message_class)
+
+    def _handle_message(self, message):
+        if not type(message) in self._message_types:
+            return False
+
+        self._bridge.call(self._queue.put_nowait, message)
+        return True
+
+    def _end(self):
+        self._bridge.call(self._enqueue_end)
+
+    def _enqueue_end(self):
+        if not self._ended:
+            self._ended = True
+            self._queue.put_nowait(None)
+
+    async def send(self, message):
+        """
+        Sends a message, waiting until the channel is ready to send it.
+
+        :param message: An instance of a ``MessageBase`` subclass.
+        :returns: The envelope the message was sent in.
+        :raises: *ConnectionError* if the channel was closed.
+        """
+        while not self.channel.is_ready_to_send():
+            if self._ended:
+                raise ConnectionError("Channel is closed")
+            await asyncio.sleep(SEND_POLL_INTERVAL)
+        return self.channel.send(message)
+
+    def close(self):
+        """
+        Stops receiving messages, and ends iteration once the queued ones are consumed.
+        """
+        self.channel.remove_message_handler(self._handle_message)
+        self._end()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._queue.get()
+        if message == None:
+            # Leave the end marker for other iterations
+            self._queue.put_nowait(None)
+            raise StopAsyncIteration
+        return message
+
+
+class StreamWriter():
+    """
+    Writes binary stream data over a ``Channel`` from asyncio coroutines,
+    with the interface of ``asyncio.StreamWriter``. Written data is held
+    until :func:`drain` is awaited, which sends it as fast as the channel
+    accepts it.
+
+      This class need not be instantiated directly.
+      Use :func:`RNS.aio.open_buffer` to open streams.
+    """
+
+    def __init__(self, raw, channel):
+        self._raw     = raw
+        self._channel = channel
+        self._pending = bytearray()
+        self._closing = None
+
+    @property
+    def transport(self):
+        return None
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def write(self, data):
+        if self._closing != None:
+            raise ConnectionError("Stream is closed")
+        self._pending.extend(data)
+
+    def writelines(self, data):
+        for line in data:
+            self.write(line)
+
+    async def drain(self):
+        """
+        Sends the data written so far.
+
+        :raises: *ConnectionError* if the channel was closed.
+        """
+        while len(self._pending) > 0:
+            sent = self._raw.write(self._pending[:RNS.RawChannelWriter.MAX_CHUNK_LEN])
+            if sent:
+                del self._pending[:sent]
+            else:
+                await self._wait_ready()
+
+    async def _wait_ready(self):
+        if self._channel._ended:
+            raise ConnectionError("Channel is closed")
+        await asyncio.sleep(SEND_POLL_INTERVAL)
+
+    def can_write_eof(self):
+        return True
+
+    def write_eof(self):
+        """
+        Closes the stream once the data written so far has been sent.
+        """
+        self.close()
+
+    def is_closing(self):
+        return self._closing != None
+
+    def close(self):
+        """
+        Closes the stream once the data written so far has been sent,
+        which can be waited for with :func:`wait_closed`.
+        """
+        if self._closing == None:
+            self._closing = asyncio.get_running_loop().create_task(self._close())
+
+    async def _close(self):
+        await self.drain()
+        while not self._channel.channel.is_ready_to_send():
+            await self._wait_ready()
+        self._raw.close()
+
+    async def wait_closed(self):
+        if self._closing != None:
+            await asyncio.shield(self._closing)
+
+
+async def open_buffer(receive_stream_id, send_stream_id, channel):
+    """
+    Opens a pair of streams that read and write binary data over a
+    ``Channel``, in the manner of ``asyncio.open_connection``. Data
+    that arrives is fed to the reader as it is received.
+
+    :param receive_stream_id: The local stream id to receive from.
+    :param send_stream_id: The remote stream id to send to.
+    :param channel: The ``Channel`` or :ref:`RNS.aio.Channel<api-aio>` to read and write on.
+    :returns: A tuple of an ``asyncio.StreamReader`` and an :ref:`RNS.aio.StreamWriter<api-aio>`.
+    """
+    if not isinstance(channel, Channel):
+        channel = Channel(channel)
+
+    bridge = get_bridge()
+    reader = asyncio.StreamReader()
+    raw_reader = RNS.RawChannelReader(receive_stream_id, channel.channel)
+    raw_writer = RNS.RawChannelWriter(send_stream_id, channel.channel)
+
+    def ready(ready_bytes):
+        while True:
+            data = raw_reader.read(STREAM_READ_SIZE)
+            if data == None:
+                return
+            elif len(data) == 0:
+                raw_reader.close()
+                bridge.call(reader.feed_eof)
+                return
+            else:
+                bridge.call(reader.feed_data, data)
+
+    raw_reader.add_ready_callback(ready)
+    return reader, StreamWriter(raw_writer, channel)
+
+
+class Resource():
+    """
+    Sends a :ref:`RNS.Resource<api-resource>` and can be awaited from
+    asyncio coroutines until the transfer concludes. Progress can be
+    followed by iterating over :func:`progress_updates`. It must be
+    created from a coroutine running on the event loop.
+
+    :param data: The data to send, see :ref:`RNS.Resource<api-resource>`.
+    :param link: The :ref:`RNS.Link<api-link>` or :ref:`RNS.aio.Link<api-aio>` to send the resource over.
+    :param \\*\\*kwargs: Further arguments for :ref:`RNS.Resource<api-resource>`, except for the callbacks.
+    """
+
+    def __init__(self, data, link, **kwargs):
+        if isinstance(link, Link):
+            link = link.link
+
+        self._bridge    = get_bridge()
+        self._concluded = self._bridge.loop.create_future()
+        self._updated   = asyncio.Event()
+        self._lock      = threading.Lock()
+        self._reported  = None
+        self.progress   = 0.0
+
+        self.resource = RNS.Resource(data, link, callback=self._resource_concluded, progress_callback=self._resource_progress, **kwargs)
+
+    def _resource_concluded(self, resource):
+        if resource.status == RNS.Resource.COMPLETE:
+            self._bridge.resolve(self._concluded, resource)
+        else:
+            self._bridge.fail(self._concluded, IOError("Resource transfer failed with status "+RNS.hexrep([resource.status])))
+        self._bridge.call(self._updated.set)
+
+    def _resource_progress(self, resource):
+        # Progress is reported to the loop at most once per
+        # iteration of it, with the latest value at the time.
+        with self._lock:
+            pending = self._reported != None
+            self._reported = resource.get_progress()
+        if not pending:
+            self._bridge.call(self._update_progress)
+
+    def _update_progress(self):
+        with self._lock:
+            self.progress = self._reported
+            self._reported = None
+        self._updated.set()
+
+    def get_progress(self):
+        """
+        :returns: The progress of the transfer as a *float* between 0.0 and 1.0, as last reported to the event loop.
+        """
+        return self.progress
+
+    async def progress_updates(self):
+        """
+        Yields the progress of the transfer as a *float* between 0.0 and
+        1.0 each time it is updated, until the transfer concludes. Updates
+        that arrive while the consumer is busy are combined into one.
+        """
+        while True:
+            await self._updated.wait()
+            self._updated.clear()
+            if self._concluded.done():
+                if self.resource.status == RNS.Resource.COMPLETE:
+                    self.progress = 1.0
+                    yield self.progress
+                return
+            yield self.progress
+
+    def __await__(self):
+        """
+        Waits for the transfer to conclude.
+
+        :returns: The concluded :ref:`RNS.Resource<api-resource>`.
+        :raises: *IOError* if the transfer failed.
+        """
+        return asyncio.shield(self._concluded).__await__()
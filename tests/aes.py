@@ -0,0 +1,127 @@
+import RNS
+import os
+import time
+import unittest
+
+from RNS.Cryptography.AES import AES_128_CBC
+from RNS.Cryptography import Token
+from RNS.Cryptography.aes import AES
+
+# FIPS-197, Appendix C
+block_vectors = [
+    ("000102030405060708090a0b0c0d0e0f", "00112233445566778899aabbccddeeff", "69c4e0d86a7b0430d8cdb78070b4c55a"),
+    ("000102030405060708090a0b0c0d0e0f1011121314151617", "00112233445566778899aabbccddeeff", "dda97ca4864cdfe06eaf70a0ec0d7191"),
+    ("000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f", "00112233445566778899aabbccddeeff", "8ea2b7ca516745bfeafc49904b496089"),
+]
+
+# NIST SP 800-38A, F.2.1 and F.2.5
+cbc_iv = "000102030405060708090a0b0c0d0e0f"
+cbc_plaintext = "6bc1bee22e409f96e93d7e117393172aae2d8a571e03ac9c9eb76fac45af8e5130c81c46a35ce411e5fbc1191a0a52eff69f2445df4f9b17ad2b417be66c3710"
+cbc_vectors = [
+    ("2b7e151628aed2a6abf7158809cf4f3c", "7649abac8119b246cee98e9b12e9197d5086cb9b507219ee95db113a917678b273bed6b8e3c1743b7116e69e222295163ff1caa1681fac09120eca307586e1a7"),
+    ("603deb1015ca71be2b73aef0857d77811f352c073b6108d72d9810a30914dff4", "f58c4c04d6e5f1ba779eabfb5f7bfbd69cfc4e967edb808d679f777bc6702c7d39f23369a9d9bacfa530e26304231461b2eb05e2c39be9fcda6c19078c6a9d1b"),
+]
+
+class TestAES(unittest.TestCase):
+    def test_block_vectors(self):
+        for key, plaintext, ciphertext in block_vectors:
+            cipher = AES(bytes.fromhex(key))
+            self.assertEqual(cipher._encrypt_block(bytes.fromhex(plaintext)), bytes.fromhex(ciphertext))
+            self.assertEqual(cipher._decrypt_block(bytes.fromhex(ciphertext)), bytes.fromhex(plaintext))
+
+    def test_cbc_vectors(self):
+        for key, ciphertext in cbc_vectors:
+            cipher = AES(bytes.fromhex(key))
+            self.assertEqual(cipher.encrypt(bytes.fromhex(cbc_plaintext), bytes.fromhex(cbc_iv)), bytes.fromhex(ciphertext))
+            self.assertEqual(cipher.decrypt(bytes.fromhex(ciphertext), bytes.fromhex(cbc_iv)), bytes.fromhex(cbc_plaintext))
+
+        # Check the provider wrapper as well
+        key, ciphertext = cbc_vectors[0]
+        self.assertEqual(AES_128_CBC.encrypt(bytes.fromhex(cbc_plaintext), bytes.fromhex(key), bytes.fromhex(cbc_iv)), bytes.fromhex(ciphertext))
+        self.assertEqual(AES_128_CBC.decrypt(bytes.fromhex(ciphertext), bytes.fromhex(key), bytes.fromhex(cbc_iv)), bytes.fromhex(cbc_plaintext))
+
+    def test_key_cache(self):
+        key = os.urandom(16)
+        iv = os.urandom(16)
+        data = os.urandom(16*8)
+        ciphertext = AES(key).encrypt(data, iv)
+        self.assertIn(key, AES._key_cache)
+
+        # A cached key must give identical results
+        self.assertEqual(AES(key).encrypt(data, iv), ciphertext)
+        self.assertEqual(AES(key).decrypt(ciphertext, iv), data)
+
+        for i in range(AES.KEY_CACHE_SIZE+1):
+            AES(os.urandom(16))
+
+        self.assertLessEqual(len(AES._key_cache), AES.KEY_CACHE_SIZE)
+        self.assertNotIn(key, AES._key_cache)
+        self.assertEqual(AES(key).decrypt(ciphertext, iv), data)
+
+    def test_token(self):
+        print("")
+        key = os.urandom(32)
+        token = Token(key)
+        for length in [0, 1, 15, 16, 17, RNS.Link.MDU]:
+            data = os.urandom(length)
+            ciphertext = token.encrypt(data)
+            self.assertEqual(len(ciphertext), len(data)//16*16+16+Token.TOKEN_OVERHEAD)
+            self.assertEqual(token.decrypt(ciphertext), data)
+            self.assertEqual(Token(key).decrypt(ciphertext), data)
+
+            tampered = ciphertext[:20]+bytes([ciphertext[20]^0x01])+ciphertext[21:]
+            self.assertRaises(ValueError, token.decrypt, tampered)
+            self.assertRaises(ValueError, Token(os.urandom(32)).decrypt, ciphertext)
+
+        self.assertRaises(ValueError, token.decrypt, os.urandom(32))
+        self.assertRaises(TypeError, token.encrypt, "data")
+
+        # Tokens are re-used for every packet on a link
+        data = os.urandom(RNS.Link.MDU)
+        rounds = 1000
+        start = time.time()
+        for i in range(rounds):
+            token.decrypt(token.encrypt(data))
+        t = time.time() - start
+        print("Token "+str(len(data))+" byte packets: "+str(round(rounds/t))+" round-trips/s")
+
+    def test_throughput(self):
+        print("")
+        if RNS.Cryptography.backend() == "internal":
+            mlen = 256*1024
+        else:
+            mlen = 8*1024*1024
+
+        b = 0
+        e_t = 0
+        d_t = 0
+        for i in range(4):
+            key = os.urandom(16)
+            iv = os.urandom(16)
+            msg = os.urandom(mlen)
+            b += mlen
+
+            start = time.time()
+            ciphertext = AES_128_CBC.encrypt(msg, key, iv)
+            e_t += time.time() - start
+
+            start = time.time()
+            self.assertEqual(AES_128_CBC.decrypt(ciphertext, key, iv), msg)
+            d_t += time.time() - start
+
+        print("AES-128-CBC encrypt: "+str(round((b*8/1000000)/e_t, 2))+"mbps")
+        print("AES-128-CBC decrypt: "+str(round((b*8/1000000)/d_t, 2))+"mbps")
+
+        # Small messages, like link packets, re-use the
+        # same key and benefit from the key cache
+        key = os.urandom(16)
+        msg = os.urandom(RNS.Reticulum.MDU//16*16)
+        rounds = 2000
+        start = time.time()
+        for i in range(rounds):
+            AES_128_CBC.encrypt(msg, key, os.urandom(16))
+        t = time.time() - start
+        print("AES-128-CBC "+str(len(msg))+" byte packets: "+str(round(rounds/t))+" packets/s")
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
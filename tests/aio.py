@@ -0,0 +1,154 @@
+import unittest
+
+import asyncio
+import threading
+import time
+import os
+import RNS
+import RNS.aio
+from RNS.Channel import Channel, MessageState
+from tests.channel import LoopbackOutlet, CounterMessage, BytesMessage
+
+class ThreadedOutlet(LoopbackOutlet):
+    """
+    A loopback outlet whose packets are delivered by a separate
+    thread, in the way Transport delivers packets received on
+    interfaces, while channels send from the event loop.
+    """
+    def __init__(self, mdu: int, rtt: float):
+        super().__init__(mdu, rtt)
+        self.lock = threading.Lock()
+
+    def send(self, raw: bytes):
+        with self.lock:
+            return super().send(raw)
+
+    def resend(self, packet):
+        with self.lock:
+            return super().resend(packet)
+
+    def deliver(self):
+        with self.lock:
+            in_flight = self.in_flight
+            self.in_flight = []
+        for packet in in_flight:
+            self.peer._receive(packet.raw)
+            packet.state = MessageState.MSGSTATE_DELIVERED
+            if packet.delivered_callback:
+                packet.delivered_callback(packet)
+
+class ThreadedLoopback:
+    def __init__(self):
+        self.outlets = [ThreadedOutlet(mdu=RNS.Link.MDU, rtt=0.001) for i in range(2)]
+        self.channels = [Channel(outlet) for outlet in self.outlets]
+        self.outlets[0].peer = self.channels[1]
+        self.outlets[1].peer = self.channels[0]
+        self.running = True
+        self.thread = threading.Thread(target=self.transport, daemon=True)
+        self.thread.start()
+
+    def transport(self):
+        while self.running:
+            for outlet in self.outlets:
+                outlet.deliver()
+            time.sleep(0.001)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+class TestAio(unittest.TestCase):
+    def test_bridge(self):
+        async def bridge_events():
+            bridge = RNS.aio.get_bridge()
+            self.assertIs(bridge, RNS.aio.get_bridge())
+
+            loop_thread = threading.current_thread()
+            called_on = []
+            result = bridge.loop.create_future()
+            cancelled = bridge.loop.create_future()
+            cancelled.cancel()
+
+            def post():
+                for i in range(100):
+                    bridge.call(lambda i=i: called_on.append((i, threading.current_thread())))
+                bridge.resolve(cancelled, True)
+                bridge.resolve(result, len(called_on))
+
+            threading.Thread(target=post).start()
+            await result
+            self.assertEqual([i for i, thread in called_on], list(range(100)))
+            self.assertTrue(all(thread is loop_thread for i, thread in called_on))
+            return bridge
+
+        bridge = asyncio.run(bridge_events())
+
+        # Events for loops that have closed are discarded
+        bridge.call(print, "Not printed")
+
+    def test_channel(self):
+        async def exchange():
+            loopback = ThreadedLoopback()
+            sender = RNS.aio.Channel(loopback.channels[0])
+            receiver = RNS.aio.Channel(loopback.channels[1])
+            receiver.register_message_type(CounterMessage)
+
+            # Messages of types not registered with the
+            # wrapper are left to other handlers
+            other = []
+            loopback.channels[1].register_message_type(BytesMessage)
+            loopback.channels[1].add_message_handler(lambda message: other.append(message))
+
+            count = 500
+            async def send():
+                await sender.send(BytesMessage(b"Other"))
+                for i in range(count):
+                    await sender.send(CounterMessage(i))
+
+            sending = asyncio.create_task(send())
+            received = []
+            async for message in receiver:
+                received.append(message.counter)
+                if len(received) == count:
+                    receiver.close()
+
+            await sending
+            loopback.stop()
+            self.assertEqual(received, list(range(count)))
+            self.assertEqual([message.data for message in other], [b"Other"])
+
+            # Iteration stays ended once the channel is closed
+            self.assertEqual([message async for message in receiver], [])
+
+        asyncio.run(asyncio.wait_for(exchange(), 30))
+
+    def test_buffer(self):
+        async def stream():
+            loopback = ThreadedLoopback()
+            reader_a, writer_a = await RNS.aio.open_buffer(0, 1, loopback.channels[0])
+            reader_b, writer_b = await RNS.aio.open_buffer(1, 0, loopback.channels[1])
+
+            data = os.urandom(256*1024)
+            writer_a.write(data[:1000])
+            writer_a.writelines([data[1000:2000], data[2000:]])
+            await writer_a.drain()
+            writer_a.write_eof()
+            await writer_a.wait_closed()
+            self.assertTrue(writer_a.is_closing())
+
+            self.assertEqual(await reader_b.readexactly(1000), data[:1000])
+            self.assertEqual(await reader_b.read(), data[1000:])
+            self.assertTrue(reader_b.at_eof())
+
+            writer_b.write(b"Received\n")
+            writer_b.close()
+            await writer_b.wait_closed()
+            self.assertEqual(await reader_a.readline(), b"Received\n")
+            self.assertEqual(await reader_a.read(), b"")
+            loopback.stop()
+
+        asyncio.run(asyncio.wait_for(stream(), 30))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -2,9 +2,18 @@ import unittest
 
 from .hashes import TestSHA256
 from .hashes import TestSHA512
+from .aes import TestAES
+from .providers import TestProviders
 from .identity import TestIdentity
 from .link import TestLink
 from .channel import TestChannel
+from .congestion import TestCongestion
+from .compression import TestCompression
+from .erasure import TestErasure
+from .scheduler import TestScheduler
+from .aio import TestAio
+from .executor import TestExecutor
+from .timers import TestTimers
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
@@ -3,6 +3,7 @@ import threading
 import RNS
 from RNS.Channel import MessageState, ChannelOutletBase, Channel, MessageBase
 import RNS.Buffer
+from RNS.Buffer import StreamDataMessage
 from RNS.vendor import umsgpack
 from typing import Callable
 import contextlib
@@ -10,6 +11,8 @@ import typing
 import types
 import time
 import uuid
+import random
+import os
 import unittest
 
 
@@ -126,6 +129,81 @@ class ChannelOutletTest(ChannelOutletBase):
         return str(self.link_id)
 
 
+class LoopbackPacket:
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.packet_id = uuid.uuid4()
+        self.state = MessageState.MSGSTATE_SENT
+        self.delivered_callback: Callable[[LoopbackPacket], None] | None = None
+
+
+class LoopbackOutlet(ChannelOutletBase):
+    """
+    An outlet that holds sent packets until they are delivered to
+    the channel at the other end, without any timers, for measuring
+    the processing cost of the channel itself.
+    """
+    def __init__(self, mdu: int, rtt: float):
+        self._mdu = mdu
+        self._rtt = rtt
+        self.in_flight: [LoopbackPacket] = []
+        self.peer: Channel | None = None
+
+    def send(self, raw: bytes) -> LoopbackPacket:
+        packet = LoopbackPacket(raw)
+        self.in_flight.append(packet)
+        return packet
+
+    def resend(self, packet: LoopbackPacket) -> LoopbackPacket:
+        self.in_flight.append(packet)
+        return packet
+
+    def deliver(self, reverse: bool = False, loss: Callable[[], bool] | None = None) -> [LoopbackPacket]:
+        in_flight = self.in_flight
+        self.in_flight = []
+        lost = []
+        for packet in reversed(in_flight) if reverse else in_flight:
+            if loss and loss():
+                lost.append(packet)
+                continue
+            self.peer._receive(packet.raw)
+            packet.state = MessageState.MSGSTATE_DELIVERED
+            if packet.delivered_callback:
+                packet.delivered_callback(packet)
+        return lost
+
+    @property
+    def mdu(self):
+        return self._mdu
+
+    @property
+    def rtt(self):
+        return self._rtt
+
+    @property
+    def is_usable(self):
+        return True
+
+    def get_packet_state(self, packet: LoopbackPacket) -> MessageState:
+        return packet.state
+
+    def timed_out(self):
+        pass
+
+    def __str__(self):
+        return "loopback"
+
+    def set_packet_timeout_callback(self, packet: LoopbackPacket, callback: Callable[[LoopbackPacket], None] | None,
+                                    timeout: float | None = None):
+        pass
+
+    def set_packet_delivered_callback(self, packet: LoopbackPacket, callback: Callable[[LoopbackPacket], None] | None):
+        packet.delivered_callback = callback
+
+    def get_packet_id(self, packet: LoopbackPacket) -> any:
+        return packet.packet_id
+
+
 class MessageTest(MessageBase):
     MSGTYPE = 0xabcd
 
@@ -141,6 +219,32 @@ class MessageTest(MessageBase):
         self.id, self.data = umsgpack.unpackb(raw)
 
 
+class CounterMessage(MessageBase):
+    MSGTYPE = 0xabce
+
+    def __init__(self, counter: int = 0):
+        self.counter = counter
+
+    def pack(self) -> bytes:
+        return self.counter.to_bytes(4, "big")
+
+    def unpack(self, raw):
+        self.counter = int.from_bytes(raw, "big")
+
+
+class BytesMessage(MessageBase):
+    MSGTYPE = 0xabcf
+
+    def __init__(self, data: bytes = b""):
+        self.data = data
+
+    def pack(self) -> bytes:
+        return self.data
+
+    def unpack(self, raw):
+        self.data = raw
+
+
 class SystemMessage(MessageBase):
     MSGTYPE = 0xf000
 
@@ -472,6 +576,11 @@ class TestChannel(unittest.TestCase):
             self.h.channel._receive(packet.raw)
             packet.delivered()
 
+            # Callbacks run on the callback executor
+            timeout_at = time.time() + 1
+            while callbacks == 0 and time.time() < timeout_at:
+                time.sleep(0.001)
+
             self.assertEqual(1, callbacks)
             self.assertEqual(len(data), last_cb_value)
 
@@ -503,6 +612,314 @@ class TestChannel(unittest.TestCase):
             self.assertIsNotNone(result)
             self.assertTrue(len(result) == 0)
 
+    def test_buffer_callback_per_message(self):
+        from RNS.Channel import Envelope
+
+        outlet = LoopbackOutlet(mdu=RNS.Link.MDU, rtt=0.001)
+        channel = Channel(outlet)
+        blocked = threading.Event()
+        announced = []
+        reads = []
+        def callback(ready: int):
+            blocked.wait(5)
+            announced.append(ready)
+            reads.append(buffer.read(ready))
+
+        buffer = RNS.Buffer.create_bidirectional_buffer(0, 0, channel, callback)
+
+        # Messages arriving while a callback runs are announced
+        # one by one, each with the number of bytes ready to
+        # read, so the stream is read message by message.
+        messages = [os.urandom(length) for length in [100, 1, 300, 20]]
+        for sequence, data in enumerate(messages):
+            envelope = Envelope(outlet, message=StreamDataMessage(0, data), sequence=sequence)
+            channel._receive(envelope.pack())
+        blocked.set()
+
+        timeout_at = time.time()+5
+        while len(reads) < len(messages) and time.time() < timeout_at:
+            time.sleep(0.001)
+
+        self.assertEqual(announced, [len(data) for data in messages])
+        self.assertEqual(reads, messages)
+
+    def test_buffer_read_throughput(self):
+        from RNS.Channel import Envelope
+
+        print("")
+        size = 4*1024*1024
+        data = os.urandom(size)
+        chunk = StreamDataMessage.MAX_DATA_LEN
+        for read_size in [1024, 64*1024]:
+            outlet = LoopbackOutlet(mdu=RNS.Link.MDU, rtt=0.001)
+            channel = Channel(outlet)
+            buffer = RNS.Buffer.create_bidirectional_buffer(0, 0, channel)
+
+            # The whole stream arrives before it is read
+            began = time.time()
+            for sequence, offset in enumerate(range(0, size, chunk)):
+                envelope = Envelope(outlet, message=StreamDataMessage(0, data[offset:offset+chunk]), sequence=sequence)
+                channel._receive(envelope.pack())
+            received = time.time()
+
+            result = bytearray()
+            while len(result) < size:
+                result += buffer.read(read_size)
+            elapsed = time.time()-received
+
+            print(f"Buffer stream received at {round(size/(received-began)/1e6, 1)} MB/s, read in {read_size//1024} KB reads at {round(size/elapsed/1e6, 1)} MB/s")
+            self.assertEqual(result, data)
+            self.assertIsNone(buffer.read(1))
+
+    def test_buffer_write_compression(self):
+        print("")
+        text = "".join([f"[{i}] Announce for <{(i*7919 % 65536):04x}{(i*104729 % 4096):03x}> received via interface {i % 5}, {i % 17} hops away\n" for i in range(16000)]).encode("utf-8")
+        payloads = {"text": text[:1024*1024], "random": os.urandom(1024*1024)}
+        for payload_name, payload in payloads.items():
+            for codec in [RNS.Compression.BZ2, RNS.Compression.ZLIB_FAST]:
+                for write_size, batching in [(16*1024, None), (20, 10)]:
+                    if batching != None and (codec != RNS.Compression.ZLIB_FAST or payload_name != "text"):
+                        continue
+                    data = payload if batching == None else payload[:64*1024]
+
+                    outlet = LoopbackOutlet(mdu=RNS.Link.MDU, rtt=0.001)
+                    outlet.link = RNS.Link.__new__(RNS.Link)
+                    outlet.link.compression = RNS.Compression.Strategy(codec)
+                    outlet.link.remote_codecs = True
+                    tx_channel = Channel(outlet)
+                    rx_channel = Channel(LoopbackOutlet(mdu=RNS.Link.MDU, rtt=0.001))
+                    outlet.peer = rx_channel
+                    tx_channel.window = tx_channel.window_max = Channel.WINDOW_MAX_FAST
+                    writer = RNS.RawChannelWriter(0, tx_channel)
+                    reader = RNS.RawChannelReader(0, rx_channel)
+                    writer.set_batching(batching)
+
+                    sent = []
+                    send = outlet.send
+                    def counting_send(raw: bytes) -> LoopbackPacket:
+                        sent.append(len(raw))
+                        return send(raw)
+                    outlet.send = counting_send
+
+                    began = time.time()
+                    cpu = time.process_time()
+                    position = 0
+                    while position < len(data):
+                        written = writer.write(data[position:position+write_size])
+                        if written == 0:
+                            outlet.deliver()
+                        position += written
+                    writer.set_batching(None)
+                    while len(writer._pending) > 0:
+                        outlet.deliver()
+                        writer._flush_pending()
+                    outlet.deliver()
+                    cpu = time.process_time()-cpu
+                    elapsed = time.time()-began
+
+                    mb = len(data)/(1024*1024)
+                    print(f"Buffer write of {payload_name:<6} with {codec:<6} in {write_size:>4} byte writes: {round(cpu/mb, 3)}s CPU per MB, {round(mb/elapsed, 2)} MB/s, {len(sent)} messages, {round(100*sum(sent)/len(data))}% of the data size sent")
+                    self.assertEqual(reader.read(), data)
+                    if payload_name == "random":
+                        self.assertLess(sum(sent), len(data)*1.05)
+                    else:
+                        self.assertLess(sum(sent), len(data)*0.8)
+                    if batching != None:
+                        self.assertLess(len(sent), len(data)/StreamDataMessage.MAX_DATA_LEN)
+
+        writer = RNS.RawChannelWriter(0, Channel(LoopbackOutlet(mdu=RNS.Link.MDU, rtt=0.001)))
+        with self.assertRaises(TypeError):
+            writer.set_batching(-1)
+
+    def test_loopback_throughput(self):
+        outlet = LoopbackOutlet(mdu=500, rtt=0.001)
+        tx_channel = Channel(outlet)
+        rx_channel = Channel(LoopbackOutlet(mdu=500, rtt=0.001))
+        outlet.peer = rx_channel
+        tx_channel.register_message_type(CounterMessage)
+        rx_channel.register_message_type(CounterMessage)
+        tx_channel.window = tx_channel.window_max = Channel.WINDOW_MAX_FAST
+
+        received = []
+        rx_channel.add_message_handler(lambda message: received.append(message.counter))
+
+        # Every other window arrives in reverse order, so half
+        # the messages are held in the RX ring until the ones
+        # preceding them arrive. Sequence numbers wrap around.
+        count = Channel.SEQ_MODULUS+10000
+        began = time.time()
+        for i in range(count):
+            if not tx_channel.is_ready_to_send():
+                outlet.deliver(reverse=(i//tx_channel.window) % 2 == 1)
+            tx_channel.send(CounterMessage(i))
+        outlet.deliver()
+        elapsed = time.time()-began
+
+        print(f"Channel loopback throughput {round(count/elapsed)} messages per second with a window of {tx_channel.window}")
+        self.assertEqual(received, list(range(count)))
+        self.assertEqual(len(tx_channel._tx_ring), 0)
+        self.assertEqual(len(rx_channel._rx_ring), 0)
+
+    def test_loopback_coalescing(self):
+        def airtime(packets: list[bytes]) -> int:
+            # Encrypted link packets, each proven by a signature
+            size = 0
+            for raw in packets:
+                token = RNS.Identity.TOKEN_OVERHEAD+(len(raw)//RNS.Identity.AES128_BLOCKSIZE+1)*RNS.Identity.AES128_BLOCKSIZE
+                size += RNS.Reticulum.HEADER_MINSIZE+token
+                size += RNS.Reticulum.HEADER_MINSIZE+RNS.Identity.SIGLENGTH//8
+            return size
+
+        print("")
+        results = {}
+        for latency in [None, 10]:
+            outlet = LoopbackOutlet(mdu=RNS.Link.MDU, rtt=0.001)
+            tx_channel = Channel(outlet)
+            rx_channel = Channel(LoopbackOutlet(mdu=RNS.Link.MDU, rtt=0.001))
+            outlet.peer = rx_channel
+            tx_channel.register_message_type(CounterMessage)
+            rx_channel.register_message_type(CounterMessage)
+            tx_channel.window = tx_channel.window_max = Channel.WINDOW_MAX_FAST
+            tx_channel.set_coalescing(latency)
+
+            received = []
+            rx_channel.add_message_handler(lambda message: received.append(message.counter))
+            sent = []
+            send = outlet.send
+            def counting_send(raw: bytes) -> LoopbackPacket:
+                sent.append(raw)
+                return send(raw)
+            outlet.send = counting_send
+
+            count = 20000
+            began = time.time()
+            for i in range(count):
+                if not tx_channel.is_ready_to_send():
+                    outlet.deliver(reverse=(i//tx_channel.window) % 2 == 1)
+                tx_channel.send(CounterMessage(i))
+            tx_channel.set_coalescing(None)
+            outlet.deliver()
+            elapsed = time.time()-began
+
+            results[latency] = (len(sent), airtime(sent))
+            label = "with coalescing" if latency != None else "without coalescing"
+            print(f"Channel loopback {label:<18} {round(count/elapsed):>6} messages per second, {len(sent):>5} packets, {results[latency][1]} bytes on air")
+            self.assertEqual(received, list(range(count)))
+            self.assertEqual(len(tx_channel._tx_ring), 0)
+            self.assertEqual(len(rx_channel._rx_ring), 0)
+
+        # Small messages share packets and proofs
+        self.assertLess(results[10][0], results[None][0]/10)
+        self.assertLess(results[10][1], results[None][1]/4)
+
+        # Messages are held no longer than the latency
+        tx_channel.set_coalescing(0.05)
+        for i in range(3):
+            tx_channel.send(CounterMessage(i))
+        self.assertEqual(len(outlet.in_flight), 0)
+        time.sleep(0.25)
+        self.assertEqual(len(outlet.in_flight), 1)
+        outlet.deliver()
+        self.assertEqual(received[-3:], [0, 1, 2])
+        self.assertEqual(len(tx_channel._tx_ring), 0)
+
+        with self.assertRaises(TypeError):
+            tx_channel.set_coalescing(-1)
+        with self.assertRaises(TypeError):
+            tx_channel.set_coalescing("fast")
+
+    def fragmentation_loopback(self, loss: float = 0):
+        outlet = LoopbackOutlet(mdu=500, rtt=0.001)
+        tx_channel = Channel(outlet)
+        rx_channel = Channel(LoopbackOutlet(mdu=500, rtt=0.001))
+        outlet.peer = rx_channel
+        for channel in [tx_channel, rx_channel]:
+            channel.register_message_type(BytesMessage)
+            channel.register_message_type(CounterMessage)
+        tx_channel._max_tries = 10
+
+        # Messages that do not fit in a packet are refused,
+        # unless fragmentation was enabled
+        with self.assertRaises(RNS.Channel.ChannelException) as raised:
+            tx_channel.send(BytesMessage(bytes(1000)))
+        self.assertEqual(raised.exception.type, RNS.Channel.CEType.ME_TOO_BIG)
+        self.assertTrue(tx_channel.is_ready_to_send())
+        tx_channel.set_max_message_size()
+
+        # Sequence numbers wrap around while sending
+        tx_channel._next_sequence = rx_channel._next_rx_sequence = Channel.SEQ_MAX-20
+        received = []
+        rx_channel.add_message_handler(lambda message: received.append(message))
+
+        rng = random.Random(3)
+        def lost() -> bool:
+            return rng.random() < loss
+
+        def deliver():
+            for packet in outlet.deliver(reverse=rng.random() < 0.5, loss=lost):
+                tx_channel._packet_timeout(packet)
+
+        # Large messages are interleaved with small ones
+        sent = []
+        for i in range(40):
+            if i % 3 == 0:
+                message = CounterMessage(i)
+            else:
+                message = BytesMessage(rng.randbytes(rng.choice([1, 493, 494, 495, 1000, 5000, 20000])))
+            while not tx_channel.is_ready_to_send():
+                deliver()
+            tx_channel.send(message)
+            sent.append(message)
+
+        while len(outlet.in_flight) > 0 or len(tx_channel._tx_ring) > 0:
+            deliver()
+
+        self.assertEqual(len(received), len(sent))
+        for rx_message, tx_message in zip(received, sent):
+            self.assertIs(type(rx_message), type(tx_message))
+            if isinstance(tx_message, BytesMessage):
+                self.assertEqual(rx_message.data, tx_message.data)
+            else:
+                self.assertEqual(rx_message.counter, tx_message.counter)
+        self.assertEqual(len(rx_channel._rx_ring), 0)
+        self.assertIsNone(rx_channel._reassembly)
+
+        return tx_channel, rx_channel, outlet, received
+
+    def test_fragmentation(self):
+        tx_channel, rx_channel, outlet, received = self.fragmentation_loopback()
+
+        # Messages above the maximum size are refused by the
+        # sender, and discarded by the receiver, which keeps
+        # delivering the messages that follow them
+        with self.assertRaises(RNS.Channel.ChannelException):
+            tx_channel.send(BytesMessage(bytes(Channel.MAX_MESSAGE_SIZE+1)))
+        with self.assertRaises(TypeError):
+            tx_channel.set_max_message_size(0)
+        tx_channel.set_max_message_size(None)
+        with self.assertRaises(RNS.Channel.ChannelException):
+            tx_channel.send(BytesMessage(bytes(1000)))
+        tx_channel.set_max_message_size(Channel.MAX_MESSAGE_SIZE)
+
+        # The envelope returned for a fragmented message is that
+        # of its last fragment, which is sent once the window
+        # opens up for it
+        rx_channel.set_max_message_size(10000)
+        envelope = tx_channel.send(BytesMessage(bytes(40000)))
+        self.assertIsNone(envelope.packet)
+        self.assertIn(envelope, tx_channel._fragments)
+        while not tx_channel.is_ready_to_send():
+            outlet.deliver()
+        self.assertIsNotNone(envelope.packet)
+        tx_channel.send(BytesMessage(bytes(10000)))
+        while len(outlet.in_flight) > 0:
+            outlet.deliver()
+        self.assertEqual(len(received[-1].data), 10000)
+        self.assertIsNone(rx_channel._reassembly)
+
+    def test_fragmentation_loss(self):
+        self.fragmentation_loopback(loss=0.1)
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
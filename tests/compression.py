@@ -0,0 +1,132 @@
+import unittest
+
+import os
+import bz2
+import json
+import time
+import random
+import RNS
+import RNS.Compression as compression
+
+def corpus():
+    # A mixed corpus of about 1 MB per kind of data
+    rng = random.Random(17)
+    words = ["reticulum", "link", "packet", "announce", "path", "interface", "transport", "identity",
+             "the", "of", "and", "to", "a", "in", "is", "that", "for", "it", "with", "as", "on"]
+    text = " ".join(rng.choice(words) for i in range(180000)).encode("utf-8")[:1024*1024]
+
+    records = []
+    while sum(len(r) for r in records) < 1024*1024:
+        records.append(json.dumps({"id": len(records), "hops": rng.randint(0, 128), "rssi": rng.randint(-130, -40), "interface": rng.choice(words)}).encode("utf-8"))
+    records = b"\n".join(records)[:1024*1024]
+
+    media = rng.randbytes(1024*1024)
+    archive = bz2.compress(text+records)
+
+    sparse = bytearray(1024*1024)
+    for i in range(0, len(sparse), 4096):
+        sparse[i:i+64] = rng.randbytes(64)
+
+    return {"text": text, "records": records, "media": media, "archive": archive, "sparse": bytes(sparse)}
+
+class TestCompression(unittest.TestCase):
+    def test_codecs(self):
+        data = os.urandom(2000)*50
+        for name, codec in compression.codecs.items():
+            compressed = codec.compress(data)
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(codec.decompress(compressed), data)
+            self.assertEqual(compression.identify(compressed).ID, codec.ID)
+            self.assertEqual(compression.by_id(codec.ID).ID, codec.ID)
+
+            # Incremental decompression with bounded output
+            compressor = codec.compressor()
+            compressed = compressor.compress(data[:50000])+compressor.compress(data[50000:])+compressor.flush()
+            decompressor = codec.decompressor()
+            output = b""
+            for i in range(0, len(compressed), 1000):
+                output += decompressor.decompress(compressed[i:i+1000], 4096)
+                while not decompressor.needs_input and not decompressor.eof:
+                    output += decompressor.decompress(b"", 4096)
+            self.assertTrue(decompressor.eof)
+            self.assertEqual(output, data)
+
+        self.assertIsNone(compression.identify(os.urandom(4)+b"\x00"*64))
+
+    def test_selection(self):
+        link = RNS.Link.__new__(RNS.Link)
+        link.set_compression(compression.ZLIB)
+        self.assertEqual(link.compression.codec.name, compression.ZLIB)
+        self.assertRaises(TypeError, link.set_compression, "zstd")
+
+    def test_strategy(self):
+        strategy = compression.Strategy()
+        compressible = compression.sample(b"reticulum "*10000)
+        incompressible = compression.sample(os.urandom(100000))
+        self.assertEqual(len(incompressible), compression.SAMPLE_COUNT*compression.SAMPLE_SIZE)
+
+        self.assertEqual(strategy.select(compressible), strategy.codec)
+        self.assertIsNone(strategy.select(incompressible))
+
+        # Repeated failures to pay off back off exponentially
+        skipped = []
+        for attempt in range(4):
+            strategy.record(1000, 1000)
+            skips = 0
+            while strategy.select(compressible) == None:
+                skips += 1
+            skipped.append(skips)
+        self.assertEqual(skipped, [1, 2, 4, 8])
+
+        # Deterministic selection ignores history
+        strategy.record(1000, 1000)
+        self.assertEqual(strategy.select(compressible, remember=False), strategy.codec)
+
+        strategy.record(1000, 100)
+        strategy.skip = 0
+        strategy.record(1000, 100)
+        self.assertEqual(strategy.failures, 0)
+        self.assertEqual(strategy.select(compressible), strategy.codec)
+
+    def test_corpus(self):
+        print("")
+        data = corpus()
+        results = {}
+        for name in list(compression.codecs.keys())+["adaptive"]:
+            cpu = 0; size = 0; compressed_size = 0
+            strategy = compression.Strategy()
+            for kind, payload in data.items():
+                began = time.process_time()
+                if name == "adaptive":
+                    codec = strategy.select(compression.sample(payload))
+                else:
+                    codec = compression.codecs[name]
+
+                output = payload
+                if codec != None:
+                    compressed = codec.compress(payload)
+                    strategy.record(len(payload), len(compressed))
+                    if len(compressed) < len(payload):
+                        output = compressed
+
+                elapsed = time.process_time()-began
+                cpu += elapsed; size += len(payload); compressed_size += len(output)
+                results[(name, kind)] = (elapsed, len(output)/len(payload))
+
+            mb = size/(1000*1000)
+            print(f"{name:<9} {round(cpu/mb*1000, 1):>7} ms CPU per MB, ratio {round(compressed_size/size, 3)}")
+            results[name] = (cpu, compressed_size/size)
+
+        # Incompressible data costs almost nothing when sampled
+        for kind in ["media", "archive"]:
+            self.assertEqual(results[("adaptive", kind)][1], 1.0)
+            self.assertLess(results[("adaptive", kind)][0], results[(compression.BZ2, kind)][0]/10)
+
+        # Compressible data is still compressed with the selected codec
+        for kind in ["text", "records", "sparse"]:
+            self.assertEqual(results[("adaptive", kind)][1], results[(compression.BZ2, kind)][1])
+
+        self.assertLess(results["adaptive"][0], results[compression.BZ2][0])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,564 @@
+import unittest
+
+import heapq
+import random
+import RNS
+import RNS.Congestion as cc
+from RNS.Channel import Channel, ChannelOutletBase, MessageBase, MessageState
+
+SDU = RNS.Resource.SDU
+REQUEST_SIZE = 64
+
+class EmulatedInterface:
+    """
+    In-process emulation of an interface with limited bandwidth,
+    propagation delay, random loss and a drop-tail queue, running
+    in virtual time. All transfers over it share the same queue.
+    """
+    def __init__(self, rate, delay, loss=0.0, queue=64, seed=1):
+        self.rate    = rate
+        self.delay   = delay
+        self.loss    = loss
+        self.queue   = queue
+        self.free_at = 0
+        self.random  = random.Random(seed)
+        self.dropped = 0
+        self.lost    = 0
+
+    def transmit(self, now, size):
+        start = max(now, self.free_at)
+        if (start-now)*self.rate/size > self.queue:
+            self.dropped += 1
+            return None
+
+        self.free_at = start+size/self.rate
+        if self.random.random() < self.loss:
+            self.lost += 1
+            return None
+
+        return self.free_at+self.delay
+
+    def signal(self, now):
+        # Requests travel in the other direction, which
+        # is not congested, but is equally lossy.
+        if self.random.random() < self.loss:
+            return None
+        return now+self.delay
+
+
+class Emulation:
+    def __init__(self):
+        self.now = 0
+        self.events = []
+        self.sequence = 0
+
+    def at(self, when, callback, *args):
+        self.sequence += 1
+        heapq.heappush(self.events, (when, self.sequence, callback, args))
+
+    def run(self, until):
+        while len(self.events) > 0 and self.events[0][0] <= until:
+            when, _, callback, args = heapq.heappop(self.events)
+            self.now = when
+            callback(*args)
+        self.now = until
+
+
+class EmulatedLink:
+    def __init__(self, interface):
+        self.attached_interface = interface
+
+
+class EmulatedTransfer:
+    """
+    Emulates the receiving side of a resource transfer, which
+    requests parts in rounds, sized by a congestion controller.
+    """
+    def __init__(self, emulation, interface, algorithm, parts, start=0, priority=RNS.Resource.DEFAULT_PRIORITY):
+        self.emulation          = emulation
+        self.interface          = interface
+        self.link               = EmulatedLink(interface)
+        self.sdu                = SDU
+        self.window             = RNS.Resource.WINDOW
+        self.window_max         = RNS.Resource.WINDOW_MAX_SLOW
+        self.window_min         = RNS.Resource.WINDOW_MIN
+        self.window_flexibility = RNS.Resource.WINDOW_FLEXIBILITY
+        self.priority           = priority
+        self.req_resp_rtt_rate  = 0
+        self.req_data_rtt_rate  = 0
+        self.total_parts        = parts
+        self.next_part          = 0
+        self.received           = set()
+        self.missing            = []
+        self.outstanding        = set()
+        self.round              = 0
+        self.completed_at       = None
+        self.timeouts           = 0
+
+        self.congestion = cc.create(self, algorithm)
+        self.congestion.clock = lambda: self.emulation.now
+        emulation.at(start, self.start)
+
+    def start(self):
+        self.congestion.started()
+        self.request()
+
+    def received_bytes(self):
+        return len(self.received)*SDU
+
+    def request(self):
+        parts = self.missing[:self.window]
+        self.missing = self.missing[self.window:]
+        while len(parts) < self.window and self.next_part < self.total_parts:
+            parts.append(self.next_part)
+            self.next_part += 1
+
+        self.round += 1
+        self.outstanding = set(parts)
+        self.req_sent = self.emulation.now
+        self.req_resp = None
+        self.round_bytes = 0
+        self.congestion.request_sent(len(parts))
+
+        arrival = self.interface.signal(self.emulation.now)
+        if arrival != None:
+            self.emulation.at(arrival, self.serve, parts)
+
+        timeout = 4*self.interface.delay+2*len(parts)*SDU/self.interface.rate+0.25
+        self.emulation.at(self.emulation.now+timeout, self.check_timeout, self.round)
+
+    def serve(self, parts):
+        for part in parts:
+            arrival = self.interface.transmit(self.emulation.now, SDU)
+            if arrival != None:
+                self.emulation.at(arrival, self.receive, part)
+
+    def receive(self, part):
+        if self.completed_at != None or part in self.received:
+            return
+
+        if self.req_resp == None:
+            self.req_resp = self.emulation.now
+            rtt = self.req_resp-self.req_sent
+            if rtt > 0:
+                self.req_resp_rtt_rate = (SDU+REQUEST_SIZE)/rtt
+            self.congestion.response()
+
+        self.received.add(part)
+        self.round_bytes += SDU
+        self.congestion.part_received(SDU)
+        if part in self.outstanding:
+            self.outstanding.remove(part)
+        elif part in self.missing:
+            self.missing.remove(part)
+
+        if len(self.received) == self.total_parts:
+            self.completed_at = self.emulation.now
+            self.congestion.concluded()
+        elif len(self.outstanding) == 0:
+            rtt = self.emulation.now-self.req_sent
+            if rtt > 0:
+                self.req_data_rtt_rate = self.round_bytes/rtt
+            self.congestion.round_completed()
+            self.request()
+
+    def check_timeout(self, round):
+        if self.completed_at == None and round == self.round and len(self.outstanding) > 0:
+            self.timeouts += 1
+            self.congestion.timeout()
+            self.missing = sorted(self.outstanding)+self.missing
+            self.request()
+
+
+class PayloadMessage(MessageBase):
+    MSGTYPE = 0xabd0
+    SIZE = 300
+
+    def __init__(self, counter=0):
+        self.counter = counter
+
+    def pack(self):
+        return self.counter.to_bytes(4, "big")+bytes(PayloadMessage.SIZE-4)
+
+    def unpack(self, raw):
+        self.counter = int.from_bytes(raw[:4], "big")
+
+
+class EmulatedReceipt:
+    # Like packet receipts, timeouts count from
+    # when the packet was last sent, and can be
+    # extended while the packet is in flight.
+    def __init__(self):
+        self.sent_at = None
+        self.timeout = None
+        self.timeout_id = 0
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+
+class EmulatedPacket:
+    def __init__(self, raw):
+        self.raw = raw
+        self.state = MessageState.MSGSTATE_SENT
+        self.receipt = EmulatedReceipt()
+        self.delivered_callback = None
+        self.timeout_callback = None
+
+
+class EmulatedChannelOutlet(ChannelOutletBase):
+    """
+    Carries the packets of a channel over an emulated interface,
+    and returns delivery proofs over the reverse path. Timeouts
+    are run in the virtual time of the emulation.
+    """
+    OVERHEAD = RNS.Reticulum.HEADER_MINSIZE+RNS.Identity.TOKEN_OVERHEAD
+
+    def __init__(self, emulation, interface):
+        self.emulation = emulation
+        self.interface = interface
+        self.peer = None
+        self.sent = 0
+        self.on_event = None
+
+    def send(self, raw):
+        packet = EmulatedPacket(raw)
+        self.transmit(packet)
+        return packet
+
+    def resend(self, packet):
+        packet.state = MessageState.MSGSTATE_SENT
+        self.transmit(packet)
+        return packet
+
+    def transmit(self, packet):
+        packet.receipt.sent_at = self.emulation.now
+        self.sent += 1
+        arrival = self.interface.transmit(self.emulation.now, len(packet.raw)+EmulatedChannelOutlet.OVERHEAD)
+        if arrival != None:
+            self.emulation.at(arrival, self.arrive, packet)
+
+    def arrive(self, packet):
+        self.peer._receive(packet.raw)
+        arrival = self.interface.signal(self.emulation.now)
+        if arrival != None:
+            self.emulation.at(arrival, self.prove, packet)
+
+    def prove(self, packet):
+        if packet.state != MessageState.MSGSTATE_DELIVERED:
+            packet.state = MessageState.MSGSTATE_DELIVERED
+            if packet.delivered_callback:
+                packet.delivered_callback(packet)
+            self.on_event()
+
+    def check_timeout(self, packet, timeout_id):
+        receipt = packet.receipt
+        if packet.state == MessageState.MSGSTATE_SENT and receipt.timeout_id == timeout_id:
+            expires = receipt.sent_at+receipt.timeout
+            if expires > self.emulation.now:
+                self.emulation.at(expires, self.check_timeout, packet, timeout_id)
+                return
+
+            packet.state = MessageState.MSGSTATE_FAILED
+            if packet.timeout_callback:
+                packet.timeout_callback(packet)
+            self.on_event()
+
+    @property
+    def mdu(self):
+        return RNS.Link.MDU
+
+    @property
+    def rtt(self):
+        return 2*self.interface.delay
+
+    @property
+    def is_usable(self):
+        return True
+
+    def get_packet_state(self, packet):
+        return packet.state
+
+    def timed_out(self):
+        pass
+
+    def __str__(self):
+        return "emulated"
+
+    def set_packet_timeout_callback(self, packet, callback, timeout=None):
+        packet.timeout_callback = callback
+        packet.receipt.timeout_id += 1
+        if callback != None and timeout != None:
+            packet.receipt.timeout = timeout
+            self.emulation.at(packet.receipt.sent_at+timeout, self.check_timeout, packet, packet.receipt.timeout_id)
+
+    def set_packet_delivered_callback(self, packet, callback):
+        packet.delivered_callback = callback
+
+    def get_packet_id(self, packet):
+        return id(packet)
+
+
+class EmulatedChannelTransfer:
+    """
+    Sends messages over a channel as fast as its window allows, and
+    measures the throughput and latency at the receiving channel.
+    """
+    def __init__(self, emulation, interface, algorithm, start=0):
+        self.emulation = emulation
+        self.outlet = EmulatedChannelOutlet(emulation, interface)
+        self.outlet.on_event = self.pump
+        self.channel = Channel(self.outlet)
+        self.channel.set_congestion_control(algorithm)
+        self.channel._congestion.clock = lambda: self.emulation.now
+        self.channel._max_tries = 64
+
+        self.receiver = Channel(EmulatedChannelOutlet(emulation, interface))
+        self.outlet.peer = self.receiver
+        self.channel.register_message_type(PayloadMessage)
+        self.receiver.register_message_type(PayloadMessage)
+        self.receiver.add_message_handler(self.received)
+
+        self.counter = 0
+        self.sent_at = {}
+        self.latencies = []
+        self.delivered = 0
+        emulation.at(start, self.pump)
+
+    def pump(self):
+        while self.channel.is_ready_to_send():
+            self.sent_at[self.counter] = self.emulation.now
+            self.channel.send(PayloadMessage(self.counter))
+            self.counter += 1
+
+    def received(self, message):
+        self.latencies.append(self.emulation.now-self.sent_at.pop(message.counter))
+        self.delivered += 1
+
+    def measure(self, since):
+        """
+        :returns: The throughput in bytes per second, and the mean latency of messages delivered since the *since* index.
+        """
+        latencies = self.latencies[since:]
+        return len(latencies)*PayloadMessage.SIZE, sum(latencies)/max(1, len(latencies))
+
+
+def jain_index(values):
+    return sum(values)**2/(len(values)*sum([v**2 for v in values]))
+
+class TestCongestion(unittest.TestCase):
+    def setUp(self):
+        cc.Bottleneck.bottlenecks = {}
+
+    def transfer(self, algorithm, interface, parts):
+        emulation = Emulation()
+        transfer = EmulatedTransfer(emulation, interface, algorithm, parts)
+        emulation.run(until=3600)
+        self.assertIsNotNone(transfer.completed_at)
+        self.assertEqual(len(cc.Bottleneck.bottlenecks), 0)
+        return transfer.received_bytes()/transfer.completed_at
+
+    def test_selection(self):
+        self.assertEqual(set(cc.controllers.keys()), set([cc.CLASSIC, cc.AIMD, cc.BBR]))
+        link = RNS.Link.__new__(RNS.Link)
+        link.congestion_control = cc.DEFAULT
+        link.set_congestion_control(cc.BBR)
+        self.assertEqual(link.congestion_control, cc.BBR)
+        self.assertRaises(TypeError, link.set_congestion_control, "cubic")
+        self.assertRaises(TypeError, cc.register, "cubic", object)
+
+        transfer = EmulatedTransfer(Emulation(), EmulatedInterface(10000, 0.1), cc.BBR, 1)
+        self.assertIsInstance(transfer.congestion, cc.BBRControl)
+
+    def test_high_bdp(self):
+        # A fast backbone with a long round trip
+        print("")
+        rates = {}
+        for algorithm in cc.controllers:
+            interface = EmulatedInterface(rate=250*1000, delay=0.04, queue=256)
+            rates[algorithm] = self.transfer(algorithm, interface, 2500)
+            print(f"High BDP path, {algorithm:<8} {RNS.prettyspeed(rates[algorithm]*8)}, utilisation {round(100*rates[algorithm]/interface.rate)}%")
+
+        self.assertGreater(rates[cc.BBR], 0.5*250*1000)
+        self.assertGreater(rates[cc.AIMD], 0.5*250*1000)
+        self.assertGreaterEqual(rates[cc.BBR], rates[cc.CLASSIC])
+
+    def test_lossy_radio(self):
+        # A slow radio channel with random loss
+        print("")
+        rates = {}
+        for algorithm in cc.controllers:
+            interface = EmulatedInterface(rate=1200, delay=0.25, loss=0.05, queue=32, seed=7)
+            rates[algorithm] = self.transfer(algorithm, interface, 200)
+            print(f"Lossy radio path, {algorithm:<8} {RNS.prettyspeed(rates[algorithm]*8)}, utilisation {round(100*rates[algorithm]/interface.rate)}%")
+
+        self.assertGreater(rates[cc.BBR], rates[cc.AIMD])
+
+    def test_shared_bottleneck(self):
+        print("")
+        for algorithm in [cc.AIMD, cc.BBR]:
+            emulation = Emulation()
+            interface = EmulatedInterface(rate=50*1000, delay=0.05, queue=48, seed=3)
+            transfers = [EmulatedTransfer(emulation, interface, algorithm, 100000, start=i*0.5) for i in range(3)]
+            emulation.run(until=10)
+            measured = [t.received_bytes() for t in transfers]
+            emulation.run(until=60)
+            measured = [transfers[i].received_bytes()-measured[i] for i in range(len(transfers))]
+            fairness = jain_index(measured)
+            utilisation = sum(measured)/50/interface.rate
+            print(f"Shared bottleneck, {algorithm:<8} fairness {round(fairness, 3)}, utilisation {round(100*utilisation)}%")
+
+            self.assertGreater(fairness, 0.9)
+            self.assertGreater(utilisation, 0.5)
+
+    def test_weighted_bottleneck(self):
+        print("")
+        emulation = Emulation()
+        interface = EmulatedInterface(rate=50*1000, delay=0.05, queue=48, seed=5)
+        transfers = [EmulatedTransfer(emulation, interface, cc.BBR, 100000, priority=priority) for priority in [3, 1]]
+        emulation.run(until=10)
+        measured = [t.received_bytes() for t in transfers]
+        emulation.run(until=60)
+        measured = [transfers[i].received_bytes()-measured[i] for i in range(len(transfers))]
+        ratio = measured[0]/measured[1]
+        print(f"Weighted bottleneck, priorities 3 and 1, throughput ratio {round(ratio, 2)}")
+
+        # Capacity is shared in proportion to priority
+        self.assertGreater(ratio, 2)
+        self.assertLess(ratio, 4)
+    def test_rtt_estimator(self):
+        estimator = cc.RTTEstimator()
+        self.assertIsNone(estimator.timeout(1))
+        estimator.sample(1.0)
+        self.assertEqual((estimator.srtt, estimator.rttvar, estimator.rto), (1.0, 0.5, 3.0))
+        estimator.sample(2.0)
+        self.assertAlmostEqual(estimator.srtt, 1.125)
+        self.assertAlmostEqual(estimator.rttvar, 0.625)
+        self.assertAlmostEqual(estimator.rto, 3.625)
+        self.assertAlmostEqual(estimator.timeout(3), 14.5)
+        self.assertEqual(estimator.timeout(10), cc.RTTEstimator.RTO_MAX)
+
+        for i in range(100):
+            estimator.sample(0.001)
+        self.assertEqual(estimator.rto, cc.RTTEstimator.RTO_MIN)
+
+    def test_channel_selection(self):
+        self.assertEqual(set(cc.channel_controllers.keys()), set([cc.CLASSIC, cc.VEGAS]))
+        link = RNS.Link.__new__(RNS.Link)
+        link._channel = None
+        link.channel_congestion_control = cc.DEFAULT
+        link.set_channel_congestion_control(cc.VEGAS)
+        self.assertEqual(link.channel_congestion_control, cc.VEGAS)
+        self.assertRaises(TypeError, link.set_channel_congestion_control, cc.BBR)
+        self.assertRaises(TypeError, cc.register_channel, "cubic", cc.BBRControl)
+
+        transfer = EmulatedChannelTransfer(Emulation(), EmulatedInterface(10000, 0.1), cc.VEGAS)
+        self.assertIsInstance(transfer.channel._congestion, cc.VegasChannelControl)
+        self.assertRaises(TypeError, transfer.channel.set_congestion_control, "cubic")
+
+        # Switching back restores the window limits of the
+        # round-trip time tier, and the classic timeouts
+        channel = transfer.channel
+        self.assertEqual(channel.window_max, Channel.WINDOW_MAX)
+        channel.window = Channel.WINDOW_MAX
+        channel._congestion.sample(0.5)
+        self.assertIsNotNone(channel._congestion.retransmission_timeout(1))
+        self.assertAlmostEqual(channel._get_packet_timeout_time(1), channel._congestion.retransmission_timeout(1))
+        channel.set_congestion_control(cc.CLASSIC)
+        self.assertEqual((channel.window_max, channel.window_min), (Channel.WINDOW_MAX_SLOW, Channel.WINDOW_MIN))
+        self.assertEqual(channel.window, Channel.WINDOW_MAX_SLOW)
+        for tries in [1, 3]:
+            self.assertAlmostEqual(channel._get_packet_timeout_time(tries), pow(1.5, tries-1)*max(channel._outlet.rtt*2.5, 0.025)*1.5)
+
+    def channel_transfer(self, algorithm, interface, duration=300):
+        emulation = Emulation()
+        transfer = EmulatedChannelTransfer(emulation, interface, algorithm)
+        emulation.run(until=duration/5)
+        since = len(transfer.latencies)
+        emulation.run(until=duration)
+        delivered, latency = transfer.measure(since)
+        rate = delivered/(duration*4/5)
+        retries = transfer.outlet.sent-transfer.counter
+        return rate, latency, retries
+
+    def test_channel_queueing_delay(self):
+        # A slow interface with a deep queue, on which packets
+        # take far longer to transmit than to propagate
+        print("")
+        results = {}
+        for algorithm in cc.channel_controllers:
+            interface = EmulatedInterface(rate=1200, delay=0.05, queue=64, seed=11)
+            results[algorithm] = self.channel_transfer(algorithm, interface)
+            rate, latency, retries = results[algorithm]
+            print(f"Deep queue, {algorithm:<8} {RNS.prettyspeed(rate*8)}, utilisation {round(100*rate/interface.rate)}%, mean latency {round(latency, 2)}s, {retries} retries")
+
+        # Delay-based control keeps the queue short, at
+        # nearly the same throughput
+        self.assertLess(results[cc.VEGAS][1], results[cc.CLASSIC][1]/3)
+        self.assertGreater(results[cc.VEGAS][0], results[cc.CLASSIC][0]*0.9)
+
+    def test_channel_loss(self):
+        print("")
+        for loss in [0.02, 0.1]:
+            results = {}
+            for algorithm in cc.channel_controllers:
+                interface = EmulatedInterface(rate=10*1000, delay=0.1, loss=loss, queue=32, seed=13)
+                results[algorithm] = self.channel_transfer(algorithm, interface)
+                rate, latency, retries = results[algorithm]
+                print(f"{round(loss*100):>2}% loss, {algorithm:<8} {RNS.prettyspeed(rate*8)}, utilisation {round(100*rate/interface.rate)}%, mean latency {round(latency, 2)}s, {retries} retries")
+
+            self.assertGreater(results[cc.VEGAS][0], results[cc.CLASSIC][0]*0.9)
+
+    def test_channel_outage(self):
+        # A fast path is interrupted for a few seconds
+        print("")
+        results = {}
+        for algorithm in cc.channel_controllers:
+            emulation = Emulation()
+            interface = EmulatedInterface(rate=100*1000, delay=0.08, queue=64, seed=5)
+            transfer = EmulatedChannelTransfer(emulation, interface, algorithm)
+            def outage(loss):
+                interface.loss = loss
+            emulation.at(60, outage, 1.0)
+            emulation.at(63, outage, 0.0)
+
+            emulation.run(until=30)
+            since = len(transfer.latencies)
+            emulation.run(until=60)
+            before = transfer.measure(since)[0]/30
+            emulation.run(until=90)
+            since = len(transfer.latencies)
+            emulation.run(until=150)
+            after = transfer.measure(since)[0]/60
+            results[algorithm] = (before, after)
+            print(f"Outage, {algorithm:<8} utilisation {round(100*before/interface.rate)}% before, {round(100*after/interface.rate)}% after")
+
+        # The window recovers fully after the outage
+        self.assertGreater(results[cc.VEGAS][1], results[cc.VEGAS][0]*0.9)
+        self.assertGreater(results[cc.VEGAS][1], results[cc.CLASSIC][1]*1.5)
+
+    def test_channel_shared_interface(self):
+        print("")
+        results = {}
+        for algorithm in cc.channel_controllers:
+            emulation = Emulation()
+            interface = EmulatedInterface(rate=5*1000, delay=0.05, queue=64, seed=17)
+            transfers = [EmulatedChannelTransfer(emulation, interface, algorithm, start=i*5) for i in range(3)]
+            emulation.run(until=60)
+            since = [len(t.latencies) for t in transfers]
+            emulation.run(until=300)
+            measured = [transfers[i].measure(since[i]) for i in range(len(transfers))]
+            fairness = jain_index([m[0] for m in measured])
+            utilisation = sum([m[0] for m in measured])/240/interface.rate
+            latency = max([m[1] for m in measured])
+            print(f"Shared interface, {algorithm:<8} fairness {round(fairness, 3)}, utilisation {round(100*utilisation)}%, mean latency {round(latency, 2)}s")
+            results[algorithm] = (fairness, utilisation, latency)
+
+        # Channels sharing an interface converge to equal
+        # shares, without building a standing queue
+        self.assertGreater(results[cc.VEGAS][0], 0.9)
+        self.assertGreater(results[cc.VEGAS][1], 0.7)
+        self.assertLess(results[cc.VEGAS][2], results[cc.CLASSIC][2]/3)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
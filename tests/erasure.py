@@ -0,0 +1,129 @@
+import unittest
+
+import os
+import random
+import RNS
+import RNS.Erasure as erasure
+
+SDU = RNS.Resource.SDU
+
+def transfer(parts, window, loss, fec, seed=1):
+    """
+    Emulates a resource transfer over a channel that loses
+    packets at random in both directions. The receiver
+    requests missing parts in rounds of up to *window* parts,
+    and reports the loss it observed, which the sender uses
+    to decide how many repair parts to send with each round.
+    Returns the number of request rounds, the number of those
+    that stalled until the receiver timed out waiting for lost
+    parts, and the number of part and repair packets sent.
+    """
+    rng = random.Random(seed)
+    data = [rng.randbytes(SDU) for i in range(parts)]
+    received = [None]*parts
+    rounds = 0; stalls = 0; sent = 0; reported_loss = None
+
+    while None in received:
+        rounds += 1
+        requested = [i for i in range(parts) if received[i] == None][:window]
+        if rng.random() < loss:
+            # The request itself was lost
+            stalls += 1
+            continue
+
+        repair_parts = []
+        if fec and reported_loss != None:
+            repair_parts = erasure.encode([data[i] for i in requested], erasure.repair_count(len(requested), reported_loss))
+
+        direct = 0
+        for i in requested:
+            sent += 1
+            if rng.random() >= loss:
+                received[i] = data[i]
+                direct += 1
+
+        repairs = {}
+        for j, repair_part in enumerate(repair_parts):
+            sent += 1
+            if rng.random() >= loss:
+                repairs[j] = repair_part
+
+        symbols = [received[i] for i in requested]
+        if None in symbols and symbols.count(None) <= len(repairs):
+            for position, symbol in erasure.decode(symbols, repairs).items():
+                received[requested[position]] = symbol
+
+        if None in [received[i] for i in requested]:
+            stalls += 1
+
+        round_loss = 1-direct/len(requested)
+        reported_loss = round_loss if reported_loss == None else 0.75*reported_loss+0.25*round_loss
+
+    assert received == data
+    return rounds, stalls, sent
+
+class TestErasure(unittest.TestCase):
+    def test_field(self):
+        for a in range(1, 256):
+            self.assertEqual(erasure.multiply(a, erasure.inverse(a)), 1)
+            self.assertEqual(bytes([1, 0]).translate(erasure.table(a)), bytes([a, 0]))
+
+        matrix = [[erasure.coefficient(j, i) for i in range(8)] for j in range(8)]
+        inverted = erasure.invert(matrix)
+        for r in range(8):
+            for c in range(8):
+                value = 0
+                for k in range(8):
+                    value ^= erasure.multiply(matrix[r][k], inverted[k][c])
+                self.assertEqual(value, 1 if r == c else 0)
+
+    def test_codec(self):
+        rng = random.Random(7)
+        for attempt in range(100):
+            k = rng.randint(1, 75)
+            count = rng.randint(1, 24)
+            symbols = [os.urandom(SDU) for i in range(k)]
+            repair_parts = erasure.encode(symbols, count)
+            self.assertEqual(len(repair_parts), count)
+
+            # Any combination of received source and repair
+            # symbols that is at least k large reconstructs
+            lost = rng.sample(range(k), min(k, rng.randint(1, count)))
+            kept = rng.sample(range(count), len(lost))
+            received = [None if i in lost else symbols[i] for i in range(k)]
+            recovered = erasure.decode(received, {j: repair_parts[j] for j in kept})
+            self.assertEqual(sorted(recovered.keys()), sorted(lost))
+            for i in lost:
+                self.assertEqual(recovered[i], symbols[i])
+
+        self.assertEqual(erasure.decode(symbols, {}), {})
+        received = [None, None]+symbols[2:]
+        self.assertRaises(ValueError, erasure.decode, received, {0: repair_parts[0]})
+        self.assertRaises(ValueError, erasure.encode, symbols, erasure.MAX_SYMBOLS)
+
+    def test_repair_count(self):
+        self.assertEqual(erasure.repair_count(75, 0), 0)
+        self.assertEqual(erasure.repair_count(0, 0.1), 0)
+        for k in [4, 16, 75]:
+            counts = [erasure.repair_count(k, loss) for loss in [0.01, 0.05, 0.1, 0.2, 0.5, 0.9]]
+            self.assertEqual(counts, sorted(counts))
+            self.assertLessEqual(counts[-1], k)
+
+    def test_lossy_channel(self):
+        print("")
+        for loss in [0.05, 0.1, 0.2]:
+            results = {}
+            for fec in [False, True]:
+                results[fec] = transfer(1000, 75, loss, fec)
+                rounds, stalls, sent = results[fec]
+                label = "with FEC" if fec else "without FEC"
+                print(f"{round(loss*100):>2}% loss, {label:<12} {rounds:>3} request rounds, {stalls:>2} timed out, {sent} packets sent")
+
+            # Repair parts spare most rounds from waiting
+            # for a timeout, for a moderate amount of
+            # extra packets
+            self.assertLess(results[True][1], results[False][1]/2)
+            self.assertLess(results[True][2], results[False][2]*1.25)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
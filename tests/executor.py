@@ -0,0 +1,174 @@
+import unittest
+
+import time
+import threading
+import RNS
+from RNS.Executor import CallbackExecutor
+
+def wait_for(condition, timeout=5):
+    timeout_at = time.time()+timeout
+    while not condition() and time.time() < timeout_at:
+        time.sleep(0.001)
+    return condition()
+
+class TestExecutor(unittest.TestCase):
+    def test_ordering(self):
+        executor = CallbackExecutor(workers=4)
+        lock = threading.Lock()
+        running = set()
+        overlapped = []
+        received = {key: [] for key in range(50)}
+        peak_threads = [threading.active_count()]
+
+        def callback(key, value):
+            with lock:
+                if key in running:
+                    overlapped.append(key)
+                running.add(key)
+                peak_threads[0] = max(peak_threads[0], threading.active_count())
+            received[key].append(value)
+            with lock:
+                running.discard(key)
+
+        def submit(keys):
+            for value in range(200):
+                for key in keys:
+                    executor.submit(callback, key, value, key=key)
+
+        started_with = threading.active_count()
+        submitters = [threading.Thread(target=submit, args=(range(i, 50, 5),)) for i in range(5)]
+        for submitter in submitters:
+            submitter.start()
+        for submitter in submitters:
+            submitter.join()
+
+        self.assertTrue(wait_for(lambda: executor.get_stats()["completed"] == 50*200))
+        self.assertEqual(overlapped, [])
+        for key in received:
+            self.assertEqual(received[key], list(range(200)))
+        self.assertLessEqual(peak_threads[0], started_with+len(submitters)+4)
+
+        stats = executor.get_stats()
+        self.assertEqual(stats["submitted"], 50*200)
+        self.assertEqual(stats["queued"], 0)
+        self.assertEqual(stats["dropped"], 0)
+        self.assertLessEqual(stats["workers"], 4)
+        self.assertGreater(stats["peak_queued"], 0)
+        self.assertGreaterEqual(stats["max_latency"], stats["latency"])
+
+    def test_overflow(self):
+        release = threading.Event()
+        received = []
+        def callback(value):
+            release.wait()
+            received.append(value)
+
+        # While the queue for a key is full, new callbacks
+        # for it are dropped, and other keys are unaffected
+        executor = CallbackExecutor(workers=1, max_queued=2, policy=RNS.Executor.DROP_NEWEST)
+        executor.submit(callback, 0, key="a")
+        self.assertTrue(wait_for(lambda: executor.queue_depth() == 0))
+        self.assertTrue(executor.submit(callback, 1, key="a"))
+        self.assertTrue(executor.submit(callback, 2, key="a"))
+        self.assertFalse(executor.submit(callback, 3, key="a"))
+        self.assertEqual(executor.queue_depth("a"), 2)
+        self.assertTrue(executor.submit(callback, 4, key="b"))
+        self.assertTrue(executor.submit(callback, 5, key="a", bounded=False))
+
+        # Callbacks without a key share one limit
+        self.assertTrue(executor.submit(callback, 6))
+        self.assertTrue(executor.submit(callback, 7))
+        self.assertFalse(executor.submit(callback, 8))
+        release.set()
+        self.assertTrue(wait_for(lambda: len(received) == 7))
+        self.assertEqual(sorted(received), [0, 1, 2, 4, 5, 6, 7])
+        self.assertEqual(executor.get_stats()["dropped"], 2)
+
+        # Or the oldest one queued for the same key is
+        release.clear(); received.clear()
+        executor = CallbackExecutor(workers=1, max_queued=2, policy=RNS.Executor.DROP_OLDEST)
+        executor.submit(callback, 0, key="a")
+        self.assertTrue(wait_for(lambda: executor.queue_depth() == 0))
+        executor.submit(callback, 1, key="a")
+        executor.submit(callback, 2, key="a")
+        self.assertTrue(executor.submit(callback, 3, key="a"))
+        self.assertTrue(executor.submit(callback, 4, key="b"))
+        release.set()
+        self.assertTrue(wait_for(lambda: len(received) == 4))
+        self.assertEqual([value for value in received if value != 4], [0, 2, 3])
+
+        # Or the submitter waits until there is space, if
+        # it allows that, and the callback is dropped if not
+        release.clear(); received.clear()
+        executor = CallbackExecutor(workers=1, max_queued=2, policy=RNS.Executor.BLOCK)
+        executor.submit(callback, 0, key="a")
+        self.assertTrue(wait_for(lambda: executor.queue_depth() == 0))
+        for value in range(1, 3):
+            executor.submit(callback, value, key="a")
+        self.assertFalse(executor.submit(callback, 5, key="a"))
+        submitter = threading.Thread(target=executor.submit, args=(callback, 3), kwargs={"key": "a", "block": True})
+        submitter.start()
+        time.sleep(0.1)
+        self.assertTrue(submitter.is_alive())
+        self.assertTrue(executor.submit(callback, 4, key="b"))
+        release.set()
+        submitter.join(5)
+        self.assertFalse(submitter.is_alive())
+        self.assertTrue(wait_for(lambda: len(received) == 5))
+        self.assertEqual([value for value in received if value != 4], [0, 1, 2, 3])
+
+        self.assertRaises(TypeError, CallbackExecutor, workers=0)
+        self.assertRaises(TypeError, CallbackExecutor, max_queued=None)
+        self.assertRaises(TypeError, CallbackExecutor, policy="fifo")
+
+    def test_dispatch(self):
+        thread = []
+        RNS.Executor.dispatch(RNS.Executor.INLINE, lambda: thread.append(threading.current_thread()))
+        self.assertEqual(thread, [threading.current_thread()])
+
+        RNS.Executor.dispatch(None, lambda: thread.append(threading.current_thread()))
+        self.assertTrue(wait_for(lambda: len(thread) == 2))
+        self.assertNotEqual(thread[1], threading.current_thread())
+
+        link = RNS.Link.__new__(RNS.Link)
+        link.set_callback_executor(RNS.Executor.INLINE)
+        self.assertEqual(link.callback_executor, RNS.Executor.INLINE)
+        self.assertRaises(TypeError, link.set_callback_executor, "threads")
+        self.assertRaises(TypeError, RNS.Executor.set_shared, None)
+
+    def test_throughput(self):
+        print("")
+        count = 20000
+        done = threading.Event()
+        lock = threading.Lock()
+        received = [0]
+        def callback(value):
+            with lock:
+                received[0] += 1
+                if received[0] == count:
+                    done.set()
+
+        # Compared to starting a thread for every callback
+        began = time.time()
+        for value in range(count):
+            thread = threading.Thread(target=callback, args=(value,))
+            thread.daemon = True
+            thread.start()
+        done.wait(30)
+        threaded = time.time()-began
+
+        done.clear(); received[0] = 0
+        executor = CallbackExecutor()
+        link = object()
+        began = time.time()
+        for value in range(count):
+            executor.submit(callback, value, key=link, block=True)
+        done.wait(30)
+        pooled = time.time()-began
+
+        print(f"Ran {count} callbacks at {round(count/threaded)}/s with a thread each, and at {round(count/pooled)}/s on the executor")
+        self.assertEqual(received[0], count)
+        self.assertLess(pooled, threaded)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
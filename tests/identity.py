@@ -206,6 +206,141 @@ class TestIdentity(unittest.TestCase):
         print("Encrypt "+self.size_str(mlen)+" chunks: "+self.size_str(b/e_t, "b")+"ps")
         print("Decrypt "+self.size_str(mlen)+" chunks: "+self.size_str(b/d_t, "b")+"ps")
 
+    def test_3_validate_batch(self):
+        print("")
+
+        rounds = 32
+        batch = []
+        for i in range(rounds):
+            id1 = RNS.Identity()
+            id2 = RNS.Identity(create_keys=False)
+            id2.load_public_key(id1.get_public_key())
+            msg = os.urandom(i*8+1)
+            batch.append((id2, id1.sign(msg), msg))
+
+        # Test that a fully valid batch passes
+        self.assertEqual(RNS.Identity.validate_batch(batch), [])
+        self.assertEqual(RNS.Identity.validate_batch([]), [])
+
+        # Mix invalid signatures into the batch
+        invalid = [0, 5, 6, 17, rounds-1]
+        for i in invalid:
+            identity, signature, msg = batch[i]
+            if i == 5:
+                # Signature from another identity
+                signature = RNS.Identity().sign(msg)
+            elif i == 6:
+                # Tampered message
+                msg = msg+b"\x00"
+            elif i == 17:
+                # Malformed signature
+                signature = signature[:32]
+            else:
+                # Flipped bit in S
+                signature = signature[:40]+bytes([signature[40]^0x01])+signature[41:]
+            batch[i] = (identity, signature, msg)
+
+        self.assertEqual(RNS.Identity.validate_batch(batch), invalid)
+        for i in range(rounds):
+            identity, signature, msg = batch[i]
+            self.assertEqual(identity.validate(signature, msg), not i in invalid)
+
+        # Test single-entry batches
+        self.assertEqual(RNS.Identity.validate_batch(batch[1:2]), [])
+        self.assertEqual(RNS.Identity.validate_batch(batch[0:1]), [0])
+
+        # Compare against individual validation
+        valid = [batch[i] for i in range(rounds) if not i in invalid]
+        start = time.time()
+        for identity, signature, msg in valid:
+            self.assertEqual(True, identity.validate(signature, msg))
+        single_t = time.time() - start
+
+        start = time.time()
+        self.assertEqual(RNS.Identity.validate_batch(valid), [])
+        batch_t = time.time() - start
+
+        print("Validate "+str(len(valid))+" signatures individually: "+str(round(single_t*1000, 1))+"ms")
+        print("Validate "+str(len(valid))+" signatures in batch: "+str(round(batch_t*1000, 1))+"ms")
+
+        # An identity without a public key cannot validate
+        self.assertRaises(KeyError, RNS.Identity.validate_batch, [(RNS.Identity(create_keys=False), batch[1][1], batch[1][2])])
+
+    def test_5_held_announces(self):
+        from RNS.Interfaces.Interface import Interface
+
+        class HeldAnnounce:
+            def __init__(self, destination_hash):
+                self.destination_hash = destination_hash
+                self.hops = 1
+
+        # Announces that fail batch validation are dropped,
+        # while announces held in the meantime are kept for
+        # the next batch, and arrivals are not recorded again.
+        interface = Interface()
+        valid = HeldAnnounce(b"valid")
+        invalid = HeldAnnounce(b"invalid")
+        replaced = HeldAnnounce(b"replaced")
+        interface.hold_announce(valid, validated=True)
+        interface.hold_announce(invalid, validated=False)
+        interface.hold_announce(replaced, validated=False)
+
+        validate = RNS.Identity.validate_announce_signatures
+        def validate_while_holding(packets):
+            interface.hold_announce(HeldAnnounce(b"later"), validated=False)
+            interface.hold_announce(HeldAnnounce(b"replaced"), validated=True)
+            return validate(packets)
+
+        try:
+            RNS.Identity.validate_announce_signatures = validate_while_holding
+            interface.validate_held_announces()
+        finally:
+            RNS.Identity.validate_announce_signatures = validate
+
+        self.assertEqual(sorted(interface.held_announces.keys()), [b"later", b"replaced", b"valid"])
+        self.assertIsNot(interface.held_announces[b"replaced"], replaced)
+        self.assertEqual(interface.ic_held_unvalidated, {b"later"})
+        self.assertEqual(len(interface.ia_freq_deque), 0)
+
+    def test_4_destination_hash_cache(self):
+        print("")
+
+        identity = RNS.Identity()
+        destination = RNS.Destination(identity, RNS.Destination.OUT, RNS.Destination.SINGLE, "hashcache", "test")
+
+        # Cached hashes must match the uncached computation
+        name_hash = RNS.Identity.full_hash("hashcache.test".encode("utf-8"))[:(RNS.Identity.NAME_HASH_LENGTH//8)]
+        self.assertEqual(destination.name_hash, name_hash)
+        self.assertEqual(destination.hash, RNS.Identity.full_hash(name_hash+identity.hash)[:RNS.Reticulum.TRUNCATED_HASHLENGTH//8])
+        self.assertEqual(RNS.Destination.hash_from_name_and_identity("hashcache.test", identity), destination.hash)
+        self.assertEqual(RNS.Destination.hash_from_name_and_identity("hashcache.test", identity.hash), destination.hash)
+        self.assertNotEqual(RNS.Destination.hash(None, "hashcache", "test"), destination.hash)
+        self.assertRaises(TypeError, RNS.Destination.hash, b"\x00", "hashcache", "test")
+
+        random_hash = os.urandom(10)
+        signed_data = destination.hash+identity.get_public_key()+destination.name_hash+random_hash
+        announce = RNS.Packet(destination, identity.get_public_key()+destination.name_hash+random_hash+identity.sign(signed_data), RNS.Packet.ANNOUNCE)
+        announce.pack()
+
+        rounds = 100
+        before = RNS.Destination.hash_cache_stats()
+        for i in range(rounds):
+            received = RNS.Packet(None, announce.raw)
+            received.unpack()
+            self.assertTrue(RNS.Identity.validate_announce(received))
+            self.assertEqual(RNS.Destination.hash_from_name_and_identity("hashcache.test", RNS.Identity.recall(received.destination_hash)), destination.hash)
+        after = RNS.Destination.hash_cache_stats()
+
+        self.assertEqual(after["sha256_computed"], before["sha256_computed"])
+        saved = (after["sha256_saved"]-before["sha256_saved"])/rounds
+        self.assertEqual(saved, 3)
+        print("SHA-256 invocations saved per announce: "+str(saved))
+
+        # The caches must stay bounded
+        for i in range(RNS.Destination.HASH_CACHE_SIZE+1):
+            RNS.Destination.hash(os.urandom(RNS.Reticulum.TRUNCATED_HASHLENGTH//8), "hashcache", "test")
+        self.assertLessEqual(RNS.Destination.hash_cache_stats()["destination_hashes"], RNS.Destination.HASH_CACHE_SIZE)
+
     def size_str(self, num, suffix='B'):
         units = ['','K','M','G','T','P','E','Z']
         last_unit = 'Y'
@@ -5,14 +5,19 @@ import shlex
 import threading
 import time
 import random
+import tempfile
+import bz2
+import asyncio
 from unittest import skipIf
 import RNS
 import os
 from tests.channel import MessageTest
 from RNS.Channel import MessageBase
 from RNS.Buffer import StreamDataMessage
+from RNS.Destination import ResponseCache
 from RNS.Interfaces.LocalInterface import LocalClientInterface
 from math import ceil
+from resource import getrusage, RUSAGE_SELF
 
 APP_NAME = "rns_unit_tests"
 
@@ -109,11 +114,31 @@ class TestLink(unittest.TestCase):
         l1 = RNS.Link(dest)
         time.sleep(0.5)
         self.assertEqual(l1.status, RNS.Link.ACTIVE)
+        self.assertIs(RNS.Transport.active_link_ids[l1.link_id], l1)
 
         l1.teardown()
         time.sleep(0.5)
         self.assertEqual(l1.status, RNS.Link.CLOSED)
 
+        # A link registered again with the same link ID keeps
+        # being found after either of the two is torn down
+        links = []
+        for i in range(3):
+            link = RNS.Link.__new__(RNS.Link)
+            link.link_id = RNS.Identity.full_hash(b"Retried link request")[:RNS.Reticulum.TRUNCATED_HASHLENGTH//8]
+            link.initiator = False
+            link.status = RNS.Link.ACTIVE
+            RNS.Transport.register_link(link)
+            links.append(link)
+        self.assertIs(RNS.Transport.active_link_ids[link.link_id], links[2])
+        RNS.Transport.deregister_link(links[0])
+        self.assertIs(RNS.Transport.active_link_ids[link.link_id], links[2])
+        RNS.Transport.deregister_link(links[2])
+        self.assertIs(RNS.Transport.active_link_ids[link.link_id], links[1])
+        RNS.Transport.deregister_link(links[1])
+        self.assertNotIn(link.link_id, RNS.Transport.active_link_ids)
+        self.assertEqual([l for l in RNS.Transport.active_links if l in links], [])
+
     @skipIf(os.getenv('SKIP_NORMAL_TESTS') != None, "Skipping")
     def test_3_packets(self):
         init_rns(self)
@@ -348,7 +373,613 @@ class TestLink(unittest.TestCase):
         time.sleep(0.5)
         self.assertEqual(l1.status, RNS.Link.CLOSED)
 
+    @skipIf(os.getenv('SKIP_NORMAL_TESTS') != None, "Skipping")
+    def test_17_streamed_resource(self):
+        init_rns(self)
+        print("")
+        print("Streamed resource test")
+
+        # TODO: Load this from public bytes only
+        id1 = RNS.Identity.from_bytes(bytes.fromhex(fixed_keys[0][0]))
+        self.assertEqual(id1.hash, bytes.fromhex(fixed_keys[0][1]))
+
+        RNS.Transport.request_path(bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+        time.sleep(0.2)
+
+        dest = RNS.Destination(id1, RNS.Destination.OUT, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
+        self.assertEqual(dest.hash, bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+
+        l1 = RNS.Link(dest)
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.ACTIVE)
+
+        streaming_threshold = RNS.Resource.STREAMING_THRESHOLD
+        stream_chunk_size = RNS.Resource.STREAM_CHUNK_SIZE
+        RNS.Resource.STREAMING_THRESHOLD = 32*1000
+        RNS.Resource.STREAM_CHUNK_SIZE = 10000
+        try:
+            for compressible in [False, True]:
+                resource_size = 200*1000
+                if compressible:
+                    data = os.urandom(resource_size//2).hex().encode("ascii")
+                else:
+                    data = os.urandom(resource_size)
+
+                file = tempfile.TemporaryFile()
+                file.write(data)
+                file.seek(0)
+
+                resource = RNS.Resource(file, l1, timeout=120, advertise=False)
+                self.assertIsNotNone(resource.spool)
+                self.assertIsNone(resource.data)
+                self.assertEqual(resource.compressed, compressible)
+                self.assertEqual(resource.hash, RNS.Identity.full_hash(data+resource.random_hash))
+                self.assertEqual(resource.expected_proof, RNS.Identity.full_hash(data+resource.hash))
+
+                # Parts are hashed while the spool is written,
+                # and must map to the parts read back from it
+                resource.spool.seek(0)
+                spooled = resource.spool.read()
+                parts = [spooled[i:i+resource.sdu] for i in range(0, len(spooled), resource.sdu)]
+                self.assertEqual(resource.hashmap, b"".join([resource.get_map_hash(part) for part in parts]))
+                self.assertIsNone(resource.spooled_map_hashes)
+
+                # Map hashes can repeat beyond the collision guard
+                # distance, and each occurrence is found in range
+                map_hash = resource.map_hashes[0]
+                resource._Resource__index_map_hash(map_hash, resource.total_parts)
+                self.assertEqual(resource.find_part(map_hash, 0, resource.total_parts), 0)
+                self.assertEqual(resource.find_part(map_hash, 1, resource.total_parts+1), resource.total_parts)
+                self.assertIsNone(resource.find_part(map_hash, 1, resource.total_parts))
+                resource.map_hash_index[map_hash] = 0
+
+                # The spooled stream must decrypt to the payload
+                resource.spool.seek(0)
+                plaintext = l1.decrypt(resource.spool.read())[RNS.Resource.RANDOM_HASH_SIZE:]
+                if compressible:
+                    plaintext = bz2.decompress(plaintext)
+                self.assertEqual(plaintext, data)
+
+                print("Sending "+self.size_str(resource_size)+" streamed resource...")
+                resource.advertise()
+                start = time.time()
+
+                # This is a hack, don't do it. Use the callbacks instead.
+                while resource.status < RNS.Resource.COMPLETE:
+                    time.sleep(0.01)
+
+                t = time.time() - start
+                self.assertEqual(resource.status, RNS.Resource.COMPLETE)
+                self.assertTrue(resource.spool.closed)
+                print("Resource completed at "+self.size_str(resource_size/t, "b")+"ps")
+
+        finally:
+            RNS.Resource.STREAMING_THRESHOLD = streaming_threshold
+            RNS.Resource.STREAM_CHUNK_SIZE = stream_chunk_size
+
+        l1.teardown()
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.CLOSED)
+
+    @skipIf(os.getenv('SKIP_NORMAL_TESTS') != None, "Skipping")
+    def test_18_streamed_resource_receive(self):
+        init_rns(self)
+        print("")
+        print("Streamed resource receive test")
+
+        # TODO: Load this from public bytes only
+        id1 = RNS.Identity.from_bytes(bytes.fromhex(fixed_keys[0][0]))
+        self.assertEqual(id1.hash, bytes.fromhex(fixed_keys[0][1]))
+
+        RNS.Transport.request_path(bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+        time.sleep(0.2)
+
+        dest = RNS.Destination(id1, RNS.Destination.OUT, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
+        self.assertEqual(dest.hash, bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+
+        l1 = RNS.Link(dest)
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.ACTIVE)
+
+        # Both ends of a link share the same symmetric key, so
+        # resources prepared on this link can be received on it
+        # as well, by feeding their parts in directly.
+        class FakePacket:
+            def __init__(self, link, data):
+                self.link = link
+                self.data = data
+                self.plaintext = data
+                self.raw = data
+
+        # Other codecs than the default one are only used
+        # once the peer has reported support for them
+        l1.set_compression(RNS.Compression.ZLIB)
+        sender = RNS.Resource(os.urandom(50*1000).hex().encode("ascii"), l1, timeout=120, advertise=False)
+        self.assertEqual(sender.codec.ID, RNS.Compression.codecs[RNS.Compression.BZ2].ID)
+        receiver = RNS.Resource.accept(FakePacket(l1, RNS.ResourceAdvertisement(sender).pack()))
+        report = receiver._Resource__request_report()
+        self.assertEqual(report & RNS.Resource.REQUEST_CODECS != 0, RNS.Compression.all_available())
+        self.assertFalse(l1.remote_codecs)
+        sender.adv_sent = time.time()
+        sender.request(bytes([report | RNS.Resource.REQUEST_CODECS])+sender.hash)
+        self.assertTrue(l1.remote_codecs)
+        receiver.cancel()
+        sender.cancel()
+
+        streaming_threshold = RNS.Resource.STREAMING_THRESHOLD
+        stream_chunk_size = RNS.Resource.STREAM_CHUNK_SIZE
+        RNS.Resource.STREAMING_THRESHOLD = 32*1000
+        RNS.Resource.STREAM_CHUNK_SIZE = 10000
+        try:
+            cases = [(False, False, RNS.Compression.BZ2), (True, False, RNS.Compression.BZ2), (True, True, RNS.Compression.BZ2), (True, False, RNS.Compression.ZLIB)]
+            if RNS.Compression.LZMA in RNS.Compression.codecs:
+                cases.append((True, False, RNS.Compression.LZMA))
+
+            for compressible, corrupt, codec in cases:
+                l1.set_compression(codec)
+                resource_size = 100*1000
+                if compressible:
+                    data = os.urandom(resource_size//2).hex().encode("ascii")
+                else:
+                    data = os.urandom(resource_size)
+
+                received = []
+                def callback(resource):
+                    received.append((resource.status, resource.data.read() if resource.status == RNS.Resource.COMPLETE else None))
+
+                sender = RNS.Resource(data, l1, timeout=120, advertise=False)
+                self.assertGreater(sender.size, RNS.Resource.STREAMING_THRESHOLD)
+                advertisement = RNS.ResourceAdvertisement(sender).pack()
+                receiver = RNS.Resource.accept(FakePacket(l1, advertisement), callback=callback)
+                self.assertIsNotNone(receiver.spool)
+                self.assertEqual(receiver.compressed, compressible)
+                if compressible:
+                    # The codec is signalled in the advertisement
+                    self.assertEqual(receiver.codec.ID, RNS.Compression.codecs[codec].ID)
+                receiver.hashmap = list(sender.map_hashes)
+                receiver.hashmap_height = sender.total_parts
+                receiver.map_hash_index = dict(sender.map_hash_index)
+
+                for i in range(sender.total_parts):
+                    self.assertEqual(sender.map_hashes[i], sender.get_map_hash(sender.get_part_data(i)))
+                    self.assertEqual(sender.find_part(sender.map_hashes[i], 0, sender.total_parts), i)
+                self.assertEqual(receiver.match_part(sender.get_part_data(0)), (0, sender.map_hashes[0]))
+                self.assertIsNone(receiver.match_part(sender.get_part_data(receiver.window)))
+
+                # Assembly is done off the thread parts arrive on
+                assembly_threads = set()
+                assembly_advance = receiver._Resource__assembly_advance_locked
+                def recording_advance(final, flush):
+                    assembly_threads.add(threading.current_thread())
+                    assembly_advance(final, flush)
+                receiver._Resource__assembly_advance_locked = recording_advance
+
+                order = list(range(sender.total_parts))
+                for i in range(0, len(order)-1, 2):
+                    order[i], order[i+1] = order[i+1], order[i]
+
+                for i in order:
+                    part_data = sender.get_part_data(i)
+                    if corrupt and i == sender.total_parts//2:
+                        part_data = bytes([part_data[0] ^ 0x01])+part_data[1:]
+                        receiver.hashmap[i] = receiver.get_map_hash(part_data)
+                        receiver.map_hash_index[receiver.hashmap[i]] = i
+                    receiver.receive_part(FakePacket(l1, part_data))
+                    if i < sender.total_parts-1:
+                        # Parts are spooled, not held in memory
+                        self.assertTrue(all(part == None or part == True for part in receiver.parts))
+
+                self.wait_for_assembly(receiver)
+                self.assertGreater(len(assembly_threads), 0)
+                self.assertNotIn(threading.current_thread(), assembly_threads)
+                self.assertTrue(receiver.spool.closed)
+                self.assertFalse(os.path.isfile(receiver.storagepath))
+                if corrupt:
+                    self.assertEqual(receiver.status, RNS.Resource.CORRUPT)
+                else:
+                    self.assertEqual(receiver.status, RNS.Resource.COMPLETE)
+                    self.assertEqual(receiver.proof, sender.expected_proof)
+                    self.assertEqual(received, [(RNS.Resource.COMPLETE, data)])
+
+        finally:
+            RNS.Resource.STREAMING_THRESHOLD = streaming_threshold
+            RNS.Resource.STREAM_CHUNK_SIZE = stream_chunk_size
+            l1.set_compression(RNS.Compression.DEFAULT)
+
+        l1.teardown()
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.CLOSED)
+
+    def test_19_repaired_resource_receive(self):
+        init_rns(self)
+        print("")
+        print("Repaired resource receive test")
+
+        # TODO: Load this from public bytes only
+        id1 = RNS.Identity.from_bytes(bytes.fromhex(fixed_keys[0][0]))
+        self.assertEqual(id1.hash, bytes.fromhex(fixed_keys[0][1]))
+
+        RNS.Transport.request_path(bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+        time.sleep(0.2)
+
+        dest = RNS.Destination(id1, RNS.Destination.OUT, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
+        self.assertEqual(dest.hash, bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+
+        l1 = RNS.Link(dest)
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.ACTIVE)
+        self.assertRaises(TypeError, l1.set_resource_fec, 1)
+
+        class FakePacket:
+            def __init__(self, link, data):
+                self.link = link
+                self.data = data
+                self.plaintext = data
+                self.raw = data
+
+        # Receivers only report loss to senders that set
+        # the FEC flag in their advertisement
+        sender = RNS.Resource(os.urandom(1000), l1, timeout=120, advertise=False)
+        advertisement = RNS.ResourceAdvertisement(sender)
+        self.assertTrue(RNS.ResourceAdvertisement.unpack(advertisement.pack()).y)
+        advertisement.f &= ~0x40
+        receiver = RNS.Resource.accept(FakePacket(l1, advertisement.pack()))
+        self.assertFalse(receiver.sender_fec)
+        receiver.cancel()
+
+        # Emulates a transfer where parts and repair parts are
+        # lost at random, and returns the number of rounds in
+        # which the receiver had to request lost parts again.
+        def transfer(data, loss, fec):
+            l1.set_resource_fec(fec)
+            sender = RNS.Resource(data, l1, timeout=120, advertise=False)
+            received = []
+            receiver = RNS.Resource.accept(FakePacket(l1, RNS.ResourceAdvertisement(sender).pack()), callback=lambda resource: received.append(resource.data.read()))
+            receiver.hashmap = list(sender.map_hashes)
+            receiver.hashmap_height = sender.total_parts
+            receiver.map_hash_index = dict(sender.map_hash_index)
+
+            rng = random.Random(3)
+            retries = 0
+            while receiver.status == RNS.Resource.TRANSFERRING:
+                round_id = receiver.fec_round_id
+                round_parts = list(receiver.fec_round_parts)
+                requested_hashes = b"".join([receiver.hashmap[i] for i in round_parts])
+                if sender.fec and receiver.fec_loss != None:
+                    self.assertTrue(receiver.sender_fec)
+                    report = receiver._Resource__request_report()
+                    self.assertTrue(report & RNS.Resource.REQUEST_FEC)
+                    sender.fec_loss = (report >> 2)/RNS.Resource.REQUEST_LOSS_STEPS
+
+                repairs = sender._Resource__prepare_repairs(requested_hashes, round_parts) if sender.fec_loss != None else None
+                if repairs != None:
+                    receiver.repair_map_packet(repairs[0])
+                for i in round_parts:
+                    if rng.random() >= loss:
+                        receiver.receive_part(FakePacket(l1, sender.get_part_data(i)))
+                if repairs != None:
+                    for repair_part in repairs[1]:
+                        repair_index = receiver.match_repair(repair_part)
+                        if rng.random() >= loss and repair_index != None:
+                            receiver.receive_repair(FakePacket(l1, repair_part), repair_index)
+
+                if receiver.fec_round_id == round_id and receiver.status == RNS.Resource.TRANSFERRING:
+                    # Lost parts are requested again, as
+                    # the watchdog would after a timeout
+                    retries += 1
+                    receiver.request_next()
+
+            self.wait_for_assembly(receiver)
+            self.assertEqual(receiver.status, RNS.Resource.COMPLETE)
+            self.assertEqual(received, [data])
+            return retries
+
+        streaming_threshold = RNS.Resource.STREAMING_THRESHOLD
+        try:
+            for streamed in [False, True]:
+                RNS.Resource.STREAMING_THRESHOLD = 32*1000 if streamed else streaming_threshold
+                data = os.urandom(200*1000)
+                plain_retries = transfer(data, 0.1, False)
+                repaired_retries = transfer(data, 0.1, True)
+                print(f"{'Streamed' if streamed else 'In-memory'} transfer at 10% loss requested lost parts again in {plain_retries} rounds without FEC, {repaired_retries} with FEC")
+                self.assertLess(repaired_retries, plain_retries)
+
+        finally:
+            RNS.Resource.STREAMING_THRESHOLD = streaming_threshold
+            l1.set_resource_fec(False)
+
+        l1.teardown()
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.CLOSED)
+
+    def test_20_resumed_resource_receive(self):
+        init_rns(self)
+        print("")
+        print("Resumed resource receive test")
+
+        # TODO: Load this from public bytes only
+        id1 = RNS.Identity.from_bytes(bytes.fromhex(fixed_keys[0][0]))
+        self.assertEqual(id1.hash, bytes.fromhex(fixed_keys[0][1]))
+
+        RNS.Transport.request_path(bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+        time.sleep(0.2)
+
+        dest = RNS.Destination(id1, RNS.Destination.OUT, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
+        self.assertEqual(dest.hash, bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+
+        l1 = RNS.Link(dest)
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.ACTIVE)
+
+        class FakePacket:
+            def __init__(self, link, data):
+                self.link = link
+                self.data = data
+                self.plaintext = data
+                self.raw = data
+
+        def feed_hashmap(sender, receiver):
+            receiver.hashmap = list(sender.map_hashes)
+            receiver.hashmap_height = sender.total_parts
+            receiver.map_hash_index = dict(sender.map_hash_index)
+
+        stream_chunk_size = RNS.Resource.STREAM_CHUNK_SIZE
+        RNS.Resource.STREAM_CHUNK_SIZE = 10000
+        try:
+            for compressible in [False, True]:
+                resource_size = 100*1000
+                if compressible:
+                    data = os.urandom(resource_size//2).hex().encode("ascii")
+                else:
+                    data = os.urandom(resource_size)
+
+                received = []
+                def callback(resource):
+                    received.append((resource.status, resource.data.read() if resource.status == RNS.Resource.COMPLETE else None))
+
+                # Receive part of the resource, and interrupt the transfer
+                sender = RNS.Resource(data, l1, timeout=120, advertise=False, resumable=True)
+                receiver = RNS.Resource.accept(FakePacket(l1, RNS.ResourceAdvertisement(sender).pack()), callback=callback)
+                self.assertTrue(receiver.resumable)
+                self.assertIsNotNone(receiver.spool)
+                feed_hashmap(sender, receiver)
+
+                interrupted_at = sender.total_parts*3//4
+                for i in range(interrupted_at):
+                    receiver.receive_part(FakePacket(l1, sender.get_part_data(i)))
+
+                receiver.cancel()
+                self.assertEqual(received, [(RNS.Resource.FAILED, None)])
+                resume_path = receiver.storagepath+RNS.Resource.RESUME_SUFFIX
+                partial_path = receiver.storagepath+RNS.Resource.PARTIAL_SUFFIX
+                self.assertTrue(os.path.isfile(resume_path))
+                held = os.path.getsize(partial_path)
+                self.assertGreater(held, (interrupted_at-4)*receiver.sdu)
+                self.assertEqual(held % 16, 0)
+
+                # Offering the same data again yields the same resource
+                # hash, even though the encrypted parts are different
+                sender = RNS.Resource(data, l1, timeout=120, advertise=False, resumable=True)
+                self.assertEqual(sender.hash, receiver.hash)
+                receiver = RNS.Resource.accept(FakePacket(l1, RNS.ResourceAdvertisement(sender).pack()), callback=callback)
+                held_parts = held//receiver.sdu
+                self.assertEqual(receiver.received_count, held_parts)
+                self.assertEqual(receiver.consecutive_completed_height, held_parts-1)
+
+                sender.resume(1, receiver._Resource__held_parts())
+                self.assertEqual(sender.sent_parts, held_parts)
+                if held_parts > RNS.ResourceAdvertisement.HASHMAP_MAX_LEN:
+                    # The map hashes needed to request the first missing
+                    # part were not advertised, so none were requested yet
+                    self.assertTrue(receiver.waiting_for_hmu)
+                    self.assertEqual(receiver.outstanding_parts, 0)
+
+                # Only the missing parts are requested
+                feed_hashmap(sender, receiver)
+                receiver.waiting_for_hmu = False
+                receiver.request_next()
+                self.assertGreater(receiver.outstanding_parts, 0)
+
+                # Parts already held are not received again
+                receiver.receive_part(FakePacket(l1, sender.get_part_data(held_parts-1)))
+                self.assertEqual(receiver.received_count, held_parts)
+
+                for i in range(held_parts, sender.total_parts):
+                    receiver.receive_part(FakePacket(l1, sender.get_part_data(i)))
+
+                self.wait_for_assembly(receiver)
+                self.assertEqual(receiver.status, RNS.Resource.COMPLETE)
+                self.assertEqual(receiver.proof, sender.expected_proof)
+                self.assertEqual(received[-1], (RNS.Resource.COMPLETE, data))
+                self.assertFalse(os.path.isfile(resume_path))
+                self.assertFalse(os.path.isfile(partial_path))
+                self.assertFalse(os.path.isfile(receiver.storagepath))
+
+        finally:
+            RNS.Resource.STREAM_CHUNK_SIZE = stream_chunk_size
+
+        l1.teardown()
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.CLOSED)
+
+    @skipIf(os.getenv('SKIP_NORMAL_TESTS') != None, "Skipping")
+    def test_21_concurrent_resources(self):
+        init_rns(self)
+        print("")
+        print("Concurrent resources test")
+
+        # TODO: Load this from public bytes only
+        id1 = RNS.Identity.from_bytes(bytes.fromhex(fixed_keys[0][0]))
+        self.assertEqual(id1.hash, bytes.fromhex(fixed_keys[0][1]))
+
+        RNS.Transport.request_path(bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+        time.sleep(0.2)
+
+        dest = RNS.Destination(id1, RNS.Destination.OUT, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
+        self.assertEqual(dest.hash, bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+
+        l1 = RNS.Link(dest)
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.ACTIVE)
+
+        self.assertRaises(TypeError, l1.set_resource_concurrency, 0)
+        large_size = 1000*1000
+        small_size = 20*1000
+        # Leave room for all small resources next to the large one
+        small_count = RNS.Link.RESOURCE_CONCURRENCY-1
+        latencies = {}
+        for concurrency in [1, RNS.Link.RESOURCE_CONCURRENCY]:
+            l1.set_resource_concurrency(concurrency)
+            concluded = {}
+            def callback(resource):
+                concluded[resource] = time.time()
+
+            # Resources are prepared before they are advertised,
+            # since encrypting the large one takes longer than
+            # sending it on a local interface
+            large = RNS.Resource(os.urandom(large_size), l1, advertise=False, timeout=120, auto_compress=False, callback=callback)
+            small = [RNS.Resource(os.urandom(small_size), l1, advertise=False, timeout=120, auto_compress=False, callback=callback) for i in range(small_count)]
+            resources = [large]+small
+
+            start = time.time()
+            large.advertise()
+            time.sleep(0.1)
+            for resource in small:
+                resource.advertise()
+            while len(concluded) < len(resources) and time.time() < start+120:
+                time.sleep(0.01)
+
+            for resource in resources:
+                self.assertEqual(resource.status, RNS.Resource.COMPLETE)
+
+            t = max(concluded.values())-start
+            latencies[concurrency] = max(concluded[resource] for resource in small)-start
+            print(f"Concurrency {concurrency}, small resources completed after {round(latencies[concurrency], 2)}s, all after {round(t, 2)}s at {self.size_str((large_size+small_count*small_size)/t, 'b')}ps")
+
+        # Small resources are no longer held back behind a large one
+        self.assertLess(max(concluded[resource] for resource in small), concluded[large])
+        self.assertLess(latencies[RNS.Link.RESOURCE_CONCURRENCY], latencies[1])
+
+        l1.teardown()
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.CLOSED)
+
+    def test_22_deduplicated_resource_receive(self):
+        init_rns(self)
+        print("")
+        print("Deduplicated resource receive test")
+
+        # TODO: Load this from public bytes only
+        id1 = RNS.Identity.from_bytes(bytes.fromhex(fixed_keys[0][0]))
+        self.assertEqual(id1.hash, bytes.fromhex(fixed_keys[0][1]))
+
+        RNS.Transport.request_path(bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+        time.sleep(0.2)
+
+        dest = RNS.Destination(id1, RNS.Destination.OUT, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
+        self.assertEqual(dest.hash, bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+
+        l1 = RNS.Link(dest)
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.ACTIVE)
+
+        class FakePacket:
+            def __init__(self, link, data):
+                self.link = link
+                self.data = data
+                self.plaintext = data
+                self.raw = data
+
+        def receive(sender, callback):
+            receiver = RNS.Resource.accept(FakePacket(l1, RNS.ResourceAdvertisement(sender).pack()), callback=callback)
+            receiver.hashmap = list(sender.map_hashes)
+            receiver.hashmap_height = sender.total_parts
+            receiver.map_hash_index = dict(sender.map_hash_index)
+            for i in range(sender.total_parts):
+                receiver.receive_part(FakePacket(l1, sender.get_part_data(i)))
+            self.wait_for_assembly(receiver)
+            return receiver
+
+        content_path = os.path.join(os.path.dirname(__file__), "rnsconfig", "storage", "content")
+        RNS.ContentStore.start(content_path, 10*1000*1000)
+        try:
+            # Concurrent stores of the same content are
+            # only accounted for once
+            source_path = os.path.join(os.path.dirname(__file__), "rnsconfig", "storage", "content_source")
+            with open(source_path, "wb") as source:
+                source.write(os.urandom(100*1000))
+            content_hash = RNS.Identity.full_hash(b"Concurrent content")
+            stores = [threading.Thread(target=RNS.ContentStore.store, args=(content_hash, source_path, 0, 100*1000)) for i in range(8)]
+            for thread in stores: thread.start()
+            for thread in stores: thread.join()
+            os.unlink(source_path)
+            self.assertIsNotNone(RNS.ContentStore.get(content_hash))
+            self.assertEqual(RNS.ContentStore.used, sum(RNS.ContentStore.entries.values()))
+            RNS.ContentStore.remove(content_hash)
+
+            for kind in ["cacheable", "resumable"]:
+                data = os.urandom(50*1000).hex().encode("ascii")
+                received = []
+                def callback(resource):
+                    received.append((resource.status, resource.data.read() if resource.status == RNS.Resource.COMPLETE else None))
+
+                # Content is stored once it was received and verified
+                sender = RNS.Resource(data, l1, timeout=120, advertise=False, **{kind: True})
+                receiver = receive(sender, callback)
+                self.assertEqual(receiver.status, RNS.Resource.COMPLETE)
+                self.assertEqual(received[-1], (RNS.Resource.COMPLETE, data))
+                self.assertIsNotNone(RNS.ContentStore.get(sender.hash))
+
+                # Sending the same content again reuses the compressed
+                # payload, and the receiver concludes the transfer from
+                # the store, without requesting any parts
+                self.assertIn(RNS.Identity.full_hash(data), RNS.Resource.payload_cache)
+                sender = RNS.Resource(data, l1, timeout=120, advertise=False, **{kind: True})
+                self.assertEqual(sender.hash, receiver.hash)
+                receiver = RNS.Resource.accept(FakePacket(l1, RNS.ResourceAdvertisement(sender).pack()), callback=callback)
+                self.assertEqual(receiver.status, RNS.Resource.COMPLETE)
+                self.assertEqual(receiver.proof, sender.expected_proof)
+                self.assertEqual(received[-1], (RNS.Resource.COMPLETE, data))
+                self.assertFalse(receiver in l1.incoming_resources)
+                self.assertFalse(os.path.isfile(receiver.storagepath))
+                self.assertFalse(os.path.isfile(receiver.storagepath+RNS.Resource.RESUME_SUFFIX))
+                sender.validate_proof(receiver.hash+receiver.proof)
+                self.assertEqual(sender.status, RNS.Resource.COMPLETE)
+
+                # Resources with a random hash are transferred as usual
+                sender = RNS.Resource(data, l1, timeout=120, advertise=False)
+                self.assertNotEqual(sender.hash, receiver.hash)
+                receiver = RNS.Resource.accept(FakePacket(l1, RNS.ResourceAdvertisement(sender).pack()), callback=callback)
+                self.assertEqual(receiver.status, RNS.Resource.TRANSFERRING)
+                receiver.cancel()
+
+                # Stored content that does not match is removed,
+                # and the resource is transferred as usual
+                sender = RNS.Resource(data, l1, timeout=120, advertise=False, **{kind: True})
+                with open(RNS.ContentStore.get(sender.hash), "r+b") as stored_file:
+                    stored_file.write(b"corrupt")
+                receiver = receive(sender, callback)
+                self.assertEqual(receiver.status, RNS.Resource.COMPLETE)
+                self.assertEqual(received[-1], (RNS.Resource.COMPLETE, data))
+                self.assertEqual(receiver.received_count, sender.total_parts)
+
+        finally:
+            RNS.ContentStore.set_quota(0)
+
+        l1.teardown()
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.CLOSED)
+
     large_resource_status = None
+    def wait_for_assembly(self, resource, timeout=10):
+        # Spooled resources are assembled on the protocol
+        # executor, after their last part was received,
+        # and concluded by the same job.
+        timeout_at = time.time()+timeout
+        executor = RNS.Executor.protocol()
+        while (resource.status == RNS.Resource.ASSEMBLING or resource in executor.queues) and time.time() < timeout_at:
+            time.sleep(0.01)
+
     def lr_callback(self, resource):
         TestLink.large_resource_status = resource.status
 
@@ -395,6 +1026,71 @@ class TestLink(unittest.TestCase):
         time.sleep(0.5)
         self.assertEqual(l1.status, RNS.Link.CLOSED)
 
+    @skipIf(os.getenv('SKIP_NORMAL_TESTS') != None, "Skipping")
+    def test_23_large_streamed_resource(self):
+        if RNS.Cryptography.backend() == "internal":
+            print("Skipping large streamed resource test...")
+            return
+
+        init_rns(self)
+        print("")
+        print("Large streamed resource test")
+
+        # TODO: Load this from public bytes only
+        id1 = RNS.Identity.from_bytes(bytes.fromhex(fixed_keys[0][0]))
+        self.assertEqual(id1.hash, bytes.fromhex(fixed_keys[0][1]))
+
+        RNS.Transport.request_path(bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+        time.sleep(0.2)
+
+        dest = RNS.Destination(id1, RNS.Destination.OUT, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
+        self.assertEqual(dest.hash, bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+
+        l1 = RNS.Link(dest)
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.ACTIVE)
+
+        resource_timeout = 120
+        resource_size = 3*RNS.Resource.MAX_EFFICIENT_SIZE
+        file = tempfile.TemporaryFile()
+        written = 0
+        while written < resource_size:
+            chunk = os.urandom(min(1024*1024, resource_size-written))
+            file.write(chunk)
+            written += len(chunk)
+        file.seek(0)
+
+        # The data is streamed from the file and spooled to
+        # disk, so the memory used while sending it must not
+        # grow with the size of the resource. Packet hashes
+        # kept for duplicate detection do, up to their own
+        # limit, so that is lowered for the measurement.
+        hashlist_maxsize = RNS.Transport.hashlist_maxsize
+        RNS.Transport.hashlist_maxsize = 20000
+        try:
+            max_rss_before = getrusage(RUSAGE_SELF).ru_maxrss*1024
+            print("Sending "+self.size_str(resource_size)+" streamed resource...")
+            resource = RNS.Resource(file, l1, timeout=resource_timeout, callback=self.lr_callback, auto_compress=False)
+            start = time.time()
+
+            TestLink.large_resource_status = resource.status
+            while TestLink.large_resource_status < RNS.Resource.COMPLETE:
+                time.sleep(0.01)
+
+            t = time.time() - start
+            rss_growth = getrusage(RUSAGE_SELF).ru_maxrss*1024 - max_rss_before
+
+        finally:
+            RNS.Transport.hashlist_maxsize = hashlist_maxsize
+
+        self.assertEqual(TestLink.large_resource_status, RNS.Resource.COMPLETE)
+        print("Resource completed at "+self.size_str(resource_size/t, "b")+"ps, peak memory grew by "+self.size_str(rss_growth))
+        self.assertLess(rss_growth, resource_size//2)
+
+        l1.teardown()
+        time.sleep(0.5)
+        self.assertEqual(l1.status, RNS.Link.CLOSED)
+
     #@skipIf(os.getenv('SKIP_NORMAL_TESTS') != None, "Skipping")
     def test_10_channel_round_trip(self):
         global c_rns
@@ -601,6 +1297,142 @@ class TestLink(unittest.TestCase):
             local_interface.bitrate = original_bitrate
             local_interface._force_bitrate = False
 
+    def test_14_aio_round_trip(self):
+        global c_rns
+        init_rns(self)
+        print("")
+        print("Asyncio round trip test")
+
+        id1 = RNS.Identity.from_bytes(bytes.fromhex(fixed_keys[0][0]))
+        RNS.Transport.request_path(bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+        time.sleep(0.2)
+
+        dest = RNS.Destination(id1, RNS.Destination.OUT, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
+
+        async def round_trip():
+            link = await RNS.aio.Link.establish(dest, timeout=5)
+            self.assertEqual(link.link.status, RNS.Link.ACTIVE)
+
+            self.assertEqual(await link.request("/echo", b"Hello"), b"Hello")
+
+            channel = link.get_channel()
+            channel.register_message_type(MessageTest)
+            test_message = MessageTest()
+            test_message.data = "Hello"
+            await channel.send(test_message)
+            async for message in channel:
+                self.assertEqual("Hello back", message.data)
+                break
+
+            reader, writer = await link.open_buffer(0, 0)
+            writer.write("Hi there".encode("utf-8"))
+            await writer.drain()
+            self.assertEqual(await reader.read(1024), "Hi there back at you".encode("utf-8"))
+
+            resource = RNS.aio.Resource(os.urandom(256*1024), link, auto_compress=False)
+            updates = [progress async for progress in resource.progress_updates()]
+            concluded = await resource
+            self.assertEqual(concluded.status, RNS.Resource.COMPLETE)
+            self.assertGreater(len(updates), 1)
+            self.assertEqual(updates, sorted(updates))
+            self.assertEqual(updates[-1], 1.0)
+
+            link.teardown()
+            await asyncio.wait_for(link.wait_closed(), 5)
+            self.assertEqual([message async for message in channel], [])
+
+        asyncio.run(asyncio.wait_for(round_trip(), 60))
+
+    def test_15_response_cache(self):
+        cache = ResponseCache(max_entries=3, max_bytes=100)
+
+        # Entries expire after their TTL
+        cache.put(("a", 1, None), "A", 10, 0.1)
+        self.assertEqual(cache.get(("a", 1, None)), "A")
+        self.assertEqual(cache.get(("a", 2, None)), None)
+        time.sleep(0.15)
+        self.assertEqual(cache.get(("a", 1, None)), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        # The least recently used entries are evicted
+        # beyond the entry and size limits
+        for i in range(3):
+            cache.put(("a", i, None), i, 10, 60)
+        cache.get(("a", 0, None))
+        cache.put(("b", 0, None), "B", 10, 60)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.get(("a", 1, None)), None)
+        self.assertEqual(cache.get(("a", 0, None)), 0)
+        cache.put(("b", 1, None), "C", 80, 60)
+        self.assertEqual(cache.size, 100)
+        self.assertEqual(cache.get(("a", 2, None)), None)
+        self.assertEqual(cache.get(("b", 0, None)), "B")
+        cache.put(("b", 2, None), "Too large", 101, 60)
+        self.assertEqual(cache.get(("b", 2, None)), None)
+
+        cache.invalidate("b")
+        self.assertEqual(cache.get(("b", 1, None)), None)
+        self.assertEqual(len(cache), 1)
+        cache.invalidate()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+        init_rns(self)
+        destination = RNS.Destination(None, RNS.Destination.IN, RNS.Destination.PLAIN, APP_NAME, "response", "cache")
+        self.assertRaises(ValueError, destination.register_request_handler, "/path", lambda *args: None, RNS.Destination.ALLOW_ALL, mode=0xFF)
+        self.assertRaises(ValueError, destination.register_request_handler, "/path", lambda *args: None, RNS.Destination.ALLOW_ALL, cache_ttl=0)
+        self.assertRaises(TypeError, destination.set_request_concurrency, 0)
+        self.assertRaises(TypeError, destination.set_response_cache_limits, max_bytes=None)
+
+    def test_16_request_handlers(self):
+        init_rns(self)
+        print("")
+
+        id1 = RNS.Identity.from_bytes(bytes.fromhex(fixed_keys[0][0]))
+        RNS.Transport.request_path(bytes.fromhex("fb48da0e82e6e01ba0c014513f74540d"))
+        time.sleep(0.2)
+
+        dest = RNS.Destination(id1, RNS.Destination.OUT, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
+        l1 = RNS.Link(dest)
+        time.sleep(1)
+        self.assertEqual(l1.status, RNS.Link.ACTIVE)
+
+        def request_all(path, requests):
+            responses = {}
+            failed = []
+            began = time.time()
+            for i in range(requests):
+                l1.request(path, i, response_callback=lambda receipt: responses.update({receipt.request_id: receipt.response}), failed_callback=lambda receipt: failed.append(receipt), timeout=15)
+            timeout_at = time.time()+30
+            while len(responses)+len(failed) < requests and time.time() < timeout_at:
+                time.sleep(0.01)
+            self.assertEqual(failed, [])
+            return time.time()-began, sorted(responses.values())
+
+        # The target handlers take 0.25 seconds for each request
+        requests = 8
+        inline, responses = request_all("/slow", requests)
+        self.assertEqual(responses, list(range(requests)))
+        concurrent, responses = request_all("/slow_concurrent", requests)
+        self.assertEqual(responses, list(range(requests)))
+        print("Handled "+str(requests)+" slow requests in "+str(round(inline, 2))+"s inline, and in "+str(round(concurrent, 2))+"s concurrently")
+        self.assertLess(concurrent, inline/2)
+
+        # Identical requests are answered from the cache
+        def request(path, data):
+            response = []
+            l1.request(path, data, response_callback=lambda receipt: response.append(receipt.response), timeout=15)
+            timeout_at = time.time()+15
+            while len(response) == 0 and time.time() < timeout_at:
+                time.sleep(0.01)
+            return response[0]
+
+        first = request("/cached", b"Data")
+        self.assertEqual(request("/cached", b"Data"), first)
+        self.assertNotEqual(request("/cached", b"Other data"), first)
+
+        l1.teardown()
+        time.sleep(0.5)
+
     # Run with
     #  RUN_SLOW_TESTS=1 python tests/link.py TestLink.test_13_buffer_round_trip_big_slow
     # Or
@@ -706,6 +1538,20 @@ def targets(yp=False):
     d1 = RNS.Destination(id1, RNS.Destination.IN, RNS.Destination.SINGLE, APP_NAME, "link", "establish")
     d1.set_proof_strategy(RNS.Destination.PROVE_ALL)
     d1.set_link_established_callback(link_established)
+    d1.register_request_handler("/echo", lambda path, data, request_id, link_id, remote_identity, requested_at: data, RNS.Destination.ALLOW_ALL)
+
+    def slow(path, data, request_id, link_id, remote_identity, requested_at):
+        time.sleep(0.25)
+        return data
+
+    generated = [0]
+    def counted(path, data, request_id, link_id, remote_identity, requested_at):
+        generated[0] += 1
+        return generated[0]
+
+    d1.register_request_handler("/slow", slow, RNS.Destination.ALLOW_ALL)
+    d1.register_request_handler("/slow_concurrent", slow, RNS.Destination.ALLOW_ALL, mode=RNS.Destination.HANDLE_CONCURRENT)
+    d1.register_request_handler("/cached", counted, RNS.Destination.ALLOW_ALL, cache_ttl=60)
 
     while True:
         time.sleep(1)
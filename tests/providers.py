@@ -0,0 +1,88 @@
+import RNS
+import os
+import unittest
+
+import RNS.Cryptography.Provider as cp
+
+class TestProviders(unittest.TestCase):
+    def setUp(self):
+        self.selected = {primitive: cp.active(primitive) for primitive in cp.PRIMITIVES}
+
+    def tearDown(self):
+        for primitive in self.selected:
+            cp.select(primitive, self.selected[primitive])
+
+    def test_defaults(self):
+        for primitive in cp.PRIMITIVES:
+            self.assertIn(cp.active(primitive), cp.available(primitive))
+            self.assertIn("internal", cp.available(primitive))
+
+        # Native implementations are preferred when present
+        self.assertEqual(cp.active(cp.SHA256), "hashlib")
+        self.assertEqual(cp.active(cp.HMAC), "stdlib")
+        self.assertNotIn(cp.SHA256, cp.pure_python_hot_primitives())
+        self.assertNotIn(cp.HMAC, cp.pure_python_hot_primitives())
+
+        if not cp.use_pyca:
+            self.assertEqual(RNS.Cryptography.backend(), "internal")
+            self.assertIn(cp.AES_CBC, cp.pure_python_hot_primitives())
+
+    def test_select(self):
+        self.assertRaises(ValueError, cp.select, "md5", "internal")
+        self.assertRaises(ValueError, cp.select, cp.SHA256, "nonexistent")
+        if not cp.use_pyca:
+            self.assertRaises(ValueError, cp.select, cp.AES_CBC, "pyca")
+
+        cp.select(cp.SHA256, "internal")
+        self.assertEqual(cp.active(cp.SHA256), "internal")
+        self.assertTrue(cp.is_pure_python(cp.SHA256))
+
+    def test_equivalence(self):
+        data = os.urandom(1000)
+        key = os.urandom(32)
+        results = {}
+        for primitive in [cp.SHA256, cp.HMAC, cp.HKDF]:
+            results[primitive] = set()
+            for name in cp.available(primitive):
+                cp.select(primitive, name)
+                if primitive == cp.SHA256:
+                    results[primitive].add(RNS.Cryptography.sha256(data))
+                elif primitive == cp.HMAC:
+                    results[primitive].add(RNS.Cryptography.HMAC.hmac_sha256(key, data))
+                elif primitive == cp.HKDF:
+                    results[primitive].add(RNS.Cryptography.hkdf(length=64, derive_from=key, salt=data[:16], context=None))
+            self.assertEqual(len(results[primitive]), 1)
+
+        # Tokens must be interoperable across HMAC providers
+        cp.select(cp.HMAC, "internal")
+        token = RNS.Cryptography.Token(os.urandom(32))
+        ciphertext = token.encrypt(data)
+        cp.select(cp.HMAC, "stdlib")
+        self.assertEqual(token.decrypt(ciphertext), data)
+
+    def test_mixed_keys(self):
+        if len(cp.available(cp.X25519)) < 2:
+            self.skipTest("Only one X25519 provider available")
+
+        private_key_class, public_key_class = cp.implementation(cp.X25519)
+        a = RNS.Cryptography.X25519PrivateKey.generate()
+        b = RNS.Cryptography.X25519PrivateKey.generate()
+        for name in cp.available(cp.X25519):
+            cp.select(cp.X25519, name)
+            b_pub = RNS.Cryptography.X25519PublicKey.from_public_bytes(b.public_key().public_bytes())
+            self.assertEqual(a.exchange(b_pub), b.exchange(a.public_key()))
+
+    def test_status(self):
+        cp.autoselect(duration=0.005, exclude=[cp.X25519, cp.ED25519])
+        status = cp.status(measure=True)
+        self.assertEqual(set(status.keys()), set(cp.PRIMITIVES))
+        print("")
+        for primitive in status:
+            entry = status[primitive]
+            self.assertEqual(entry["provider"], cp.active(primitive))
+            self.assertGreater(entry["ops"], 0)
+            self.assertEqual(entry["hot"], primitive in cp.HOT_PRIMITIVES)
+            print(f"{primitive:<8} {entry['provider']:<9} {round(entry['ops'])} ops/s")
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,143 @@
+import unittest
+
+import time
+import threading
+import RNS
+from RNS.Scheduler import ResourceScheduler
+
+SDU = RNS.Resource.SDU
+
+class QueuedPacket:
+    def __init__(self, resource, index, sent):
+        self.resource = resource
+        self.index = index
+        self.data = bytes(SDU)
+        self.sent = sent
+
+    def send(self):
+        self.sent_on = threading.get_ident()
+        self.sent.append(self)
+
+class QueuedResource:
+    def __init__(self, name, priority=RNS.Resource.DEFAULT_PRIORITY):
+        self.name = name
+        self.priority = priority
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+def schedule(scheduler, arrivals):
+    """
+    Emulates a link that sends one packet at a time, while
+    requests for parts of several resources arrive. Each
+    arrival is a tuple of the time slot it arrives in, the
+    resource and the number of parts requested. Returns the
+    packets in the order they were sent.
+    """
+    sent = []
+    queued = {}
+    scheduler.draining = True
+    slot = 0
+    while True:
+        for arrival_slot, resource, parts in arrivals:
+            if arrival_slot == slot:
+                for i in range(parts):
+                    index = queued.get(resource, 0)
+                    queued[resource] = index+1
+                    scheduler.enqueue(resource, QueuedPacket(resource, index, sent))
+
+        entry = scheduler.next()
+        if entry == None and slot > max(a[0] for a in arrivals):
+            break
+        elif entry != None:
+            entry[1].send()
+        slot += 1
+
+    return sent
+
+def completion(sent, resource):
+    # The number of packets sent until the last part of the resource was
+    return max(i for i, packet in enumerate(sent) if packet.resource == resource)+1
+
+class TestScheduler(unittest.TestCase):
+    def test_order(self):
+        scheduler = ResourceScheduler(None)
+        resource = QueuedResource("single")
+        sent = schedule(scheduler, [(0, resource, 10)])
+        self.assertEqual([p.index for p in sent], list(range(10)))
+        self.assertEqual(scheduler.queued(), 0)
+
+    def test_mixed_transfers(self):
+        print("")
+        # A large resource requests windows of 75 parts, and
+        # four small resources request a few parts each while
+        # its first window is being sent.
+        large = QueuedResource("large")
+        small = [QueuedResource("small "+str(i)) for i in range(4)]
+        arrivals = [(0, large, 75), (75, large, 75), (150, large, 75)]
+        arrivals += [(5+i*5, small[i], 4) for i in range(4)]
+
+        fifo = []
+        for slot, resource, parts in sorted(arrivals, key=lambda a: a[0]):
+            fifo += [resource]*parts
+        sent = schedule(ResourceScheduler(None), arrivals)
+
+        # Throughput is unchanged, since the link is never idle
+        self.assertEqual(len(sent), len(fifo))
+        for resource in [large]+small:
+            sent_parts = [p.index for p in sent if p.resource == resource]
+            self.assertEqual(sent_parts, sorted(sent_parts))
+
+        for i, resource in enumerate(small):
+            fifo_latency = max(j for j, r in enumerate(fifo) if r == resource)+1-arrivals[3+i][0]
+            latency = completion(sent, resource)-arrivals[3+i][0]
+            print(f"{resource.name} completed after {latency} packets, {fifo_latency} without scheduling")
+            # At most three resources have parts queued at once
+            self.assertLessEqual(latency, 3*4+1)
+            self.assertLess(latency, fifo_latency/5)
+
+        print(f"large completed after {completion(sent, large)} packets, {len(fifo)} without scheduling")
+        self.assertEqual(completion(sent, large), len(fifo))
+
+    def test_priority(self):
+        high = QueuedResource("high", priority=3)
+        normal = QueuedResource("normal")
+        sent = schedule(ResourceScheduler(None), [(0, high, 300), (0, normal, 300)])
+
+        # While both have parts queued, the link is shared in
+        # proportion to their priority
+        share = [p.resource for p in sent[:200]].count(high)/200
+        self.assertAlmostEqual(share, 0.75, delta=0.02)
+        self.assertRaises(TypeError, RNS.Resource.set_priority, high, 0)
+        self.assertRaises(TypeError, RNS.Resource.set_priority, high, "high")
+
+        # Resources can not save up credit while idle
+        scheduler = ResourceScheduler(None)
+        sent = schedule(scheduler, [(0, normal, 100), (100, high, 10), (100, normal, 10)])
+        self.assertEqual([p.resource for p in sent[100:104]].count(high), 3)
+
+    def test_drain(self):
+        scheduler = ResourceScheduler(None)
+        resources = [QueuedResource(str(i)) for i in range(4)]
+        sent = []
+        for i in range(50):
+            for resource in resources:
+                scheduler.enqueue(resource, QueuedPacket(resource, i, sent))
+
+        scheduler.remove(resources[3])
+        deadline = time.time()+5
+        while scheduler.queued() > 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+        time.sleep(0.1)
+        self.assertFalse(scheduler.draining)
+
+        # Packets are sent from the protocol executor,
+        # rather than from a thread started per burst
+        self.assertTrue(set([p.sent_on for p in sent]) <= RNS.Executor.protocol().worker_ids)
+        self.assertEqual(len([p for p in sent if p.resource != resources[3]]), 150)
+        self.assertLess(len([p for p in sent if p.resource == resources[3]]), 50)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
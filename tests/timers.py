@@ -0,0 +1,203 @@
+import unittest
+
+import time
+import threading
+import RNS
+from RNS.Timers import TimerService
+
+def wait_for(condition, timeout=5):
+    timeout_at = time.time()+timeout
+    while not condition() and time.time() < timeout_at:
+        time.sleep(0.001)
+    return condition()
+
+def idle_link(status=RNS.Link.ACTIVE, keepalive=RNS.Link.KEEPALIVE, stale_time=RNS.Link.STALE_TIME, initiator=False):
+    # Links are set up without keys or a destination, with
+    # only the state their watchdog reads, since deriving
+    # keys for thousands of links would take a long time.
+    link = RNS.Link.__new__(RNS.Link)
+    now = time.time()
+    link.status = status
+    link.initiator = initiator
+    link.watchdog = None
+    link.watchdog_lock = False
+    link.request_time = now
+    link.establishment_timeout = RNS.Link.ESTABLISHMENT_TIMEOUT_PER_HOP
+    link.activated_at = now
+    link.last_inbound = now
+    link.last_proof = 0
+    link.keepalive = keepalive
+    link.stale_time = stale_time
+    link.rtt = 0.001
+    link.keepalive_timeout_factor = RNS.Link.KEEPALIVE_TIMEOUT_FACTOR
+    link.teardown_reason = None
+    link._Link__track_phy_stats = False
+    link.closed_at = None
+    link.keepalives = []
+
+    def link_closed():
+        link.closed_at = time.time()
+        link.watchdog.cancel()
+    def send_keepalive():
+        link.keepalives.append(time.time())
+
+    link.link_closed = link_closed
+    link.send_keepalive = send_keepalive
+    return link
+
+class TestTimers(unittest.TestCase):
+    def test_ordering(self):
+        service = TimerService(executor=RNS.Executor.INLINE)
+        fired = []
+        for delay in [0.3, 0.1, 0.2, 0.0]:
+            service.call_later(delay, lambda delay=delay: fired.append(delay))
+        self.assertTrue(wait_for(lambda: len(fired) == 4))
+        self.assertEqual(fired, [0.0, 0.1, 0.2, 0.3])
+        self.assertEqual(service.get_scheduled(), 0)
+
+    def test_cancel_and_reschedule(self):
+        service = TimerService(executor=RNS.Executor.INLINE)
+        fired = []
+        cancelled = service.call_later(0.05, fired.append, "cancelled")
+        moved = service.call_later(0.05, fired.append, "moved")
+        def repeat():
+            fired.append("repeating")
+            if fired.count("repeating") < 3:
+                repeating.schedule(0.01)
+        repeating = service.timer(repeat)
+
+        cancelled.cancel()
+        self.assertFalse(cancelled.is_scheduled())
+        moved.schedule(0.2)
+        moved.schedule(0.1)
+        repeating.schedule(0)
+        self.assertEqual(service.get_scheduled(), 2)
+
+        time.sleep(0.3)
+        self.assertEqual(fired.count("repeating"), 3)
+        self.assertEqual([event for event in fired if event != "repeating"], ["moved"])
+        self.assertFalse(moved.is_scheduled())
+
+        # Replaced deadlines do not accumulate
+        timer = service.timer(fired.append, "late")
+        for i in range(10*TimerService.COMPACTION_MIN):
+            timer.schedule(60+i)
+        self.assertLessEqual(len(service.heap), 2*TimerService.COMPACTION_MIN)
+        timer.cancel()
+
+    def test_blocked_callbacks(self):
+        # Timers fire while every worker of the shared
+        # executor is held up by application callbacks
+        release = threading.Event()
+        executor = RNS.Executor.shared()
+        for i in range(executor.max_workers):
+            executor.submit(release.wait, 10, bounded=False)
+        try:
+            self.assertTrue(wait_for(lambda: executor.get_stats()["workers"] == executor.max_workers))
+            fired = []
+            RNS.Timers.shared().call_later(0.1, fired.append, time.time())
+            self.assertTrue(wait_for(lambda: len(fired) == 1, 2))
+        finally:
+            release.set()
+
+    def test_idle_links(self):
+        count = 10000
+        threads_before = threading.active_count()
+        service = RNS.Timers.shared()
+        scheduled_before = service.get_scheduled()
+
+        began = time.time()
+        links = [idle_link() for i in range(count)]
+        for link in links:
+            link.start_watchdog()
+        self.assertTrue(wait_for(lambda: service.get_scheduled() >= scheduled_before+count, 30))
+        print("\nStarted the watchdogs of "+str(count)+" links in "+str(round(time.time()-began, 3))+" seconds", end=" ")
+
+        # Previously, each link held a thread of its own
+        self.assertLess(threading.active_count(), threads_before+RNS.Executor.CallbackExecutor.WORKERS+2)
+        for link in links:
+            self.assertTrue(link.watchdog.is_scheduled())
+            self.assertEqual(link.status, RNS.Link.ACTIVE)
+
+        for link in links:
+            link.status = RNS.Link.CLOSED
+            link.watchdog.cancel()
+        self.assertEqual(service.get_scheduled(), scheduled_before)
+
+    def test_link_timeouts(self):
+        # Links send keepalives, become stale and close
+        # at the same points in time as they did when
+        # their watchdogs slept on threads of their own.
+        link = idle_link(keepalive=0.2, stale_time=0.4, initiator=True)
+        link.start_watchdog()
+        self.assertTrue(wait_for(lambda: link.status == RNS.Link.STALE))
+        stale_at = time.time()
+        self.assertGreaterEqual(stale_at-link.last_inbound, 0.4)
+        self.assertGreaterEqual(len(link.keepalives), 1)
+        self.assertGreaterEqual(link.keepalives[0]-link.last_inbound, 0.2)
+
+        self.assertTrue(wait_for(lambda: link.closed_at != None))
+        self.assertEqual(link.status, RNS.Link.CLOSED)
+        self.assertEqual(link.teardown_reason, RNS.Link.TIMEOUT)
+        self.assertAlmostEqual(link.closed_at-stale_at, link.rtt*link.keepalive_timeout_factor+RNS.Link.STALE_GRACE, delta=0.1)
+        self.assertFalse(link.watchdog.is_scheduled())
+
+        # Inbound traffic postpones the keepalive
+        link = idle_link(keepalive=0.2, stale_time=0.4, initiator=True)
+        link.start_watchdog()
+        for i in range(5):
+            time.sleep(0.1)
+            link.last_inbound = time.time()
+        self.assertEqual(link.keepalives, [])
+        self.assertEqual(link.status, RNS.Link.ACTIVE)
+        link.status = RNS.Link.CLOSED
+
+        # Links that are never established time out
+        link = idle_link(status=RNS.Link.PENDING)
+        link.establishment_timeout = 0.2
+        link.start_watchdog()
+        self.assertTrue(wait_for(lambda: link.closed_at != None))
+        self.assertAlmostEqual(link.closed_at-link.request_time, 0.2, delta=0.1)
+        self.assertEqual(link.teardown_reason, RNS.Link.TIMEOUT)
+
+    def test_receipt_timeout(self):
+        destination = idle_link()
+        destination.type = RNS.Destination.LINK
+        destination.traffic_timeout_factor = RNS.Link.TRAFFIC_TIMEOUT_FACTOR
+        destination.callback_executor = RNS.Executor.INLINE
+        packet = RNS.Packet.__new__(RNS.Packet)
+        packet.destination = destination
+        packet.packet_hash = RNS.Identity.full_hash(b"Receipt")
+        packet.get_hash = lambda: packet.packet_hash
+        packet.getTruncatedHash = lambda: packet.packet_hash[:RNS.Reticulum.TRUNCATED_HASHLENGTH//8]
+
+        # Receipts fail once the grace period after their
+        # timeout has passed
+        timed_out = []
+        receipt = RNS.PacketReceipt(packet)
+        receipt.set_timeout_callback(lambda receipt: timed_out.append(time.time()))
+        receipt.set_timeout(0.2)
+        self.assertTrue(wait_for(lambda: len(timed_out) == 1))
+        self.assertAlmostEqual(timed_out[0]-receipt.sent_at, 0.2+RNS.PacketReceipt.TIMEOUT_GRACE, delta=0.1)
+        self.assertEqual(receipt.status, RNS.PacketReceipt.FAILED)
+        self.assertFalse(receipt.timer.is_scheduled())
+
+        # Culled receipts no longer hold a timer
+        receipt = RNS.PacketReceipt(packet)
+        self.assertTrue(receipt.timer.is_scheduled())
+        receipt.timeout = -1
+        receipt.check_timeout()
+        self.assertEqual(receipt.status, RNS.PacketReceipt.CULLED)
+        self.assertFalse(receipt.timer.is_scheduled())
+
+        # Delivered ones are left alone
+        receipt = RNS.PacketReceipt(packet)
+        receipt.set_timeout_callback(lambda receipt: timed_out.append(time.time()))
+        receipt.set_timeout(0.1)
+        receipt.status = RNS.PacketReceipt.DELIVERED
+        time.sleep(0.2+RNS.PacketReceipt.TIMEOUT_GRACE)
+        self.assertEqual(len(timed_out), 1)
+        self.assertFalse(receipt.timer.is_scheduled())
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)